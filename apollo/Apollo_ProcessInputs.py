@@ -18,6 +18,7 @@ if str(APOLLO_DIRECTORY) not in sys.path:
     sys.path.append(str(APOLLO_DIRECTORY))
 
 import apollo.src.ApolloFunctions as af  # noqa: E402
+from apollo.opacities.binary_store import get_table_header_filepath  # noqa: E402
 from apollo.Apollo_ReadInputsfromFile import (  # noqa: E402
     DataParameters,
     ModelParameters,
@@ -25,6 +26,7 @@ from apollo.Apollo_ReadInputsfromFile import (  # noqa: E402
     ParameterValue,
 )
 from apollo.planet import CPlanetBlueprint, SwitchBlueprint  # noqa: E402
+from apollo.radiative_transfer.quadrature import get_stream_quadrature  # noqa: E402
 from apollo.spectrum.band_bin_and_convolve import (  # noqa: E402
     find_band_limits_from_wavelength_bins,
     get_bin_spacings_from_wavelengths,
@@ -322,7 +324,9 @@ def get_unbanded_wavelengths_from_opacity_tables(
     fiducial_species_name: str = "h2o",
 ) -> NDArray[np.float64]:
     # Compute hires spectrum wavelengths
-    opacfile = f"{opacdir}/gases/{fiducial_species_name}.{opacity_catalog_name}.dat"
+    opacfile = get_table_header_filepath(
+        opacdir, fiducial_species_name, opacity_catalog_name
+    )
     with open(opacfile, "r") as fopac:
         opacshape = fopac.readline().split()
     nwave = (int)(opacshape[6])
@@ -583,7 +587,10 @@ def set_up_PyPlanet(
     hazetype: int,
     list_of_gas_species: Sequence[str],
     opacity_parameters: OpacityParameters,
+    table_source: PyPlanet | None = None,
 ) -> PyPlanet:
+    # With a table source (a planet made from the same inputs), the new planet shares its
+    # cross-section tables rather than reading its own, e.g. for one planet per thread.
     observation_mode_index: int = model_parameters.mode
 
     number_of_streams: int = model_parameters.streams
@@ -629,6 +636,11 @@ def set_up_PyPlanet(
     )
 
     planet = PyPlanet()
-    planet.MakePlanet(*planet_make_parameters)
+    planet.MakePlanet(*planet_make_parameters, read_tables=table_source is None)
+    if table_source is not None:
+        planet.share_tables(table_source)
+    planet.set_Quadrature(*get_stream_quadrature(model_parameters.quadrature))
+    if model_parameters.threads > 0:
+        planet.set_Threads(model_parameters.threads)
 
     return planet
@@ -93,6 +93,8 @@ class LocationParameters:
 class ModelParameters:
     mode: int  # eventually enum?
     streams: int  # eventually enum?
+    quadrature: str = "standard"  # preset name or number of angles
+    threads: int = 0  # for an OpenMP build; 0 leaves it to APOLLO_NUM_THREADS
 
 
 @dataclass
@@ -180,6 +182,8 @@ def read_in_settings_from_input_file(
     printfull: bool = False
 
     vres: int = 71
+    quadrature: str = "standard"
+    threads: int = 0
 
     samples_file: str = ""
 
@@ -305,6 +309,11 @@ def read_in_settings_from_input_file(
             elif line[0] == "Streams":
                 if len(line) > 1:
                     streams = (int)(line[1])
+                if len(line) > 2:
+                    quadrature = line[2]
+            elif line[0] == "Threads":
+                if len(line) > 1:
+                    threads = (int)(line[1])
             elif line[0] == "Output_Mode":
                 if len(line) > 1:
                     outmode = line[1]
@@ -332,7 +341,9 @@ def read_in_settings_from_input_file(
 
     data_parameters: DataParameters = DataParameters(datain, dataconv, databin)
     location_parameters: LocationParameters = LocationParameters(dist, RA, dec)
-    model_parameters: ModelParameters = ModelParameters(mode, streams)
+    model_parameters: ModelParameters = ModelParameters(
+        mode, streams, quadrature, threads
+    )
     model_restriction_parameters: ModelRestrictionParameters = (
         ModelRestrictionParameters(polyfit, gray, tgray)
     )
@@ -15,9 +15,12 @@ if str(APOLLO_DIRECTORY) not in sys.path:
 import apollo.src.ApolloFunctions as af  # noqa: E402
 from apollo.planet import (  # noqa: E402
     CPlanetBlueprint,
+    CPlanetSettings,
+    DerivedParameterSchedule,
     MakeModelBlueprint,
     ObserveModelBlueprint,
     Planet,
+    SwitchBlueprint,
 )
 from apollo.src.ApolloFunctions import BinModel, ConvSpec, NormSpec  # noqa: E402
 
@@ -97,6 +100,7 @@ def ReadInputsfromFile(
     norm = False  # Dummy variable if polyfit is false
     checkpoint_file = None
     sampler = None
+    derived = "every_call"  # When to compute the derived parameters, incl. Teff
     samples_file = None
     num_samples = 0
     dataconv = 1  # Factor to convolve the observations to blur the spectrum or account for actual resolving power
@@ -121,6 +125,8 @@ def ReadInputsfromFile(
     gray = False  # Used to create a gray atmosphere for testing
     vres = 71  # Number of layers for radiative transfer
     streams = 1  # Use 1-stream by default
+    quadrature = "standard"  # Gauss quadrature over the stream angles
+    threads = 0  # Threads for an OpenMP build; 0 leaves it to APOLLO_NUM_THREADS
     wavei = 10000.0 / 0.60  # Full NIR wavelength range
     wavef = 10000.0 / 5.00
     outmode = ""  # JWST observing mode
@@ -215,6 +221,8 @@ def ReadInputsfromFile(
         elif line[0] == "Sampler":
             if len(line) > 1:
                 sampler = line[1]
+            if len(line) > 2:
+                derived = line[2]
         elif line[0] == "Samples":
             if len(line) > 1:
                 samples_file = line[1]
@@ -292,6 +300,11 @@ def ReadInputsfromFile(
         elif line[0] == "Streams":
             if len(line) > 1:
                 streams = (int)(line[1])
+            if len(line) > 2:
+                quadrature = line[2]
+        elif line[0] == "Threads":
+            if len(line) > 1:
+                threads = (int)(line[1])
         elif line[0] == "Output_Mode":
             if len(line) > 1:
                 outmode = line[1]
@@ -467,6 +480,7 @@ def ReadInputsfromFile(
         "datain": str(Path(APOLLO_DIRECTORY) / datain),
         # "polyfit": polyfit, # Not in ProcessInputs
         "sampler": sampler,
+        "derived": derived,
         # "samples_file": samples_file, # Not in ProcessInputs
         # "num_samples": num_samples, # Not in ProcessInputs
         "dataconv": dataconv,
@@ -521,6 +535,8 @@ def ReadInputsfromFile(
         "tgray": tgray,
         "vres": vres,
         "streams": streams,
+        "quadrature": quadrature,
+        "threads": threads,
         "ensparams": ensparams,
         # "outmode": outmode, # Not in ProcessInputs
         # "exptime": exptime, # Not in ProcessInputs
@@ -536,6 +552,7 @@ class ProcessedInputs(NamedTuple):
     MakePlanet_kwargs: CPlanetBlueprint
     MakeModel_initialization_kwargs: MakeModelBlueprint
     ModelObservable_initialization_kwargs: ObserveModelBlueprint
+    CPlanet_settings: CPlanetSettings = CPlanetSettings()
 
 
 def ProcessInputs(
@@ -598,6 +615,9 @@ def ProcessInputs(
     maxP,
     ensparams,
     streams,
+    derived="every_call",
+    quadrature="standard",
+    threads=0,
 ) -> ProcessedInputs:
     cluster_mode = (task == "Retrieval") and parallel
 
@@ -1013,11 +1033,13 @@ def ProcessInputs(
             fout.write("\n")
 
     MakePlanet_kwargs: CPlanetBlueprint = CPlanetBlueprint(
-        observation_mode_index=mode,
-        cloud_model_index=cloudmod,
-        hazetype_index=hazetype,
-        number_of_streams=streams,
-        TP_model_switch=atmmod,
+        switches=SwitchBlueprint(
+            observation_mode_index=mode,
+            cloud_model_index=cloudmod,
+            hazetype_index=hazetype,
+            number_of_streams=streams,
+            TP_model_switch=atmmod,
+        ),
         model_wavelengths=modwave,
         Teff_calculation_wavelengths=modwavelo,
         gas_species_indices=mollist,
@@ -1057,6 +1079,9 @@ def ProcessInputs(
         calibration_parameter_names=end,
         calibration_start_index=e1,
         APOLLO_use_mode=task,
+        compute_derived_parameters=(
+            DerivedParameterSchedule(derived) == DerivedParameterSchedule.every_call
+        ),
     )
 
     ModelObservable_initialization_kwargs: ObserveModelBlueprint = (
@@ -1102,11 +1127,17 @@ def ProcessInputs(
         MakePlanet_kwargs=MakePlanet_kwargs,
         MakeModel_initialization_kwargs=MakeModel_initialization_kwargs,
         ModelObservable_initialization_kwargs=ModelObservable_initialization_kwargs,
+        CPlanet_settings=CPlanetSettings(
+            stream_quadrature=quadrature, number_of_threads=threads
+        ),
     )
 
 
-def MakePlanet(PlanetCCore_kwargs: CPlanetBlueprint) -> Planet:
-    return Planet("b", PlanetCCore_kwargs)
+def MakePlanet(
+    PlanetCCore_kwargs: CPlanetBlueprint,
+    PlanetCCore_settings: CPlanetSettings = CPlanetSettings(),
+) -> Planet:
+    return Planet("b", PlanetCCore_kwargs, PlanetCCore_settings)
 
 
 def MakeObservation(observation_constructor: ObserveModelBlueprint) -> Callable:
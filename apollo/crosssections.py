@@ -1,15 +1,30 @@
-from dataclasses import dataclass
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
 from os import PathLike
 from pathlib import Path
-from typing import Any, Sequence
+from typing import Any, Final, Sequence
 from warnings import warn
 
 import numpy as np
 from numpy.typing import NDArray
 from xarray import DataArray, Dataset
 
+from apollo.opacities.binary_store import (
+    HEADER_SUFFIX,
+    TABLE_SCALE_NOTE,
+    TEXT_TABLE_SUFFIX,
+    decode_crosssections,
+    get_table_scale,
+    has_binary_table,
+    load_binary_table,
+)
+from apollo.opacities.catalog_index import update_catalog_index
+from apollo.opacities.shared_memory import SharedArray, load_into_shared_memory
 from custom_types import Pathlike
 
+# How much of the loaded (not memory-mapped) tables a CrossSectionDirectory keeps.
+DEFAULT_CROSSSECTION_MEMORY_BUDGET_IN_BYTES: Final[int] = 4 * 1024**3
+
 
 @dataclass(slots=True)
 class CrossSectionTableHeader:
@@ -84,8 +99,11 @@ def get_file_headers(filepaths: Sequence[Pathlike]) -> tuple[tuple[Any]]:
     return tuple(file_headers)
 
 
-def get_valid_files_and_header(filepaths, header_protocol=CrossSectionTableHeader):
-    file_headers: tuple[tuple[float | int]] = get_file_headers(filepaths)
+def get_valid_files_and_header(
+    filepaths, header_protocol=CrossSectionTableHeader, file_headers=None
+):
+    if file_headers is None:
+        file_headers: tuple[tuple[float | int]] = get_file_headers(filepaths)
 
     expected_number_of_header_entries: int = len(header_protocol.__slots__)
 
@@ -115,22 +133,197 @@ def get_valid_files_and_header(filepaths, header_protocol=CrossSectionTableHeade
     return valid_filepaths, directory_header
 
 
+@dataclass
+class CrossSectionCacheInfo:
+    hits: int
+    misses: int
+    evictions: int
+    number_of_tables: int
+    resident_bytes: int
+    memory_budget_in_bytes: int
+
+
+def get_resident_bytes(table: NDArray[np.float64]) -> int:
+    # Memory-mapped tables live in the page cache, which the OS manages,
+    # so they do not count against the budget.
+    return 0 if isinstance(table, np.memmap) else table.nbytes
+
+
 @dataclass
 class CrossSectionDirectory:
+    """
+    Tables are loaded on first use through get_crosssections, and the most recently
+    used ones are kept until their total size would exceed memory_budget_in_bytes.
+    """
+
     header: CrossSectionTableHeader
     directory_name: str
     list_of_species: tuple[str]
     filepath_directory: dict[str, Pathlike]
+    memory_budget_in_bytes: int = DEFAULT_CROSSSECTION_MEMORY_BUDGET_IN_BYTES
+    _loaded_tables: OrderedDict = field(
+        default_factory=OrderedDict, init=False, repr=False, compare=False
+    )
+    _cache_counts: Counter = field(
+        default_factory=Counter, init=False, repr=False, compare=False
+    )
+
+    @property
+    def table_header(self) -> CrossSectionTableHeader:
+        # The header is kept as the tuple of values read from the files.
+        return CrossSectionTableHeader(*self.header)
+
+    @property
+    def table_shape(self) -> tuple[int, int, int]:
+        return (
+            self.table_header.number_of_pressure_layers,
+            self.table_header.number_of_temperatures,
+            self.table_header.number_of_spectral_elements,
+        )
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(get_resident_bytes(table) for table in self._loaded_tables.values())
+
+    def get_table_scale(self, species: str) -> str:
+        return get_table_scale(self.filepath_directory[species])
+
+    def get_crosssections(
+        self,
+        species: str,
+        wavelength_index_ranges: Sequence[tuple[int, int]] = None,
+    ) -> NDArray[np.floating]:
+        # Values as stored; see get_table_scale and decode_crosssections.
+        cache_key = (
+            species,
+            (
+                None
+                if wavelength_index_ranges is None
+                else tuple(map(tuple, wavelength_index_ranges))
+            ),
+        )
+
+        if cache_key in self._loaded_tables:
+            self._cache_counts["hits"] += 1
+            self._loaded_tables.move_to_end(cache_key)
+            return self._loaded_tables[cache_key]
+
+        self._cache_counts["misses"] += 1
+        table = load_crosssection_table(
+            self.filepath_directory[species],
+            self.table_shape,
+            wavelength_index_ranges,
+        )
+
+        table_bytes = get_resident_bytes(table)
+        if table_bytes > self.memory_budget_in_bytes:
+            warn(
+                f"The {species} table ({table_bytes} bytes) is larger than the "
+                + f"memory budget ({self.memory_budget_in_bytes} bytes), "
+                + "so it will not be cached."
+            )
+            return table
+
+        self.evict_until_free(table_bytes)
+        self._loaded_tables[cache_key] = table
+
+        return table
+
+    def evict_until_free(self, number_of_bytes: int) -> None:
+        # Least recently used first.
+        while (
+            self._loaded_tables
+            and self.resident_bytes + number_of_bytes > self.memory_budget_in_bytes
+        ):
+            self._loaded_tables.popitem(last=False)
+            self._cache_counts["evictions"] += 1
+
+    def get_dataset(
+        self,
+        list_of_species: Sequence[str] = None,
+        wavelength_index_ranges: Sequence[tuple[int, int]] = None,
+    ) -> Dataset:
+        # Like load_crosssections_into_dataset, but through the cache.
+        if list_of_species is None:
+            list_of_species = self.list_of_species
+
+        wavelengths = self.table_header.wavelengths
+        if wavelength_index_ranges is not None:
+            wavelengths = wavelengths[
+                get_wavelength_indices_from_ranges(wavelength_index_ranges)
+            ]
+
+        return Dataset(
+            {
+                species: DataArray(
+                    self.get_crosssections(species, wavelength_index_ranges),
+                    coords=dict(
+                        pressures=self.table_header.pressures,
+                        temperatures=self.table_header.temperatures,
+                        wavelengths=wavelengths,
+                    ),
+                    attrs={TABLE_SCALE_NOTE: self.get_table_scale(species)},
+                )
+                for species in list_of_species
+            }
+        )
+
+    def cache_info(self) -> CrossSectionCacheInfo:
+        return CrossSectionCacheInfo(
+            hits=self._cache_counts["hits"],
+            misses=self._cache_counts["misses"],
+            evictions=self._cache_counts["evictions"],
+            number_of_tables=len(self._loaded_tables),
+            resident_bytes=self.resident_bytes,
+            memory_budget_in_bytes=self.memory_budget_in_bytes,
+        )
+
+    def clear_cache(self) -> None:
+        self._loaded_tables.clear()
+
+
+def find_crosssection_filepaths(
+    file_directory: PathLike | str,
+    filename_match_strings: Sequence[str] = (r"*.*.dat", r"*.*.hdr"),
+) -> list[Path]:
+    # Where a table exists both as text and in the binary store,
+    # keep only the binary store's header sidecar.
+    filepaths_by_table = {}
+    for filename_match_string in filename_match_strings:
+        for filepath in Path(file_directory).glob(filename_match_string):
+            if not filepath.is_file():
+                continue
+            table_stem = filepath.with_suffix("")
+            if table_stem not in filepaths_by_table or filepath.suffix == HEADER_SUFFIX:
+                filepaths_by_table[table_stem] = filepath
+
+    return list(filepaths_by_table.values())
 
 
 def create_crosssection_catalog(
-    file_directory: PathLike | str, filename_match_string: str = r"*.*.dat"
-) -> dict[str, CrossSectionTable]:
-    crosssection_filepaths = [
-        filepath
-        for filepath in Path(file_directory).glob(filename_match_string)
-        if filepath.is_file()
-    ]
+    file_directory: PathLike | str,
+    filename_match_strings: Sequence[str] = (r"*.*.dat", r"*.*.hdr"),
+    memory_budget_in_bytes: int = DEFAULT_CROSSSECTION_MEMORY_BUDGET_IN_BYTES,
+    use_index: bool = True,
+) -> dict[str, CrossSectionDirectory]:
+    """
+    With use_index, headers come from the directory's catalog index (see
+    apollo.opacities.catalog_index), and only new or changed files are opened.
+    """
+    crosssection_filepaths = find_crosssection_filepaths(
+        file_directory, filename_match_strings
+    )
+
+    if use_index:
+        catalog_index = update_catalog_index(file_directory, crosssection_filepaths)
+        file_headers = {
+            filepath: catalog_index.files[filepath.name].header
+            for filepath in crosssection_filepaths
+        }
+    else:
+        file_headers = dict(
+            zip(crosssection_filepaths, get_file_headers(crosssection_filepaths))
+        )
     crosssection_filenames = [filepath.name for filepath in crosssection_filepaths]
     species, crosssection_names, _ = list(
         zip(
@@ -156,7 +349,10 @@ def create_crosssection_catalog(
         )
 
         directory_filepaths, directory_header = get_valid_files_and_header(
-            candidate_filepaths
+            candidate_filepaths,
+            file_headers=tuple(
+                file_headers[filepath] for filepath in candidate_filepaths
+            ),
         )
         if not directory_header:
             warn(f"No files under the name {directory_name} have valid headers.")
@@ -170,39 +366,179 @@ def create_crosssection_catalog(
                 species: filepath
                 for species, filepath in zip(directory_species, directory_filepaths)
             },
+            memory_budget_in_bytes=memory_budget_in_bytes,
         )
 
     return directories
 
 
+def get_wavelength_index_ranges_from_band_indices(
+    band_start_indices: Sequence[int],
+    band_end_indices: Sequence[int],
+    degrade: int,
+    number_of_spectral_elements: int,
+) -> list[tuple[int, int]]:
+    """
+    Converts the (degraded) model band slices from af.SliceModel_bindex, which
+    already include the minDL/maxDL calibration margins, into sorted and merged
+    [start, stop) index ranges along the full-resolution table wavelength axis.
+    """
+    full_resolution_ranges = sorted(
+        (
+            max(int(band_start) * degrade, 0),
+            min((int(band_end) + 1) * degrade, number_of_spectral_elements),
+        )
+        for band_start, band_end in zip(band_start_indices, band_end_indices)
+    )
+
+    merged_ranges = [full_resolution_ranges[0]]
+    for range_start, range_stop in full_resolution_ranges[1:]:
+        previous_start, previous_stop = merged_ranges[-1]
+        if range_start <= previous_stop:
+            merged_ranges[-1] = (previous_start, max(previous_stop, range_stop))
+        else:
+            merged_ranges.append((range_start, range_stop))
+
+    return merged_ranges
+
+
+def get_wavelength_indices_from_ranges(
+    wavelength_index_ranges: Sequence[tuple[int, int]],
+) -> NDArray[np.int_]:
+    return np.concatenate(
+        [
+            np.arange(range_start, range_stop)
+            for range_start, range_stop in wavelength_index_ranges
+        ]
+    )
+
+
+def load_crosssection_table(
+    filepath: Pathlike,
+    table_shape: tuple[int, int, int],
+    wavelength_index_ranges: Sequence[tuple[int, int]] = None,
+    loadtxt_kwargs=dict(skiprows=1),
+) -> NDArray[np.floating]:
+    # Tables are returned in file order, i.e. ascending in pressure, temperature
+    # and wavelength, which matches the coordinates built from the header.
+    # Binary tables are returned as stored (see get_table_scale).
+    if has_binary_table(filepath):
+        # The binary store is memory-mapped, so only the pages holding
+        # the requested wavelength ranges are ever read from disk.
+        table = load_binary_table(filepath).reshape(table_shape)
+        if wavelength_index_ranges is None:
+            return table
+
+        return np.concatenate(
+            [
+                table[..., range_start:range_stop]
+                for range_start, range_stop in wavelength_index_ranges
+            ],
+            axis=-1,
+        )
+
+    if wavelength_index_ranges is not None:
+        loadtxt_kwargs = loadtxt_kwargs | dict(
+            usecols=get_wavelength_indices_from_ranges(wavelength_index_ranges)
+        )
+
+    return np.loadtxt(
+        Path(filepath).with_suffix(TEXT_TABLE_SUFFIX), ndmin=2, **loadtxt_kwargs
+    ).reshape(*table_shape[:-1], -1)
+
+
 def load_crosssections_into_array(
     number_of_pressure_layers: int,
     number_of_temperatures: int,
     number_of_spectral_elements: int,
     filepaths: dict[str, Pathlike],
     excluded_species: list[str] = None,
+    wavelength_index_ranges: Sequence[tuple[int, int]] = None,
 ):
-    def load_array(filepath, loadtxt_kwargs=dict(skiprows=1)):
-        return np.flip(np.loadtxt(filepath, **loadtxt_kwargs)).reshape(
-            number_of_pressure_layers,
-            number_of_temperatures,
-            number_of_spectral_elements,
-        )
+    if excluded_species is None:
+        excluded_species = []
+
+    table_shape = (
+        number_of_pressure_layers,
+        number_of_temperatures,
+        number_of_spectral_elements,
+    )
 
     return {
-        species: load_array(filepath)
+        species: load_crosssection_table(filepath, table_shape, wavelength_index_ranges)
         for species, filepath in filepaths.items()
         if species not in excluded_species
     }
 
 
+def load_crosssections_into_shared_array(
+    number_of_pressure_layers: int,
+    number_of_temperatures: int,
+    number_of_spectral_elements: int,
+    filepaths: dict[str, Pathlike],
+    excluded_species: list[str] = None,
+    wavelength_index_ranges: Sequence[tuple[int, int]] = None,
+    node_comm=None,
+    shared_memory_name: str = None,
+) -> tuple[tuple[str], SharedArray]:
+    """
+    Loads the tables into one (species, pressure, temperature, wavelength) array in
+    shared memory. Only the node leader (or this process, without MPI) reads the
+    files; see apollo.opacities.shared_memory.load_into_shared_memory.
+    """
+    if excluded_species is None:
+        excluded_species = []
+
+    table_shape = (
+        number_of_pressure_layers,
+        number_of_temperatures,
+        number_of_spectral_elements,
+    )
+    species_to_load = tuple(
+        species for species in filepaths if species not in excluded_species
+    )
+    number_of_loaded_spectral_elements = (
+        number_of_spectral_elements
+        if wavelength_index_ranges is None
+        else sum(stop - start for start, stop in wavelength_index_ranges)
+    )
+
+    def fill_array(shared_array: NDArray[np.float64]) -> None:
+        for species_index, species in enumerate(species_to_load):
+            shared_array[species_index] = decode_crosssections(
+                load_crosssection_table(
+                    filepaths[species], table_shape, wavelength_index_ranges
+                ),
+                get_table_scale(filepaths[species]),
+            )
+
+    shared_crosssections = load_into_shared_memory(
+        shape=(
+            len(species_to_load),
+            *table_shape[:-1],
+            number_of_loaded_spectral_elements,
+        ),
+        fill_array=fill_array,
+        node_comm=node_comm,
+        name=shared_memory_name,
+    )
+
+    return species_to_load, shared_crosssections
+
+
 def load_crosssections_into_dataset(
     pressures: NDArray[np.float64],
     temperatures: NDArray[np.float64],
     wavelengths: NDArray[np.float64],
     filepaths: dict[str, Pathlike],
     excluded_species: list[str] = None,
+    wavelength_index_ranges: Sequence[tuple[int, int]] = None,
 ):
+    """
+    If wavelength_index_ranges is given (see
+    get_wavelength_index_ranges_from_band_indices), only those parts of the
+    wavelength axis are loaded, and the wavelength coordinate is cut to match.
+    """
     if excluded_species is None:
         excluded_species = []
 
@@ -212,8 +548,14 @@ def load_crosssections_into_dataset(
         number_of_spectral_elements=len(wavelengths),
         filepaths=filepaths,
         excluded_species=excluded_species,
+        wavelength_index_ranges=wavelength_index_ranges,
     )
 
+    if wavelength_index_ranges is not None:
+        wavelengths = wavelengths[
+            get_wavelength_indices_from_ranges(wavelength_index_ranges)
+        ]
+
     DataArray_dict = {
         species: DataArray(
             crosssection_array,
@@ -222,8 +564,55 @@ def load_crosssections_into_dataset(
                 temperatures=temperatures,
                 wavelengths=wavelengths,
             ),
+            attrs={TABLE_SCALE_NOTE: get_table_scale(filepaths[species])},
         )
         for species, crosssection_array in crosssection_array_dict.items()
     }
 
     return Dataset(DataArray_dict)
+
+
+def load_crosssections_into_shared_dataset(
+    pressures: NDArray[np.float64],
+    temperatures: NDArray[np.float64],
+    wavelengths: NDArray[np.float64],
+    filepaths: dict[str, Pathlike],
+    excluded_species: list[str] = None,
+    wavelength_index_ranges: Sequence[tuple[int, int]] = None,
+    node_comm=None,
+    shared_memory_name: str = None,
+) -> tuple[Dataset, SharedArray]:
+    """
+    Like load_crosssections_into_dataset, but the data variables are views into
+    a node-wide shared-memory block. Keep the returned SharedArray alive for as
+    long as the dataset is used, and call its release() method when done.
+    """
+    species_loaded, shared_crosssections = load_crosssections_into_shared_array(
+        number_of_pressure_layers=len(pressures),
+        number_of_temperatures=len(temperatures),
+        number_of_spectral_elements=len(wavelengths),
+        filepaths=filepaths,
+        excluded_species=excluded_species,
+        wavelength_index_ranges=wavelength_index_ranges,
+        node_comm=node_comm,
+        shared_memory_name=shared_memory_name,
+    )
+
+    if wavelength_index_ranges is not None:
+        wavelengths = wavelengths[
+            get_wavelength_indices_from_ranges(wavelength_index_ranges)
+        ]
+
+    DataArray_dict = {
+        species: DataArray(
+            shared_crosssections.array[species_index],
+            coords=dict(
+                pressures=pressures,
+                temperatures=temperatures,
+                wavelengths=wavelengths,
+            ),
+        )
+        for species_index, species in enumerate(species_loaded)
+    }
+
+    return Dataset(DataArray_dict), shared_crosssections
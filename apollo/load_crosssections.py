@@ -3,10 +3,7 @@ from pathlib import Path
 
 from xarray import Dataset
 
-from apollo.crosssections import (
-    create_crosssection_catalog,
-    load_crosssections_into_dataset,
-)
+from apollo.crosssections import create_crosssection_catalog
 
 OPACITY_DIRECTORY = Path("/Volumes/ResearchStorage/Opacities_0v10")
 GAS_OPACITY_DIRECTORY = OPACITY_DIRECTORY / "gases"
@@ -21,9 +18,7 @@ def load_gas_opacity_data_into_dataset(
 ) -> Dataset:
     crosssection_catalog = create_crosssection_catalog(gas_opacity_directory)
 
-    crosssection_dataset = load_crosssections_into_dataset(
-        crosssection_catalog[opacity_name]
-    )
+    crosssection_dataset = crosssection_catalog[opacity_name].get_dataset()
 
     crosssection_dataset.wavelengths.attrs.update(dict(units=wavelength_units))
     crosssection_dataset.pressures.attrs.update(dict(units=pressure_units))
@@ -35,7 +35,9 @@ def prep_inputs_for_model(input_filepath: Pathlike) -> dict:
 
     processed_inputs: ProcessedInputs = ProcessInputs(**inputs)
 
-    planet: Planet = MakePlanet(processed_inputs.MakePlanet_kwargs)
+    planet: Planet = MakePlanet(
+        processed_inputs.MakePlanet_kwargs, processed_inputs.CPlanet_settings
+    )
 
     get_model: Callable = planet.MakeModel(
         processed_inputs.MakeModel_initialization_kwargs
@@ -0,0 +1,205 @@
+from io import TextIOWrapper
+from itertools import islice
+from pathlib import Path
+from typing import Final, Sequence
+
+import numpy as np
+from numpy.typing import NDArray
+
+from custom_types import Pathlike
+
+TEXT_TABLE_SUFFIX: Final[str] = ".dat"
+BINARY_TABLE_SUFFIX: Final[str] = ".npy"
+HEADER_SUFFIX: Final[str] = ".hdr"
+
+# Number of text lines parsed at a time when converting a table.
+DEFAULT_LINES_PER_CHUNK: Final[int] = 2048
+
+# Key of the .hdr line saying how stored values map to cross sections, e.g.
+# "scale log10" for tables holding log10 of the cross sections. Tables without
+# it hold the cross sections themselves.
+TABLE_SCALE_NOTE: Final[str] = "scale"
+LINEAR_SCALE: Final[str] = "linear"
+LOG10_SCALE: Final[str] = "log10"
+
+
+def get_binary_table_filepath(table_filepath: Pathlike) -> Path:
+    return Path(table_filepath).with_suffix(BINARY_TABLE_SUFFIX)
+
+
+def get_header_filepath(table_filepath: Pathlike) -> Path:
+    return Path(table_filepath).with_suffix(HEADER_SUFFIX)
+
+
+def has_binary_table(table_filepath: Pathlike) -> bool:
+    return (
+        get_binary_table_filepath(table_filepath).is_file()
+        and get_header_filepath(table_filepath).is_file()
+    )
+
+
+def get_table_header_filepath(
+    opacity_directory: Pathlike, species: str, catalog_name: str
+) -> Path:
+    """
+    Returns the file whose first line holds the APOLLO-style header for a table,
+    preferring the binary store's sidecar over the original text table.
+    """
+    table_filepath = Path(opacity_directory) / "gases" / f"{species}.{catalog_name}.dat"
+    header_filepath = get_header_filepath(table_filepath)
+
+    return header_filepath if header_filepath.is_file() else table_filepath
+
+
+def read_header_line(filepath: Pathlike) -> str:
+    with open(filepath, "r") as file:
+        return file.readline().strip()
+
+
+def read_header_values(filepath: Pathlike) -> tuple[float | int]:
+    return tuple(
+        float(entry) if "." in entry else int(entry)
+        for entry in read_header_line(filepath).split()
+    )
+
+
+def read_header_notes(table_filepath: Pathlike) -> dict[str, list[str]]:
+    # Only the binary store's sidecar carries notes; text tables never do.
+    header_filepath = get_header_filepath(table_filepath)
+    if not header_filepath.is_file():
+        return {}
+
+    with open(header_filepath, "r") as file:
+        note_lines = [line.split() for line in file.readlines()[1:]]
+
+    return {key: values for key, *values in filter(None, note_lines)}
+
+
+def get_table_scale(table_filepath: Pathlike) -> str:
+    return read_header_notes(table_filepath).get(TABLE_SCALE_NOTE, [LINEAR_SCALE])[0]
+
+
+def decode_crosssections(
+    stored_values: NDArray[np.floating], scale: str = LINEAR_SCALE
+) -> NDArray[np.float64]:
+    # Stored values of any precision or scale, as float64 cross sections.
+    if scale == LOG10_SCALE:
+        return np.power(10.0, stored_values, dtype=np.float64)
+
+    return np.asarray(stored_values, dtype=np.float64)
+
+
+def read_text_values_in_chunks(
+    file: TextIOWrapper, lines_per_chunk: int = DEFAULT_LINES_PER_CHUNK
+):
+    # The C++ reader treats the table as a stream of whitespace-separated values,
+    # so the line structure of the file is not relied on here either.
+    while lines := list(islice(file, lines_per_chunk)):
+        yield np.fromstring("".join(lines), sep=" ")
+
+
+def get_partial_binary_table_filepath(table_filepath: Pathlike) -> Path:
+    return get_binary_table_filepath(table_filepath).with_suffix(".partial.npy")
+
+
+def open_partial_binary_table(
+    table_filepath: Pathlike,
+    table_shape: tuple[int, int, int],
+    dtype: np.dtype = np.float64,
+) -> np.memmap:
+    # Tables are written under a temporary name so an interrupted write is never
+    # mistaken for a finished table; see finish_binary_table.
+    return np.lib.format.open_memmap(
+        get_partial_binary_table_filepath(table_filepath),
+        mode="w+",
+        dtype=dtype,
+        shape=table_shape,
+    )
+
+
+def finish_binary_table(
+    table_filepath: Pathlike,
+    header_line: str,
+    header_notes: dict[str, Sequence[str]] = None,
+) -> Path:
+    # Notes go on the lines after the header, which the table readers never look
+    # past (see read_header_notes).
+    if header_notes is None:
+        header_notes = {}
+
+    binary_filepath = get_binary_table_filepath(table_filepath)
+    get_partial_binary_table_filepath(table_filepath).replace(binary_filepath)
+    get_header_filepath(table_filepath).write_text(
+        "".join(
+            f"{line}\n"
+            for line in (
+                header_line,
+                *(" ".join([key, *values]) for key, values in header_notes.items()),
+            )
+        )
+    )
+
+    return binary_filepath
+
+
+def convert_text_table_to_binary(
+    table_filepath: Pathlike,
+    lines_per_chunk: int = DEFAULT_LINES_PER_CHUNK,
+    overwrite: bool = False,
+) -> Path:
+    """
+    Writes a text table as a (pressure, temperature, wavelength) float64 .npy file,
+    in the same order as the text, plus a .hdr sidecar holding the original header.
+    """
+    table_filepath = Path(table_filepath)
+    binary_filepath = get_binary_table_filepath(table_filepath)
+
+    if has_binary_table(table_filepath) and not overwrite:
+        return binary_filepath
+
+    with open(table_filepath, "r") as table_file:
+        header_line = table_file.readline().strip()
+        header_values = header_line.split()
+        table_shape = (
+            int(header_values[0]),
+            int(header_values[3]),
+            int(header_values[6]),
+        )
+
+        binary_table = open_partial_binary_table(table_filepath, table_shape)
+        flat_table = binary_table.reshape(-1)
+
+        number_of_values_written = 0
+        for values in read_text_values_in_chunks(table_file, lines_per_chunk):
+            number_of_values_to_write = min(
+                len(values), flat_table.size - number_of_values_written
+            )
+            flat_table[
+                number_of_values_written : number_of_values_written
+                + number_of_values_to_write
+            ] = values[:number_of_values_to_write]
+            number_of_values_written += number_of_values_to_write
+
+        binary_table.flush()
+        del flat_table, binary_table
+
+    if number_of_values_written != np.prod(table_shape):
+        get_partial_binary_table_filepath(table_filepath).unlink()
+        raise ValueError(
+            f"{table_filepath} holds {number_of_values_written} values, "
+            + f"but its header implies {np.prod(table_shape)}."
+        )
+
+    finish_binary_table(table_filepath, header_line)
+
+    return binary_filepath
+
+
+def load_binary_table(
+    table_filepath: Pathlike, memory_map: bool = True
+) -> NDArray[np.floating]:
+    # Values as stored, which may be float32 or log10; see decode_crosssections.
+    return np.load(
+        get_binary_table_filepath(table_filepath),
+        mmap_mode="r" if memory_map else None,
+    )
@@ -0,0 +1,114 @@
+"""
+A persistent index of the cross-section tables in a directory.
+
+Building a catalog means reading the header of every table, which is slow on network
+storage with hundreds of tables. The index keeps each file's header, species, set name,
+size and modification time in <directory>/.crosssection_index.json, so that only files
+that are new or have changed since the index was written are opened again.
+"""
+
+import os
+from pathlib import Path
+from typing import Final, Sequence
+from warnings import warn
+
+import msgspec
+
+from apollo.opacities.binary_store import read_header_values
+from custom_types import Pathlike
+
+CATALOG_INDEX_FILENAME: Final[str] = ".crosssection_index.json"
+
+# Bump when the layout of the index changes; older indices are then rebuilt.
+CATALOG_INDEX_VERSION: Final[int] = 1
+
+
+class IndexedTableFile(msgspec.Struct):
+    species: str
+    set_name: str
+    size: int
+    mtime_ns: int
+    header: tuple[int | float, ...]
+
+
+class CatalogIndex(msgspec.Struct):
+    version: int = CATALOG_INDEX_VERSION
+    files: dict[str, IndexedTableFile] = {}
+
+
+def get_catalog_index_filepath(file_directory: Pathlike) -> Path:
+    return Path(file_directory) / CATALOG_INDEX_FILENAME
+
+
+def read_catalog_index(file_directory: Pathlike) -> CatalogIndex:
+    index_filepath = get_catalog_index_filepath(file_directory)
+
+    try:
+        catalog_index = msgspec.json.decode(
+            index_filepath.read_bytes(), type=CatalogIndex
+        )
+    except (OSError, msgspec.DecodeError, msgspec.ValidationError):
+        return CatalogIndex()
+
+    return (
+        catalog_index
+        if catalog_index.version == CATALOG_INDEX_VERSION
+        else CatalogIndex()
+    )
+
+
+def write_catalog_index(file_directory: Pathlike, catalog_index: CatalogIndex) -> None:
+    index_filepath = get_catalog_index_filepath(file_directory)
+    temporary_filepath = index_filepath.with_name(
+        f"{index_filepath.name}.{os.getpid()}.tmp"
+    )
+
+    # Shared opacity directories may be read-only; the index is only a speed-up.
+    try:
+        temporary_filepath.write_bytes(msgspec.json.encode(catalog_index))
+        os.replace(temporary_filepath, index_filepath)
+    except OSError as error:
+        warn(f"Could not write the cross-section index {index_filepath}: {error}")
+
+
+def index_table_file(filepath: Path) -> IndexedTableFile:
+    file_stat = filepath.stat()
+    species, set_name, _ = filepath.name.split(".")
+
+    return IndexedTableFile(
+        species=species,
+        set_name=set_name,
+        size=file_stat.st_size,
+        mtime_ns=file_stat.st_mtime_ns,
+        header=read_header_values(filepath),
+    )
+
+
+def update_catalog_index(
+    file_directory: Pathlike, filepaths: Sequence[Path]
+) -> CatalogIndex:
+    """
+    Returns the index for these files, re-reading only those whose size or
+    modification time differ from what the index holds. Files no longer in
+    the list are dropped, and the index is rewritten if anything changed.
+    """
+    catalog_index = read_catalog_index(file_directory)
+
+    updated_files = {}
+    for filepath in map(Path, filepaths):
+        indexed_file = catalog_index.files.get(filepath.name)
+        file_stat = filepath.stat()
+
+        if indexed_file is None or (indexed_file.size, indexed_file.mtime_ns) != (
+            file_stat.st_size,
+            file_stat.st_mtime_ns,
+        ):
+            indexed_file = index_table_file(filepath)
+
+        updated_files[filepath.name] = indexed_file
+
+    if updated_files != catalog_index.files:
+        catalog_index = CatalogIndex(files=updated_files)
+        write_catalog_index(file_directory, catalog_index)
+
+    return catalog_index
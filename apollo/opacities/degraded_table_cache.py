@@ -0,0 +1,463 @@
+"""
+Cache of degraded (down-sampled), band-limited opacity tables.
+
+Planet::readopac averages every `degrade` consecutive wavelength points of a table,
+keeping only the rows that the model wavelengths fall in. When the cache directory
+exists (<opacdir>/gases/degraded, or $APOLLO_DEGRADED_CACHE), the C++ core stores that
+result as <species>.<catalog>.<key>.npy and reads it back directly on later runs.
+The key is a 64-bit FNV-1a hash of the species, catalog, degrade factor, stored rows,
+element type of the in-memory tables (float32 if the core was built with
+APOLLO_FLOAT32_TABLES, whose averages round differently), and the size and
+modification time of the source table; this module computes the same key, so it can
+pre-warm the cache before a batch of retrievals and evict entries whose source tables
+have changed.
+
+Usage:
+    python -m apollo.opacities.degraded_table_cache warm <APOLLO input file> [--table-dtype float32]
+    python -m apollo.opacities.degraded_table_cache evict <opacity directory> [--older-than DAYS]
+"""
+
+import json
+import os
+from argparse import ArgumentParser, Namespace
+from dataclasses import dataclass
+from pathlib import Path
+from time import time
+from typing import Final, Sequence
+
+import numpy as np
+from numpy.typing import DTypeLike, NDArray
+
+from apollo.opacities.binary_store import (
+    decode_crosssections,
+    get_binary_table_filepath,
+    get_header_filepath,
+    get_table_scale,
+    has_binary_table,
+    load_binary_table,
+    read_header_values,
+)
+from custom_types import Pathlike
+
+CACHE_DIRECTORY_ENVIRONMENT_VARIABLE: Final[str] = "APOLLO_DEGRADED_CACHE"
+
+MINIMUM_OPACITY: Final[float] = 1e-50
+
+FNV_OFFSET_BASIS: Final[int] = 14695981039346656037
+FNV_PRIME: Final[int] = 1099511628211
+
+
+@dataclass
+class CacheKey:
+    species: str
+    catalog_name: str
+    degrade: int
+    number_of_spectral_elements: int
+    table_dtype: str
+    rows: str
+    source_size: int
+    source_mtime: int
+
+    @property
+    def text(self) -> str:
+        return (
+            f"{self.species}.{self.catalog_name}"
+            + f"|degrade={self.degrade}"
+            + f"|nwave={self.number_of_spectral_elements}"
+            + f"|dtype={self.table_dtype}"
+            + f"|rows={self.rows}"
+            + f"|size={self.source_size}"
+            + f"|mtime={self.source_mtime}"
+        )
+
+    @property
+    def digest(self) -> str:
+        return f"{fnv1a64(self.text):016x}"
+
+    @property
+    def filename(self) -> str:
+        return f"{self.species}.{self.catalog_name}.{self.digest}.npy"
+
+    @classmethod
+    def from_text(cls, key_text: str) -> "CacheKey":
+        table_name, *fields = key_text.split("|")
+        species, catalog_name = table_name.rsplit(".", 1)
+        values = dict(field.split("=", 1) for field in fields)
+
+        return cls(
+            species=species,
+            catalog_name=catalog_name,
+            degrade=int(values["degrade"]),
+            number_of_spectral_elements=int(values["nwave"]),
+            table_dtype=values["dtype"],
+            rows=values["rows"],
+            source_size=int(values["size"]),
+            source_mtime=int(values["mtime"]),
+        )
+
+
+def fnv1a64(text: str) -> int:
+    hash_value = FNV_OFFSET_BASIS
+    for byte in text.encode("utf-8"):
+        hash_value = ((hash_value ^ byte) * FNV_PRIME) % 2**64
+
+    return hash_value
+
+
+def get_cache_directory(opacity_directory: Pathlike) -> Path:
+    return Path(
+        os.environ.get(
+            CACHE_DIRECTORY_ENVIRONMENT_VARIABLE,
+            Path(opacity_directory) / "gases" / "degraded",
+        )
+    )
+
+
+def get_source_filepath(opacity_directory: Pathlike, species: str, catalog_name: str):
+    # The file the C++ core reads the table from (see opacitySourceFile).
+    table_filepath = Path(opacity_directory) / "gases" / f"{species}.{catalog_name}.dat"
+
+    return (
+        get_binary_table_filepath(table_filepath)
+        if has_binary_table(table_filepath)
+        else table_filepath
+    )
+
+
+def get_degrade_factor(
+    model_wavelengths: NDArray[np.float64], effective_resolution: float
+) -> int:
+    # As in the Planet constructor.
+    return int(
+        np.round(
+            effective_resolution * np.log(model_wavelengths[1] / model_wavelengths[0])
+        )
+    )
+
+
+def get_stored_rows(
+    model_wavelengths: NDArray[np.float64],
+    minimum_wavelength: float,
+    effective_resolution: float,
+    degrade: int,
+    number_of_table_rows: int,
+) -> NDArray[np.int_]:
+    # The degraded table rows the C++ core keeps for a model wavelength grid.
+    row_indices = (
+        np.log(np.asarray(model_wavelengths) / minimum_wavelength)
+        * effective_resolution
+        / degrade
+        + 0.000001
+    ).astype(int)
+
+    return np.unique(np.clip(row_indices, 0, number_of_table_rows - 1))
+
+
+def format_row_ranges(rows: Sequence[int]) -> str:
+    # Inclusive runs of consecutive rows, e.g. "100-399,500-619",
+    # as in Planet::degradedCacheKey.
+    row_set = set(int(row) for row in rows)
+    sorted_rows = sorted(row_set)
+    run_starts = [row for row in sorted_rows if row - 1 not in row_set]
+    run_ends = [row for row in sorted_rows if row + 1 not in row_set]
+
+    return ",".join(f"{start}-{end}" for start, end in zip(run_starts, run_ends))
+
+
+def make_cache_key(
+    species: str,
+    catalog_name: str,
+    degrade: int,
+    number_of_spectral_elements: int,
+    rows: Sequence[int],
+    source_filepath: Pathlike,
+    table_dtype: DTypeLike = np.float64,
+) -> CacheKey:
+    source_stat = os.stat(source_filepath)
+
+    return CacheKey(
+        species=species,
+        catalog_name=catalog_name,
+        degrade=degrade,
+        number_of_spectral_elements=number_of_spectral_elements,
+        table_dtype=np.dtype(table_dtype).name,
+        rows=format_row_ranges(rows),
+        source_size=source_stat.st_size,
+        source_mtime=int(source_stat.st_mtime),
+    )
+
+
+def build_degraded_table(
+    source_filepath: Pathlike,
+    table_shape: tuple[int, int, int],
+    degrade: int,
+    rows: NDArray[np.int_],
+    table_dtype: DTypeLike = np.float64,
+) -> NDArray[np.floating]:
+    """
+    Averages `degrade` consecutive wavelength points into each stored row, clipping
+    values below 1e-50 (and nans/infs) first, with the same operations in the same
+    order as Planet::readopac so that the result is bit-identical. Each sum is
+    rounded to table_dtype, as it is in a core built with that table type.
+    """
+    source_filepath = Path(source_filepath)
+    if source_filepath.suffix == ".npy":
+        table = load_binary_table(source_filepath).reshape(table_shape)
+    else:
+        table = np.loadtxt(source_filepath, skiprows=1).reshape(table_shape)
+    table_scale = get_table_scale(source_filepath)
+
+    number_of_spectral_elements = table_shape[-1]
+    degraded_table = np.zeros((*table_shape[:-1], len(rows)), dtype=table_dtype)
+    for offset in range(degrade):
+        columns = rows * degrade + offset
+        in_table = columns < number_of_spectral_elements
+
+        values = np.array(
+            decode_crosssections(table[..., columns[in_table]], table_scale)
+        )
+        values[~(values >= MINIMUM_OPACITY) | np.isinf(values)] = MINIMUM_OPACITY
+        degraded_table[..., in_table] += values / degrade
+
+    return degraded_table
+
+
+def write_cache_entry(
+    cache_directory: Pathlike,
+    key: CacheKey,
+    degraded_table: NDArray[np.floating],
+    source_filepath: Pathlike,
+) -> Path:
+    cache_directory = Path(cache_directory)
+    entry_filepath = cache_directory / key.filename
+
+    entry_filepath.with_suffix(".json").write_text(
+        json.dumps(dict(key=key.text, source=str(Path(source_filepath).resolve())))
+        + "\n"
+    )
+
+    # Write under a temporary name and rename, so that ranks reading the cache
+    # never see a partial file. Entries are always stored as float64, as the core
+    # writes them.
+    temporary_filepath = entry_filepath.with_name(
+        f"{entry_filepath.name}.{os.getpid()}.tmp"
+    )
+    with open(temporary_filepath, "wb") as file:
+        np.save(file, np.ascontiguousarray(degraded_table, dtype=np.float64))
+    os.replace(temporary_filepath, entry_filepath)
+
+    return entry_filepath
+
+
+def warm_degraded_table_cache(
+    opacity_directory: Pathlike,
+    catalog_name: str,
+    list_of_species: Sequence[str],
+    model_wavelengths: NDArray[np.float64],
+    table_dtype: DTypeLike = np.float64,
+) -> list[Path]:
+    """
+    Writes the cache entries that a Planet built with these model wavelengths would
+    look for. Entries that already exist are left alone. The table_dtype must match
+    the core's build (PyPlanet.table_dtype).
+    """
+    cache_directory = get_cache_directory(opacity_directory)
+    cache_directory.mkdir(parents=True, exist_ok=True)
+
+    entry_filepaths = []
+    for species in list_of_species:
+        source_filepath = get_source_filepath(opacity_directory, species, catalog_name)
+        if not source_filepath.is_file():
+            print(f"No table for {species}.{catalog_name}; skipping.")
+            continue
+
+        header = read_header_values(
+            get_header_filepath(source_filepath)
+            if source_filepath.suffix == ".npy"
+            else source_filepath
+        )
+        (
+            number_of_pressures,
+            _,
+            _,
+            number_of_temperatures,
+            _,
+            _,
+            number_of_spectral_elements,
+            minimum_wavelength,
+            _,
+            effective_resolution,
+        ) = header
+
+        degrade = get_degrade_factor(model_wavelengths, effective_resolution)
+        number_of_table_rows = int(np.ceil(number_of_spectral_elements / degrade))
+        rows = get_stored_rows(
+            model_wavelengths,
+            minimum_wavelength,
+            effective_resolution,
+            degrade,
+            number_of_table_rows,
+        )
+
+        key = make_cache_key(
+            species,
+            catalog_name,
+            degrade,
+            number_of_spectral_elements,
+            rows,
+            source_filepath,
+            table_dtype,
+        )
+        entry_filepath = cache_directory / key.filename
+        if not entry_filepath.is_file():
+            degraded_table = build_degraded_table(
+                source_filepath,
+                (
+                    number_of_pressures,
+                    number_of_temperatures,
+                    number_of_spectral_elements,
+                ),
+                degrade,
+                rows,
+                table_dtype,
+            )
+            write_cache_entry(cache_directory, key, degraded_table, source_filepath)
+            print(f"Cached {entry_filepath.name}")
+
+        entry_filepaths.append(entry_filepath)
+
+    return entry_filepaths
+
+
+def is_stale(metadata_filepath: Path) -> bool:
+    metadata = json.loads(metadata_filepath.read_text())
+    try:
+        key = CacheKey.from_text(metadata["key"])
+    except KeyError:
+        # Written with an older form of the key, so it can never be read again.
+        return True
+    source_filepath = Path(metadata["source"])
+
+    if not source_filepath.is_file():
+        return True
+
+    source_stat = os.stat(source_filepath)
+    return (source_stat.st_size, int(source_stat.st_mtime)) != (
+        key.source_size,
+        key.source_mtime,
+    )
+
+
+def evict_stale_entries(
+    cache_directory: Pathlike, older_than_days: float = None
+) -> list[Path]:
+    """
+    Removes entries whose source table has changed or gone, entries without
+    metadata, leftover temporary files, and (optionally) entries not read
+    within the given number of days.
+    """
+    cache_directory = Path(cache_directory)
+    evicted_filepaths = []
+
+    for temporary_filepath in cache_directory.glob("*.tmp"):
+        temporary_filepath.unlink()
+        evicted_filepaths.append(temporary_filepath)
+
+    for entry_filepath in cache_directory.glob("*.npy"):
+        metadata_filepath = entry_filepath.with_suffix(".json")
+
+        expired = older_than_days is not None and (
+            time() - entry_filepath.stat().st_atime > older_than_days * 86400
+        )
+        if not metadata_filepath.is_file() or expired or is_stale(metadata_filepath):
+            entry_filepath.unlink()
+            metadata_filepath.unlink(missing_ok=True)
+            evicted_filepaths.append(entry_filepath)
+
+    for metadata_filepath in cache_directory.glob("*.json"):
+        if not metadata_filepath.with_suffix(".npy").is_file():
+            metadata_filepath.unlink()
+
+    return evicted_filepaths
+
+
+def read_command_line_arguments() -> Namespace:
+    parser: ArgumentParser = ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    warm_parser = subparsers.add_parser(
+        "warm", help="Pre-compute the cache entries for an APOLLO input file."
+    )
+    warm_parser.add_argument("input_file", type=Path)
+    warm_parser.add_argument("--minDL", type=float, default=0.0)
+    warm_parser.add_argument("--maxDL", type=float, default=0.0)
+    warm_parser.add_argument(
+        "--table-dtype",
+        choices=("float64", "float32"),
+        default="float64",
+        help="float32 for a core built with APOLLO_FLOAT32_TABLES.",
+    )
+
+    evict_parser = subparsers.add_parser(
+        "evict", help="Remove stale entries from an opacity directory's cache."
+    )
+    evict_parser.add_argument("opacity_directory", type=Path)
+    evict_parser.add_argument("--older-than", type=float, default=None)
+
+    return parser.parse_args()
+
+
+def warm_cache_from_input_file(
+    input_file: Pathlike,
+    minDL: float = 0.0,
+    maxDL: float = 0.0,
+    table_dtype: DTypeLike = np.float64,
+) -> list[Path]:
+    # The full input-file machinery is only needed for this command.
+    from apollo.Apollo_ProcessInputs import (
+        set_model_wavelengths_from_opacity_tables_and_data,
+    )
+    from apollo.Apollo_ReadInputsfromFile import read_inputs_from_file
+
+    readin_specs = read_inputs_from_file(input_file)
+    opacity_parameters = readin_specs["settings"]["opacity_parameters"]
+    _, _, model_wavelengths = set_model_wavelengths_from_opacity_tables_and_data(
+        data_parameters=readin_specs["settings"]["data_parameters"],
+        opacity_parameters=opacity_parameters,
+        minDL=minDL,
+        maxDL=maxDL,
+    )
+    list_of_gas_species = readin_specs["parameters"]["gas_readin_parameters"].gases
+
+    return warm_degraded_table_cache(
+        opacity_directory=opacity_parameters.opacdir,
+        catalog_name=opacity_parameters.hires,
+        # H- is only read from a table if one has been written (see hminus_table.py).
+        list_of_species=[
+            species
+            for species in list_of_gas_species
+            if species != "h-"
+            or has_binary_table(
+                get_source_filepath(
+                    opacity_parameters.opacdir, species, opacity_parameters.hires
+                )
+            )
+        ],
+        model_wavelengths=model_wavelengths,
+        table_dtype=table_dtype,
+    )
+
+
+if __name__ == "__main__":
+    args: Namespace = read_command_line_arguments()
+
+    if args.command == "warm":
+        warm_cache_from_input_file(
+            args.input_file, args.minDL, args.maxDL, args.table_dtype
+        )
+
+    elif args.command == "evict":
+        evicted_filepaths = evict_stale_entries(
+            get_cache_directory(args.opacity_directory), args.older_than
+        )
+        print(f"Evicted {len(evicted_filepaths)} file(s).")
@@ -0,0 +1,253 @@
+"""
+Precomputed H- continuum tables.
+
+Planet::readopac computes the H- bound-free and free-free cross sections point by point
+whenever "h-" is in the gas list, for both the hires and lores tables, on every
+startup and every rank. The result depends only on temperature and wavelength, so this
+computes it once per catalog, with the same operations in the same order as
+Planet::HminBoundFree and Planet::HminFreeFree, and writes it into the binary store as
+an ordinary table, gases/h-.<catalog>.npy (with its .hdr). The C++ core then loads it
+like any other species, through the degraded-table cache if one is set up, and falls
+back to computing it if the table is missing.
+
+Usage:
+    python -m apollo.opacities.hminus_table <opacity directory> <catalog> [<catalog> ...]
+"""
+
+import math
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
+from typing import Final
+
+import numpy as np
+from numpy.typing import NDArray
+
+from apollo.crosssections import CrossSectionTableHeader, create_crosssection_catalog
+from apollo.opacities.binary_store import (
+    finish_binary_table,
+    has_binary_table,
+    open_partial_binary_table,
+    read_header_line,
+)
+from custom_types import Pathlike
+
+HMINUS_SPECIES_NAME: Final[str] = "h-"
+
+BOLTZMANN_CONSTANT: Final[float] = 1.38064852e-16  # in CGS, as in constants.cpp
+
+MINIMUM_OPACITY: Final[float] = 1e-50
+
+# Photodetachment threshold of H-, in microns.
+HMINUS_BOUND_FREE_THRESHOLD: Final[float] = 1.6419
+
+# Coefficients of the bound-free fit, in the order of the Horner scheme.
+HMINUS_BOUND_FREE_COEFFICIENTS: Final[tuple[float]] = (
+    152.519,
+    49.534,
+    -118.858,
+    92.536,
+    -34.194,
+    4.982,
+)
+
+# Free-free fit coefficients (rows a-f, one column per power of 5040/T), for
+# wavelengths above HMINUS_FREE_FREE_LONG_WAVELENGTH and below
+# HMINUS_FREE_FREE_SHORT_WAVELENGTH respectively; zero in between.
+HMINUS_FREE_FREE_LONG_COEFFICIENTS: Final[NDArray[np.float64]] = np.array(
+    [
+        [0.0, 2483.346, -3449.889, 2200.040, -696.271, 88.283],
+        [0.0, 285.827, -1158.382, 2427.719, -1841.400, 444.517],
+        [0.0, -2054.291, 8746.523, -13651.105, 8624.970, -1863.864],
+        [0.0, 2827.776, -11485.632, 16755.524, -10051.530, 2095.288],
+        [0.0, -1341.537, 5303.609, -7510.494, 4400.067, -901.788],
+        [0.0, 208.952, -812.939, 1132.738, -655.020, 132.985],
+    ]
+)
+HMINUS_FREE_FREE_SHORT_COEFFICIENTS: Final[NDArray[np.float64]] = np.array(
+    [
+        [518.1021, 473.2636, -482.2089, 115.5291, 0.0, 0.0],
+        [-734.8666, 1443.4137, -737.1616, 169.6374, 0.0, 0.0],
+        [1021.1775, -1977.3395, 1096.8827, -245.6490, 0.0, 0.0],
+        [-479.0721, 922.3575, -521.1341, 114.2430, 0.0, 0.0],
+        [93.1373, -178.9275, 101.7963, -21.9972, 0.0, 0.0],
+        [-6.4285, 12.3600, -7.0571, 1.5097, 0.0, 0.0],
+    ]
+)
+HMINUS_FREE_FREE_LONG_WAVELENGTH: Final[float] = 0.3645
+HMINUS_FREE_FREE_SHORT_WAVELENGTH: Final[float] = 0.1823
+
+# The free-free fit is only used from 800 K and out to 20 microns.
+HMINUS_FREE_FREE_MINIMUM_TEMPERATURE: Final[float] = 800.0
+HMINUS_FREE_FREE_MAXIMUM_WAVELENGTH: Final[float] = 20.0
+
+
+def calculate_libm_powers(
+    bases: NDArray[np.float64], exponent: float
+) -> NDArray[np.float64]:
+    # NumPy's vectorized pow and exp can differ from the C library's in the last bit,
+    # so the one-dimensional factors are computed with the functions the C++ core uses.
+    return np.fromiter(
+        (math.pow(base, exponent) for base in np.ravel(bases)),
+        dtype=np.float64,
+        count=np.size(bases),
+    ).reshape(np.shape(bases))
+
+
+def get_table_temperatures(
+    table_header: CrossSectionTableHeader,
+) -> NDArray[np.float64]:
+    # As computed in Planet::readopac, so that the values match bit for bit.
+    minimum_temperature = math.pow(10, table_header.minimum_log_temperature)
+    maximum_temperature = math.pow(10, table_header.maximum_log_temperature)
+    deltalogt = (table_header.number_of_temperatures - 1) / math.log10(
+        maximum_temperature / minimum_temperature
+    )
+
+    return np.array(
+        [
+            minimum_temperature * math.pow(10, k / deltalogt)
+            for k in range(table_header.number_of_temperatures)
+        ]
+    )
+
+
+def get_table_wavelengths(table_header: CrossSectionTableHeader) -> NDArray[np.float64]:
+    return np.array(
+        [
+            table_header.minimum_wavelength
+            * math.exp(wavelength_index / table_header.effective_resolution)
+            for wavelength_index in range(table_header.number_of_spectral_elements)
+        ]
+    )
+
+
+def calculate_hminus_bound_free_crosssections(
+    wavelengths_in_microns: NDArray[np.float64],
+) -> NDArray[np.float64]:
+    wavelengths_in_microns = np.asarray(wavelengths_in_microns, dtype=np.float64)
+    below_threshold = wavelengths_in_microns < HMINUS_BOUND_FREE_THRESHOLD
+
+    wavelengths = wavelengths_in_microns[below_threshold]
+    x = np.sqrt(1.0 / wavelengths - 1.0 / HMINUS_BOUND_FREE_THRESHOLD)
+    f = np.zeros_like(x)
+    for coefficient in HMINUS_BOUND_FREE_COEFFICIENTS:
+        f *= x
+        f += coefficient
+
+    crosssections = np.zeros_like(wavelengths_in_microns)
+    crosssections[below_threshold] = (
+        calculate_libm_powers(wavelengths * x, 3) * f * 1.0e-18
+    )
+
+    return crosssections
+
+
+def calculate_hminus_free_free_fit_terms(
+    wavelengths_in_microns: NDArray[np.float64],
+) -> NDArray[np.float64]:
+    # The wavelength-dependent factors hj of Planet::HminFreeFree, shaped (6, wavelength).
+    al = np.asarray(wavelengths_in_microns, dtype=np.float64)
+    fit_terms = np.zeros((6, len(al)))
+
+    for wavelength_range, coefficients in (
+        (al > HMINUS_FREE_FREE_LONG_WAVELENGTH, HMINUS_FREE_FREE_LONG_COEFFICIENTS),
+        (al < HMINUS_FREE_FREE_SHORT_WAVELENGTH, HMINUS_FREE_FREE_SHORT_COEFFICIENTS),
+    ):
+        a, b, c, d, e, f = coefficients[..., np.newaxis]
+        wl = al[wavelength_range]
+        fit_terms[:, wavelength_range] = (
+            1.0e-29 * (wl * wl * a + b + (c + (d + (e + f) / wl) / wl) / wl) / wl
+        )
+
+    return fit_terms
+
+
+def calculate_hminus_free_free_crosssections(
+    temperatures_in_K: NDArray[np.float64],
+    wavelengths_in_microns: NDArray[np.float64],
+) -> NDArray[np.float64]:
+    # Shaped (temperature, wavelength).
+    temperatures = np.asarray(temperatures_in_K, dtype=np.float64)[:, np.newaxis]
+    wavelengths = np.asarray(wavelengths_in_microns, dtype=np.float64)
+    fit_terms = calculate_hminus_free_free_fit_terms(wavelengths)
+
+    tcoeff = 5040.0 / temperatures
+    crosssections = np.zeros((len(temperatures), len(wavelengths)))
+    for i, fit_term in enumerate(fit_terms):
+        crosssections += calculate_libm_powers(tcoeff, (i + 1.0) / 2.0) * fit_term
+    crosssections *= BOLTZMANN_CONSTANT * temperatures
+
+    crosssections[
+        (temperatures < HMINUS_FREE_FREE_MINIMUM_TEMPERATURE)
+        | (wavelengths > HMINUS_FREE_FREE_MAXIMUM_WAVELENGTH)
+    ] = 0.0
+
+    return crosssections
+
+
+def calculate_hminus_crosssections(
+    temperatures_in_K: NDArray[np.float64],
+    wavelengths_in_microns: NDArray[np.float64],
+) -> NDArray[np.float64]:
+    # Shaped (temperature, wavelength), clipped as in Planet::readopac.
+    crosssections = calculate_hminus_bound_free_crosssections(
+        wavelengths_in_microns
+    ) + calculate_hminus_free_free_crosssections(
+        temperatures_in_K, wavelengths_in_microns
+    )
+    crosssections[~(crosssections >= MINIMUM_OPACITY) | np.isinf(crosssections)] = (
+        MINIMUM_OPACITY
+    )
+
+    return crosssections
+
+
+def build_hminus_table(
+    opacity_directory: Pathlike, catalog_name: str, overwrite: bool = False
+) -> Path:
+    """
+    Writes gases/h-.<catalog>.npy on the catalog's own grid, taking the header from
+    its other tables. The values are the same at every pressure.
+    """
+    gas_directory = Path(opacity_directory) / "gases"
+    hminus_filepath = gas_directory / f"{HMINUS_SPECIES_NAME}.{catalog_name}.dat"
+    if has_binary_table(hminus_filepath) and not overwrite:
+        return hminus_filepath.with_suffix(".npy")
+
+    catalog = create_crosssection_catalog(gas_directory)[catalog_name]
+    reference_species = next(
+        species for species in catalog.list_of_species if species != HMINUS_SPECIES_NAME
+    )
+    table_header = catalog.table_header
+
+    hminus_crosssections = calculate_hminus_crosssections(
+        get_table_temperatures(table_header), get_table_wavelengths(table_header)
+    )
+
+    hminus_table = open_partial_binary_table(hminus_filepath, catalog.table_shape)
+    hminus_table[:] = hminus_crosssections
+    hminus_table.flush()
+    del hminus_table
+
+    return finish_binary_table(
+        hminus_filepath,
+        read_header_line(catalog.filepath_directory[reference_species]),
+    )
+
+
+def read_command_line_arguments() -> Namespace:
+    parser: ArgumentParser = ArgumentParser(description=__doc__)
+    parser.add_argument("opacity_directory", type=Path)
+    parser.add_argument("catalog_names", nargs="+", type=str)
+    parser.add_argument("--overwrite", action="store_true")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args: Namespace = read_command_line_arguments()
+
+    for catalog_name in args.catalog_names:
+        print(
+            f"Wrote {build_hminus_table(args.opacity_directory, catalog_name, args.overwrite)}"
+        )
@@ -0,0 +1,674 @@
+"""
+Reduced spectral grids for running the forward model on binned data.
+
+The hires table is split into bins of constant resolving power R (log-uniform, like
+the tables themselves), and each bin is replaced by G points, so the reduced table is
+an ordinary APOLLO table at resolution R*G that the C++ core loads unchanged:
+
+    ktable:  correlated-k. The cross sections in each bin are sorted, and each of G
+             equal-weight g-intervals gets the mean over its part of the sorted
+             distribution. This keeps the bin-mean cross section exactly, and the
+             points average back to the k-distribution when the model is binned.
+             Species are combined as if perfectly correlated within a bin.
+    sampled: opacity sampling. Each point takes the hires value it falls on.
+
+The reduced catalog is named e.g. "nir_ktable8R500" and written into the binary store
+(<species>.<catalog>.npy/.hdr) next to the source tables. To run on it, put its name
+in the "Tables" line of the input file, with "Degrade 1". Choose R at or above the
+resolving power of the data; the accuracy report compares the bin-mean transmission of
+the reduced and line-by-line tables, over the data bins if a data file is given.
+
+Usage:
+    python -m apollo.opacities.reduced_grid build <opacity directory> <catalog>
+        (--resolution R | --data <data file>) [--points G] [--method ktable|sampled]
+    python -m apollo.opacities.reduced_grid report <opacity directory> <catalog>
+        <reduced catalog> [--data <data file>]
+"""
+
+from argparse import ArgumentParser, Namespace
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Final, Sequence
+
+import numpy as np
+from numpy.typing import NDArray
+
+from apollo.crosssections import (
+    CrossSectionDirectory,
+    CrossSectionTableHeader,
+    create_crosssection_catalog,
+    load_crosssection_table,
+)
+from apollo.opacities.binary_store import (
+    decode_crosssections,
+    finish_binary_table,
+    get_table_scale,
+    has_binary_table,
+    open_partial_binary_table,
+    read_header_line,
+    read_header_notes,
+)
+from custom_types import Pathlike
+
+REDUCTION_METHODS: Final[tuple[str]] = ("ktable", "sampled")
+
+DEFAULT_POINTS_PER_BIN: Final[int] = 8
+
+# Bin-mean optical depths at which the accuracy report compares transmission.
+REPORT_OPTICAL_DEPTHS: Final[tuple[float]] = (0.1, 1.0, 10.0)
+
+MINIMUM_OPACITY: Final[float] = 1e-50
+
+# Key of the .hdr line recording how a reduced table was made:
+# reduced_grid <method> <source catalog> <R> <G>
+REDUCED_GRID_NOTE: Final[str] = "reduced_grid"
+
+
+@dataclass
+class ReducedGrid:
+    minimum_wavelength: float
+    effective_resolution: float
+    number_of_spectral_elements: int
+    bin_resolution: int
+    points_per_bin: int
+
+    @property
+    def number_of_bins(self) -> int:
+        return int(
+            np.ceil(
+                self.number_of_spectral_elements
+                * self.bin_resolution
+                / self.effective_resolution
+                - 1e-9
+            )
+        )
+
+    @property
+    def number_of_points(self) -> int:
+        return self.number_of_bins * self.points_per_bin
+
+    @property
+    def reduced_resolution(self) -> float:
+        return float(self.bin_resolution * self.points_per_bin)
+
+    @property
+    def source_bin_indices(self) -> NDArray[np.int_]:
+        # The bin each hires point falls in.
+        return (
+            np.arange(self.number_of_spectral_elements)
+            * self.bin_resolution
+            / self.effective_resolution
+            + 1e-9
+        ).astype(int)
+
+    @property
+    def log_positions(self) -> NDArray[np.float64]:
+        # ln(wavelength / minimum wavelength) of the reduced points, which start
+        # G equal steps across each bin. The first point is at the table minimum,
+        # so sampled points sit exactly on the hires points they take.
+        return np.arange(self.number_of_points) / self.reduced_resolution
+
+    @property
+    def wavelengths(self) -> NDArray[np.float64]:
+        return self.minimum_wavelength * np.exp(self.log_positions)
+
+
+def get_reduced_catalog_name(
+    catalog_name: str, method: str, bin_resolution: int, points_per_bin: int
+) -> str:
+    # Catalog names sit between the species and the suffix, so no dots.
+    return f"{catalog_name}_{method}{points_per_bin}R{bin_resolution}"
+
+
+def get_bin_resolution_from_data(data_filepath: Pathlike) -> int:
+    # The largest resolving power of the data bins (APOLLO data files
+    # start with the lower and upper bin edges in microns).
+    wavelo, wavehi = np.loadtxt(data_filepath, usecols=(0, 1), ndmin=2).T
+
+    return int(np.ceil(np.max(0.5 * (wavelo + wavehi) / (wavehi - wavelo))))
+
+
+def format_reduced_header_line(source_header_line: str, reduced_grid: ReducedGrid):
+    # The pressure, temperature and minimum wavelength entries are kept
+    # exactly as in the source.
+    source_header_entries = source_header_line.split()
+
+    return " ".join(
+        [
+            *source_header_entries[:6],
+            f"{reduced_grid.number_of_points}",
+            source_header_entries[7],
+            f"{reduced_grid.wavelengths[-1]:.8f}",
+            f"{reduced_grid.reduced_resolution:.2f}",
+        ]
+    )
+
+
+def clip_crosssections(crosssections: NDArray[np.float64]) -> NDArray[np.float64]:
+    # As Planet::readopac does on reading.
+    crosssections = np.array(crosssections, dtype=np.float64)
+    crosssections[~(crosssections >= MINIMUM_OPACITY) | np.isinf(crosssections)] = (
+        MINIMUM_OPACITY
+    )
+
+    return crosssections
+
+
+def calculate_k_distribution_means(
+    crosssections_in_bin: NDArray[np.float64], points_per_bin: int
+) -> NDArray[np.float64]:
+    """
+    Takes cross sections shaped (..., number of points in the bin) and returns
+    (..., points_per_bin) means over equal-weight intervals of the sorted
+    distribution. Intervals may split a point, so any number of points works.
+    """
+    sorted_crosssections = np.sort(crosssections_in_bin, axis=-1)
+    number_of_points_in_bin = sorted_crosssections.shape[-1]
+
+    cumulative_crosssections = np.concatenate(
+        [
+            np.zeros((*sorted_crosssections.shape[:-1], 1)),
+            np.cumsum(sorted_crosssections, axis=-1),
+        ],
+        axis=-1,
+    )
+
+    # The cumulative sum is piecewise linear between points.
+    interval_edges = number_of_points_in_bin * np.linspace(0, 1, points_per_bin + 1)
+    edge_indices = np.minimum(interval_edges.astype(int), number_of_points_in_bin - 1)
+    edge_fractions = interval_edges - edge_indices
+    cumulative_at_edges = (
+        cumulative_crosssections[..., edge_indices]
+        + edge_fractions * sorted_crosssections[..., edge_indices]
+    )
+
+    return (
+        np.diff(cumulative_at_edges, axis=-1) * points_per_bin / number_of_points_in_bin
+    )
+
+
+def reduce_crosssections(
+    crosssections: NDArray[np.float64], reduced_grid: ReducedGrid, method: str
+) -> NDArray[np.float64]:
+    # (..., hires wavelength) -> (..., reduced wavelength)
+    crosssections = clip_crosssections(crosssections)
+
+    if method == "sampled":
+        source_indices = (
+            reduced_grid.log_positions * reduced_grid.effective_resolution + 1e-6
+        ).astype(int)
+
+        return crosssections[
+            ...,
+            np.minimum(source_indices, reduced_grid.number_of_spectral_elements - 1),
+        ]
+
+    elif method == "ktable":
+        reduced_crosssections = np.empty(
+            (*crosssections.shape[:-1], reduced_grid.number_of_points)
+        )
+        bin_indices = reduced_grid.source_bin_indices
+        bin_starts = np.searchsorted(
+            bin_indices, np.arange(reduced_grid.number_of_bins)
+        )
+        bin_sizes = np.bincount(bin_indices, minlength=reduced_grid.number_of_bins)
+
+        # Bins holding the same number of points are reduced together.
+        for bin_size in np.unique(bin_sizes):
+            bins = np.flatnonzero(bin_sizes == bin_size)
+            source_indices = bin_starts[bins, np.newaxis] + np.arange(bin_size)
+            reduced_indices = bins[
+                :, np.newaxis
+            ] * reduced_grid.points_per_bin + np.arange(reduced_grid.points_per_bin)
+            reduced_crosssections[..., reduced_indices] = (
+                calculate_k_distribution_means(
+                    crosssections[..., source_indices], reduced_grid.points_per_bin
+                )
+            )
+
+        return reduced_crosssections
+
+    else:
+        raise ValueError(
+            f"Unknown reduction method {method}; choose from {REDUCTION_METHODS}."
+        )
+
+
+def get_reduced_grid_for_header(
+    header: CrossSectionTableHeader, bin_resolution: int, points_per_bin: int
+) -> ReducedGrid:
+    reduced_grid = ReducedGrid(
+        minimum_wavelength=header.minimum_wavelength,
+        effective_resolution=header.effective_resolution,
+        number_of_spectral_elements=header.number_of_spectral_elements,
+        bin_resolution=bin_resolution,
+        points_per_bin=points_per_bin,
+    )
+
+    if points_per_bin > header.effective_resolution / bin_resolution:
+        raise ValueError(
+            f"{points_per_bin} points per bin at R={bin_resolution} would be finer "
+            + f"than the source table (R={header.effective_resolution:g})."
+        )
+
+    return reduced_grid
+
+
+def build_reduced_table(
+    source_filepath: Pathlike,
+    reduced_filepath: Pathlike,
+    header: CrossSectionTableHeader,
+    reduced_grid: ReducedGrid,
+    method: str,
+    source_catalog_name: str,
+) -> Path:
+    table_shape = (
+        header.number_of_pressure_layers,
+        header.number_of_temperatures,
+        header.number_of_spectral_elements,
+    )
+    source_table = load_crosssection_table(source_filepath, table_shape)
+    source_scale = get_table_scale(source_filepath)
+
+    reduced_table = open_partial_binary_table(
+        reduced_filepath, (*table_shape[:-1], reduced_grid.number_of_points)
+    )
+    # One pressure at a time, so a memory-mapped source is never read in full.
+    for pressure_index in range(header.number_of_pressure_layers):
+        reduced_table[pressure_index] = reduce_crosssections(
+            decode_crosssections(source_table[pressure_index], source_scale),
+            reduced_grid,
+            method,
+        )
+    reduced_table.flush()
+    del reduced_table
+
+    return finish_binary_table(
+        reduced_filepath,
+        format_reduced_header_line(read_header_line(source_filepath), reduced_grid),
+        header_notes={
+            REDUCED_GRID_NOTE: [
+                method,
+                source_catalog_name,
+                str(reduced_grid.bin_resolution),
+                str(reduced_grid.points_per_bin),
+            ]
+        },
+    )
+
+
+def build_reduced_catalog(
+    opacity_directory: Pathlike,
+    catalog_name: str,
+    bin_resolution: int,
+    points_per_bin: int = DEFAULT_POINTS_PER_BIN,
+    method: str = "ktable",
+    list_of_species: Sequence[str] = None,
+    overwrite: bool = False,
+) -> str:
+    if method not in REDUCTION_METHODS:
+        raise ValueError(
+            f"Unknown reduction method {method}; choose from {REDUCTION_METHODS}."
+        )
+
+    gas_directory = Path(opacity_directory) / "gases"
+    source_catalog: CrossSectionDirectory = create_crosssection_catalog(gas_directory)[
+        catalog_name
+    ]
+    source_header = source_catalog.table_header
+    reduced_grid = get_reduced_grid_for_header(
+        source_header, bin_resolution, points_per_bin
+    )
+    reduced_catalog_name = get_reduced_catalog_name(
+        catalog_name, method, bin_resolution, points_per_bin
+    )
+
+    if list_of_species is None:
+        list_of_species = source_catalog.list_of_species
+
+    for species in list_of_species:
+        reduced_filepath = gas_directory / f"{species}.{reduced_catalog_name}.dat"
+        if has_binary_table(reduced_filepath) and not overwrite:
+            continue
+
+        build_reduced_table(
+            source_catalog.filepath_directory[species],
+            reduced_filepath,
+            source_header,
+            reduced_grid,
+            method,
+            catalog_name,
+        )
+        print(f"Wrote {species}.{reduced_catalog_name}")
+
+    return reduced_catalog_name
+
+
+def get_bin_index_ranges(
+    wavelengths: NDArray[np.float64],
+    bin_lower_edges: NDArray[np.float64],
+    bin_upper_edges: NDArray[np.float64],
+) -> tuple[NDArray[np.int_], NDArray[np.int_]]:
+    # [start, stop) indices of the (ascending) wavelengths in each bin.
+    return (
+        np.searchsorted(wavelengths, bin_lower_edges, side="left"),
+        np.searchsorted(wavelengths, bin_upper_edges, side="left"),
+    )
+
+
+def calculate_bin_means(
+    values: NDArray[np.float64],
+    bin_starts: NDArray[np.int_],
+    bin_stops: NDArray[np.int_],
+) -> NDArray[np.float64]:
+    cumulative_values = np.concatenate(
+        [np.zeros((*values.shape[:-1], 1)), np.cumsum(values, axis=-1)], axis=-1
+    )
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (
+            cumulative_values[..., bin_stops] - cumulative_values[..., bin_starts]
+        ) / (bin_stops - bin_starts)
+
+
+def get_column_densities_at_points(
+    bin_column_densities: NDArray[np.float64],
+    bin_starts: NDArray[np.int_],
+    bin_stops: NDArray[np.int_],
+    number_of_points: int,
+) -> NDArray[np.float64]:
+    # Points outside every bin get no absorber.
+    point_bin_indices = np.full(number_of_points, len(bin_starts))
+    for bin_index, (bin_start, bin_stop) in enumerate(zip(bin_starts, bin_stops)):
+        point_bin_indices[bin_start:bin_stop] = bin_index
+
+    padded_column_densities = np.concatenate(
+        [bin_column_densities, np.zeros((*bin_column_densities.shape[:-1], 1))],
+        axis=-1,
+    )
+
+    return padded_column_densities[..., point_bin_indices]
+
+
+def compare_transmission(
+    source_table: NDArray[np.float64],
+    source_bin_ranges: tuple[NDArray[np.int_], NDArray[np.int_]],
+    reduced_table: NDArray[np.float64],
+    reduced_bin_ranges: tuple[NDArray[np.int_], NDArray[np.int_]],
+    optical_depths: Sequence[float] = REPORT_OPTICAL_DEPTHS,
+) -> tuple[NDArray[np.float64], NDArray[np.bool_]]:
+    """
+    For every pressure, temperature, and bin, picks the column density that gives each
+    of the bin-mean optical depths in the line-by-line table, and returns the absolute
+    differences in bin-mean transmission between the reduced and line-by-line tables,
+    shaped (optical depth, pressure, temperature, bin), along with a mask of the bins
+    that both grids have points in. Bins are [start, stop) index ranges into each
+    table's wavelengths, and must not overlap.
+    """
+    source_starts, source_stops = source_bin_ranges
+    reduced_starts, reduced_stops = reduced_bin_ranges
+    bins_are_covered = (source_stops > source_starts) & (reduced_stops > reduced_starts)
+
+    transmission_errors = np.zeros(
+        (len(optical_depths), *source_table.shape[:-1], len(source_starts))
+    )
+    for pressure_index in range(source_table.shape[0]):
+        source_crosssections = clip_crosssections(source_table[pressure_index])
+        reduced_crosssections = clip_crosssections(reduced_table[pressure_index])
+        mean_crosssections = calculate_bin_means(
+            source_crosssections, source_starts, source_stops
+        )
+
+        for optical_depth_index, optical_depth in enumerate(optical_depths):
+            bin_column_densities = np.where(
+                bins_are_covered, optical_depth / mean_crosssections, 0.0
+            )
+
+            source_transmissions = np.exp(
+                -get_column_densities_at_points(
+                    bin_column_densities,
+                    source_starts,
+                    source_stops,
+                    source_crosssections.shape[-1],
+                )
+                * source_crosssections
+            )
+            reduced_transmissions = np.exp(
+                -get_column_densities_at_points(
+                    bin_column_densities,
+                    reduced_starts,
+                    reduced_stops,
+                    reduced_crosssections.shape[-1],
+                )
+                * reduced_crosssections
+            )
+
+            transmission_errors[optical_depth_index, pressure_index] = np.where(
+                bins_are_covered,
+                np.abs(
+                    calculate_bin_means(
+                        reduced_transmissions, reduced_starts, reduced_stops
+                    )
+                    - calculate_bin_means(
+                        source_transmissions, source_starts, source_stops
+                    )
+                ),
+                0.0,
+            )
+
+    return transmission_errors, bins_are_covered
+
+
+def get_reduced_grid_from_catalog(
+    reduced_catalog: CrossSectionDirectory,
+) -> tuple[ReducedGrid, str, str]:
+    # Reads back the note build_reduced_table leaves in each .hdr sidecar.
+    reduced_header = reduced_catalog.table_header
+    header_notes = read_header_notes(
+        next(iter(reduced_catalog.filepath_directory.values()))
+    )
+    if REDUCED_GRID_NOTE not in header_notes:
+        raise ValueError(f"{reduced_catalog.directory_name} is not a reduced catalog.")
+
+    method, source_catalog_name, bin_resolution, points_per_bin = header_notes[
+        REDUCED_GRID_NOTE
+    ]
+    reduced_grid = ReducedGrid(
+        minimum_wavelength=reduced_header.minimum_wavelength,
+        effective_resolution=reduced_header.effective_resolution,
+        number_of_spectral_elements=reduced_header.number_of_spectral_elements,
+        bin_resolution=int(bin_resolution),
+        points_per_bin=int(points_per_bin),
+    )
+
+    return reduced_grid, method, source_catalog_name
+
+
+@dataclass
+class AccuracyReport:
+    species: str
+    optical_depths: tuple[float]
+    maximum_errors: NDArray[np.float64]  # (optical depth,)
+    rms_errors: NDArray[np.float64]  # (optical depth,)
+    bin_maximum_errors: NDArray[np.float64]  # (optical depth, bin)
+
+
+def report_reduced_catalog_accuracy(
+    opacity_directory: Pathlike,
+    reduced_catalog_name: str,
+    data_filepath: Pathlike = None,
+    list_of_species: Sequence[str] = None,
+    optical_depths: Sequence[float] = REPORT_OPTICAL_DEPTHS,
+) -> list[AccuracyReport]:
+    """
+    Compares against the catalog the reduced one was built from, over the data bins
+    if a data file is given, otherwise over the bins of the reduced grid.
+    """
+    catalogs = create_crosssection_catalog(Path(opacity_directory) / "gases")
+    reduced_catalog: CrossSectionDirectory = catalogs[reduced_catalog_name]
+    reduced_grid, _, source_catalog_name = get_reduced_grid_from_catalog(
+        reduced_catalog
+    )
+    source_catalog: CrossSectionDirectory = catalogs[source_catalog_name]
+    source_header = source_catalog.table_header
+    reduced_header = reduced_catalog.table_header
+
+    if data_filepath is not None:
+        bin_lower_edges, bin_upper_edges = np.loadtxt(
+            data_filepath, usecols=(0, 1), ndmin=2
+        ).T
+        source_bin_ranges = get_bin_index_ranges(
+            source_header.wavelengths, bin_lower_edges, bin_upper_edges
+        )
+        reduced_bin_ranges = get_bin_index_ranges(
+            reduced_header.wavelengths, bin_lower_edges, bin_upper_edges
+        )
+    else:
+        # The reduced grid's own bins, by index, so that rounding in the
+        # headers cannot move a point into the wrong bin.
+        bins = np.arange(reduced_grid.number_of_bins)
+        source_bin_indices = get_reduced_grid_for_header(
+            source_header, reduced_grid.bin_resolution, reduced_grid.points_per_bin
+        ).source_bin_indices
+        source_bin_ranges = (
+            np.searchsorted(source_bin_indices, bins, side="left"),
+            np.searchsorted(source_bin_indices, bins, side="right"),
+        )
+        reduced_bin_ranges = (
+            bins * reduced_grid.points_per_bin,
+            (bins + 1) * reduced_grid.points_per_bin,
+        )
+
+    if list_of_species is None:
+        list_of_species = [
+            species
+            for species in reduced_catalog.list_of_species
+            if species in source_catalog.list_of_species
+        ]
+
+    accuracy_reports = []
+    for species in list_of_species:
+        transmission_errors, bins_are_covered = compare_transmission(
+            decode_crosssections(
+                source_catalog.get_crosssections(species),
+                source_catalog.get_table_scale(species),
+            ),
+            source_bin_ranges,
+            decode_crosssections(
+                reduced_catalog.get_crosssections(species),
+                reduced_catalog.get_table_scale(species),
+            ),
+            reduced_bin_ranges,
+            optical_depths,
+        )
+        covered_errors = transmission_errors[..., bins_are_covered]
+
+        accuracy_reports.append(
+            AccuracyReport(
+                species=species,
+                optical_depths=tuple(optical_depths),
+                maximum_errors=np.max(covered_errors, axis=(1, 2, 3)),
+                rms_errors=np.sqrt(np.mean(covered_errors**2, axis=(1, 2, 3))),
+                bin_maximum_errors=np.max(transmission_errors, axis=(1, 2)),
+            )
+        )
+
+    return accuracy_reports
+
+
+def print_accuracy_reports(accuracy_reports: Sequence[AccuracyReport]) -> None:
+    print("Absolute error in bin-mean transmission (max / rms over P, T, bins)")
+    print(
+        f"{'species':>10}"
+        + "".join(
+            f"{f'tau={optical_depth:g}':>22}"
+            for optical_depth in accuracy_reports[0].optical_depths
+        )
+    )
+    for accuracy_report in accuracy_reports:
+        print(
+            f"{accuracy_report.species:>10}"
+            + "".join(
+                f"{f'{maximum_error:.2e} / {rms_error:.2e}':>22}"
+                for maximum_error, rms_error in zip(
+                    accuracy_report.maximum_errors, accuracy_report.rms_errors
+                )
+            )
+        )
+
+
+def read_command_line_arguments() -> Namespace:
+    parser: ArgumentParser = ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser(
+        "build", help="Write a reduced catalog from a hires catalog."
+    )
+    build_parser.add_argument("opacity_directory", type=Path)
+    build_parser.add_argument("catalog_name", type=str)
+    resolution_group = build_parser.add_mutually_exclusive_group(required=True)
+    resolution_group.add_argument("--resolution", type=int)
+    resolution_group.add_argument(
+        "--data", type=Path, help="Take R from the finest bins in this data file."
+    )
+    build_parser.add_argument("--points", type=int, default=DEFAULT_POINTS_PER_BIN)
+    build_parser.add_argument("--method", choices=REDUCTION_METHODS, default="ktable")
+    build_parser.add_argument("--species", nargs="+", default=None)
+    build_parser.add_argument("--overwrite", action="store_true")
+
+    report_parser = subparsers.add_parser(
+        "report", help="Compare a reduced catalog against its line-by-line source."
+    )
+    report_parser.add_argument("opacity_directory", type=Path)
+    report_parser.add_argument("reduced_catalog_name", type=str)
+    report_parser.add_argument("--data", type=Path, default=None)
+    report_parser.add_argument("--species", nargs="+", default=None)
+    report_parser.add_argument(
+        "--output", type=Path, default=None, help="Write the worst error per bin here."
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args: Namespace = read_command_line_arguments()
+
+    if args.command == "build":
+        bin_resolution = (
+            args.resolution
+            if args.resolution is not None
+            else get_bin_resolution_from_data(args.data)
+        )
+        reduced_catalog_name = build_reduced_catalog(
+            args.opacity_directory,
+            args.catalog_name,
+            bin_resolution,
+            args.points,
+            args.method,
+            args.species,
+            args.overwrite,
+        )
+        print(f'Built "{reduced_catalog_name}"; use it in the "Tables" line.')
+
+    elif args.command == "report":
+        accuracy_reports = report_reduced_catalog_accuracy(
+            args.opacity_directory, args.reduced_catalog_name, args.data, args.species
+        )
+        print_accuracy_reports(accuracy_reports)
+
+        if args.output is not None:
+            worst_bin_errors = np.max(
+                [
+                    accuracy_report.bin_maximum_errors
+                    for accuracy_report in accuracy_reports
+                ],
+                axis=0,
+            )
+            np.savetxt(
+                args.output,
+                worst_bin_errors.T,
+                header=" ".join(
+                    f"tau={optical_depth:g}"
+                    for optical_depth in accuracy_reports[0].optical_depths
+                ),
+            )
@@ -0,0 +1,166 @@
+"""
+Node-wide shared-memory arrays for the opacity tables.
+
+One process per node (the node "leader") allocates and fills the tables; the other
+processes on the node attach to the same memory read-only, instead of each holding
+its own copy. Under MPI the segment is an MPI-3 shared window on the node
+communicator (as in extensions/memory_on_one_core.py); without MPI, a named
+multiprocessing.shared_memory block is used, which pool workers attach to by name.
+"""
+
+from collections.abc import Callable
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Any, Final
+
+import numpy as np
+from numpy.typing import DTypeLike, NDArray
+
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI = None
+
+
+@dataclass
+class SharedArray:
+    array: NDArray
+    is_owner: bool
+    name: str | None
+    # Keeps the MPI window or SharedMemory block alive for as long as the array is.
+    handle: Any
+
+    def release(self) -> None:
+        # Views of the block must be dropped before the block itself can be closed.
+        self.array = None
+        if MPI is not None and isinstance(self.handle, MPI.Win):
+            self.handle.Free()
+        elif isinstance(self.handle, shared_memory.SharedMemory):
+            self.handle.close()
+            if self.is_owner:
+                self.handle.unlink()
+        self.handle = None
+
+
+def get_node_communicator(comm=None):
+    """
+    Splits a communicator (COMM_WORLD by default) into one communicator per
+    shared-memory node. Returns None if mpi4py is not available.
+    """
+    if MPI is None:
+        return None
+
+    if comm is None:
+        comm = MPI.COMM_WORLD
+
+    return comm.Split_type(MPI.COMM_TYPE_SHARED)
+
+
+def mpi_shared_array(
+    shape: tuple[int], node_comm, dtype: DTypeLike = np.float64
+) -> SharedArray:
+    dtype = np.dtype(dtype)
+    is_owner = node_comm.Get_rank() == 0
+
+    # Only the node leader allocates; everyone else gets a handle to its block.
+    nbytes = int(np.prod(shape)) * dtype.itemsize if is_owner else 0
+    window = MPI.Win.Allocate_shared(nbytes, dtype.itemsize, comm=node_comm)
+    buffer, itemsize = window.Shared_query(0)
+    assert itemsize == dtype.itemsize
+
+    array = np.ndarray(buffer=buffer, dtype=dtype, shape=shape)
+
+    return SharedArray(array=array, is_owner=is_owner, name=None, handle=window)
+
+
+def create_multiprocessing_shared_array(
+    shape: tuple[int], dtype: DTypeLike = np.float64, name: str = None
+) -> SharedArray:
+    dtype = np.dtype(dtype)
+    nbytes = max(int(np.prod(shape)) * dtype.itemsize, 1)
+    block = shared_memory.SharedMemory(name=name, create=True, size=nbytes)
+
+    array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+    return SharedArray(array=array, is_owner=True, name=block.name, handle=block)
+
+
+def attach_multiprocessing_shared_array(
+    name: str, shape: tuple[int], dtype: DTypeLike = np.float64
+) -> SharedArray:
+    block = shared_memory.SharedMemory(name=name, create=False)
+
+    array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    array.flags.writeable = False
+
+    return SharedArray(array=array, is_owner=False, name=name, handle=block)
+
+
+def load_into_shared_memory(
+    shape: tuple[int],
+    fill_array: Callable[[NDArray], None],
+    dtype: DTypeLike = np.float64,
+    node_comm=None,
+    name: str = None,
+) -> SharedArray:
+    """
+    Allocates a shared array and has only the owning process fill it.
+
+    With a node communicator, rank 0 on each node fills the array and the other
+    ranks wait for it and get a read-only view. Without one, this process creates
+    a named block (see SharedArray.name) that other processes can attach to with
+    attach_multiprocessing_shared_array.
+    """
+    if node_comm is not None:
+        shared_array = mpi_shared_array(shape, node_comm, dtype)
+        if shared_array.is_owner:
+            fill_array(shared_array.array)
+        node_comm.Barrier()
+    else:
+        shared_array = create_multiprocessing_shared_array(shape, dtype, name)
+        fill_array(shared_array.array)
+
+    if not shared_array.is_owner:
+        shared_array.array.flags.writeable = False
+
+    return shared_array
+
+
+PLANET_TABLE_NAMES: Final[tuple[str, ...]] = ("hires", "lores")
+
+
+def share_planet_tables(
+    planet, node_comm=None, names: dict[str, str] = None
+) -> dict[str, SharedArray]:
+    """
+    Moves the cross-section tables of a PyPlanet into shared memory, and points the
+    planet at them (so it frees its own copies).
+
+    Under MPI, rank 0 on each node needs a planet that has read its tables, and the
+    other ranks can make theirs with MakePlanet(..., read_tables=False). Without MPI,
+    other processes attach to the named blocks with attach_planet_tables.
+    """
+    shared_tables = {}
+    for table in PLANET_TABLE_NAMES:
+        shared_tables[table] = load_into_shared_memory(
+            planet.get_table_shape(table),
+            lambda array: np.copyto(array, planet.get_table(table)),
+            dtype=planet.table_dtype,
+            node_comm=node_comm,
+            name=None if names is None else names[table],
+        )
+        planet.attach_table(table, shared_tables[table].array)
+
+    return shared_tables
+
+
+def attach_planet_tables(planet, names: dict[str, str]) -> dict[str, SharedArray]:
+    # For a planet made with read_tables=False, in a process other than the owner's.
+    shared_tables = {}
+    for table in PLANET_TABLE_NAMES:
+        shared_tables[table] = attach_multiprocessing_shared_array(
+            names[table], planet.get_table_shape(table), planet.table_dtype
+        )
+        planet.attach_table(table, shared_tables[table].array)
+
+    return shared_tables
@@ -0,0 +1,328 @@
+"""
+Reduced-precision copies of cross-section catalogs.
+
+A reduced-precision catalog is an ordinary APOLLO catalog, named e.g. "nir_float32"
+or "nir_log10", whose tables are stored as float32:
+
+    float32: the cross sections, rounded to float32 (relative error ~6e-8). Values
+             below ~1e-38 lose precision, and those below ~1e-45 become 0.
+    log10:   log10 of the cross sections, rounded to float32; the .hdr holds a
+             "scale log10" line so that readers know to undo it. This keeps the
+             full 1e-50 to 1e-18 cm^2 range, at a relative error of ~1e-5.
+
+Both halve the size of the tables on disk and in the page cache. The Python readers
+keep the stored values and decode them to float64 only at interpolation time; the
+C++ core decodes them as it reads, into float64 tables, or into float32 tables if
+built with -DAPOLLO_FLOAT32_TABLES (see apollo/src/setup.py).
+
+The validate command runs the forward model of an input file on both its own catalog
+and a reduced-precision copy, and reports the largest difference in spectral flux.
+
+Usage:
+    python -m apollo.opacities.table_precision build <opacity directory> <catalog>
+        [--precision float32|log10]
+    python -m apollo.opacities.table_precision validate <input file>
+        [--precision float32|log10] [--opacity-directory <opacity directory>]
+"""
+
+from argparse import ArgumentParser, Namespace
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Final, Sequence
+
+import numpy as np
+from numpy.typing import NDArray
+
+from apollo.crosssections import (
+    CrossSectionDirectory,
+    create_crosssection_catalog,
+    load_crosssection_table,
+)
+from apollo.opacities.binary_store import (
+    LOG10_SCALE,
+    TABLE_SCALE_NOTE,
+    decode_crosssections,
+    finish_binary_table,
+    get_table_scale,
+    has_binary_table,
+    open_partial_binary_table,
+    read_header_line,
+)
+from custom_types import Pathlike
+
+TABLE_PRECISIONS: Final[tuple[str]] = ("float32", LOG10_SCALE)
+
+DEFAULT_TABLE_PRECISION: Final[str] = "float32"
+
+STORED_DTYPE: Final[type] = np.float32
+
+
+def get_reduced_precision_catalog_name(catalog_name: str, precision: str) -> str:
+    return f"{catalog_name}_{precision}"
+
+
+def encode_crosssections(
+    crosssections: NDArray[np.float64], precision: str
+) -> NDArray[np.float32]:
+    if precision == LOG10_SCALE:
+        # Zero (or negative) cross sections are stored as -inf, which decodes to 0.
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.log10(np.where(crosssections > 0, crosssections, 0.0)).astype(
+                STORED_DTYPE
+            )
+
+    return np.asarray(crosssections).astype(STORED_DTYPE)
+
+
+def build_reduced_precision_table(
+    source_filepath: Pathlike,
+    reduced_filepath: Pathlike,
+    table_shape: tuple[int, int, int],
+    precision: str,
+) -> Path:
+    source_table = load_crosssection_table(source_filepath, table_shape)
+    source_scale = get_table_scale(source_filepath)
+
+    reduced_table = open_partial_binary_table(
+        reduced_filepath, table_shape, dtype=STORED_DTYPE
+    )
+    # One pressure at a time, so a memory-mapped source is never read in full.
+    for pressure_index in range(table_shape[0]):
+        reduced_table[pressure_index] = encode_crosssections(
+            decode_crosssections(source_table[pressure_index], source_scale),
+            precision,
+        )
+    reduced_table.flush()
+    del reduced_table
+
+    return finish_binary_table(
+        reduced_filepath,
+        read_header_line(source_filepath),
+        header_notes=(
+            {TABLE_SCALE_NOTE: [LOG10_SCALE]} if precision == LOG10_SCALE else None
+        ),
+    )
+
+
+def build_reduced_precision_catalog(
+    opacity_directory: Pathlike,
+    catalog_name: str,
+    precision: str = DEFAULT_TABLE_PRECISION,
+    list_of_species: Sequence[str] = None,
+    overwrite: bool = False,
+) -> str:
+    if precision not in TABLE_PRECISIONS:
+        raise ValueError(
+            f"Unknown table precision {precision}; choose from {TABLE_PRECISIONS}."
+        )
+
+    gas_directory = Path(opacity_directory) / "gases"
+    source_catalog: CrossSectionDirectory = create_crosssection_catalog(gas_directory)[
+        catalog_name
+    ]
+    reduced_catalog_name = get_reduced_precision_catalog_name(catalog_name, precision)
+
+    if list_of_species is None:
+        list_of_species = source_catalog.list_of_species
+
+    for species in list_of_species:
+        reduced_filepath = gas_directory / f"{species}.{reduced_catalog_name}.dat"
+        if has_binary_table(reduced_filepath) and not overwrite:
+            continue
+
+        build_reduced_precision_table(
+            source_catalog.filepath_directory[species],
+            reduced_filepath,
+            source_catalog.table_shape,
+            precision,
+        )
+        print(f"Wrote {species}.{reduced_catalog_name}")
+
+    return reduced_catalog_name
+
+
+def calculate_maximum_relative_table_error(
+    opacity_directory: Pathlike, catalog_name: str, reduced_catalog_name: str
+) -> dict[str, float]:
+    # Over the cross sections above the 1e-50 floor the C++ core clips to.
+    catalogs = create_crosssection_catalog(Path(opacity_directory) / "gases")
+    source_catalog = catalogs[catalog_name]
+    reduced_catalog = catalogs[reduced_catalog_name]
+
+    maximum_relative_errors = {}
+    for species in reduced_catalog.list_of_species:
+        source_table = source_catalog.get_crosssections(species)
+        reduced_table = reduced_catalog.get_crosssections(species)
+        source_scale = source_catalog.get_table_scale(species)
+        reduced_scale = reduced_catalog.get_table_scale(species)
+
+        maximum_relative_error = 0.0
+        for pressure_index in range(source_catalog.table_shape[0]):
+            source_values = decode_crosssections(
+                source_table[pressure_index], source_scale
+            )
+            reduced_values = decode_crosssections(
+                reduced_table[pressure_index], reduced_scale
+            )
+            above_floor = source_values > 1e-50
+            maximum_relative_error = max(
+                maximum_relative_error,
+                np.max(
+                    np.abs(reduced_values - source_values)[above_floor]
+                    / source_values[above_floor],
+                    initial=0.0,
+                ),
+            )
+        maximum_relative_errors[species] = float(maximum_relative_error)
+
+    return maximum_relative_errors
+
+
+def calculate_model_spectrum(
+    input_filepath: Pathlike,
+    opacity_directory: Pathlike = None,
+    catalog_name: str = None,
+) -> NDArray[np.float64]:
+    """
+    The full-resolution emission flux (or transit depth) of the model in an input
+    file, optionally with a different opacity directory or catalog.
+    """
+    # The forward model needs the compiled C++ core, which building catalogs does not.
+    from apollo.Apollo_components import (
+        MakePlanet,
+        ProcessInputs,
+        ReadInputsfromFile,
+    )
+
+    inputs: dict = ReadInputsfromFile(str(input_filepath))
+    if opacity_directory is not None:
+        inputs["opacdir"] = str(opacity_directory)
+    if catalog_name is not None:
+        inputs["hires"] = catalog_name
+
+    processed_inputs = ProcessInputs(**inputs)
+    planet = MakePlanet(
+        processed_inputs.MakePlanet_kwargs, processed_inputs.CPlanet_settings
+    )
+    get_model = planet.MakeModel(processed_inputs.MakeModel_initialization_kwargs)
+
+    return np.asarray(get_model(processed_inputs.parameters)[0], dtype=np.float64)
+
+
+@dataclass
+class PrecisionValidation:
+    catalog_name: str
+    reduced_catalog_name: str
+    maximum_absolute_flux_error: float
+    maximum_relative_flux_error: float
+    maximum_relative_table_errors: dict[str, float]
+
+
+def validate_reduced_precision_catalog(
+    input_filepath: Pathlike,
+    precision: str = DEFAULT_TABLE_PRECISION,
+    opacity_directory: Pathlike = None,
+) -> PrecisionValidation:
+    """
+    Builds the reduced-precision copy of the input file's catalog if needed, and
+    compares the model spectra on the two catalogs.
+    """
+    from apollo.Apollo_components import ReadInputsfromFile
+
+    inputs: dict = ReadInputsfromFile(str(input_filepath))
+    if opacity_directory is None:
+        opacity_directory = inputs["opacdir"]
+    catalog_name = inputs["hires"]
+
+    reduced_catalog_name = build_reduced_precision_catalog(
+        opacity_directory, catalog_name, precision
+    )
+
+    reference_spectrum = calculate_model_spectrum(
+        input_filepath, opacity_directory, catalog_name
+    )
+    reduced_spectrum = calculate_model_spectrum(
+        input_filepath, opacity_directory, reduced_catalog_name
+    )
+    flux_errors = np.abs(reduced_spectrum - reference_spectrum)
+    nonzero_flux = reference_spectrum != 0
+
+    return PrecisionValidation(
+        catalog_name=catalog_name,
+        reduced_catalog_name=reduced_catalog_name,
+        maximum_absolute_flux_error=float(np.max(flux_errors)),
+        maximum_relative_flux_error=float(
+            np.max(
+                flux_errors[nonzero_flux] / np.abs(reference_spectrum[nonzero_flux]),
+                initial=0.0,
+            )
+        ),
+        maximum_relative_table_errors=calculate_maximum_relative_table_error(
+            opacity_directory, catalog_name, reduced_catalog_name
+        ),
+    )
+
+
+def print_precision_validation(validation: PrecisionValidation) -> None:
+    print(f"{validation.reduced_catalog_name} against {validation.catalog_name}:")
+    print(
+        f"  maximum spectral flux error: {validation.maximum_absolute_flux_error:.3e} "
+        + f"(relative {validation.maximum_relative_flux_error:.3e})"
+    )
+    print("  maximum relative cross-section error by species:")
+    for species, error in validation.maximum_relative_table_errors.items():
+        print(f"    {species:>12s}  {error:.3e}")
+
+
+def read_command_line_arguments() -> Namespace:
+    parser: ArgumentParser = ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser(
+        "build", help="Write a reduced-precision copy of a catalog."
+    )
+    build_parser.add_argument("opacity_directory", type=Path)
+    build_parser.add_argument("catalog_name", type=str)
+    build_parser.add_argument(
+        "--precision", choices=TABLE_PRECISIONS, default=DEFAULT_TABLE_PRECISION
+    )
+    build_parser.add_argument("--species", nargs="+", default=None)
+    build_parser.add_argument("--overwrite", action="store_true")
+
+    validate_parser = subparsers.add_parser(
+        "validate",
+        help="Compare the spectrum of an input file on float64 and reduced tables.",
+    )
+    validate_parser.add_argument("input_file", type=Path)
+    validate_parser.add_argument(
+        "--precision", choices=TABLE_PRECISIONS, default=DEFAULT_TABLE_PRECISION
+    )
+    validate_parser.add_argument(
+        "--opacity-directory",
+        type=Path,
+        default=None,
+        help="Defaults to the one in the input file.",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args: Namespace = read_command_line_arguments()
+
+    if args.command == "build":
+        reduced_catalog_name = build_reduced_precision_catalog(
+            args.opacity_directory,
+            args.catalog_name,
+            args.precision,
+            args.species,
+            args.overwrite,
+        )
+        print(f'Built "{reduced_catalog_name}"; use it in the "Tables" line.')
+
+    elif args.command == "validate":
+        print_precision_validation(
+            validate_reduced_precision_catalog(
+                args.input_file, args.precision, args.opacity_directory
+            )
+        )
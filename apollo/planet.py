@@ -6,6 +6,10 @@ from typing import Callable, NamedTuple, Sequence, TypedDict
 import numpy as np
 from scipy.interpolate import interp1d
 
+from apollo.radiative_transfer.quadrature import (
+    DEFAULT_QUADRATURE,
+    get_stream_quadrature,
+)
 from apollo.src.ApolloFunctions import GetScaOpac
 from apollo.src.wrapPlanet import PyPlanet
 from user.TP_models import TP_models
@@ -26,6 +30,15 @@ class RadiusInputs(StrEnum):
     norad = auto()
 
 
+class DerivedParameterSchedule(StrEnum):
+    # When the model computes mass, C/O, [Fe/H] and Teff. With saved_samples, the
+    # likelihood calls skip them (and the low-resolution RT behind Teff), and the
+    # derived parameters of the saved samples are filled in afterwards by
+    # apollo.retrieval.results.derived_parameters.save_derived_parameters_for_samples.
+    every_call = auto()
+    saved_samples = auto()
+
+
 class SwitchBlueprint(NamedTuple):
     observation_mode_index: int
     cloud_model_index: int
@@ -44,6 +57,12 @@ class CPlanetBlueprint(NamedTuple):
     Teff_opacity_catalog_name: str
 
 
+class CPlanetSettings(NamedTuple):
+    # Set on the C++ planet once it is made.
+    stream_quadrature: str = DEFAULT_QUADRATURE  # preset name or number of angles
+    number_of_threads: int = 0  # for an OpenMP build; 0 leaves it to APOLLO_NUM_THREADS
+
+
 class MakeModelBlueprint(TypedDict):
     model_wavelengths: Sequence[float]
     gas_species: Sequence[str]
@@ -75,6 +94,7 @@ class MakeModelBlueprint(TypedDict):
     calibration_parameter_names: Sequence[str]
     calibration_start_index: int
     APOLLO_use_mode: str
+    compute_derived_parameters: bool
 
 
 # emission_flux:                               Sequence[float]
@@ -115,17 +135,28 @@ class Planet:
 
     name: str
     cclass_constructor: InitVar[CPlanetBlueprint]
+    cclass_settings: InitVar[CPlanetSettings] = CPlanetSettings()
     cclass: PyPlanet = field(init=False)
 
-    def __post_init__(self, cclass_constructor: CPlanetBlueprint):
+    def __post_init__(
+        self, cclass_constructor: CPlanetBlueprint, cclass_settings: CPlanetSettings
+    ):
         self.cclass = PyPlanet()
         cclass_args = [
-            list(cclass_constructor.values())[:5],
-            *list(cclass_constructor.values())[5:8],
-            *[arg.encode("utf-8") for arg in list(cclass_constructor.values())[8:]],
+            list(cclass_constructor.switches),
+            cclass_constructor.model_wavelengths,
+            cclass_constructor.Teff_calculation_wavelengths,
+            cclass_constructor.gas_species_indices,
+            *[arg.encode("utf-8") for arg in cclass_constructor[4:]],
         ]
         self.cclass.MakePlanet(*cclass_args)
 
+        self.cclass.set_Quadrature(
+            *get_stream_quadrature(cclass_settings.stream_quadrature)
+        )
+        if cclass_settings.number_of_threads > 0:
+            self.cclass.set_Threads(cclass_settings.number_of_threads)
+
     def MakeModel(self, model_constructor: MakeModelBlueprint):
         def ModelFunction(
             model_parameters: Sequence[float],
@@ -160,6 +191,7 @@ class Planet:
             calibration_parameter_names: Sequence[str],
             calibration_start_index: int,
             APOLLO_use_mode: str,
+            compute_derived_parameters: bool = True,
         ):
             # calls Set_Params(), Get(Clear)_Spectrum(), and Get_Teff()
             ##########################################
@@ -282,68 +314,70 @@ class Planet:
                 params1[2] = minP + 0.01
             # Ensures the cloud deck is inside the model bounds.
 
-            mass = grav * radius * radius / 6.67e-8 / 1.898e30
-
-            # Compute C/O and [Fe/H]
-            carbon = 0.0
-            oxygen = 0.0
-            metals = 0.0
-            ccompounds = ["ch4", "co", "co2", "hcn"]
-            cmult = [1.0, 1.0, 1.0, 1.0]
-            ocompounds = ["h2o", "co", "co2", "tio", "vo"]
-            omult = [1.0, 1.0, 2.0, 1.0, 1.0]
-            zcompounds = [
-                "h2o",
-                "ch4",
-                "co",
-                "co2",
-                "nh3",
-                "h2s",
-                "Burrows_alk",
-                "Lupu_alk",
-                "crh",
-                "feh",
-                "tio",
-                "vo",
-                "hcn",
-                "n2",
-                "ph3",
-            ]
-            zmult = [
-                16.0,
-                12.0,
-                28.0,
-                44.0,
-                14.0,
-                32.0,
-                24.0,
-                24.0,
-                52.0,
-                56.0,
-                64.0,
-                67.0,
-                26.0,
-                28.0,
-                31.0,
-            ]
-
-            for i in range(0, len(ccompounds)):
-                if ccompounds[i] in gases:
-                    j = gases.index(ccompounds[i])
-                    carbon = carbon + cmult[i] * (
-                        10 ** x[g1 + j - 1]
-                    )  # -1 because of hydrogen
-            for i in range(0, len(ocompounds)):
-                if ocompounds[i] in gases:
-                    j = gases.index(ocompounds[i])
-                    oxygen = oxygen + omult[i] * (10 ** x[g1 + j - 1])
-            for i in range(0, len(zcompounds)):
-                if zcompounds[i] in gases:
-                    j = gases.index(zcompounds[i])
-                    metals = metals + zmult[i] * (10 ** x[g1 + j - 1])
-
-            ctoo = carbon / oxygen
-            fetoh = np.log10(metals / 0.0196)
+            # Derived parameters can be left to the samples that are saved.
+            if compute_derived_parameters:
+                mass = grav * radius * radius / 6.67e-8 / 1.898e30
+
+                # Compute C/O and [Fe/H]
+                carbon = 0.0
+                oxygen = 0.0
+                metals = 0.0
+                ccompounds = ["ch4", "co", "co2", "hcn"]
+                cmult = [1.0, 1.0, 1.0, 1.0]
+                ocompounds = ["h2o", "co", "co2", "tio", "vo"]
+                omult = [1.0, 1.0, 2.0, 1.0, 1.0]
+                zcompounds = [
+                    "h2o",
+                    "ch4",
+                    "co",
+                    "co2",
+                    "nh3",
+                    "h2s",
+                    "Burrows_alk",
+                    "Lupu_alk",
+                    "crh",
+                    "feh",
+                    "tio",
+                    "vo",
+                    "hcn",
+                    "n2",
+                    "ph3",
+                ]
+                zmult = [
+                    16.0,
+                    12.0,
+                    28.0,
+                    44.0,
+                    14.0,
+                    32.0,
+                    24.0,
+                    24.0,
+                    52.0,
+                    56.0,
+                    64.0,
+                    67.0,
+                    26.0,
+                    28.0,
+                    31.0,
+                ]
+
+                for i in range(0, len(ccompounds)):
+                    if ccompounds[i] in gases:
+                        j = gases.index(ccompounds[i])
+                        carbon = carbon + cmult[i] * (
+                            10 ** x[g1 + j - 1]
+                        )  # -1 because of hydrogen
+                for i in range(0, len(ocompounds)):
+                    if ocompounds[i] in gases:
+                        j = gases.index(ocompounds[i])
+                        oxygen = oxygen + omult[i] * (10 ** x[g1 + j - 1])
+                for i in range(0, len(zcompounds)):
+                    if zcompounds[i] in gases:
+                        j = gases.index(zcompounds[i])
+                        metals = metals + zmult[i] * (10 ** x[g1 + j - 1])
+
+                ctoo = carbon / oxygen
+                fetoh = np.log10(metals / 0.0196)
 
             # ada: For fractional cloud coverage, we generate the cloud-free
             # and cloudy spectra, then mix according to the fraction.
@@ -481,12 +515,14 @@ class Planet:
                     )
                     print("Truth array: {}".format(monotonic))
 
-            teff = self.cclass.get_Teff()
-            if task != "Ensemble":
-                print("M/Mj: ", mass)
-                print("C/O: ", ctoo)
-                print("[Fe/H]: ", fetoh)
-                print("Teff: ", teff)
+            if compute_derived_parameters:
+                # The low-resolution opacities and RT for Teff are only run here.
+                teff = self.cclass.get_Teff()
+                if task != "Ensemble":
+                    print("M/Mj: ", mass)
+                    print("C/O: ", ctoo)
+                    print("[Fe/H]: ", fetoh)
+                    print("Teff: ", teff)
 
             if "scaleJ" in end:
                 pos = end.index("scaleJ")
@@ -582,6 +618,9 @@ class Planet:
             sys.exit()
             """
 
+            if not compute_derived_parameters:
+                return specflux, None
+
             return specflux, [mass, ctoo, fetoh, teff]
 
         return partial(ModelFunction, **model_constructor)
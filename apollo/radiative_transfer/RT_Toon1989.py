@@ -1,16 +1,59 @@
+"""
+Two-stream emission spectra following Toon et al. (1989), as in Planet::getFlux.
+
+Every function works over arbitrary leading (batch) dimensions, so a whole set of
+models (e.g. posterior draws) is computed in one vectorized call. Arrays indexed by
+layer are shaped (..., number_of_wavelengths, number_of_layers), the same order as
+taulayer[i][j] on the C++ side; temperatures are shaped (..., number_of_levels), with
+number_of_levels = number_of_layers + 1, top of the atmosphere first; wavelengths are
+shaped (..., number_of_wavelengths). The emergent flux is (..., number_of_wavelengths).
+
+The atmosphere is taken to extend to the bottom level of the profile (hmin at the
+base, so tbfrac = 1 in getFlux).
+
+Given contribution_optical_depths (which can be empty, for the total alone), the
+contribution functions are returned with the flux, from the same thermal intensities;
+see contributions.py.
+"""
+
+from enum import StrEnum, auto
 from typing import Final, NamedTuple
 
 import numpy as np
 from numpy.typing import NDArray
+from scipy.linalg import solve_banded
 
+from apollo.radiative_transfer.contributions import (
+    ContributionOpticalDepths,
+    EmissionWithContributions,
+    calculate_contribution_functions,
+)
+from apollo.radiative_transfer.planck_cache import (  # noqa: F401
+    PlanckCache,
+    blackbody_intensity_by_wavelength,
+    c,
+    h,
+    k,
+)
 from useful_internal_functions import interleave
 
-c: Final[float] = 2.99792458e10  # in CGS
-hc: Final[float] = 1.98644568e-16  # in CGS
-hc_over_k: Final[float] = 1.98644568 / 1.38064852
-
 MAXIMUM_EXP_FLOAT: Final[float] = 35
 
+# Layers thinner than this are treated as isothermal, at the mean of their edges.
+MINIMUM_OPTICAL_DEPTH_FOR_GRADIENT: Final[float] = 1e-6
+
+# Below this single-scattering albedo, scattering is ignored in the flux integration.
+MINIMUM_SCATTERING_ALBEDO: Final[float] = 0.01
+
+# Number of (model, wavelength) systems per call to the banded solver.
+BANDED_SOLVER_ROWS_PER_CHUNK: Final[int] = 4096
+
+
+class TridiagonalSolver(StrEnum):
+    thomas = auto()  # the DTRIDGL sweeps, vectorized over rows
+    banded = auto()  # scipy.linalg.solve_banded
+
+
 STREAM_COSINE_ANGLES = np.array(
     [
         0.0446339553,
@@ -49,126 +92,168 @@ def RT_Toon1989(
     scattering_asymmetry: NDArray[np.float64],
     stream_cosine_angles: NDArray[np.float64] = STREAM_COSINE_ANGLES,
     stream_weights: NDArray[np.float64] = STREAM_WEIGHTS,
-):
-    thermal_intensity, delta_thermal_intensity = thermal_intensity_by_layer(
-        temperatures_in_K, wavelengths_in_cm
+    tridiagonal_solver: TridiagonalSolver = TridiagonalSolver.thomas,
+    planck_cache: PlanckCache | None = None,
+    contribution_optical_depths: ContributionOpticalDepths | None = None,
+) -> NDArray[np.float64] | EmissionWithContributions:
+    thermal_intensities = thermal_intensity_by_layer(
+        temperatures_in_K, wavelengths_in_cm, optical_depth_per_layer, planck_cache
     )
 
     terms_for_DSolver = calculate_terms_for_DSolver(
         optical_depth_per_layer,
         single_scattering_albedo,
         scattering_asymmetry,
-        thermal_intensity,
-        delta_thermal_intensity,
+        *thermal_intensities,
     )
 
     terms_for_DTRIDGL = DSolver_subroutine(*terms_for_DSolver)
 
-    xki_terms = DTRIDGL_subroutine(*terms_for_DTRIDGL)
+    xki_terms = DTRIDGL_subroutine(*terms_for_DTRIDGL, tridiagonal_solver)
 
     total_flux = calculate_flux(
         optical_depth_per_layer,
         single_scattering_albedo,
         scattering_asymmetry,
-        thermal_intensity,
-        delta_thermal_intensity,
+        *thermal_intensities,
+        xki_terms,
         stream_cosine_angles,
         stream_weights,
-        xki_terms,
     )
-    return total_flux
+
+    if contribution_optical_depths is None:
+        return total_flux
+
+    return EmissionWithContributions(
+        emitted_flux=total_flux,
+        contribution_functions=calculate_contribution_functions(
+            optical_depth_per_layer,
+            thermal_intensities.thermal_intensity,
+            contribution_optical_depths,
+        ),
+    )
 
 
 ###############################################################################
 
 
-def blackbody_intensity_by_wavelength(temperature_in_K, wavelength_in_cm):
-    T, wave = temperature_in_K, wavelength_in_cm
-    return (2 * hc * c / wave**5) / (np.exp(hc_over_k * (wave / T)) - 1)
+class ThermalIntensities(NamedTuple):
+    # size of arrays: (..., number_of_wavelengths, number_of_layers)
+    thermal_intensity: NDArray[np.float64]  # b0, at the top of each layer
+    delta_thermal_intensity: NDArray[np.float64]  # bdiff, per unit optical depth
+    # size of arrays: (..., number_of_wavelengths)
+    thermal_intensity_at_TOA: NDArray[np.float64]
+    thermal_intensity_at_base: NDArray[np.float64]
 
 
 def thermal_intensity_by_layer(
-    temperatures_in_K: NDArray[np.float64], wavelengths_in_cm: NDArray[np.float64]
-):
-    wavelength_grid, temperature_grid = np.meshgrid(
-        wavelengths_in_cm, temperatures_in_K
-    )
-    thermal_intensity_bin_edges = blackbody_intensity_by_wavelength(
-        temperature_grid, wavelength_grid
+    temperatures_in_K: NDArray[np.float64],
+    wavelengths_in_cm: NDArray[np.float64],
+    optical_depth_per_layer: NDArray[np.float64],
+    planck_cache: PlanckCache | None = None,
+) -> ThermalIntensities:
+    if planck_cache is None:
+        thermal_intensity_at_levels = blackbody_intensity_by_wavelength(
+            np.expand_dims(temperatures_in_K, axis=-2),
+            np.expand_dims(wavelengths_in_cm, axis=-1),
+        )
+    else:
+        planck_cache.check_wavelengths(wavelengths_in_cm)
+        thermal_intensity_at_levels = planck_cache.blackbody_intensity(
+            temperatures_in_K
+        )
+    thermal_intensity_at_layer_tops = thermal_intensity_at_levels[..., :-1]
+    thermal_intensity_at_layer_bottoms = thermal_intensity_at_levels[..., 1:]
+
+    is_thin_layer = optical_depth_per_layer < MINIMUM_OPTICAL_DEPTH_FOR_GRADIENT
+    # In getFlux the gradient is computed first, then replaced in thin layers.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        delta_thermal_intensity = (
+            thermal_intensity_at_layer_bottoms - thermal_intensity_at_layer_tops
+        ) / optical_depth_per_layer
+
+    thermal_intensity = np.where(
+        is_thin_layer,
+        0.5 * (thermal_intensity_at_layer_tops + thermal_intensity_at_layer_bottoms),
+        thermal_intensity_at_layer_tops,
     )
+    delta_thermal_intensity = np.where(is_thin_layer, 0.0, delta_thermal_intensity)
 
-    # mean across each layer bin
-    thermal_intensity = (
-        thermal_intensity_bin_edges[:, :-1] + thermal_intensity_bin_edges[:, 1:]
-    ) / 2
-    # change across each layer bin
-    delta_thermal_intensity = (
-        thermal_intensity_bin_edges[:, 1:] - thermal_intensity_bin_edges[:, :-1]
+    return ThermalIntensities(
+        thermal_intensity=thermal_intensity,
+        delta_thermal_intensity=delta_thermal_intensity,
+        thermal_intensity_at_TOA=thermal_intensity_at_levels[..., 0],
+        thermal_intensity_at_base=thermal_intensity_at_levels[..., -1],
     )
 
-    return thermal_intensity, delta_thermal_intensity
-
 
 class DsolverInputs(NamedTuple):
-    # cp, cpm1, cm, cmm1, ep, btop, bottom, gama
-    cp: NDArray[np.float64]  # size of array:
+    # size of arrays: (..., number_of_wavelengths, number_of_layers)
+    cp: NDArray[np.float64]
     cpm1: NDArray[np.float64]
     cm: NDArray[np.float64]
     cmm1: NDArray[np.float64]
     ep: NDArray[np.float64]
+    # size of arrays: (..., number_of_wavelengths)
     btop: NDArray[np.float64]
     bottom: NDArray[np.float64]
+    # size of array: (..., number_of_wavelengths, number_of_layers)
     gama: NDArray[np.float64]
 
 
+def calculate_hemispheric_mean_terms(
+    single_scattering_albedo: NDArray[np.float64],
+    scattering_asymmetry: NDArray[np.float64],
+    mu_1: float = 0.5,  # This is mu_1 in Toon et al. 1989
+) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+    # lamda is the lambda in Toon et al., alpha feeds into their capital-Gamma.
+    w0 = single_scattering_albedo
+    g = scattering_asymmetry
+
+    alpha = np.sqrt((1 - w0) / (1 - w0 * g))
+    lamda = alpha * (1 - w0 * g) / mu_1
+
+    return alpha, lamda
+
+
 def calculate_terms_for_DSolver(
-    # size of array: (number_of_models, number_of_layers, number_of_wavelengths)
+    # size of array: (..., number_of_wavelengths, number_of_layers)
     optical_depth_per_layer: NDArray[np.float64],
-    # size of array: (number_of_models, number_of_layers, number_of_wavelengths)
+    # size of array: (..., number_of_wavelengths, number_of_layers)
     single_scattering_albedo: NDArray[np.float64],
-    # size of array: (number_of_models, number_of_layers, number_of_wavelengths)
+    # size of array: (..., number_of_wavelengths, number_of_layers)
     scattering_asymmetry: NDArray[np.float64],
     thermal_intensity: NDArray[np.float64],
     delta_thermal_intensity: NDArray[np.float64],
+    thermal_intensity_at_TOA: NDArray[np.float64],
+    thermal_intensity_at_base: NDArray[np.float64],
     mu_1: float = 0.5,  # This is mu_1 in Toon et al. 1989
-):
-    number_of_wavelengths, number_of_layers = np.shape(optical_depth_per_layer)
+) -> DsolverInputs:
     tau = optical_depth_per_layer
     w0 = single_scattering_albedo
     g = scattering_asymmetry
-    tbfrac: float = 1  # INCOMPLETE IMPLEMENTATION
-    # tbase = getT(hmin)       # INCOMPLETE IMPLEMENTATION
-    thermal_intensity_at_TOA = thermal_intensity[0] - delta_thermal_intensity[0] / 2
-    thermal_intensity_at_base = thermal_intensity[-1] + delta_thermal_intensity[-1] / 2
 
-    alpha = np.sqrt(
-        (1 - w0) / (1 - w0 * g)
-    )  # sqrt( (1.-w0[i][j])/(1.-w0[i][j]*asym[i][j]) )
-    lamda = alpha * (1 - w0 * g) / mu_1  # alpha[j]*(1.-w0[i][j]*cosbar[j])/mu_1
-    gama = (1 - alpha) / (1 + alpha)  # (1.-alpha[j])/(1.+alpha[j])
-    term = 1 / 2 / (1 - w0 * g)  # 0.5/(1.-w0[i][j]*cosbar[j])
+    alpha, lamda = calculate_hemispheric_mean_terms(w0, g, mu_1)
+    gama = (1 - alpha) / (1 + alpha)
+    term = 0.5 / (1 - w0 * g)
 
-    dti_x_term = delta_thermal_intensity * term
-    dti_x_tau = delta_thermal_intensity * tau
+    # cp and cm are C^+ and C^- in Toon et al., evaluated at the bottom of each layer,
+    # cpm1 and cmm1 at the top, without their factor of 2*pi*mu_1.
+    b0 = thermal_intensity
+    bdiff = delta_thermal_intensity
+    cp = b0 + bdiff * tau + bdiff * term
+    cm = b0 + bdiff * tau - bdiff * term
+    cpm1 = b0 + bdiff * term
+    cmm1 = b0 - bdiff * term
 
-    cpm1 = thermal_intensity + dti_x_term
-    cp = cpm1 + dti_x_tau
-    cmm1 = thermal_intensity - dti_x_term
-    cm = cmm1 + dti_x_tau
+    ep = np.exp(np.minimum(lamda * tau, MAXIMUM_EXP_FLOAT))
 
-    lamda_x_tau = np.clip(lamda * tau, a_min=None, a_max=MAXIMUM_EXP_FLOAT)
-    ep = np.exp(lamda_x_tau)
-
-    tautop = tau[:, 0]
-    btop = (
-        (1 - np.exp(-tautop / mu_1)) * thermal_intensity_at_TOA
-    )  # (1. - exp(-tautop/mu_1))*blackbodyL(tprof[0],wavelength)
-    bsurf = thermal_intensity_at_base  # blackbodyL(tbase,wavelength)
-    bottom = bsurf + delta_thermal_intensity[:, -1] * (
-        mu_1 / tbfrac
-    )  # Equivalent to multiplying taulayer by tbfrac.
+    tautop = tau[..., 0]
+    btop = (1 - np.exp(-tautop / mu_1)) * thermal_intensity_at_TOA
+    bsurf = thermal_intensity_at_base
+    bottom = bsurf + bdiff[..., -1] * mu_1
 
-    return cp, cpm1, cm, cmm1, ep, btop, bottom, gama
+    return DsolverInputs(cp, cpm1, cm, cmm1, ep, btop, bottom, gama)
 
 
 def DSolver_subroutine(cp, cpm1, cm, cmm1, ep, btop, bottom, gama, rsf=0):
@@ -183,60 +268,59 @@ def DSolver_subroutine(cp, cpm1, cm, cmm1, ep, btop, bottom, gama, rsf=0):
     # af, bd, cd, and df appear to be A_l, B_l, D_l, and E_l in Toon et al.
     # xk1 and xk2 appear to be Y_1n and Y_2n in Toon et al.
     # However, these do not match their formulae.
-    top_layer = [slice(None), slice(0)]
-    # bottom_layer = [slice(None), slice(-1)]
-    upper_edges = [slice(None), slice(None, -1)]
-    lower_edges = [slice(None), slice(1, None)]
+    cp, cpm1, cm, cmm1, ep, gama = np.broadcast_arrays(cp, cpm1, cm, cmm1, ep, gama)
+
+    upper_edges = (..., slice(None, -1))  # nn
+    lower_edges = (..., slice(1, None))  # nn + 1
 
     e1 = ep + gama / ep
     e2 = ep - gama / ep
     e3 = gama * ep + 1 / ep
     e4 = gama * ep - 1 / ep
 
-    af_top = 0
-    bf_top = gama[top_layer] + 1
-    cf_top = gama[top_layer] - 1
-    df_top = btop - cmm1[top_layer]
+    af_top = np.zeros_like(gama[..., 0])
+    bf_top = gama[..., 0] + 1
+    cf_top = gama[..., 0] - 1
+    df_top = btop - cmm1[..., 0]
 
     # odd indices
-    odd_afs = (e1[upper_edges] + e3[upper_edges]) * (
-        gama[lower_edges] - 1
-    )  # (e1[nn]+e3[nn])*(gama[nn+1]-1.)
-    odd_bfs = (e2[upper_edges] + e4[upper_edges]) * (
-        gama[lower_edges] - 1
-    )  # e2[nn]+e4[nn])*(gama[nn+1]-1.)
-    odd_cfs = 2 * (1 - gama[lower_edges] ** 2)  # 2.*(1.-gama[nn+1]*gama[nn+1])
-    odd_dfs = (
-        gama[lower_edges] - 1
-    ) * (  # (gama[nn+1]-1.)*(cpm1[nn+1]-cp[nn]) + (1.-gama[nn+1])*(cm[nn]-cmm1[nn+1])
-        (cpm1[lower_edges] - cp[upper_edges]) + (cmm1[lower_edges] - cm[upper_edges])
-    )
+    odd_afs = (e1[upper_edges] + e3[upper_edges]) * (gama[lower_edges] - 1)
+    odd_bfs = (e2[upper_edges] + e4[upper_edges]) * (gama[lower_edges] - 1)
+    odd_cfs = 2 * (1 - gama[lower_edges] * gama[lower_edges])
+    odd_dfs = (gama[lower_edges] - 1) * (cpm1[lower_edges] - cp[upper_edges]) + (
+        1 - gama[lower_edges]
+    ) * (cm[upper_edges] - cmm1[lower_edges])
 
     # even indices -- NOTE: even and odd have been switched from the
     # Fortran code and Toon et al. due to fencepost effects.
-    even_afs = 2 * (1 - gama[upper_edges] ** 2)  # 2.*(1.-gama[nn]*gama[nn])
-    even_bfs = (e1[upper_edges] - e3[upper_edges]) * (
-        gama[lower_edges] + 1
-    )  # (e1[nn]-e3[nn])*(1.+gama[nn+1])
-    even_cfs = odd_afs  # (e1[nn]+e3[nn])*(gama[nn+1]-1.)
+    even_afs = 2 * (1 - gama[upper_edges] * gama[upper_edges])
+    even_bfs = (e1[upper_edges] - e3[upper_edges]) * (1 + gama[lower_edges])
+    even_cfs = (e1[upper_edges] + e3[upper_edges]) * (gama[lower_edges] - 1)
     even_dfs = e3[upper_edges] * (cpm1[lower_edges] - cp[upper_edges]) + e1[
         upper_edges
-    ] * (
-        cm[upper_edges] - cmm1[lower_edges]
-    )  # e3[nn]*(cpm1[nn+1]-cp[nn]) + e1[nn]*(cm[nn]-cmm1[nn+1])
+    ] * (cm[upper_edges] - cmm1[lower_edges])
 
-    af_base = e1[:, -1] - rsf * e3[:, -1]  # e1[nlayershort-1] - rsf*e3[nlayershort-1]
-    bf_base = e2[:, -1] - rsf * e4[:, -1]  # e2[nlayershort-1] - rsf*e4[nlayershort-1]
-    cf_base = 0
+    af_base = e1[..., -1] - rsf * e3[..., -1]
+    bf_base = e2[..., -1] - rsf * e4[..., -1]
+    cf_base = np.zeros_like(af_base)
     # note: original C++ version says bsurf, but was called with bottom
-    df_base = (
-        bottom - cp[:, -1] + rsf * cm[:, -1]
-    )  # bottom - cp[nlayershort-1] + rsf*cm[nlayershort-1]
+    df_base = bottom - cp[..., -1] + rsf * cm[..., -1]
+
+    def assemble_diagonal(top, odd_terms, even_terms, base):
+        # Along the last axis: top, odd_0, even_0, odd_1, even_1, ..., base.
+        return np.concatenate(
+            [
+                top[..., np.newaxis],
+                interleave(odd_terms, even_terms),
+                base[..., np.newaxis],
+            ],
+            axis=-1,
+        )
 
-    afs = np.stack([af_top, interleave(odd_afs, even_afs), af_base], axis=-1)
-    bfs = np.stack([bf_top, interleave(odd_bfs, even_bfs), bf_base], axis=-1)
-    cfs = np.stack([cf_top, interleave(odd_cfs, even_cfs), cf_base], axis=-1)
-    dfs = np.stack([df_top, interleave(odd_dfs, even_dfs), df_base], axis=-1)
+    afs = assemble_diagonal(af_top, odd_afs, even_afs, af_base)
+    bfs = assemble_diagonal(bf_top, odd_bfs, even_bfs, bf_base)
+    cfs = assemble_diagonal(cf_top, odd_cfs, even_cfs, cf_base)
+    dfs = assemble_diagonal(df_top, odd_dfs, even_dfs, df_base)
 
     return afs, bfs, cfs, dfs
 
@@ -244,37 +328,91 @@ def DSolver_subroutine(cp, cpm1, cm, cmm1, ep, btop, bottom, gama, rsf=0):
 # End of DSolver subroutine.
 
 
-def DTRIDGL_subroutine(afs, bfs, cfs, dfs):
+def DTRIDGL_subroutine(
+    afs, bfs, cfs, dfs, tridiagonal_solver: TridiagonalSolver = TridiagonalSolver.thomas
+):
     # DTRIDGL subroutine to compute the necessary xki array
     # This matches the algorithm in Toon et al.
-    af_base = afs[-1]
-    bf_base = bfs[-1]
-    df_base = dfs[-1]
+    # The last axis runs over the 2 * number_of_layers unknowns.
+    if tridiagonal_solver == TridiagonalSolver.banded:
+        return solve_DTRIDGL_system_banded(afs, bfs, cfs, dfs)
+
+    # The sweeps step along the half-layer axis, so it is moved to the front: each
+    # step then works on one contiguous vector of every (model, wavelength) row.
+    afs, bfs, cfs, dfs = (
+        np.ascontiguousarray(np.moveaxis(terms, -1, 0), dtype=np.float64)
+        for terms in np.broadcast_arrays(afs, bfs, cfs, dfs)
+    )
+    twice_number_of_layers = len(afs)
+
+    as_terms = np.zeros_like(afs)
+    ds_terms = np.zeros_like(afs)
+    as_terms[-1] = afs[-1] / bfs[-1]
+    ds_terms[-1] = dfs[-1] / bfs[-1]
+
+    # As in getFlux, the back-substitution stops at index 1, leaving as[0] = ds[0] = 0.
+    xx = np.empty_like(afs[0])
+    for half_layer in reversed(range(1, twice_number_of_layers - 1)):
+        # xx = 1 / (bf - cf * as[+1]); as = af * xx; ds = (df - cf * ds[+1]) * xx
+        np.multiply(cfs[half_layer], as_terms[half_layer + 1], out=xx)
+        np.subtract(bfs[half_layer], xx, out=xx)
+        np.divide(1, xx, out=xx)
+        np.multiply(afs[half_layer], xx, out=as_terms[half_layer])
+        np.multiply(cfs[half_layer], ds_terms[half_layer + 1], out=ds_terms[half_layer])
+        np.subtract(dfs[half_layer], ds_terms[half_layer], out=ds_terms[half_layer])
+        np.multiply(ds_terms[half_layer], xx, out=ds_terms[half_layer])
 
-    as_base = af_base / bf_base  # as[nl2-1] = af[nl2-1]/bf[nl2-1]
-    ds_base = df_base / bf_base  # ds[nl2-1] = df[nl2-1]/bf[nl2-1]
+    xki_terms = np.empty_like(ds_terms)
+    xki_terms[0] = ds_terms[0]
 
-    as_terms = np.empty_like(afs, dtype=np.float64)
-    as_terms[-1] = as_base
-    ds_terms = np.empty_like(afs, dtype=np.float64)
-    ds_terms[-1] = ds_base
+    for half_layer in range(1, twice_number_of_layers):
+        # xki = ds - as * xki[-1]
+        np.multiply(
+            as_terms[half_layer], xki_terms[half_layer - 1], out=xki_terms[half_layer]
+        )
+        np.subtract(
+            ds_terms[half_layer], xki_terms[half_layer], out=xki_terms[half_layer]
+        )
 
-    twice_number_of_layers = np.shape(afs)[-1]
+    return np.moveaxis(xki_terms, 0, -1)
 
-    for half_layer in reversed(range(twice_number_of_layers)):
-        xx = 1 / (bfs[half_layer] - cfs[half_layer] * as_terms[half_layer])
-        as_terms[half_layer - 1] = afs[half_layer] / xx
-        ds_terms[half_layer - 1] = (
-            dfs[half_layer] - cfs[half_layer] * ds_terms[half_layer]
-        ) * xx
 
-    xki_terms = np.empty_like(ds_terms)
-    xki_terms[0] = ds_terms[0]
+def solve_DTRIDGL_system_banded(
+    afs, bfs, cfs, dfs, rows_per_chunk: int = BANDED_SOLVER_ROWS_PER_CHUNK
+):
+    # The same system solved with LAPACK. DTRIDGL never uses the first equation and
+    # leaves xki[0] = 0, so that row is replaced by xki[0] = 0 here to give the same
+    # answer. The systems of a chunk of rows are strung together into one banded
+    # matrix; they do not couple, since af is zero in each first row and cf in each
+    # last row.
+    afs, bfs, cfs, dfs = np.broadcast_arrays(afs, bfs, cfs, dfs)
+    system_shape = np.shape(afs)
+    twice_number_of_layers = system_shape[-1]
+
+    afs, bfs, cfs, dfs = (
+        np.array(terms, dtype=np.float64).reshape(-1, twice_number_of_layers)
+        for terms in (afs, bfs, cfs, dfs)
+    )
+    afs[:, 0] = 0.0
+    bfs[:, 0] = 1.0
+    cfs[:, 0] = 0.0
+    dfs[:, 0] = 0.0
+
+    xki_terms = np.empty_like(dfs)
+    for chunk_start in range(0, len(dfs), rows_per_chunk):
+        chunk = slice(chunk_start, chunk_start + rows_per_chunk)
+        chunk_diagonal = bfs[chunk].ravel()
 
-    for half_layer, (as_term, ds_term) in enumerate(zip(as_terms[1:], ds_terms[1:])):
-        xki_terms[half_layer + 1] = ds_term - as_term * xki_terms[half_layer]
+        banded_matrix = np.zeros((3, len(chunk_diagonal)))
+        banded_matrix[0, 1:] = cfs[chunk].ravel()[:-1]
+        banded_matrix[1] = chunk_diagonal
+        banded_matrix[2, :-1] = afs[chunk].ravel()[1:]
 
-    return xki_terms
+        xki_terms[chunk] = solve_banded(
+            (1, 1), banded_matrix, dfs[chunk].ravel(), check_finite=False
+        ).reshape(-1, twice_number_of_layers)
+
+    return xki_terms.reshape(system_shape)
 
 
 # End of DTRIDGL subroutine
@@ -286,6 +424,8 @@ def calculate_flux(
     scattering_asymmetry: NDArray[np.float64],
     thermal_intensity: NDArray[np.float64],
     delta_thermal_intensity: NDArray[np.float64],
+    thermal_intensity_at_TOA: NDArray[np.float64],
+    thermal_intensity_at_base: NDArray[np.float64],
     xki_terms: NDArray[np.float64],
     stream_cosine_angles: NDArray[np.float64] = STREAM_COSINE_ANGLES,
     stream_weights: NDArray[np.float64] = STREAM_WEIGHTS,
@@ -294,68 +434,78 @@ def calculate_flux(
     tau = optical_depth_per_layer
     w0 = single_scattering_albedo
     g = scattering_asymmetry
-    thermal_intensity_at_base = thermal_intensity[-1] + delta_thermal_intensity[-1] / 2
-
+    b0 = thermal_intensity
+    bdiff = delta_thermal_intensity
     bsurf = thermal_intensity_at_base
-    number_of_layers = np.shape(tau)[-1]
 
     # NOTE: there was a line in the original C++ for loop (index n3):
     # if(xk2[n3]!=0. && fabs(xk2[n3]/xk[2*n3] < 1.e-30)) xk2[n3] = 0.;
-    # but note xk was only initialized, so all xk would be zero at this step?
-    even_xki_terms = xki_terms[0::2]
-    odd_xki_terms = xki_terms[1::2]
+    # but xk there is left over from the previous wavelength (and indexed past its
+    # end), so it is not reproduced here.
+    even_xki_terms = xki_terms[..., 0::2]
+    odd_xki_terms = xki_terms[..., 1::2]
     xk1_terms = even_xki_terms + odd_xki_terms
     xk2_terms = even_xki_terms - odd_xki_terms
 
     # These are calculated just as they are in the setup function.
     # My goal is to decouple the RT components as much as possible, which leads
     # to this bit of redundant calculation (there's probably a better way!).
-    alpha = np.sqrt(
-        (1 - w0) / (1 - w0 * g)
-    )  # sqrt( (1.-w0[i][j])/(1.-w0[i][j]*asym[i][j]) )
-    lamda = alpha * (1 - w0 * g) / mu_1  # alpha[j]*(1.-w0[i][j]*cosbar[j])/mu_1
-    lamda_x_tau = np.clip(lamda * tau, a_min=None, a_max=MAXIMUM_EXP_FLOAT)
+    alpha, lamda = calculate_hemispheric_mean_terms(w0, g, mu_1)
 
     # These are the variables that are used to compute the flux.
     # They are all functions of the e-coefficient and blackbody fluxes via the matrix solver.
-    gg_terms = xk1_terms * 2 * np.pi * w0 * (1 + (g * alpha)) / (1 + alpha)
-    hh_terms = xk2_terms * 2 * np.pi * w0 * (1 - (g * alpha)) / (1 + alpha)
-
-    blackbody_scattering_term = delta_thermal_intensity * (
-        mu_1 * (w0 * g) / (1 - w0 * g)
+    is_scattering = w0 >= MINIMUM_SCATTERING_ALBEDO
+    gg_terms = np.where(
+        is_scattering,
+        2 * np.pi * w0 * xk1_terms * (1 + g * alpha) / (1 + alpha),
+        0.0,
     )
-    alpha1 = 2 * np.pi * (thermal_intensity + blackbody_scattering_term)
-    alpha2 = 2 * np.pi * delta_thermal_intensity
-
-    stream_cosine_angles = np.expand_dims(
-        stream_cosine_angles, axis=tuple(range(1, w0.ndim + 1))
+    hh_terms = np.where(
+        is_scattering,
+        2 * np.pi * w0 * xk2_terms * (1 - g * alpha) / (1 + alpha),
+        0.0,
+    )
+    alpha1 = np.where(
+        is_scattering,
+        2 * np.pi * (b0 + bdiff * (mu_1 * w0 * g / (1 - w0 * g))),
+        2 * np.pi * b0,
     )
-    stream_weights = np.expand_dims(stream_weights, axis=tuple(range(1, w0.ndim + 1)))
+    alpha2 = 2 * np.pi * bdiff
 
-    epp_terms = np.exp(lamda_x_tau)
-    em1_terms = np.exp(-lamda_x_tau)
-    em2_terms = np.exp(-tau / stream_cosine_angles)
-    em3_terms = em1_terms * em2_terms
+    em1_terms = np.exp(-lamda * tau)
+    epp_terms = np.exp(np.minimum(lamda * tau, MAXIMUM_EXP_FLOAT))
 
-    fpt_base = (
-        2 * np.pi * (bsurf + delta_thermal_intensity[:, -1] * stream_cosine_angles)
-    )
-    fpt_terms = np.empty_like(delta_thermal_intensity, dtype=np.float64)
-    fpt_terms[-1] = fpt_base
-
-    for layer in reversed(range(number_of_layers)):
-        fpt_terms[:, layer - 1] = (
-            fpt_terms[:, layer] * em2_terms[:, layer]
-            + gg_terms[:, layer]
-            / (lamda[:, layer] * stream_cosine_angles - 1)
-            * (epp_terms[:, layer] * em2_terms[:, layer] - 1)
-            + hh_terms[:, layer]
-            / (lamda[:, layer] * stream_cosine_angles + 1)
-            * (1 - em3_terms[:, layer])
-            + alpha1[:, layer] * (1 - em2_terms[:, layer])
-            + alpha2[:, layer]
-            * (stream_cosine_angles * (em2_terms[:, layer] - 1) + tau[..., layer])
+    number_of_layers = np.shape(tau)[-1]
+    total_flux = 0.0
+    for stream_cosine_angle, stream_weight in zip(stream_cosine_angles, stream_weights):
+        em2_terms = np.exp(-tau / stream_cosine_angle)
+        em3_terms = em1_terms * em2_terms
+
+        gg_contributions = (
+            gg_terms
+            / (lamda * stream_cosine_angle - 1.0)
+            * (epp_terms * em2_terms - 1.0)
         )
+        hh_contributions = (
+            hh_terms / (lamda * stream_cosine_angle + 1.0) * (1.0 - em3_terms)
+        )
+        alpha1_contributions = alpha1 * (1.0 - em2_terms)
+        alpha2_contributions = alpha2 * (
+            stream_cosine_angle - (tau + stream_cosine_angle) * em2_terms
+        )
+
+        # fpt is the outward flux, computed by adding up the quadrature terms
+        # from the bottom of the atmosphere up.
+        fpt = 2.0 * np.pi * (bsurf + bdiff[..., -1] * stream_cosine_angle)
+        for layer in reversed(range(number_of_layers)):
+            fpt = (
+                fpt * em2_terms[..., layer]
+                + gg_contributions[..., layer]
+                + hh_contributions[..., layer]
+                + alpha1_contributions[..., layer]
+                + alpha2_contributions[..., layer]
+            )
+
+        total_flux = total_flux + stream_weight * fpt
 
-    total_flux = stream_weights * fpt_terms[..., ::-1]
     return total_flux
@@ -1,42 +1,35 @@
-from typing import Final, NamedTuple
+"""
+Compiled (numba) backend for the Toon et al. (1989) two-stream solver.
+
+Same inputs, outputs and arithmetic as RT_Toon1989.py, but each step is a kernel that
+runs in parallel over (model, wavelength) rows and walks the layers with scalars, so
+no temporary arrays are made inside the layer loops. The blackbody terms are still
+computed with NumPy, as they are a single vectorized pass.
+"""
+
+from typing import Final
 
 import numpy as np
+from numba import njit, prange
 from numpy.typing import NDArray
 
-from useful_internal_functions import interleave
-
-c: Final[float] = 2.99792458e10  # in CGS
-hc: Final[float] = 1.98644568e-16  # in CGS
-hc_over_k: Final[float] = 1.98644568 / 1.38064852
-
-MAXIMUM_EXP_FLOAT: Final[float] = 35
-
-STREAM_COSINE_ANGLES = np.array(
-    [
-        0.0446339553,
-        0.1443662570,
-        0.2868247571,
-        0.4548133152,
-        0.6280678354,
-        0.7856915206,
-        0.9086763921,
-        0.9822200849,
-    ]
+from apollo.radiative_transfer.contributions import (
+    ContributionOpticalDepths,
+    EmissionWithContributions,
+    calculate_contribution_functions,
 )
-
-STREAM_WEIGHTS: Final[NDArray[np.float64]] = np.array(
-    [
-        0.0032951914,
-        0.0178429027,
-        0.0454393195,
-        0.0791995995,
-        0.1060473494,
-        0.1125057995,
-        0.0911190236,
-        0.0445508044,
-    ]
+from apollo.radiative_transfer.RT_Toon1989 import (
+    MAXIMUM_EXP_FLOAT,
+    MINIMUM_SCATTERING_ALBEDO,
+    STREAM_COSINE_ANGLES,
+    STREAM_WEIGHTS,
+    PlanckCache,
+    thermal_intensity_by_layer,
 )
 
+mu_1: Final[float] = 0.5  # This is mu_1 in Toon et al. 1989
+rsf: Final[float] = 0.0  # "surface" reflectivity, zero for emission
+
 
 ###############################################################################
 ############################ Main callable function. ##########################
@@ -49,313 +42,220 @@ def RT_Toon1989(
     scattering_asymmetry: NDArray[np.float64],
     stream_cosine_angles: NDArray[np.float64] = STREAM_COSINE_ANGLES,
     stream_weights: NDArray[np.float64] = STREAM_WEIGHTS,
-):
-    thermal_intensity, delta_thermal_intensity = thermal_intensity_by_layer(
-        temperatures_in_K, wavelengths_in_cm
+    planck_cache: PlanckCache | None = None,
+    contribution_optical_depths: ContributionOpticalDepths | None = None,
+) -> NDArray[np.float64] | EmissionWithContributions:
+    thermal_intensities = thermal_intensity_by_layer(
+        temperatures_in_K, wavelengths_in_cm, optical_depth_per_layer, planck_cache
     )
 
-    terms_for_DSolver = calculate_terms_for_DSolver(
-        optical_depth_per_layer,
-        single_scattering_albedo,
-        scattering_asymmetry,
-        thermal_intensity,
-        delta_thermal_intensity,
+    layer_shape = np.broadcast_shapes(
+        np.shape(optical_depth_per_layer),
+        np.shape(single_scattering_albedo),
+        np.shape(scattering_asymmetry),
+        np.shape(thermal_intensities.thermal_intensity),
     )
-
-    terms_for_DTRIDGL = DSolver_subroutine(*terms_for_DSolver)
-
-    xki_terms = DTRIDGL_subroutine(*terms_for_DTRIDGL)
-
-    total_flux = calculate_flux(
-        optical_depth_per_layer,
-        single_scattering_albedo,
-        scattering_asymmetry,
-        thermal_intensity,
-        delta_thermal_intensity,
-        stream_cosine_angles,
-        stream_weights,
-        xki_terms,
-    )
-    return total_flux
-
-
-###############################################################################
-
-
-def blackbody_intensity_by_wavelength(temperature_in_K, wavelength_in_cm):
-    T, wave = temperature_in_K, wavelength_in_cm
-    return (2 * hc * c / wave**5) / (np.exp(hc_over_k * (wave / T)) - 1)
-
-
-def thermal_intensity_by_layer(
-    temperatures_in_K: NDArray[np.float64], wavelengths_in_cm: NDArray[np.float64]
-):
-    wavelength_grid, temperature_grid = np.meshgrid(
-        wavelengths_in_cm, temperatures_in_K
-    )
-    thermal_intensity_bin_edges = blackbody_intensity_by_wavelength(
-        temperature_grid, wavelength_grid
+    output_shape = layer_shape[:-1]
+
+    def as_rows(array, shape):
+        # The kernels work on (model x wavelength, ...) rows of contiguous float64.
+        return np.ascontiguousarray(
+            np.broadcast_to(array, shape), dtype=np.float64
+        ).reshape(-1, *shape[len(output_shape) :])
+
+    tau, w0, g, b0, bdiff = (
+        as_rows(array, layer_shape)
+        for array in (
+            optical_depth_per_layer,
+            single_scattering_albedo,
+            scattering_asymmetry,
+            thermal_intensities.thermal_intensity,
+            thermal_intensities.delta_thermal_intensity,
+        )
     )
-
-    # mean across each layer bin
-    thermal_intensity = (
-        thermal_intensity_bin_edges[:, :-1] + thermal_intensity_bin_edges[:, 1:]
-    ) / 2
-    # change across each layer bin
-    delta_thermal_intensity = (
-        thermal_intensity_bin_edges[:, 1:] - thermal_intensity_bin_edges[:, :-1]
+    b_top, b_base = (
+        as_rows(array, output_shape)
+        for array in (
+            thermal_intensities.thermal_intensity_at_TOA,
+            thermal_intensities.thermal_intensity_at_base,
+        )
     )
 
-    return thermal_intensity, delta_thermal_intensity
-
-
-class DsolverInputs(NamedTuple):
-    # cp, cpm1, cm, cmm1, ep, btop, bottom, gama
-    cp: NDArray[np.float64]  # size of array:
-    cpm1: NDArray[np.float64]
-    cm: NDArray[np.float64]
-    cmm1: NDArray[np.float64]
-    ep: NDArray[np.float64]
-    btop: NDArray[np.float64]
-    bottom: NDArray[np.float64]
-    gama: NDArray[np.float64]
-
-
-def calculate_terms_for_DSolver(
-    # size of array: (number_of_models, number_of_layers, number_of_wavelengths)
-    optical_depth_per_layer: NDArray[np.float64],
-    # size of array: (number_of_models, number_of_layers, number_of_wavelengths)
-    single_scattering_albedo: NDArray[np.float64],
-    # size of array: (number_of_models, number_of_layers, number_of_wavelengths)
-    scattering_asymmetry: NDArray[np.float64],
-    thermal_intensity: NDArray[np.float64],
-    delta_thermal_intensity: NDArray[np.float64],
-    mu_1: float = 0.5,  # This is mu_1 in Toon et al. 1989
-):
-    number_of_wavelengths, number_of_layers = np.shape(optical_depth_per_layer)
-    tau = optical_depth_per_layer
-    w0 = single_scattering_albedo
-    g = scattering_asymmetry
-    tbfrac: float = 1  # INCOMPLETE IMPLEMENTATION
-    # tbase = getT(hmin)       # INCOMPLETE IMPLEMENTATION
-    thermal_intensity_at_TOA = thermal_intensity[0] - delta_thermal_intensity[0] / 2
-    thermal_intensity_at_base = thermal_intensity[-1] + delta_thermal_intensity[-1] / 2
-
-    alpha = np.sqrt(
-        (1 - w0) / (1 - w0 * g)
-    )  # sqrt( (1.-w0[i][j])/(1.-w0[i][j]*asym[i][j]) )
-    lamda = alpha * (1 - w0 * g) / mu_1  # alpha[j]*(1.-w0[i][j]*cosbar[j])/mu_1
-    gama = (1 - alpha) / (1 + alpha)  # (1.-alpha[j])/(1.+alpha[j])
-    term = 1 / 2 / (1 - w0 * g)  # 0.5/(1.-w0[i][j]*cosbar[j])
-
-    dti_x_term = delta_thermal_intensity * term
-    dti_x_tau = delta_thermal_intensity * tau
-
-    cpm1 = thermal_intensity + dti_x_term
-    cp = cpm1 + dti_x_tau
-    cmm1 = thermal_intensity - dti_x_term
-    cm = cmm1 + dti_x_tau
-
-    lamda_x_tau = np.clip(lamda * tau, a_min=None, a_max=MAXIMUM_EXP_FLOAT)
-    ep = np.exp(lamda_x_tau)
-
-    tautop = tau[:, 0]
-    btop = (
-        (1 - np.exp(-tautop / mu_1)) * thermal_intensity_at_TOA
-    )  # (1. - exp(-tautop/mu_1))*blackbodyL(tprof[0],wavelength)
-    bsurf = thermal_intensity_at_base  # blackbodyL(tbase,wavelength)
-    bottom = bsurf + delta_thermal_intensity[:, -1] * (
-        mu_1 / tbfrac
-    )  # Equivalent to multiplying taulayer by tbfrac.
-
-    return cp, cpm1, cm, cmm1, ep, btop, bottom, gama
-
-
-def DSolver_subroutine(cp, cpm1, cm, cmm1, ep, btop, bottom, gama, rsf=0):
-    # rsf is "surface" reflectivity, can set to zero
-    # Surface reflectivity should be zero for emission.
-    # (It is used in the tridiagonal matrix in the bottom layer.)
-
-    # DSolver subroutine to compute xk1 and xk2.
-    # Computes a,b,c,d coefficients first, top to bottom
-    # Then as and ds, *bottom to top*
-    # Then xk coefficients, top to bottom
-    # af, bd, cd, and df appear to be A_l, B_l, D_l, and E_l in Toon et al.
-    # xk1 and xk2 appear to be Y_1n and Y_2n in Toon et al.
-    # However, these do not match their formulae.
-    top_layer = [slice(None), slice(0)]
-    # bottom_layer = [slice(None), slice(-1)]
-    upper_edges = [slice(None), slice(None, -1)]
-    lower_edges = [slice(None), slice(1, None)]
-
-    e1 = ep + gama / ep
-    e2 = ep - gama / ep
-    e3 = gama * ep + 1 / ep
-    e4 = gama * ep - 1 / ep
-
-    af_top = 0
-    bf_top = gama[top_layer] + 1
-    cf_top = gama[top_layer] - 1
-    df_top = btop - cmm1[top_layer]
-
-    # odd indices
-    odd_afs = (e1[upper_edges] + e3[upper_edges]) * (
-        gama[lower_edges] - 1
-    )  # (e1[nn]+e3[nn])*(gama[nn+1]-1.)
-    odd_bfs = (e2[upper_edges] + e4[upper_edges]) * (
-        gama[lower_edges] - 1
-    )  # e2[nn]+e4[nn])*(gama[nn+1]-1.)
-    odd_cfs = 2 * (1 - gama[lower_edges] ** 2)  # 2.*(1.-gama[nn+1]*gama[nn+1])
-    odd_dfs = (
-        gama[lower_edges] - 1
-    ) * (  # (gama[nn+1]-1.)*(cpm1[nn+1]-cp[nn]) + (1.-gama[nn+1])*(cm[nn]-cmm1[nn+1])
-        (cpm1[lower_edges] - cp[upper_edges]) + (cmm1[lower_edges] - cm[upper_edges])
+    number_of_rows, number_of_layers = tau.shape
+    afs, bfs, cfs, dfs = np.empty((4, number_of_rows, 2 * number_of_layers))
+    DSolver_kernel(tau, w0, g, b0, bdiff, b_top, b_base, afs, bfs, cfs, dfs)
+
+    xki_terms = np.empty_like(afs)
+    DTRIDGL_kernel(afs, bfs, cfs, dfs, xki_terms)
+
+    total_flux = np.empty(number_of_rows)
+    flux_kernel(
+        tau,
+        w0,
+        g,
+        b0,
+        bdiff,
+        b_base,
+        xki_terms,
+        np.ascontiguousarray(stream_cosine_angles, dtype=np.float64),
+        np.ascontiguousarray(stream_weights, dtype=np.float64),
+        total_flux,
     )
 
-    # even indices -- NOTE: even and odd have been switched from the
-    # Fortran code and Toon et al. due to fencepost effects.
-    even_afs = 2 * (1 - gama[upper_edges] ** 2)  # 2.*(1.-gama[nn]*gama[nn])
-    even_bfs = (e1[upper_edges] - e3[upper_edges]) * (
-        gama[lower_edges] + 1
-    )  # (e1[nn]-e3[nn])*(1.+gama[nn+1])
-    even_cfs = odd_afs  # (e1[nn]+e3[nn])*(gama[nn+1]-1.)
-    even_dfs = e3[upper_edges] * (cpm1[lower_edges] - cp[upper_edges]) + e1[
-        upper_edges
-    ] * (
-        cm[upper_edges] - cmm1[lower_edges]
-    )  # e3[nn]*(cpm1[nn+1]-cp[nn]) + e1[nn]*(cm[nn]-cmm1[nn+1])
-
-    af_base = e1[:, -1] - rsf * e3[:, -1]  # e1[nlayershort-1] - rsf*e3[nlayershort-1]
-    bf_base = e2[:, -1] - rsf * e4[:, -1]  # e2[nlayershort-1] - rsf*e4[nlayershort-1]
-    cf_base = 0
-    # note: original C++ version says bsurf, but was called with bottom
-    df_base = (
-        bottom - cp[:, -1] + rsf * cm[:, -1]
-    )  # bottom - cp[nlayershort-1] + rsf*cm[nlayershort-1]
-
-    afs = np.stack([af_top, interleave(odd_afs, even_afs), af_base], axis=-1)
-    bfs = np.stack([bf_top, interleave(odd_bfs, even_bfs), bf_base], axis=-1)
-    cfs = np.stack([cf_top, interleave(odd_cfs, even_cfs), cf_base], axis=-1)
-    dfs = np.stack([df_top, interleave(odd_dfs, even_dfs), df_base], axis=-1)
-
-    return afs, bfs, cfs, dfs
-
-
-# End of DSolver subroutine.
-
-
-def DTRIDGL_subroutine(afs, bfs, cfs, dfs):
-    # DTRIDGL subroutine to compute the necessary xki array
-    # This matches the algorithm in Toon et al.
-    af_base = afs[-1]
-    bf_base = bfs[-1]
-    df_base = dfs[-1]
-
-    as_base = af_base / bf_base  # as[nl2-1] = af[nl2-1]/bf[nl2-1]
-    ds_base = df_base / bf_base  # ds[nl2-1] = df[nl2-1]/bf[nl2-1]
-
-    as_terms = np.empty_like(afs, dtype=np.float64)
-    as_terms[-1] = as_base
-    ds_terms = np.empty_like(afs, dtype=np.float64)
-    ds_terms[-1] = ds_base
-
-    twice_number_of_layers = np.shape(afs)[-1]
-
-    for half_layer in reversed(range(twice_number_of_layers)):
-        xx = 1 / (bfs[half_layer] - cfs[half_layer] * as_terms[half_layer])
-        as_terms[half_layer - 1] = afs[half_layer] / xx
-        ds_terms[half_layer - 1] = (
-            dfs[half_layer] - cfs[half_layer] * ds_terms[half_layer]
-        ) * xx
-
-    xki_terms = np.empty_like(ds_terms)
-    xki_terms[0] = ds_terms[0]
+    total_flux = total_flux.reshape(output_shape)
 
-    for half_layer, (as_term, ds_term) in enumerate(zip(as_terms[1:], ds_terms[1:])):
-        xki_terms[half_layer + 1] = ds_term - as_term * xki_terms[half_layer]
+    if contribution_optical_depths is None:
+        return total_flux
 
-    return xki_terms
-
-
-# End of DTRIDGL subroutine
-
-
-def calculate_flux(
-    optical_depth_per_layer: NDArray[np.float64],
-    single_scattering_albedo: NDArray[np.float64],
-    scattering_asymmetry: NDArray[np.float64],
-    thermal_intensity: NDArray[np.float64],
-    delta_thermal_intensity: NDArray[np.float64],
-    xki_terms: NDArray[np.float64],
-    stream_cosine_angles: NDArray[np.float64] = STREAM_COSINE_ANGLES,
-    stream_weights: NDArray[np.float64] = STREAM_WEIGHTS,
-    mu_1: float = 0.5,  # This is mu_1 in Toon et al. 1989
-) -> NDArray[np.float64]:
-    tau = optical_depth_per_layer
-    w0 = single_scattering_albedo
-    g = scattering_asymmetry
-    thermal_intensity_at_base = thermal_intensity[-1] + delta_thermal_intensity[-1] / 2
-
-    bsurf = thermal_intensity_at_base
-    number_of_layers = np.shape(tau)[-1]
-
-    # NOTE: there was a line in the original C++ for loop (index n3):
-    # if(xk2[n3]!=0. && fabs(xk2[n3]/xk[2*n3] < 1.e-30)) xk2[n3] = 0.;
-    # but note xk was only initialized, so all xk would be zero at this step?
-    even_xki_terms = xki_terms[0::2]
-    odd_xki_terms = xki_terms[1::2]
-    xk1_terms = even_xki_terms + odd_xki_terms
-    xk2_terms = even_xki_terms - odd_xki_terms
-
-    # These are calculated just as they are in the setup function.
-    # My goal is to decouple the RT components as much as possible, which leads
-    # to this bit of redundant calculation (there's probably a better way!).
-    alpha = np.sqrt(
-        (1 - w0) / (1 - w0 * g)
-    )  # sqrt( (1.-w0[i][j])/(1.-w0[i][j]*asym[i][j]) )
-    lamda = alpha * (1 - w0 * g) / mu_1  # alpha[j]*(1.-w0[i][j]*cosbar[j])/mu_1
-    lamda_x_tau = np.clip(lamda * tau, a_min=None, a_max=MAXIMUM_EXP_FLOAT)
-
-    # These are the variables that are used to compute the flux.
-    # They are all functions of the e-coefficient and blackbody fluxes via the matrix solver.
-    gg_terms = xk1_terms * 2 * np.pi * w0 * (1 + (g * alpha)) / (1 + alpha)
-    hh_terms = xk2_terms * 2 * np.pi * w0 * (1 - (g * alpha)) / (1 + alpha)
-
-    blackbody_scattering_term = delta_thermal_intensity * (
-        mu_1 * (w0 * g) / (1 - w0 * g)
+    return EmissionWithContributions(
+        emitted_flux=total_flux,
+        contribution_functions=calculate_contribution_functions(
+            optical_depth_per_layer,
+            thermal_intensities.thermal_intensity,
+            contribution_optical_depths,
+        ),
     )
-    alpha1 = 2 * np.pi * (thermal_intensity + blackbody_scattering_term)
-    alpha2 = 2 * np.pi * delta_thermal_intensity
 
-    stream_cosine_angles = np.expand_dims(
-        stream_cosine_angles, axis=tuple(range(1, w0.ndim + 1))
-    )
-    stream_weights = np.expand_dims(stream_weights, axis=tuple(range(1, w0.ndim + 1)))
 
-    epp_terms = np.exp(lamda_x_tau)
-    em1_terms = np.exp(-lamda_x_tau)
-    em2_terms = np.exp(-tau / stream_cosine_angles)
-    em3_terms = em1_terms * em2_terms
+###############################################################################
 
-    fpt_base = (
-        2 * np.pi * (bsurf + delta_thermal_intensity[:, -1] * stream_cosine_angles)
-    )
-    fpt_terms = np.empty_like(delta_thermal_intensity, dtype=np.float64)
-    fpt_terms[-1] = fpt_base
-
-    for layer in reversed(range(number_of_layers)):
-        fpt_terms[:, layer - 1] = (
-            fpt_terms[:, layer] * em2_terms[:, layer]
-            + gg_terms[:, layer]
-            / (lamda[:, layer] * stream_cosine_angles - 1)
-            * (epp_terms[:, layer] * em2_terms[:, layer] - 1)
-            + hh_terms[:, layer]
-            / (lamda[:, layer] * stream_cosine_angles + 1)
-            * (1 - em3_terms[:, layer])
-            + alpha1[:, layer] * (1 - em2_terms[:, layer])
-            + alpha2[:, layer]
-            * (stream_cosine_angles * (em2_terms[:, layer] - 1) + tau[..., layer])
-        )
 
-    total_flux = stream_weights * fpt_terms[..., ::-1]
-    return total_flux
+@njit(parallel=True, cache=True)
+def DSolver_kernel(tau, w0, g, b0, bdiff, b_top, b_base, afs, bfs, cfs, dfs):
+    # Fills the tridiagonal system (af, bf, cf, df) of DSolver, one row at a time.
+    number_of_rows, number_of_layers = tau.shape
+    nl2 = 2 * number_of_layers
+
+    for i in prange(number_of_rows):
+        # Layer nn's terms are carried over while layer nn + 1's are computed.
+        gama_nn = cp_nn = cm_nn = e1_nn = e2_nn = e3_nn = e4_nn = 0.0
+
+        for j in range(number_of_layers):
+            alpha = np.sqrt((1.0 - w0[i, j]) / (1.0 - w0[i, j] * g[i, j]))
+            lamda = alpha * (1.0 - w0[i, j] * g[i, j]) / mu_1
+            gama = (1.0 - alpha) / (1.0 + alpha)
+            term = 0.5 / (1.0 - w0[i, j] * g[i, j])
+
+            cp = b0[i, j] + bdiff[i, j] * tau[i, j] + bdiff[i, j] * term
+            cm = b0[i, j] + bdiff[i, j] * tau[i, j] - bdiff[i, j] * term
+            cpm1 = b0[i, j] + bdiff[i, j] * term
+            cmm1 = b0[i, j] - bdiff[i, j] * term
+
+            ep = np.exp(min(lamda * tau[i, j], MAXIMUM_EXP_FLOAT))
+            e1 = ep + gama / ep
+            e2 = ep - gama / ep
+            e3 = gama * ep + 1.0 / ep
+            e4 = gama * ep - 1.0 / ep
+
+            if j == 0:
+                btop = (1.0 - np.exp(-tau[i, 0] / mu_1)) * b_top[i]
+                afs[i, 0] = 0.0
+                bfs[i, 0] = gama + 1.0
+                cfs[i, 0] = gama - 1.0
+                dfs[i, 0] = btop - cmm1
+            else:
+                # odd index, then even index, for nn = j - 1
+                ii = 2 * j - 1
+                afs[i, ii] = (e1_nn + e3_nn) * (gama - 1.0)
+                bfs[i, ii] = (e2_nn + e4_nn) * (gama - 1.0)
+                cfs[i, ii] = 2.0 * (1.0 - gama * gama)
+                dfs[i, ii] = (gama - 1.0) * (cpm1 - cp_nn) + (1.0 - gama) * (
+                    cm_nn - cmm1
+                )
+
+                afs[i, ii + 1] = 2.0 * (1.0 - gama_nn * gama_nn)
+                bfs[i, ii + 1] = (e1_nn - e3_nn) * (1.0 + gama)
+                cfs[i, ii + 1] = (e1_nn + e3_nn) * (gama - 1.0)
+                dfs[i, ii + 1] = e3_nn * (cpm1 - cp_nn) + e1_nn * (cm_nn - cmm1)
+
+            gama_nn, cp_nn, cm_nn = gama, cp, cm
+            e1_nn, e2_nn, e3_nn, e4_nn = e1, e2, e3, e4
+
+        bottom = b_base[i] + bdiff[i, number_of_layers - 1] * mu_1
+        afs[i, nl2 - 1] = e1_nn - rsf * e3_nn
+        bfs[i, nl2 - 1] = e2_nn - rsf * e4_nn
+        cfs[i, nl2 - 1] = 0.0
+        dfs[i, nl2 - 1] = bottom - cp_nn + rsf * cm_nn
+
+
+@njit(parallel=True, cache=True)
+def DTRIDGL_kernel(afs, bfs, cfs, dfs, xki_terms):
+    # DTRIDGL subroutine to compute the necessary xki array, one row at a time.
+    number_of_rows, nl2 = afs.shape
+
+    for i in prange(number_of_rows):
+        # as[k] overwrites afs[i, k] and ds[k] overwrites dfs[i, k]; both are read
+        # only at k before being written, so the sweep needs no scratch arrays.
+        afs[i, nl2 - 1] = afs[i, nl2 - 1] / bfs[i, nl2 - 1]
+        dfs[i, nl2 - 1] = dfs[i, nl2 - 1] / bfs[i, nl2 - 1]
+        # As in getFlux, the back-substitution stops at index 1, leaving as[0] = ds[0] = 0.
+        for k in range(nl2 - 2, 0, -1):
+            xx = 1.0 / (bfs[i, k] - cfs[i, k] * afs[i, k + 1])
+            afs[i, k] = afs[i, k] * xx
+            dfs[i, k] = (dfs[i, k] - cfs[i, k] * dfs[i, k + 1]) * xx
+        afs[i, 0] = 0.0
+        dfs[i, 0] = 0.0
+
+        xki_terms[i, 0] = dfs[i, 0]
+        for k in range(1, nl2):
+            xki_terms[i, k] = dfs[i, k] - afs[i, k] * xki_terms[i, k - 1]
+
+
+@njit(parallel=True, cache=True)
+def flux_kernel(
+    tau, w0, g, b0, bdiff, b_base, xki_terms, stream_cosine_angles, stream_weights, flux
+):
+    # The upward recursion of calculate_flux, summed over the quadrature streams.
+    number_of_rows, number_of_layers = tau.shape
+
+    for i in prange(number_of_rows):
+        total_flux = 0.0
+
+        for ng in range(stream_cosine_angles.shape[0]):
+            ugauss = stream_cosine_angles[ng]
+            fpt = 2.0 * np.pi * (b_base[i] + bdiff[i, number_of_layers - 1] * ugauss)
+
+            for j in range(number_of_layers - 1, -1, -1):
+                alpha = np.sqrt((1.0 - w0[i, j]) / (1.0 - w0[i, j] * g[i, j]))
+                lamda = alpha * (1.0 - w0[i, j] * g[i, j]) / mu_1
+
+                if w0[i, j] >= MINIMUM_SCATTERING_ALBEDO:
+                    xk1 = xki_terms[i, 2 * j] + xki_terms[i, 2 * j + 1]
+                    xk2 = xki_terms[i, 2 * j] - xki_terms[i, 2 * j + 1]
+                    gg = (2.0 * np.pi * w0[i, j] * xk1 * (1.0 + g[i, j] * alpha)) / (
+                        1.0 + alpha
+                    )
+                    hh = (2.0 * np.pi * w0[i, j] * xk2 * (1.0 - g[i, j] * alpha)) / (
+                        1.0 + alpha
+                    )
+                    alpha1 = (
+                        2.0
+                        * np.pi
+                        * (
+                            b0[i, j]
+                            + bdiff[i, j]
+                            * (mu_1 * w0[i, j] * g[i, j] / (1.0 - w0[i, j] * g[i, j]))
+                        )
+                    )
+                else:
+                    gg = 0.0
+                    hh = 0.0
+                    alpha1 = 2.0 * np.pi * b0[i, j]
+                alpha2 = 2.0 * np.pi * bdiff[i, j]
+
+                em1 = np.exp(-lamda * tau[i, j])
+                em2 = np.exp(-tau[i, j] / ugauss)
+                em3 = em1 * em2
+                epp = np.exp(min(lamda * tau[i, j], MAXIMUM_EXP_FLOAT))
+
+                fpt = (
+                    fpt * em2
+                    + gg / (lamda * ugauss - 1.0) * (epp * em2 - 1.0)
+                    + hh / (lamda * ugauss + 1.0) * (1.0 - em3)
+                    + alpha1 * (1.0 - em2)
+                    + alpha2 * (ugauss - (tau[i, j] + ugauss) * em2)
+                )
+
+            total_flux += stream_weights[ng] * fpt
+
+        flux[i] = total_flux
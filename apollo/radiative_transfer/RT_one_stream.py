@@ -0,0 +1,123 @@
+"""
+One-stream emission spectra, as in Planet::getFluxOneStream and Planet::getFluxes.
+
+Each layer emits at the blackbody intensity of its mid-layer temperature, attenuated by
+everything above it, along each of the Gauss quadrature angles. An opaque cloud deck
+hides the layers below it; the layer it cuts through emits from its visible part and
+from the cloud top. Shapes follow RT_Toon1989: (..., number_of_wavelengths,
+number_of_layers) for layer arrays, (..., number_of_levels) for temperatures and
+altitudes, and (..., number_of_wavelengths) for the emergent flux.
+"""
+
+import numpy as np
+from numpy.typing import NDArray
+
+from apollo.radiative_transfer.cloud_deck import locate_cloud_deck
+from apollo.radiative_transfer.RT_Toon1989 import (
+    STREAM_COSINE_ANGLES,
+    STREAM_WEIGHTS,
+    PlanckCache,
+    blackbody_intensity_by_wavelength,
+)
+
+
+def RT_one_stream(
+    wavelengths_in_cm: NDArray[np.float64],
+    temperatures_in_K: NDArray[np.float64],
+    optical_depth_per_layer: NDArray[np.float64],
+    cumulative_optical_depth: NDArray[np.float64] | None = None,
+    altitudes_in_cm: NDArray[np.float64] | None = None,
+    cloud_deck_altitude_in_cm: NDArray[np.float64] | float | None = None,
+    stream_cosine_angles: NDArray[np.float64] = STREAM_COSINE_ANGLES,
+    stream_weights: NDArray[np.float64] = STREAM_WEIGHTS,
+    planck_cache: PlanckCache | None = None,
+) -> NDArray[np.float64]:
+    """
+    cumulative_optical_depth is the optical depth from the top of the atmosphere to
+    the bottom of each layer (tauprof); it defaults to the running sum of
+    optical_depth_per_layer. altitudes_in_cm are only needed with a cloud deck.
+    """
+    tau = optical_depth_per_layer
+    if cumulative_optical_depth is None:
+        cumulative_optical_depth = np.cumsum(tau, axis=-1)
+    # tauprof[j-1], the absorption above layer j; there is none above the top layer.
+    optical_depth_above_layer = np.concatenate(
+        [
+            np.zeros_like(cumulative_optical_depth[..., :1]),
+            cumulative_optical_depth[..., :-1],
+        ],
+        axis=-1,
+    )
+
+    is_below_deck, is_above_deck, visible_fraction = (
+        np.expand_dims(layer_property, axis=-2)
+        for layer_property in locate_cloud_deck(
+            altitudes_in_cm, cloud_deck_altitude_in_cm, np.shape(tau)[-1]
+        )
+    )
+    is_straddling_deck = ~is_below_deck & ~is_above_deck
+
+    wavelengths = np.expand_dims(wavelengths_in_cm, axis=-1)
+    temperatures = np.expand_dims(temperatures_in_K, axis=-2)
+    if planck_cache is not None:
+        planck_cache.check_wavelengths(wavelengths_in_cm)
+
+    def blackbody_intensity(layer_temperatures):
+        # layer_temperatures are (..., 1, number_of_layers), like temperatures.
+        if planck_cache is None:
+            return blackbody_intensity_by_wavelength(layer_temperatures, wavelengths)
+        return planck_cache.blackbody_intensity(layer_temperatures[..., 0, :])
+
+    layer_top_temperatures = temperatures[..., :-1]  # tprof[j]
+    layer_bottom_temperatures = temperatures[..., 1:]  # tprof[j+1]
+
+    midlayer_intensity = blackbody_intensity(
+        0.5 * (layer_bottom_temperatures + layer_top_temperatures)
+    )
+
+    deck_is_in_a_layer = np.any(is_straddling_deck)
+    if deck_is_in_a_layer:
+        f = visible_fraction
+        cloud_top_intensity = blackbody_intensity(
+            f * layer_bottom_temperatures + (1.0 - f) * layer_top_temperatures
+        )
+        visible_midlayer_intensity = blackbody_intensity(
+            0.5 * f * layer_bottom_temperatures
+            + (1.0 - 0.5 * f) * layer_top_temperatures
+        )
+        visible_optical_depth = f * tau
+
+    number_of_layers = np.shape(tau)[-1]
+    total_flux = 0.0
+    for cosmu, stream_weight in zip(stream_cosine_angles, stream_weights):
+        sinmu = np.sqrt(1.0 - cosmu * cosmu)
+
+        layer_fluxes = (
+            midlayer_intensity
+            * (1.0 - np.exp(-tau / cosmu))  # source function
+            * np.exp(-optical_depth_above_layer / cosmu)  # absorption above layer
+            * sinmu  # multiply by area
+        )
+
+        if deck_is_in_a_layer:
+            straddling_layer_fluxes = (
+                cloud_top_intensity
+                * np.exp(-(visible_optical_depth + optical_depth_above_layer) / cosmu)
+                + visible_midlayer_intensity
+                * (1.0 - np.exp(-visible_optical_depth / cosmu))
+                * np.exp(-optical_depth_above_layer / cosmu)
+            ) * sinmu
+            layer_fluxes = np.where(
+                is_straddling_deck, straddling_layer_fluxes, layer_fluxes
+            )
+
+        layer_fluxes = np.where(is_below_deck, 0.0, layer_fluxes)
+
+        fluxes = 0.0
+        for layer in reversed(range(number_of_layers)):
+            fluxes = fluxes + layer_fluxes[..., layer]
+
+        # extra factor of pi/2 from the mu substitution; in erg/s/cm^2/Hz
+        total_flux = total_flux + 2.0 * np.pi * fluxes * stream_weight * np.pi / 2.0
+
+    return total_flux
@@ -0,0 +1,53 @@
+"""
+Transit depths, as in Planet::transFlux.
+
+Each layer is an annulus around the planet, blocking the fraction 1 - exp(-tau) of the
+starlight behind it, with tau the slant optical depth through the layer (from
+transTauProf). Layers below an opaque cloud deck block all of it, and the layer the
+deck cuts through blocks in proportion to its visible fraction. Shapes follow
+RT_Toon1989: (..., number_of_wavelengths, number_of_layers) for the optical depths,
+(..., number_of_levels) for altitudes above the base of the profile, and
+(..., number_of_wavelengths) for the transit depth.
+"""
+
+import numpy as np
+from numpy.typing import NDArray
+
+from apollo.radiative_transfer.cloud_deck import locate_cloud_deck
+
+
+def RT_transmission(
+    slant_optical_depth_per_layer: NDArray[np.float64],
+    altitudes_in_cm: NDArray[np.float64],
+    planet_radius_in_cm: NDArray[np.float64] | float,
+    stellar_radius_in_cm: NDArray[np.float64] | float,
+    cloud_deck_altitude_in_cm: NDArray[np.float64] | float | None = None,
+) -> NDArray[np.float64]:
+    tau = slant_optical_depth_per_layer
+    rp = np.expand_dims(planet_radius_in_cm, axis=-1)
+    rs = np.expand_dims(stellar_radius_in_cm, axis=-1)
+
+    is_below_deck, is_above_deck, visible_fraction = (
+        np.expand_dims(layer_property, axis=-2)
+        for layer_property in locate_cloud_deck(
+            altitudes_in_cm, cloud_deck_altitude_in_cm, np.shape(tau)[-1]
+        )
+    )
+
+    layer_tops = altitudes_in_cm[..., :-1]  # hprof[j]
+    layer_thicknesses = np.expand_dims(layer_tops - altitudes_in_cm[..., 1:], axis=-2)
+    layer_circumferences = np.expand_dims(2 * np.pi * (rp + layer_tops), axis=-2)
+
+    blocked_areas = (1 - np.exp(-tau)) * layer_thicknesses * layer_circumferences
+    blocked_areas = np.where(
+        is_above_deck, blocked_areas, blocked_areas * visible_fraction
+    )
+    blocked_areas = np.where(
+        is_below_deck, layer_thicknesses * layer_circumferences, blocked_areas
+    )
+
+    blocked_flux = np.pi * rp * rp
+    for layer in reversed(range(np.shape(tau)[-1])):
+        blocked_flux = blocked_flux + blocked_areas[..., layer]
+
+    return blocked_flux / (np.pi * rs * rs)
@@ -0,0 +1,403 @@
+"""
+Preallocated buffers for running RT_Toon1989 many times on the same grid.
+
+A retrieval calls the two-stream solver with the same numbers of layers, wavelengths
+and streams on every likelihood evaluation. RTWorkspace allocates every intermediate
+array once for that size and then computes each stage in place (with out=), sharing
+the terms that RT_Toon1989 computes twice (alpha, lamda, the clipped exp(lamda*tau)
+and exp(-lamda*tau)) between the DSolver and flux stages. The arithmetic is the same,
+operation for operation, so the fluxes match RT_Toon1989 exactly.
+
+Inside the workspace, arrays are stored layer-major, (number_of_layers, ...,
+number_of_wavelengths), so that each step of the layer recursions works on one
+contiguous block; inputs and outputs use the usual (..., wavelength, layer) order.
+"""
+
+from dataclasses import dataclass, field
+
+import numpy as np
+from numpy.typing import NDArray
+
+from apollo.radiative_transfer.RT_Toon1989 import (
+    MAXIMUM_EXP_FLOAT,
+    MINIMUM_OPTICAL_DEPTH_FOR_GRADIENT,
+    MINIMUM_SCATTERING_ALBEDO,
+    STREAM_COSINE_ANGLES,
+    STREAM_WEIGHTS,
+    c,
+    h,
+    k,
+)
+
+NUMBER_OF_SHARED_LAYER_BUFFERS: int = 8
+NUMBER_OF_SCRATCH_LAYER_BUFFERS: int = 13
+NUMBER_OF_WAVELENGTH_BUFFERS: int = 7
+
+
+@dataclass
+class RTWorkspace:
+    number_of_layers: int
+    number_of_wavelengths: int
+    batch_shape: tuple[int, ...] = ()
+    stream_cosine_angles: NDArray[np.float64] = field(
+        default_factory=lambda: STREAM_COSINE_ANGLES
+    )
+    stream_weights: NDArray[np.float64] = field(default_factory=lambda: STREAM_WEIGHTS)
+    mu_1: float = 0.5  # This is mu_1 in Toon et al. 1989
+    rsf: float = 0.0  # "surface" reflectivity, zero for emission
+
+    material_buffers: NDArray[np.float64] = field(init=False, repr=False)
+    shared_layer_buffers: NDArray[np.float64] = field(init=False, repr=False)
+    scratch_layer_buffers: NDArray[np.float64] = field(init=False, repr=False)
+    layer_masks: NDArray[np.bool_] = field(init=False, repr=False)
+    level_intensities: NDArray[np.float64] = field(init=False, repr=False)
+    half_layer_buffers: NDArray[np.float64] = field(init=False, repr=False)
+    wavelength_buffers: NDArray[np.float64] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.batch_shape = tuple(self.batch_shape)
+        L, wavelength_shape = self.number_of_layers, self.wavelength_shape
+
+        self.material_buffers = np.empty((3, L, *wavelength_shape))
+        self.shared_layer_buffers = np.empty(
+            (NUMBER_OF_SHARED_LAYER_BUFFERS, L, *wavelength_shape)
+        )
+        self.scratch_layer_buffers = np.empty(
+            (NUMBER_OF_SCRATCH_LAYER_BUFFERS, L, *wavelength_shape)
+        )
+        self.layer_masks = np.empty((2, L, *wavelength_shape), dtype=bool)
+        self.level_intensities = np.empty((L + 1, *wavelength_shape))
+        self.half_layer_buffers = np.empty((5, 2 * L, *wavelength_shape))
+        self.wavelength_buffers = np.empty(
+            (NUMBER_OF_WAVELENGTH_BUFFERS, *wavelength_shape)
+        )
+
+    @property
+    def wavelength_shape(self) -> tuple[int, ...]:
+        return (*self.batch_shape, self.number_of_wavelengths)
+
+    @property
+    def layer_shape(self) -> tuple[int, ...]:
+        return (*self.wavelength_shape, self.number_of_layers)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            buffer.nbytes
+            for buffer in (
+                self.material_buffers,
+                self.shared_layer_buffers,
+                self.scratch_layer_buffers,
+                self.layer_masks,
+                self.level_intensities,
+                self.half_layer_buffers,
+                self.wavelength_buffers,
+            )
+        )
+
+    def RT_Toon1989(
+        self,
+        wavelengths_in_cm: NDArray[np.float64],
+        temperatures_in_K: NDArray[np.float64],
+        optical_depth_per_layer: NDArray[np.float64],
+        single_scattering_albedo: NDArray[np.float64],
+        scattering_asymmetry: NDArray[np.float64],
+    ) -> NDArray[np.float64]:
+        self.load_material_properties(
+            optical_depth_per_layer, single_scattering_albedo, scattering_asymmetry
+        )
+        self.calculate_thermal_intensities(wavelengths_in_cm, temperatures_in_K)
+        self.calculate_shared_terms()
+        self.DSolver()
+        self.DTRIDGL()
+
+        return self.calculate_flux().copy()
+
+    def load_material_properties(
+        self,
+        optical_depth_per_layer: NDArray[np.float64],
+        single_scattering_albedo: NDArray[np.float64],
+        scattering_asymmetry: NDArray[np.float64],
+    ) -> None:
+        for buffer, layer_property in zip(
+            self.material_buffers,
+            (optical_depth_per_layer, single_scattering_albedo, scattering_asymmetry),
+        ):
+            np.copyto(
+                buffer,
+                np.moveaxis(np.broadcast_to(layer_property, self.layer_shape), -1, 0),
+            )
+
+    def calculate_thermal_intensities(
+        self,
+        wavelengths_in_cm: NDArray[np.float64],
+        temperatures_in_K: NDArray[np.float64],
+    ) -> None:
+        tau = self.material_buffers[0]
+        b0, bdiff = self.shared_layer_buffers[:2]
+        is_thin_layer = self.layer_masks[0]
+        mean_intensity = self.scratch_layer_buffers[0]
+        exponent_factor, planck_factor = self.wavelength_buffers[:2]
+        B = self.level_intensities
+
+        # blackbody_intensity_by_wavelength, at every level
+        wavelengths = np.broadcast_to(wavelengths_in_cm, self.wavelength_shape)
+        np.divide(h * c, wavelengths, out=exponent_factor)
+        np.divide(exponent_factor, k, out=exponent_factor)
+        np.power(wavelengths, 5, out=planck_factor)
+        np.divide(2 * h * c * c, planck_factor, out=planck_factor)
+
+        temperatures = np.moveaxis(
+            np.broadcast_to(
+                temperatures_in_K, (*self.batch_shape, self.number_of_layers + 1)
+            ),
+            -1,
+            0,
+        )[..., np.newaxis]
+        np.divide(exponent_factor, temperatures, out=B)
+        np.exp(B, out=B)
+        np.subtract(B, 1, out=B)
+        np.divide(planck_factor, B, out=B)
+
+        np.less(tau, MINIMUM_OPTICAL_DEPTH_FOR_GRADIENT, out=is_thin_layer)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            np.subtract(B[1:], B[:-1], out=bdiff)
+            np.divide(bdiff, tau, out=bdiff)
+        np.copyto(bdiff, 0.0, where=is_thin_layer)
+
+        np.add(B[:-1], B[1:], out=mean_intensity)
+        np.multiply(0.5, mean_intensity, out=mean_intensity)
+        np.copyto(b0, B[:-1])
+        np.copyto(b0, mean_intensity, where=is_thin_layer)
+
+    def calculate_shared_terms(self) -> None:
+        tau, w0, g = self.material_buffers
+        _, _, one_minus_w0g, alpha, one_plus_alpha, lamda, ep, em1 = (
+            self.shared_layer_buffers
+        )
+
+        np.multiply(w0, g, out=one_minus_w0g)
+        np.subtract(1, one_minus_w0g, out=one_minus_w0g)
+
+        np.subtract(1, w0, out=alpha)
+        np.divide(alpha, one_minus_w0g, out=alpha)
+        np.sqrt(alpha, out=alpha)
+        np.add(1, alpha, out=one_plus_alpha)
+
+        np.multiply(alpha, one_minus_w0g, out=lamda)
+        np.divide(lamda, self.mu_1, out=lamda)
+
+        # exp(-lamda*tau) and exp(min(lamda*tau, 35)), used by both stages
+        np.multiply(lamda, tau, out=ep)
+        np.negative(ep, out=em1)
+        np.exp(em1, out=em1)
+        np.minimum(ep, MAXIMUM_EXP_FLOAT, out=ep)
+        np.exp(ep, out=ep)
+
+    def DSolver(self) -> None:
+        tau = self.material_buffers[0]
+        b0, bdiff, one_minus_w0g, alpha, one_plus_alpha, _, ep, _ = (
+            self.shared_layer_buffers
+        )
+        gama, cp, cm, cpm1, cmm1, e1, e2, e3, e4, s1, s2, s3, s4 = (
+            self.scratch_layer_buffers
+        )
+        afs, bfs, cfs, dfs, _ = self.half_layer_buffers
+        btop, bottom, wavelength_scratch = self.wavelength_buffers[2:5]
+        B = self.level_intensities
+        mu_1, rsf = self.mu_1, self.rsf
+
+        np.subtract(1, alpha, out=gama)
+        np.divide(gama, one_plus_alpha, out=gama)
+
+        # cp = b0 + bdiff*tau + bdiff*term, etc., with term = 0.5/(1 - w0*g)
+        np.divide(0.5, one_minus_w0g, out=s1)
+        np.multiply(bdiff, s1, out=s1)
+        np.multiply(bdiff, tau, out=s2)
+        np.add(b0, s2, out=cp)
+        np.subtract(cp, s1, out=cm)
+        np.add(cp, s1, out=cp)
+        np.add(b0, s1, out=cpm1)
+        np.subtract(b0, s1, out=cmm1)
+
+        np.divide(gama, ep, out=s1)
+        np.add(ep, s1, out=e1)
+        np.subtract(ep, s1, out=e2)
+        np.multiply(gama, ep, out=s1)
+        np.divide(1, ep, out=s2)
+        np.add(s1, s2, out=e3)
+        np.subtract(s1, s2, out=e4)
+
+        np.divide(tau[0], mu_1, out=btop)
+        np.negative(btop, out=btop)
+        np.exp(btop, out=btop)
+        np.subtract(1, btop, out=btop)
+        np.multiply(btop, B[0], out=btop)
+
+        np.multiply(bdiff[-1], mu_1, out=bottom)
+        np.add(B[-1], bottom, out=bottom)
+
+        upper, lower = slice(None, -1), slice(1, None)  # nn, nn + 1
+        odd, even = slice(1, -1, 2), slice(2, -1, 2)
+
+        afs[0] = 0.0
+        np.add(gama[0], 1, out=bfs[0])
+        np.subtract(gama[0], 1, out=cfs[0])
+        np.subtract(btop, cmm1[0], out=dfs[0])
+
+        np.subtract(gama[lower], 1, out=s1[upper])  # gama[nn+1] - 1
+        np.subtract(cpm1[lower], cp[upper], out=s2[upper])  # cpm1[nn+1] - cp[nn]
+        np.subtract(cm[upper], cmm1[lower], out=s3[upper])  # cm[nn] - cmm1[nn+1]
+
+        # odd indices
+        np.add(e1[upper], e3[upper], out=afs[odd])
+        np.multiply(afs[odd], s1[upper], out=afs[odd])
+        np.add(e2[upper], e4[upper], out=bfs[odd])
+        np.multiply(bfs[odd], s1[upper], out=bfs[odd])
+        np.multiply(gama[lower], gama[lower], out=cfs[odd])
+        np.subtract(1, cfs[odd], out=cfs[odd])
+        np.multiply(2, cfs[odd], out=cfs[odd])
+        np.multiply(s1[upper], s2[upper], out=dfs[odd])
+        np.subtract(1, gama[lower], out=s4[upper])
+        np.multiply(s4[upper], s3[upper], out=s4[upper])
+        np.add(dfs[odd], s4[upper], out=dfs[odd])
+
+        # even indices
+        np.multiply(gama[upper], gama[upper], out=afs[even])
+        np.subtract(1, afs[even], out=afs[even])
+        np.multiply(2, afs[even], out=afs[even])
+        np.subtract(e1[upper], e3[upper], out=bfs[even])
+        np.add(1, gama[lower], out=s4[upper])
+        np.multiply(bfs[even], s4[upper], out=bfs[even])
+        np.copyto(cfs[even], afs[odd])
+        np.multiply(e3[upper], s2[upper], out=dfs[even])
+        np.multiply(e1[upper], s3[upper], out=s4[upper])
+        np.add(dfs[even], s4[upper], out=dfs[even])
+
+        np.multiply(rsf, e3[-1], out=wavelength_scratch)
+        np.subtract(e1[-1], wavelength_scratch, out=afs[-1])
+        np.multiply(rsf, e4[-1], out=wavelength_scratch)
+        np.subtract(e2[-1], wavelength_scratch, out=bfs[-1])
+        cfs[-1] = 0.0
+        np.subtract(bottom, cp[-1], out=dfs[-1])
+        np.multiply(rsf, cm[-1], out=wavelength_scratch)
+        np.add(dfs[-1], wavelength_scratch, out=dfs[-1])
+
+    def DTRIDGL(self) -> None:
+        # as overwrites afs and ds overwrites dfs as the sweep goes.
+        afs, bfs, cfs, dfs, xki = self.half_layer_buffers
+        xx, wavelength_scratch = self.wavelength_buffers[4:6]
+
+        np.divide(afs[-1], bfs[-1], out=afs[-1])
+        np.divide(dfs[-1], bfs[-1], out=dfs[-1])
+        # As in getFlux, the back-substitution stops at index 1, leaving as[0] = ds[0] = 0.
+        for half_layer in reversed(range(1, 2 * self.number_of_layers - 1)):
+            np.multiply(cfs[half_layer], afs[half_layer + 1], out=xx)
+            np.subtract(bfs[half_layer], xx, out=xx)
+            np.divide(1, xx, out=xx)
+            np.multiply(afs[half_layer], xx, out=afs[half_layer])
+            np.multiply(cfs[half_layer], dfs[half_layer + 1], out=wavelength_scratch)
+            np.subtract(dfs[half_layer], wavelength_scratch, out=dfs[half_layer])
+            np.multiply(dfs[half_layer], xx, out=dfs[half_layer])
+        afs[0] = 0.0
+        dfs[0] = 0.0
+
+        xki[0] = dfs[0]
+        for half_layer in range(1, 2 * self.number_of_layers):
+            np.multiply(afs[half_layer], xki[half_layer - 1], out=xki[half_layer])
+            np.subtract(dfs[half_layer], xki[half_layer], out=xki[half_layer])
+
+    def calculate_flux(self) -> NDArray[np.float64]:
+        tau, w0, g = self.material_buffers
+        b0, bdiff, one_minus_w0g, alpha, one_plus_alpha, lamda, epp, em1 = (
+            self.shared_layer_buffers
+        )
+        gg, hh, alpha1, alpha2, em2, em3, gc, hc, a1c, a2c, s1, s2, _ = (
+            self.scratch_layer_buffers
+        )
+        is_not_scattering = self.layer_masks[1]
+        xki = self.half_layer_buffers[4]
+        bsurf = self.level_intensities[-1]
+        fpt, total_flux = self.wavelength_buffers[5:7]
+        two_pi, mu_1 = 2 * np.pi, self.mu_1
+
+        np.greater_equal(w0, MINIMUM_SCATTERING_ALBEDO, out=is_not_scattering)
+        np.logical_not(is_not_scattering, out=is_not_scattering)
+
+        # gg and hh, built on xk1 and xk2
+        np.add(xki[0::2], xki[1::2], out=gg)
+        np.subtract(xki[0::2], xki[1::2], out=hh)
+        np.multiply(two_pi, w0, out=s1)
+        np.multiply(s1, gg, out=gg)
+        np.multiply(s1, hh, out=hh)
+        np.multiply(g, alpha, out=s1)
+        np.add(1, s1, out=s2)
+        np.multiply(gg, s2, out=gg)
+        np.divide(gg, one_plus_alpha, out=gg)
+        np.subtract(1, s1, out=s2)
+        np.multiply(hh, s2, out=hh)
+        np.divide(hh, one_plus_alpha, out=hh)
+        np.copyto(gg, 0.0, where=is_not_scattering)
+        np.copyto(hh, 0.0, where=is_not_scattering)
+
+        np.multiply(mu_1, w0, out=alpha1)
+        np.multiply(alpha1, g, out=alpha1)
+        np.divide(alpha1, one_minus_w0g, out=alpha1)
+        np.multiply(bdiff, alpha1, out=alpha1)
+        np.add(b0, alpha1, out=alpha1)
+        np.multiply(two_pi, alpha1, out=alpha1)
+        np.multiply(two_pi, b0, out=s1)
+        np.copyto(alpha1, s1, where=is_not_scattering)
+
+        np.multiply(two_pi, bdiff, out=alpha2)
+
+        for stream_index, (stream_cosine_angle, stream_weight) in enumerate(
+            zip(self.stream_cosine_angles, self.stream_weights)
+        ):
+            np.divide(tau, stream_cosine_angle, out=em2)
+            np.negative(em2, out=em2)
+            np.exp(em2, out=em2)
+            np.multiply(em1, em2, out=em3)
+
+            # gg / (lamda*u - 1) * (epp*em2 - 1)
+            np.multiply(lamda, stream_cosine_angle, out=s1)
+            np.subtract(s1, 1.0, out=s2)
+            np.divide(gg, s2, out=gc)
+            np.multiply(epp, em2, out=s2)
+            np.subtract(s2, 1.0, out=s2)
+            np.multiply(gc, s2, out=gc)
+
+            # hh / (lamda*u + 1) * (1 - em3)
+            np.add(s1, 1.0, out=s2)
+            np.divide(hh, s2, out=hc)
+            np.subtract(1.0, em3, out=s2)
+            np.multiply(hc, s2, out=hc)
+
+            # alpha1 * (1 - em2)
+            np.subtract(1.0, em2, out=s2)
+            np.multiply(alpha1, s2, out=a1c)
+
+            # alpha2 * (u - (tau + u)*em2)
+            np.add(tau, stream_cosine_angle, out=s2)
+            np.multiply(s2, em2, out=s2)
+            np.subtract(stream_cosine_angle, s2, out=s2)
+            np.multiply(alpha2, s2, out=a2c)
+
+            # fpt is the outward flux, from the bottom of the atmosphere up.
+            np.multiply(bdiff[-1], stream_cosine_angle, out=fpt)
+            np.add(bsurf, fpt, out=fpt)
+            np.multiply(two_pi, fpt, out=fpt)
+            for layer in reversed(range(self.number_of_layers)):
+                np.multiply(fpt, em2[layer], out=fpt)
+                np.add(fpt, gc[layer], out=fpt)
+                np.add(fpt, hc[layer], out=fpt)
+                np.add(fpt, a1c[layer], out=fpt)
+                np.add(fpt, a2c[layer], out=fpt)
+
+            if stream_index == 0:
+                np.multiply(stream_weight, fpt, out=total_flux)
+            else:
+                np.multiply(stream_weight, fpt, out=fpt)
+                np.add(total_flux, fpt, out=total_flux)
+
+        return total_flux
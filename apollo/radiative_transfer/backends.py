@@ -0,0 +1,87 @@
+"""
+Chooses between the NumPy and numba implementations of the Toon et al. (1989) solver.
+
+numba is not a requirement of APOLLO, so the compiled backend is used when it is
+installed and the NumPy one otherwise. Either can be asked for by name, per call or
+through the APOLLO_RT_BACKEND environment variable.
+"""
+
+import os
+from collections.abc import Callable
+from enum import StrEnum, auto
+from importlib import import_module
+from importlib.util import find_spec
+from typing import Final
+
+import numpy as np
+from numpy.typing import NDArray
+
+from apollo.radiative_transfer.contributions import (
+    ContributionOpticalDepths,
+    EmissionWithContributions,
+)
+from apollo.radiative_transfer.RT_Toon1989 import (
+    STREAM_COSINE_ANGLES,
+    STREAM_WEIGHTS,
+    PlanckCache,
+)
+
+RT_BACKEND_ENVIRONMENT_VARIABLE: Final[str] = "APOLLO_RT_BACKEND"
+
+NUMBA_IS_AVAILABLE: Final[bool] = find_spec("numba") is not None
+
+
+class RTBackend(StrEnum):
+    numpy = auto()
+    numba = auto()
+
+
+RT_TOON1989_MODULES: Final[dict[RTBackend, str]] = {
+    RTBackend.numpy: "apollo.radiative_transfer.RT_Toon1989",
+    RTBackend.numba: "apollo.radiative_transfer.RT_Toon1989_numba",
+}
+
+
+def get_default_RT_backend() -> RTBackend:
+    requested_backend = os.environ.get(RT_BACKEND_ENVIRONMENT_VARIABLE)
+    if requested_backend:
+        return RTBackend(requested_backend.lower())
+
+    return RTBackend.numba if NUMBA_IS_AVAILABLE else RTBackend.numpy
+
+
+def get_RT_Toon1989(backend: RTBackend | str | None = None) -> Callable:
+    backend = get_default_RT_backend() if backend is None else RTBackend(backend)
+
+    if backend == RTBackend.numba and not NUMBA_IS_AVAILABLE:
+        raise ModuleNotFoundError(
+            "The numba backend needs numba to be installed; "
+            + f"use the {RTBackend.numpy} backend instead."
+        )
+
+    return import_module(RT_TOON1989_MODULES[backend]).RT_Toon1989
+
+
+def RT_Toon1989(
+    wavelengths_in_cm: NDArray[np.float64],
+    temperatures_in_K: NDArray[np.float64],
+    optical_depth_per_layer: NDArray[np.float64],
+    single_scattering_albedo: NDArray[np.float64],
+    scattering_asymmetry: NDArray[np.float64],
+    stream_cosine_angles: NDArray[np.float64] = STREAM_COSINE_ANGLES,
+    stream_weights: NDArray[np.float64] = STREAM_WEIGHTS,
+    backend: RTBackend | str | None = None,
+    planck_cache: PlanckCache | None = None,
+    contribution_optical_depths: ContributionOpticalDepths | None = None,
+) -> NDArray[np.float64] | EmissionWithContributions:
+    return get_RT_Toon1989(backend)(
+        wavelengths_in_cm,
+        temperatures_in_K,
+        optical_depth_per_layer,
+        single_scattering_albedo,
+        scattering_asymmetry,
+        stream_cosine_angles,
+        stream_weights,
+        planck_cache=planck_cache,
+        contribution_optical_depths=contribution_optical_depths,
+    )
@@ -0,0 +1,48 @@
+from typing import NamedTuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+
+class CloudDeckLayers(NamedTuple):
+    # size of arrays: (..., number_of_layers), top of the atmosphere first
+    is_below_deck: NDArray[np.bool_]
+    is_above_deck: NDArray[np.bool_]
+    # The fraction of each layer above the deck; only used where a layer straddles it.
+    visible_fraction: NDArray[np.float64]
+
+
+def locate_cloud_deck(
+    altitudes_in_cm: NDArray[np.float64] | None,
+    cloud_deck_altitude_in_cm: NDArray[np.float64] | float | None,
+    number_of_layers: int,
+) -> CloudDeckLayers:
+    """
+    Sorts layers into those entirely below an opaque cloud deck (hmin), those
+    entirely above it, and the one that straddles it, as in Planet::getFluxes and
+    Planet::transFlux. Without a deck, every layer is above it.
+    """
+    if cloud_deck_altitude_in_cm is None:
+        return CloudDeckLayers(
+            is_below_deck=np.zeros(number_of_layers, dtype=bool),
+            is_above_deck=np.ones(number_of_layers, dtype=bool),
+            visible_fraction=np.ones(number_of_layers),
+        )
+
+    hmin = np.expand_dims(cloud_deck_altitude_in_cm, axis=-1)
+    layer_tops = altitudes_in_cm[..., :-1]  # hprof[j]
+    layer_bottoms = altitudes_in_cm[..., 1:]  # hprof[j+1]
+
+    is_below_deck = layer_tops < hmin
+    is_above_deck = ~is_below_deck & (layer_bottoms >= hmin)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        visible_fraction = (layer_tops - hmin) / (layer_tops - layer_bottoms)
+
+    return CloudDeckLayers(
+        is_below_deck=is_below_deck,
+        is_above_deck=is_above_deck,
+        visible_fraction=np.where(
+            is_below_deck | is_above_deck, is_above_deck * 1.0, visible_fraction
+        ),
+    )
@@ -0,0 +1,94 @@
+"""
+Contribution functions, as in Planet::getContribution and its gas, cloud and species
+variants, computed alongside the flux by the Python RT.
+
+Each contribution is the optical depth of a layer (in total, or from one component)
+times the thermal intensity at its top (b0), attenuated by the optical depth above:
+tau * b0 / exp(tauprof). The attenuated intensity b0 / exp(tauprof) is computed once
+and shared by every component. The C++ getCloudContribution returns the cloud
+optical depths themselves; here the cloud contribution is weighted like the others,
+so that the gas and cloud contributions add up to the total.
+
+Shapes follow RT_Toon1989: (..., number_of_wavelengths, number_of_layers), with the
+per-species arrays shaped (..., number_of_species, number_of_wavelengths,
+number_of_layers).
+"""
+
+from typing import NamedTuple, Sequence
+
+import numpy as np
+from numpy.typing import NDArray
+
+
+class ContributionOpticalDepths(NamedTuple):
+    # Any of these can be left out, and its contribution is not computed.
+    gas_optical_depth_per_layer: NDArray[np.float64] | None = None  # gastaulayer
+    cloud_optical_depth_per_layer: NDArray[np.float64] | None = None  # cloudtaulayer
+    # size of array: (..., number_of_species, number_of_wavelengths, number_of_layers)
+    optical_depth_per_layer_by_species: NDArray[np.float64] | None = None
+    # tauprof, to the bottom of each layer; defaults to the running sum of the
+    # total optical depth per layer.
+    cumulative_optical_depth: NDArray[np.float64] | None = None
+
+
+class ContributionFunctions(NamedTuple):
+    total: NDArray[np.float64]
+    gas: NDArray[np.float64] | None = None
+    cloud: NDArray[np.float64] | None = None
+    by_species: NDArray[np.float64] | None = None
+
+    def as_dict(
+        self, species_names: Sequence[str] | None = None
+    ) -> dict[str, NDArray[np.float64]]:
+        # The form compile_contributions_into_dataset takes, for a single model.
+        contributions = {
+            component_name: contribution
+            for component_name, contribution in self._asdict().items()
+            if component_name != "by_species" and contribution is not None
+        }
+        if self.by_species is not None:
+            contributions.update(
+                zip(species_names, np.moveaxis(self.by_species, -3, 0), strict=True)
+            )
+
+        return contributions
+
+
+class EmissionWithContributions(NamedTuple):
+    emitted_flux: NDArray[np.float64]
+    contribution_functions: ContributionFunctions
+
+
+def calculate_contribution_functions(
+    optical_depth_per_layer: NDArray[np.float64],
+    thermal_intensity: NDArray[np.float64],
+    contribution_optical_depths: ContributionOpticalDepths = ContributionOpticalDepths(),
+) -> ContributionFunctions:
+    (
+        gas_optical_depth_per_layer,
+        cloud_optical_depth_per_layer,
+        optical_depth_per_layer_by_species,
+        cumulative_optical_depth,
+    ) = contribution_optical_depths
+
+    if cumulative_optical_depth is None:
+        cumulative_optical_depth = np.cumsum(optical_depth_per_layer, axis=-1)
+
+    attenuated_thermal_intensity = thermal_intensity / np.exp(cumulative_optical_depth)
+
+    def weight(component_optical_depth_per_layer):
+        if component_optical_depth_per_layer is None:
+            return None
+        return component_optical_depth_per_layer * attenuated_thermal_intensity
+
+    return ContributionFunctions(
+        total=weight(optical_depth_per_layer),
+        gas=weight(gas_optical_depth_per_layer),
+        cloud=weight(cloud_optical_depth_per_layer),
+        by_species=(
+            None
+            if optical_depth_per_layer_by_species is None
+            else optical_depth_per_layer_by_species
+            * np.expand_dims(attenuated_thermal_intensity, axis=-3)
+        ),
+    )
@@ -5,7 +5,13 @@ from typing import NamedTuple
 import numpy as np
 from numpy.typing import NDArray
 
-from apollo.radiative_transfer.RT_Toon1989 import RT_Toon1989
+from apollo.radiative_transfer.backends import RT_Toon1989
+from apollo.radiative_transfer.planck_cache import (
+    PlanckCache,
+    calculate_effective_temperature,
+)
+from apollo.radiative_transfer.RT_one_stream import RT_one_stream
+from apollo.radiative_transfer.RT_transmission import RT_transmission
 
 
 class ObservationMode(Enum):
@@ -62,35 +68,74 @@ class MaterialProperties(NamedTuple):
 
 
 class RTCoordinates(NamedTuple):
-    wavelength_in_cm: NDArray[np.float64]
-    temperature_in_K: NDArray[np.float64]
+    wavelengths_in_cm: NDArray[np.float64]
+    temperatures_in_K: NDArray[np.float64]
 
 
 def getFlux(
-    RT_coordinates: RTCoordinates, material_properties: MaterialProperties
+    RT_coordinates: RTCoordinates,
+    material_properties: MaterialProperties,
+    planck_cache: PlanckCache | None = None,
 ) -> NDArray[np.float64]:
-    return RT_Toon1989(**RT_coordinates._asdict(), **material_properties._asdict())
+    return RT_Toon1989(
+        **RT_coordinates._asdict(),
+        **material_properties._asdict(),
+        planck_cache=planck_cache,
+    )
 
 
-def getFluxOneStream() -> ...:
+def getFluxOneStream(
+    RT_coordinates: RTCoordinates,
+    material_properties: MaterialProperties,
+    planck_cache: PlanckCache | None = None,
+) -> NDArray[np.float64]:
     # Calls getFluxes per integration angle (8 in total).
-    ...
+    return RT_one_stream(
+        **RT_coordinates._asdict(),
+        optical_depth_per_layer=material_properties.optical_depth_per_layer,
+        planck_cache=planck_cache,
+    )
 
 
 def getFluxes() -> ...:
     # Does the one-stream calculation at some fixed angle of emission.
+    # (Folded into RT_one_stream, which loops over the angles itself.)
     ...
 
 
-def transFlux() -> ...: ...
-
-
-def getTeff() -> ...:
+def transFlux(
+    slant_optical_depth_per_layer: NDArray[np.float64],
+    altitudes_in_cm: NDArray[np.float64],
+    planet_radius_in_cm: float,
+    stellar_radius_in_cm: float,
+) -> NDArray[np.float64]:
+    return RT_transmission(
+        slant_optical_depth_per_layer,
+        altitudes_in_cm,
+        planet_radius_in_cm,
+        stellar_radius_in_cm,
+    )
+
+
+def getTeff(
+    RT_coordinates: RTCoordinates,
+    material_properties: MaterialProperties,
+    radiative_transfer_scheme: RadiativeTransferScheme = (
+        RadiativeTransferScheme.Toon_TwoStream
+    ),
+    planck_cache: PlanckCache | None = None,
+) -> NDArray[np.float64]:
     # Calls the relevant getFlux-like functions,
-    # but for wide-wavelength, low-resolution tables.
-    # Then backs out the effective temperature from the
-    # flux and radius.
-    ...
+    # but for wide-wavelength, low-resolution tables
+    # (so planck_cache is the one for the lores wavelengths).
+    # Then backs out the effective temperature from the flux.
+    emitted_flux = RT_functions[radiative_transfer_scheme](
+        RT_coordinates, material_properties, planck_cache
+    )
+
+    return calculate_effective_temperature(
+        RT_coordinates.wavelengths_in_cm, emitted_flux
+    )
 
 
 def getContribution() -> ...:
@@ -0,0 +1,171 @@
+"""
+Blackbody intensities for a fixed wavelength grid.
+
+The model wavelengths are fixed for a whole run, so PlanckCache computes the
+wavelength-only parts of the Planck function once: 2*h*c**2/wavelength**5 and
+h*c/wavelength/k. With these, the exact evaluation is the same arithmetic as
+blackbody_intensity_by_wavelength, and gives the same values to the last bit.
+
+With tabulated=True, the cache also holds log B on a grid of temperatures spaced evenly
+in log T over the range of the opacity tables (75 to 4000 K), and interpolates it
+linearly in 1/T, where log B is close to linear (exactly so in the Wien limit). The
+relative error is at most log_temperature_spacing**2 / 8 (about 1e-7 at the default
+spacing). Temperatures outside the grid are evaluated exactly.
+
+The table replaces the exponential with a gather and a lerp. With NumPy's vectorized
+exp, that is no faster than the exact evaluation, which is why the exact evaluation
+is the default; the table is there for callers without a fast vectorized exp.
+
+One cache is made per wavelength grid: one for the model (hires) wavelengths, and one
+for the low-resolution (lores) wavelengths of the effective temperature.
+"""
+
+from dataclasses import dataclass, field
+from typing import Final
+
+import numpy as np
+from numpy.typing import NDArray
+
+c: Final[float] = 2.99792458e10  # in CGS
+h: Final[float] = 6.62607004e-27  # in CGS
+k: Final[float] = 1.38064852e-16  # in CGS
+STEFAN_BOLTZMANN_CONSTANT: Final[float] = 5.67e-5  # in CGS, as in Planet::getTeff
+
+MINIMUM_TABULATED_TEMPERATURE: Final[float] = 75.0  # K
+MAXIMUM_TABULATED_TEMPERATURE: Final[float] = 4000.0  # K
+
+DEFAULT_LOG_TEMPERATURE_SPACING: Final[float] = 1e-3
+
+
+def blackbody_intensity_by_wavelength(temperature_in_K, wavelength_in_cm):
+    T, wave = temperature_in_K, wavelength_in_cm
+    return (2 * h * c * c / wave**5) / (np.exp(h * c / wave / k / T) - 1)
+
+
+@dataclass
+class PlanckCache:
+    # size of array: (number_of_wavelengths,)
+    wavelengths_in_cm: NDArray[np.float64]
+    tabulated: bool = False
+    minimum_temperature_in_K: float = MINIMUM_TABULATED_TEMPERATURE
+    maximum_temperature_in_K: float = MAXIMUM_TABULATED_TEMPERATURE
+    log_temperature_spacing: float = DEFAULT_LOG_TEMPERATURE_SPACING
+
+    # 2*h*c**2/wavelength**5 and h*c/wavelength/k
+    intensity_prefactors: NDArray[np.float64] = field(init=False, repr=False)
+    exponent_prefactors: NDArray[np.float64] = field(init=False, repr=False)
+    log_spacing: float = field(init=False, repr=False)
+    # size of arrays: (number_of_temperatures,)
+    log_temperatures: NDArray[np.float64] = field(init=False, repr=False)
+    inverse_temperatures: NDArray[np.float64] = field(init=False, repr=False)
+    # size of array: (number_of_temperatures, number_of_wavelengths)
+    log_intensities: NDArray[np.float64] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.wavelengths_in_cm = np.asarray(self.wavelengths_in_cm, dtype=np.float64)
+        wave = self.wavelengths_in_cm
+
+        self.intensity_prefactors = 2 * h * c * c / wave**5
+        self.exponent_prefactors = h * c / wave / k
+
+        if self.tabulated:
+            self.tabulate()
+
+    def tabulate(self) -> None:
+        log_temperature_range = np.log(
+            self.maximum_temperature_in_K / self.minimum_temperature_in_K
+        )
+        number_of_temperatures = (
+            int(np.ceil(log_temperature_range / self.log_temperature_spacing)) + 1
+        )
+        self.log_spacing = log_temperature_range / (number_of_temperatures - 1)
+
+        self.log_temperatures = np.log(self.minimum_temperature_in_K) + (
+            self.log_spacing * np.arange(number_of_temperatures)
+        )
+        temperatures = np.exp(self.log_temperatures)
+        self.inverse_temperatures = 1 / temperatures
+
+        # Intensities that underflow to 0 are floored so that their logs stay finite.
+        self.log_intensities = np.log(
+            np.maximum(
+                self.evaluate_exactly(temperatures[:, np.newaxis]),
+                np.finfo(np.float64).tiny,
+            )
+        )
+
+    def evaluate_exactly(self, temperatures_in_K: NDArray[np.float64]):
+        # Broadcasts temperatures against the last (wavelength) axis.
+        return self.intensity_prefactors / (
+            np.exp(self.exponent_prefactors / temperatures_in_K) - 1
+        )
+
+    def interpolate(self, temperatures_in_K: NDArray[np.float64]):
+        temperatures = np.asarray(temperatures_in_K, dtype=np.float64)
+        temperature_indices = np.clip(
+            (
+                (np.log(temperatures) - self.log_temperatures[0]) / self.log_spacing
+            ).astype(int),
+            0,
+            len(self.log_temperatures) - 2,
+        )
+
+        lower_inverse_temperatures = self.inverse_temperatures[temperature_indices]
+        interpolation_weights = np.expand_dims(
+            (1 / temperatures - lower_inverse_temperatures)
+            / (
+                self.inverse_temperatures[temperature_indices + 1]
+                - lower_inverse_temperatures
+            ),
+            axis=-1,
+        )
+
+        log_intensities = (1 - interpolation_weights) * self.log_intensities[
+            temperature_indices
+        ] + interpolation_weights * self.log_intensities[temperature_indices + 1]
+
+        return np.exp(log_intensities)
+
+    def blackbody_intensity(
+        self, temperatures_in_K: NDArray[np.float64]
+    ) -> NDArray[np.float64]:
+        """
+        Takes temperatures shaped (..., number_of_levels) and returns intensities
+        shaped (..., number_of_wavelengths, number_of_levels), as
+        blackbody_intensity_by_wavelength does with the temperatures expanded along
+        axis -2 and the wavelengths along axis -1.
+        """
+        temperatures = np.expand_dims(temperatures_in_K, axis=-1)
+
+        is_in_table_range = self.tabulated and np.all(
+            (temperatures >= self.minimum_temperature_in_K)
+            & (temperatures <= self.maximum_temperature_in_K)
+        )
+        if not is_in_table_range:
+            return np.swapaxes(self.evaluate_exactly(temperatures), -1, -2)
+
+        return np.swapaxes(self.interpolate(temperatures_in_K), -1, -2)
+
+    def check_wavelengths(self, wavelengths_in_cm: NDArray[np.float64]) -> None:
+        if wavelengths_in_cm is self.wavelengths_in_cm:
+            return
+
+        if not np.array_equal(wavelengths_in_cm, self.wavelengths_in_cm):
+            raise ValueError(
+                "The Planck cache was made for a different wavelength grid "
+                + f"({len(self.wavelengths_in_cm)} wavelengths from "
+                + f"{self.wavelengths_in_cm[0]:.4g} cm)."
+            )
+
+
+def calculate_effective_temperature(
+    wavelengths_in_cm: NDArray[np.float64], emitted_flux: NDArray[np.float64]
+) -> NDArray[np.float64]:
+    """
+    The Stefan-Boltzmann temperature of the flux integrated over the (low-resolution)
+    wavelength grid, as in Planet::getTeff. For a perfect blackbody, at least 90% of
+    the flux falls within 0.6-30 microns between 350 and 3500 K.
+    """
+    total_flux = np.sum(emitted_flux[..., 1:] * np.diff(wavelengths_in_cm), axis=-1)
+
+    return (total_flux / STEFAN_BOLTZMANN_CONSTANT) ** 0.25
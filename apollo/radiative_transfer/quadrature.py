@@ -0,0 +1,217 @@
+"""
+Gauss quadrature over the stream angles of the emission solvers.
+
+The emergent flux is 2*pi times the integral of mu*I(mu) over mu from 0 to 1, so the
+angles are the Gauss points for the weight function mu on [0, 1] (Gauss-Jacobi with
+alpha = 0, beta = 1), and the weights sum to 1/2. Eight of them reproduce
+STREAM_COSINE_ANGLES and STREAM_WEIGHTS, the hard-coded points of Planet::getFlux.
+
+The flux integration is repeated for every angle, so its cost (most of the cost of the
+one-stream solver, and of the two-stream solver beyond its tridiagonal solve) grows
+linearly with their number. The presets trade accuracy for speed:
+
+    fast:      4 angles, for exploratory runs
+    standard:  the original 8 points
+    reference: 16 angles, to check the others against
+
+In an input file, the quadrature follows the number of streams, as a preset name or a
+number of angles, e.g. "Streams 2 fast" or "Streams 2 12".
+
+The benchmark command times RT_Toon1989 on a batch of random atmospheres for a range of
+quadratures, and reports the median and largest relative flux error of each against a
+32-angle reference. The largest errors are in the Wien tail of atmospheres with steep
+temperature gradients, where the flux is most limb-darkened.
+
+Usage:
+    python -m apollo.radiative_transfer.quadrature benchmark
+        [--number-of-angles 2 4 8 16] [--number-of-models 16]
+        [--number-of-wavelengths 1000] [--number-of-layers 70]
+"""
+
+from argparse import ArgumentParser, Namespace
+from dataclasses import dataclass
+from enum import StrEnum, auto
+from time import perf_counter
+from typing import Final, NamedTuple, Sequence
+
+import numpy as np
+from numpy.typing import NDArray
+from scipy.special import roots_jacobi
+
+from apollo.radiative_transfer.RT_Toon1989 import (
+    STREAM_COSINE_ANGLES,
+    STREAM_WEIGHTS,
+    RT_Toon1989,
+)
+
+
+class QuadraturePreset(StrEnum):
+    fast = auto()
+    standard = auto()
+    reference = auto()
+
+
+NUMBER_OF_ANGLES_BY_PRESET: Final[dict[QuadraturePreset, int]] = {
+    QuadraturePreset.fast: 4,
+    QuadraturePreset.standard: 8,
+    QuadraturePreset.reference: 16,
+}
+
+DEFAULT_QUADRATURE: Final[QuadraturePreset] = QuadraturePreset.standard
+
+BENCHMARK_REFERENCE_NUMBER_OF_ANGLES: Final[int] = 32
+
+
+class StreamQuadrature(NamedTuple):
+    stream_cosine_angles: NDArray[np.float64]
+    stream_weights: NDArray[np.float64]
+
+
+def calculate_stream_quadrature(number_of_angles: int) -> StreamQuadrature:
+    if number_of_angles < 1:
+        raise ValueError(f"Need at least one quadrature angle, got {number_of_angles}.")
+
+    # The roots are on [-1, 1] for the weight (1 + x); mu = (1 + x) / 2.
+    roots, weights = roots_jacobi(number_of_angles, 0, 1)
+
+    return StreamQuadrature(
+        stream_cosine_angles=(roots + 1) / 2, stream_weights=weights / 4
+    )
+
+
+def get_stream_quadrature(
+    quadrature: QuadraturePreset | str | int = DEFAULT_QUADRATURE,
+) -> StreamQuadrature:
+    """
+    Takes a preset name or a number of angles. The standard preset returns the
+    original hard-coded points, so that spectra are unchanged by default.
+    """
+    if isinstance(quadrature, str) and quadrature.isdigit():
+        quadrature = int(quadrature)
+
+    if isinstance(quadrature, int):
+        return calculate_stream_quadrature(quadrature)
+
+    if quadrature not in QuadraturePreset.__members__:
+        raise ValueError(
+            f'Unknown quadrature "{quadrature}"; use a number of angles or one of '
+            + ", ".join(QuadraturePreset)
+            + "."
+        )
+    if quadrature == QuadraturePreset.standard:
+        return StreamQuadrature(STREAM_COSINE_ANGLES, STREAM_WEIGHTS)
+
+    return calculate_stream_quadrature(
+        NUMBER_OF_ANGLES_BY_PRESET[QuadraturePreset(quadrature)]
+    )
+
+
+@dataclass
+class QuadratureBenchmark:
+    number_of_angles: int
+    seconds_per_call: float
+    median_relative_flux_error: float
+    maximum_relative_flux_error: float
+
+
+def make_random_atmospheres(
+    number_of_models: int,
+    number_of_wavelengths: int,
+    number_of_layers: int,
+    seed: int = 0,
+) -> dict[str, NDArray[np.float64]]:
+    rng = np.random.default_rng(seed)
+    layer_shape = (number_of_models, number_of_wavelengths, number_of_layers)
+
+    return dict(
+        wavelengths_in_cm=np.linspace(1.0, 5.0, number_of_wavelengths) * 1e-4,
+        temperatures_in_K=np.sort(
+            rng.uniform(500, 2500, size=(number_of_models, number_of_layers + 1)),
+            axis=-1,
+        ),
+        optical_depth_per_layer=10 ** rng.uniform(-4, 1, size=layer_shape),
+        single_scattering_albedo=rng.uniform(0, 0.9, size=layer_shape),
+        scattering_asymmetry=rng.uniform(0, 0.9, size=layer_shape),
+    )
+
+
+def benchmark_stream_quadratures(
+    numbers_of_angles: Sequence[int] = (2, 4, 8, 16),
+    number_of_models: int = 16,
+    number_of_wavelengths: int = 1000,
+    number_of_layers: int = 70,
+    number_of_repeats: int = 3,
+) -> list[QuadratureBenchmark]:
+    atmospheres = make_random_atmospheres(
+        number_of_models, number_of_wavelengths, number_of_layers
+    )
+    reference_fluxes = RT_Toon1989(
+        **atmospheres,
+        **calculate_stream_quadrature(BENCHMARK_REFERENCE_NUMBER_OF_ANGLES)._asdict(),
+    )
+
+    benchmarks = []
+    for number_of_angles in numbers_of_angles:
+        stream_quadrature = calculate_stream_quadrature(number_of_angles)
+
+        start_time = perf_counter()
+        for _ in range(number_of_repeats):
+            fluxes = RT_Toon1989(**atmospheres, **stream_quadrature._asdict())
+        seconds_per_call = (perf_counter() - start_time) / number_of_repeats
+        relative_flux_errors = np.abs(fluxes / reference_fluxes - 1)
+
+        benchmarks.append(
+            QuadratureBenchmark(
+                number_of_angles=number_of_angles,
+                seconds_per_call=seconds_per_call,
+                median_relative_flux_error=float(np.median(relative_flux_errors)),
+                maximum_relative_flux_error=float(np.max(relative_flux_errors)),
+            )
+        )
+
+    return benchmarks
+
+
+def print_quadrature_benchmarks(benchmarks: Sequence[QuadratureBenchmark]) -> None:
+    print(
+        "Relative flux errors against "
+        + f"{BENCHMARK_REFERENCE_NUMBER_OF_ANGLES} angles:"
+    )
+    print("angles  seconds per call  median error  maximum error")
+    for benchmark in benchmarks:
+        print(
+            f"{benchmark.number_of_angles:6d}  {benchmark.seconds_per_call:16.4f}  "
+            + f"{benchmark.median_relative_flux_error:12.3e}  "
+            + f"{benchmark.maximum_relative_flux_error:13.3e}"
+        )
+
+
+def read_command_line_arguments() -> Namespace:
+    parser: ArgumentParser = ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    benchmark_parser = subparsers.add_parser(
+        "benchmark", help="Report flux error against time for each quadrature."
+    )
+    benchmark_parser.add_argument(
+        "--number-of-angles", type=int, nargs="+", default=[2, 4, 8, 16]
+    )
+    benchmark_parser.add_argument("--number-of-models", type=int, default=16)
+    benchmark_parser.add_argument("--number-of-wavelengths", type=int, default=1000)
+    benchmark_parser.add_argument("--number-of-layers", type=int, default=70)
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args: Namespace = read_command_line_arguments()
+
+    if args.command == "benchmark":
+        print_quadrature_benchmarks(
+            benchmark_stream_quadratures(
+                args.number_of_angles,
+                args.number_of_models,
+                args.number_of_wavelengths,
+                args.number_of_layers,
+            )
+        )
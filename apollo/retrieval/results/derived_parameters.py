@@ -0,0 +1,52 @@
+import pickle
+from collections.abc import Callable, Sequence
+
+import numpy as np
+from numpy.typing import NDArray
+
+from custom_types import Pathlike
+
+DERIVED_PARAMETER_NAMES = ["Mass", "C/O", "[Fe/H]", "Teff"]
+
+
+def calculate_derived_parameters_for_samples(
+    model_function: Callable,
+    samples: Sequence[Sequence[float]],
+    model_parameters: Sequence[float],
+    free_parameter_indices: Sequence[int],
+) -> NDArray[np.float64]:
+    # For a retrieval run with DerivedParameterSchedule.saved_samples, whose
+    # likelihood calls returned None for the derived parameters: each saved sample
+    # is put into the full parameter vector and the model is called once more.
+    parameters = np.array(model_parameters, dtype=np.float64)
+
+    derived_parameters = []
+    for sample in samples:
+        parameters[free_parameter_indices] = sample
+        _, sample_derived_parameters = model_function(
+            parameters, compute_derived_parameters=True
+        )
+        derived_parameters.append(sample_derived_parameters)
+
+    return np.asarray(derived_parameters, dtype=np.float64).reshape(
+        -1, len(DERIVED_PARAMETER_NAMES)
+    )
+
+
+def save_derived_parameters_for_samples(
+    filepath: Pathlike,
+    model_function: Callable,
+    samples: Sequence[Sequence[float]],
+    model_parameters: Sequence[float],
+    free_parameter_indices: Sequence[int],
+) -> NDArray[np.float64]:
+    # One row per sample, in the order of the samples, which is what
+    # parse_dynesty_outputs.load_derived_parameters reads back.
+    derived_parameters = calculate_derived_parameters_for_samples(
+        model_function, samples, model_parameters, free_parameter_indices
+    )
+
+    with open(filepath, "wb") as derived_parameters_file:
+        pickle.dump(derived_parameters, derived_parameters_file)
+
+    return derived_parameters
@@ -0,0 +1,270 @@
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#include <sstream>
+#include "specincld.h"
+#include "OpacityStore.h"
+
+// Constructor for a file opened later with openNpy
+OpacityFile::OpacityFile()
+{
+  mapbase = NULL;
+  maplength = 0;
+  data = NULL;
+  data32 = NULL;
+  nvalues = 0;
+  position = 0;
+  binary = false;
+  found = false;
+  logscale = false;
+}
+
+// Constructor; basename is the table path without its extension,
+// e.g. opacdir + "/gases/h2o.nir"
+OpacityFile::OpacityFile(string basename)
+{
+  mapbase = NULL;
+  maplength = 0;
+  data = NULL;
+  data32 = NULL;
+  nvalues = 0;
+  position = 0;
+  binary = false;
+  found = false;
+  logscale = false;
+
+  string npyfile = basename + ".npy";
+  string hdrfile = basename + ".hdr";
+  ifstream hdrin(hdrfile.c_str());
+  if(hdrin && openNpy(npyfile)){
+    binary = true;
+    found = true;
+    logscale = readOpacityLogScale(hdrfile);
+    return;
+  }
+
+  string datfile = basename + ".dat";
+  textin.open(datfile.c_str());
+  if(textin){
+    found = true;
+    // Skip the header; the dimensions are read separately by readOpacityHeader.
+    double temp;
+    for(int i=0; i<10; i++) textin >> temp;
+  }
+}
+// end constructor
+
+OpacityFile::~OpacityFile()
+{
+  if(mapbase != NULL) munmap(mapbase, maplength);
+  if(textin.is_open()) textin.close();
+}
+
+// Maps a version 1-3 .npy file of little-endian float64 or float32 values in C order.
+bool OpacityFile::openNpy(string filename)
+{
+  int fd = open(filename.c_str(), O_RDONLY);
+  if(fd < 0) return false;
+
+  struct stat filestat;
+  if(fstat(fd, &filestat) != 0 || filestat.st_size < 10){
+    close(fd);
+    return false;
+  }
+  maplength = (size_t)filestat.st_size;
+  mapbase = mmap(NULL, maplength, PROT_READ, MAP_SHARED, fd, 0);
+  close(fd);
+  if(mapbase == MAP_FAILED){
+    mapbase = NULL;
+    return false;
+  }
+
+  const unsigned char* bytes = (const unsigned char*)mapbase;
+  size_t headerlength;
+  size_t dataoffset;
+  if(memcmp(bytes, "\x93NUMPY", 6) != 0){
+    munmap(mapbase, maplength);
+    mapbase = NULL;
+    return false;
+  }
+  if(bytes[6] == 1){
+    headerlength = bytes[8] | (bytes[9] << 8);
+    dataoffset = 10 + headerlength;
+  }
+  else{
+    headerlength = bytes[8] | (bytes[9] << 8) | (bytes[10] << 16) | ((size_t)bytes[11] << 24);
+    dataoffset = 12 + headerlength;
+  }
+
+  string header((const char*)bytes + (dataoffset - headerlength), headerlength);
+  bool single = header.find("'descr': '<f4'") != string::npos;
+  bool validtype = single || header.find("'descr': '<f8'") != string::npos;
+  bool corder = header.find("'fortran_order': False") != string::npos;
+  if(!validtype || !corder || dataoffset > maplength){
+    printf("Unsupported binary opacity table %s\n",filename.c_str());
+    munmap(mapbase, maplength);
+    mapbase = NULL;
+    return false;
+  }
+
+  if(single){
+    data32 = (const float*)(bytes + dataoffset);
+    nvalues = (maplength - dataoffset)/sizeof(float);
+  }
+  else{
+    data = (const double*)(bytes + dataoffset);
+    nvalues = (maplength - dataoffset)/sizeof(double);
+  }
+  binary = true;
+  found = true;
+  return true;
+}
+
+bool OpacityFile::good()
+{
+  return found;
+}
+
+bool OpacityFile::isBinary()
+{
+  return binary;
+}
+
+size_t OpacityFile::size()
+{
+  return nvalues;
+}
+
+double OpacityFile::next()
+{
+  double val = 0.;
+  if(binary){
+    if(position < nvalues) val = (data32 != NULL) ? (double)data32[position] : data[position];
+    position++;
+    if(logscale) val = pow(10.,val);
+  }
+  else{
+    textin >> val;
+  }
+  return val;
+}
+
+// Moves past n values. For the binary store the skipped pages are never touched.
+void OpacityFile::skip(size_t n)
+{
+  if(binary){
+    position += n;
+  }
+  else{
+    double temp;
+    for(size_t i=0; i<n; i++) textin >> temp;
+  }
+}
+
+bool readOpacityHeader(string basename, double header[10])
+{
+  string dimfile = basename + ".hdr";
+  ifstream dimin(dimfile.c_str());
+  if(!dimin){
+    dimfile = basename + ".dat";
+    dimin.open(dimfile.c_str());
+  }
+  if(!dimin) return false;
+  for(int i=0; i<10; i++) dimin >> header[i];
+  dimin.close();
+  return true;
+}
+
+// Whether a binary store's .hdr marks its values as log10 of the cross sections.
+// Lines after the 10-value header hold "key values..." notes.
+bool readOpacityLogScale(string hdrfile)
+{
+  ifstream hdrin(hdrfile.c_str());
+  string line;
+  getline(hdrin, line);
+  while(getline(hdrin, line)){
+    istringstream note(line);
+    string key, value;
+    if(note >> key >> value && key=="scale") return value=="log10";
+  }
+  return false;
+}
+
+bool hasBinaryTable(string basename)
+{
+  string hdrfile = basename + ".hdr";
+  string npyfile = basename + ".npy";
+  struct stat filestat;
+  return stat(hdrfile.c_str(), &filestat) == 0 && stat(npyfile.c_str(), &filestat) == 0;
+}
+
+// The file a table is actually read from: the binary store if present, else the text table.
+string opacitySourceFile(string basename)
+{
+  if(hasBinaryTable(basename)) return basename + ".npy";
+  return basename + ".dat";
+}
+
+bool directoryExists(string dirname)
+{
+  struct stat filestat;
+  return stat(dirname.c_str(), &filestat) == 0 && S_ISDIR(filestat.st_mode);
+}
+
+bool getFileStamp(string filename, long long &size, long long &mtime)
+{
+  struct stat filestat;
+  if(stat(filename.c_str(), &filestat) != 0) return false;
+  size = (long long)filestat.st_size;
+  mtime = (long long)filestat.st_mtime;
+  return true;
+}
+
+// 64-bit FNV-1a hash; the Python side (apollo/opacities/degraded_table_cache.py) uses the same one.
+unsigned long long fnv1a64(string text)
+{
+  unsigned long long hash = 14695981039346656037ULL;
+  for(size_t i=0; i<text.size(); i++){
+    hash ^= (unsigned char)text[i];
+    hash *= 1099511628211ULL;
+  }
+  return hash;
+}
+
+// Writes a float64 C-order .npy file. The data go to a temporary file that is then renamed,
+// so other processes never see a partly written file.
+bool writeNpy(string filename, const vector<double> &values, vector<size_t> shape)
+{
+  string shapestr = "(";
+  for(size_t i=0; i<shape.size(); i++){
+    if(i>0) shapestr += ", ";
+    shapestr += to_string(shape[i]);
+  }
+  if(shape.size()==1) shapestr += ",";
+  shapestr += ")";
+
+  string header = "{'descr': '<f8', 'fortran_order': False, 'shape': " + shapestr + ", }";
+  // Pad with spaces so the data start on a 64-byte boundary, ending in a newline.
+  size_t total = 10 + header.size() + 1;
+  header += string((64 - total%64)%64, ' ') + "\n";
+
+  char tempname[32];
+  snprintf(tempname, sizeof(tempname), ".%d.tmp", (int)getpid());
+  string tempfile = filename + tempname;
+  FILE* out = fopen(tempfile.c_str(), "wb");
+  if(out == NULL) return false;
+
+  unsigned char preamble[10] = {0x93,'N','U','M','P','Y',1,0,0,0};
+  preamble[8] = header.size() & 0xff;
+  preamble[9] = (header.size() >> 8) & 0xff;
+  bool ok = fwrite(preamble, 1, 10, out) == 10;
+  ok = ok && fwrite(header.c_str(), 1, header.size(), out) == header.size();
+  ok = ok && fwrite(values.data(), sizeof(double), values.size(), out) == values.size();
+  ok = (fclose(out) == 0) && ok;
+  if(!ok || rename(tempfile.c_str(), filename.c_str()) != 0){
+    remove(tempfile.c_str());
+    return false;
+  }
+  return true;
+}
@@ -0,0 +1,59 @@
+#ifndef OPACITYSTORE_H
+#define OPACITYSTORE_H
+
+#include "specincld.h"
+
+// Element type of the in-memory cross-section tables. Building with
+// -DAPOLLO_FLOAT32_TABLES (see setup.py) halves their memory.
+#ifdef APOLLO_FLOAT32_TABLES
+typedef float opacreal;
+#else
+typedef double opacreal;
+#endif
+
+// Sequential reader for one cross-section table.
+// Opens the binary store (<base>.npy, memory-mapped) if it exists,
+// and otherwise falls back to the text table (<base>.dat).
+// Values are returned in file order: pressure, temperature, wavelength.
+// The binary store may hold float64 or float32 values, and if its .hdr has a
+// "scale log10" line, log10 of the cross sections; next() always returns the cross section.
+class OpacityFile
+{
+ private:
+  ifstream textin;
+  void* mapbase;     // start of the memory-mapped .npy file
+  size_t maplength;
+  const double* data;
+  const float* data32; // set instead of data for float32 tables
+  size_t nvalues;
+  size_t position;
+  bool binary;
+  bool found;
+  bool logscale;
+
+ public:
+  OpacityFile();
+  OpacityFile(string basename);
+  ~OpacityFile();
+
+  bool openNpy(string filename);
+  bool good();
+  bool isBinary();
+  size_t size();
+  double next();
+  void skip(size_t n);
+};
+
+// Reads the 10-value APOLLO header for a table into header[],
+// from the binary store's .hdr sidecar if it exists, otherwise from the .dat file.
+bool readOpacityHeader(string basename, double header[10]);
+bool readOpacityLogScale(string hdrfile);
+
+bool hasBinaryTable(string basename);
+string opacitySourceFile(string basename);
+bool directoryExists(string dirname);
+bool getFileStamp(string filename, long long &size, long long &mtime);
+unsigned long long fnv1a64(string text);
+bool writeNpy(string filename, const vector<double> &values, vector<size_t> shape);
+
+#endif // OPACITYSTORE_H
@@ -1,20 +1,36 @@
-//#include <omp.h>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
 #include "specincld.h"
 #include "constants.h"
 #include "Atmosphere.h"
 #include "Planet.h"
+#include "OpacityStore.h"
 
 using namespace cons;
 // Constructor; includes all the variables that don't change between models
-Planet::Planet(vector<int> switches, vector<double> waves, vector<double> waveslo, vector<int> mollist, string opacname, string hir, string lor)
+Planet::Planet(vector<int> switches, vector<double> waves, vector<double> waveslo, vector<int> mollist, string opacname, string hir, string lor, bool readtables)
 {  
   mode = switches[0];
   cloudmod = switches[1];
   hazetype = switches[2];
   streams = switches[3];
   tprofmode = switches[4];
+
+  // The OpenMP build runs the wavelength loops on APOLLO_NUM_THREADS threads; see setThreads.
+  const char* threadsetting = getenv("APOLLO_NUM_THREADS");
+  setThreads(threadsetting ? atoi(threadsetting) : 1);
+  
+  // 8 Gauss points by default; setQuadrature replaces them.
+  // Cosines of angles to calculate the streams
+  gaussPoints = {0.0446339553, 0.1443662570, 0.2868247571, 0.4548133152,
+                 0.6280678354, 0.7856915206, 0.9086763921, 0.9822200849};
+  // Weights for the streams
+  gaussWeights = {0.0032951914, 0.0178429027, 0.0454393195, 0.0791995995,
+                  0.1060473494, 0.1125057995, 0.0911190236, 0.0445508044};
   
   nspec = mollist.size(); // Number of molecular species, not number of spectral points.
+  ntablespec = (nspec==0) ? 1 : nspec; // the gray atmosphere has one table plane
   
   wavens = waves;
   wavenslo = waveslo;
@@ -22,11 +38,19 @@ Planet::Planet(vector<int> switches, vector<double> waves, vector<double> wavesl
   hires = hir;
   lores = lor;
   
-  string dimfile = opacdir + "/gases/h2o." + hires + ".dat";
-  ifstream dimin(dimfile.c_str());
-  if(!dimin) cout << "Opacity Files Not Found" << std::endl;
-  dimin >> npress >> pmin >> pmax >> ntemp >> tmin >> tmax >> nwave >> wmin >> wmax >> res;
-  dimin.close();
+  // The header is read from the binary store's .hdr sidecar if present, else from the .dat table.
+  double dims[10] = {0};
+  if(!readOpacityHeader(opacdir + "/gases/h2o." + hires, dims)) cout << "Opacity Files Not Found" << std::endl;
+  npress = (int)dims[0];
+  pmin = dims[1];
+  pmax = dims[2];
+  ntemp = (int)dims[3];
+  tmin = dims[4];
+  tmax = dims[5];
+  nwave = (int)dims[6];
+  wmin = dims[7];
+  wmax = dims[8];
+  res = dims[9];
   
   tmin = pow(10,tmin);
   tmax = pow(10,tmax);
@@ -40,32 +64,61 @@ Planet::Planet(vector<int> switches, vector<double> waves, vector<double> wavesl
   degrade = round(res*log(wavens[1]/wavens[0]));
   ntable = ceil((double)nwave/degrade);
 
-  cout << "tmin " << tmin << " tmax " << tmax << " pmin " << pmin << " pmax " << pmax << " degrade " << degrade << std::endl;
-  
-  if(nspec==0){
-    mastertable = vector<vector<vector<vector<double> > > >(npress,vector<vector<vector<double> > >(ntemp,vector<vector<double> >(ntable,vector<double>(1))));
-  }
-  else{
-    mastertable = vector<vector<vector<vector<double> > > >(npress,vector<vector<vector<double> > >(ntemp,vector<vector<double> >(ntable,vector<double>(nspec))));
+  // Band-aware loading: only the degraded table rows that the model wavelengths fall in
+  // are stored. rowindex maps a degraded row to its place in mastertable (-1 if unused),
+  // and tablerow maps each model wavelength to its mastertable row.
+  rowindex = vector<int>(ntable,-1);
+  tablerow = vector<int>(wavens.size(),0);
+  vector<int> fullrow(wavens.size(),0);
+  for(int m=0; m<wavens.size(); m++){
+    int jw = (int)(log(wavens[m]/wmin)*res/degrade + 0.000001);
+    if(jw<0) jw = 0;
+    if(jw>ntable-1) jw = ntable-1;
+    fullrow[m] = jw;
+    rowindex[jw] = 0;
   }
-  
-  double temp;
-  dimfile = opacdir + "/gases/h2o." + lores + ".dat";
-  ifstream dimin2(dimfile.c_str());
-  if(!dimin2) cout << "Opacity Files Not Found" << std::endl;
-  dimin2 >> temp >> temp >> temp >> temp >> temp >> temp >> nwavelo >> lminlo >> lmaxlo >> reslo;
-  dimin2.close();
-  
-  if(nspec==0){
-    lotable = vector<vector<vector<vector<double> > > >(npress,vector<vector<vector<double> > >(ntemp,vector<vector<double> >(nwavelo,vector<double>(1))));
+  nrows = 0;
+  for(int x=0; x<ntable; x++){
+    if(rowindex[x]>=0){
+      rowindex[x] = nrows;
+      nrows++;
+    }
   }
-  else{
-    lotable = vector<vector<vector<vector<double> > > >(npress,vector<vector<vector<double> > >(ntemp,vector<vector<double> >(nwavelo,vector<double>(nspec))));
+  for(int m=0; m<wavens.size(); m++){
+    tablerow[m] = rowindex[fullrow[m]];
   }
+
+  // Cache of degraded, band-limited tables (see apollo/opacities/degraded_table_cache.py).
+  // Used only if the cache directory exists; APOLLO_DEGRADED_CACHE overrides its location.
+  const char* cacheenv = getenv("APOLLO_DEGRADED_CACHE");
+  cachedir = (cacheenv != NULL) ? string(cacheenv) : opacdir + "/gases/degraded";
+  if(!directoryExists(cachedir)) cachedir = "";
+
+  cout << "tmin " << tmin << " tmax " << tmax << " pmin " << pmin << " pmax " << pmax << " degrade " << degrade << " rows " << nrows << "/" << ntable << std::endl;
+  
+  double dimslo[10] = {0};
+  if(!readOpacityHeader(opacdir + "/gases/h2o." + lores, dimslo)) cout << "Opacity Files Not Found" << std::endl;
+  nwavelo = (int)dimslo[6];
+  lminlo = dimslo[7];
+  lmaxlo = dimslo[8];
+  reslo = dimslo[9];
   
   vector<double> temphaze(4,0);
   atmoshires = new Atmosphere(hazetype,temphaze,hires,opacdir);
   atmoslores = new Atmosphere(hazetype,temphaze,lores,opacdir);
+
+  // Without readtables, the tables are left empty for attachTable to point at external
+  // buffers (e.g. memory-mapped files or node-wide shared memory), filled by the caller.
+  mastertable = NULL;
+  lotable = NULL;
+  loresready = false;
+  if(!readtables) return;
+
+  masterstorage = vector<opacreal>(tableSize("hires"),0);
+  lostorage = vector<opacreal>(tableSize("lores"),0);
+  mastertable = masterstorage.data();
+  lotable = lostorage.data();
+
   printf("Reading in cross sections.\n");
   readopac(mollist, wavens, "hires", opacdir);
   readopac(mollist, wavenslo, "lores", opacdir);
@@ -73,6 +126,27 @@ Planet::Planet(vector<int> switches, vector<double> waves, vector<double> wavesl
 }
 // end constructor
 
+// Number of values in a cross-section table: species x pressure x temperature x wavelength.
+size_t Planet::tableSize(string table)
+{
+  int nw = (table=="hires") ? nrows : nwavelo;
+  return (size_t)ntablespec*npress*ntemp*nw;
+}
+
+// Points a table at an external buffer of tableSize(table) values in tableIndex order,
+// which the caller owns and keeps alive. Any table read in by the constructor is freed.
+void Planet::attachTable(string table, opacreal* buffer)
+{
+  if(table=="hires"){
+    vector<opacreal>().swap(masterstorage);
+    mastertable = buffer;
+  }
+  if(table=="lores"){
+    vector<opacreal>().swap(lostorage);
+    lotable = buffer;
+  }
+}
+
 // Overloaded function in case you want pressure-dependent abundances.
 // Reads in the variables that define a particular model and sets the parameters
 // void Planet::setParams(vector<double> plparams, vector<vector<double> > abund, vector<double> rxsecs, vector<double> tpprofile)
@@ -152,7 +226,33 @@ void Planet::setParams(vector<double> plparams, vector<double> abund, vector<dou
 }
 // end setParams
 
+// Replaces the Gauss points and weights used by getFlux and getFluxOneStream.
+void Planet::setQuadrature(vector<double> points, vector<double> weights)
+{
+  if(points.empty() || points.size()!=weights.size()){
+    cout << "Quadrature Points And Weights Do Not Match" << std::endl;
+    return;
+  }
+  gaussPoints = points;
+  gaussWeights = weights;
+}
+// end setQuadrature
+
+// Sets the number of threads for the wavelength loops, and returns the number in effect.
+// Each wavelength is computed the same way on any thread, so the results do not depend on it.
+int Planet::setThreads(int n)
+{
+#ifdef _OPENMP
+  nthreads = max(n,1);
+#else
+  nthreads = 1;
+#endif
+  return nthreads;
+}
+// end setThreads
+
 double Planet::getTeff(){
+  setWaveLores();
   vector<double> tdepthlo;
   if(streams==2) tdepthlo = getFlux(wavenslo,"lores",taulayerlo,w0lo,asymlo);
   if(streams==1) tdepthlo = getFluxOneStream(wavenslo,"lores",taulayerlo,tauproflo);
@@ -205,7 +305,7 @@ void Planet::readopac(vector<int> mollist, vector<double> wavens, string table,
 	for(int k=0; k<ntemp; k++){
 	  for(int l=0; l<nwave; l++){
 	    x = (int)(l/degrade);
-	    mastertable[j][k][x][0] = 6.629e-24;
+	    if(x<ntable && rowindex[x]>=0) mastertable[tableIndex(0,j,k,rowindex[x],nrows)] = 6.629e-24;
 	  }
 	}
       }
@@ -217,44 +317,60 @@ void Planet::readopac(vector<int> mollist, vector<double> wavens, string table,
 	int x;
 	double val;
 	
-	if(gaslist[index]=="h-"){
+	// H- is computed here unless a precomputed table (apollo/opacities/hminus_table.py) exists.
+	if(gaslist[index]=="h-" && !hasBinaryTable(opacdir + "/gases/h-." + hires)){
 	  printf("%s computed\n",gaslist[index].c_str());
 	  for(int j=0; j<npress; j++){
 	    for(int k=0; k<ntemp; k++){
 	      for(int l=0; l<nwave; l++){
-		double wn = wmin*exp(l/res);
 		x = (int)(l/degrade);
+		if(x>=ntable || rowindex[x]<0) continue;
+		double wn = wmin*exp(l/res);
 		double tmid = tmin*pow(10,k/deltalogt);
 		double bf = HminBoundFree(tmid, wn);
 		double ff = HminFreeFree(tmid, wn);
 		val = bf + ff;
 		if(isnan(val) || isinf(val) || val < 1.e-50) val = 1.e-50;
-		if(x<ntable) mastertable[j][k][x][i] += val/(double)degrade;
+		mastertable[tableIndex(i,j,k,rowindex[x],nrows)] += val/(double)degrade;
 	      }
 	    }
 	  }
 	} // end if(gaslist[index]=="h-")
 	
 	else{
-	  specfile = opacdir + "/gases/" + gaslist[index] + "." + hires + ".dat";
-	  printf("%s\n",specfile.c_str());
+	  specfile = opacdir + "/gases/" + gaslist[index] + "." + hires;
+	  
+	  // A cached copy already degraded to this model's wavelength rows skips the full read.
+	  string sourcefile = opacitySourceFile(specfile);
+	  string cachefile = degradedCacheFile(gaslist[index], sourcefile);
+	  if(cachefile!="" && readDegradedCache(cachefile, i)){
+	    printf("%s\n",cachefile.c_str());
+	    continue;
+	  }
 	  
-	  ifstream opacin(specfile.c_str());
-	  if(!opacin) cout << "Opacity File Not Found" << std::endl;
-	  double temp;
-	  opacin >> temp >> temp >> temp >> temp >> temp >> temp >> temp >> temp >> temp >> temp;
+	  // Memory-maps the binary store if it exists, otherwise parses the text table.
+	  OpacityFile opacin(specfile);
+	  if(!opacin.good()) cout << "Opacity File Not Found" << std::endl;
+	  if(opacin.isBinary()) printf("%s.npy\n",specfile.c_str());
+	  else printf("%s.dat\n",specfile.c_str());
+	  if(opacin.isBinary() && opacin.size() < (size_t)npress*ntemp*nwave) cout << "Binary Opacity File Too Short" << std::endl;
 	  
 	  for(int j=0; j<npress; j++){
 	    for(int k=0; k<ntemp; k++){
 	      for(int l=0; l<nwave; l++){
 		x = (int)(l/degrade);
-		opacin >> val;
+		// Rows outside the model bands are skipped; in the binary store they are never read from disk.
+		if(x>=ntable || rowindex[x]<0){
+		  opacin.skip(1);
+		  continue;
+		}
+		val = opacin.next();
 		if(isnan(val) || isinf(val) || val < 1.e-50) val = 1.e-50;
-		if(x<ntable) mastertable[j][k][x][i] += val/(double)degrade;
+		mastertable[tableIndex(i,j,k,rowindex[x],nrows)] += val/(double)degrade;
 	      }
 	    }
 	  }
-	  opacin.close();
+	  if(cachefile!="") writeDegradedCache(cachefile, i, gaslist[index], sourcefile);
 	} // end else(gaslist)	
       } // end for
     } // end else(nspec)
@@ -267,7 +383,7 @@ void Planet::readopac(vector<int> mollist, vector<double> wavens, string table,
       for(int j=0; j<npress; j++){
 	for(int k=0; k<ntemp; k++){
 	  for(int l=0; l<nwavelo; l++){
-	    lotable[j][k][l][0] = 6.629e-24;
+	    lotable[tableIndex(0,j,k,l,nwavelo)] = 6.629e-24;
 	  }
 	}
       }
@@ -278,42 +394,41 @@ void Planet::readopac(vector<int> mollist, vector<double> wavens, string table,
 	int index = mollist[i];
 	double val;
 	
-	if(gaslist[index]=="h-"){
+	if(gaslist[index]=="h-" && !hasBinaryTable(opacdir + "/gases/h-." + lores)){
 	  printf("%s computed\n",gaslist[index].c_str());
 	  for(int j=0; j<npress; j++){
 	    for(int k=0; k<ntemp; k++){
 	      for(int l=0; l<nwavelo; l++){
-		double wn = wmin*exp(l/reslo);
+		double wn = lminlo*exp(l/reslo);
 		double tmid = tmin*pow(10,k/deltalogt);
 		double bf = HminBoundFree(tmid, wn);
 		double ff = HminFreeFree(tmid, wn);
 		val = bf + ff;
 		if(isnan(val) || isinf(val) || val < 1.e-50) val = 1.e-50;
-		lotable[j][k][l][i] = val;
+		lotable[tableIndex(i,j,k,l,nwavelo)] = val;
 	      }
 	    }
 	  }
 	} // end if(gaslist[index]=="h-")
 	
 	else{
-	  specfile = opacdir + "/gases/" + gaslist[index] + "." + lores + ".dat";
-	  printf("%s\n",specfile.c_str());
+	  specfile = opacdir + "/gases/" + gaslist[index] + "." + lores;
 	  
-	  ifstream opacin(specfile.c_str());
-	  if(!opacin) cout << "Opacity File Not Found" << std::endl;
-	  double temp;
-	  opacin >> temp >> temp >> temp >> temp >> temp >> temp >> temp >> temp >> temp >> temp;
+	  OpacityFile opacin(specfile);
+	  if(!opacin.good()) cout << "Opacity File Not Found" << std::endl;
+	  if(opacin.isBinary()) printf("%s.npy\n",specfile.c_str());
+	  else printf("%s.dat\n",specfile.c_str());
+	  if(opacin.isBinary() && opacin.size() < (size_t)npress*ntemp*nwavelo) cout << "Binary Opacity File Too Short" << std::endl;
 	  
 	  for(int j=0; j<npress; j++){
 	    for(int k=0; k<ntemp; k++){
 	      for(int l=0; l<nwavelo; l++){
-		opacin >> val;
+		val = opacin.next();
 		if(isnan(val) || isinf(val) || val < 1.e-50) val = 1.e-50;
-		lotable[j][k][l][i] = val;
+		lotable[tableIndex(i,j,k,l,nwavelo)] = val;
 	      }
 	    }
 	  }
-	  opacin.close();
 	} // end else(gaslist)
       } // end for
     } // end else(nspec)
@@ -338,15 +453,27 @@ void Planet::setWave(int npoints, vector<double> rxsecs, vector<double> wavelist
   getOpacProf(rxsecs, wavens, abund, "hires");
   if(mode<=1) getTauProf(wavens, "hires");
   if(mode==2) transTauProf(wavens, "hires");
-  getOpacProf(rxsecs, wavenslo, abund, "lores");
-  getTauProf(wavenslo,"lores");
+
+  // The lores tables serve only getTeff, so they are computed there, on demand.
+  rxsecslo = rxsecs;
+  abundlo = abund;
+  loresready = false;
 }
 // end setWave
 
+// Computes the lores opacity and optical depth profiles for the current model, once per setParams.
+void Planet::setWaveLores()
+{
+  if(loresready) return;
+  getOpacProf(rxsecslo, wavenslo, abundlo, "lores");
+  getTauProf(wavenslo,"lores");
+  loresready = true;
+}
+// end setWaveLores
+
 // ada: Additional function to return the contribution function of the opacity, here called "taulayer".
 vector<vector<double > > Planet::getContribution()
 {
-  printf("Start of getContribution\n");
   vector<vector<double> > contribution(wavens.size(),vector<double>(nlayer,0));
 
   for(int i=0; i<wavens.size(); i++){
@@ -354,42 +481,36 @@ vector<vector<double > > Planet::getContribution()
       contribution[i][j] = taulayer[i][j]*blayer[i][j] / exp(tauprof[i][j]);
     }
   }
-  printf("End of getContribution\n");
   return contribution;
 }
 
 // ada: Additional function to return the cloud optical depth.
 vector<vector<double > > Planet::getCloudContribution()
 {
-  printf("Start of getCloudContribution\n");
   vector<vector<double> > contribution(wavens.size(),vector<double>(nlayer,0));
   for(int i=0; i<wavens.size(); i++){
     for(int j=0; j<nlayer; j++){
       contribution[i][j] = cloudtaulayer[i][j];
     }
   }
-  printf("End of getCloudContribution\n");
   return contribution;
 }
 
 // ada: Additional function to return the gas optical depth.
 vector<vector<double > > Planet::getGasContribution()
 {
-  printf("Start of getGasContribution\n");
   vector<vector<double> > contribution(wavens.size(),vector<double>(nlayer,0));
   for(int i=0; i<wavens.size(); i++){
     for(int j=0; j<nlayer; j++){
       contribution[i][j] = gastaulayer[i][j]*blayer[i][j] / exp(tauprof[i][j]);
     }
   }
-  printf("End of getGasContribution\n");
   return contribution;
 }
 
 // ada: Additional function to return the species-by-species absorption opacities.
 vector<vector<vector<double > > > Planet::getSpeciesContribution()
 {
-  printf("Start of getSpeciesContribution\n");
   int nmol = nspec;
   if(nmol==0) nmol = 1;
   vector<vector<vector<double > > > contribution(nmol,vector<vector<double> >(wavens.size(),vector<double>(nlayer,0)));
@@ -412,7 +533,6 @@ vector<vector<vector<double > > > Planet::getSpeciesContribution()
       }
     }
   }
-  printf("End of getSpeciesContribution\n");
   return contribution;
 }
 
@@ -493,30 +613,7 @@ double Planet::getH(double pr)
 // Version used by Ben Burningham.
 vector<double> Planet::getFlux(vector<double> wavens, string table, vector<vector<double > > taulayer, vector<vector<double > > w0, vector<vector<double > > asym)
 {
-  // 8 Gauss points
-  int nGauss = 8;
-  vector<double> gaussPoints(nGauss,0);
-  vector<double> gaussWeights(nGauss,0);
-
-  // Cosines of angles to calculate the streams
-  gaussPoints[0] = 0.0446339553;
-  gaussPoints[1] = 0.1443662570;
-  gaussPoints[2] = 0.2868247571;
-  gaussPoints[3] = 0.4548133152;
-  gaussPoints[4] = 0.6280678354;
-  gaussPoints[5] = 0.7856915206;
-  gaussPoints[6] = 0.9086763921;
-  gaussPoints[7] = 0.9822200849;
-
-  // Weights for the streams
-  gaussWeights[0] = 0.0032951914;
-  gaussWeights[1] = 0.0178429027;
-  gaussWeights[2] = 0.0454393195;
-  gaussWeights[3] = 0.0791995995;
-  gaussWeights[4] = 0.1060473494;
-  gaussWeights[5] = 0.1125057995;
-  gaussWeights[6] = 0.0911190236;
-  gaussWeights[7] = 0.0445508044;
+  int nGauss = gaussPoints.size();
 
   // Surface reflectivity should be zero for emission.
   // (It is used in the tridiagonal matrix in the bottom layer.)
@@ -537,15 +634,22 @@ vector<double> Planet::getFlux(vector<double> wavens, string table, vector<vecto
     }
   }
     
+  if(table == "hires"){
+    blayer = vector<vector<double> >(wavens.size(),vector<double>(nlayer,0));
+  }
+  vector<double> totalflux(wavens.size(),0);
+
+  // The wavelengths are independent, so each thread takes a block of them with its own
+  // scratch arrays, and the result does not depend on the number of threads.
+  int nwaves = wavens.size();
+#pragma omp parallel num_threads(nthreads)
+  {
   vector<double> fdown(nlevelshort,0);
   vector<double> fup(nlevelshort,0);
 
   vector<double> alpha(nlayershort,0);
   vector<double> lamda(nlayershort,0);
   vector<double> gama(nlayershort,0);
-  if(table == "hires"){
-    blayer = vector<vector<double> >(wavens.size(),vector<double>(nlayer,0));
-  }
   vector<double> b0(nlayershort,0);
   vector<double> b1(nlayershort,0);
   vector<double> bdiff(nlayershort,0);
@@ -587,13 +691,12 @@ vector<double> Planet::getFlux(vector<double> wavens, string table, vector<vecto
   vector<double> fpt(nlevelshort,0);
   vector<double> fmt(nlevelshort,0);
 
-  vector<double> totalflux(wavens.size(),0);
-
   // cosbar is layer asymmetry parameter with layer 0 on top
   // zero for most circumstances; may be nonzero for high cloud opacity
   vector<double> cosbar(nlayershort,0);
 
-  for(int i=0; i<wavens.size(); i++){
+#pragma omp for schedule(static)
+  for(int i=0; i<nwaves; i++){
     double wavelength = wavens[i]/1.e4;
 
     double btop;
@@ -772,7 +875,9 @@ calculating the contribution functions.
     for(int n3=0; n3<nlayershort; n3++){
       xk1[n3] = xki[2*n3] + xki[2*n3+1];
       xk2[n3] = xki[2*n3] - xki[2*n3+1];
-      if(xk2[n3]!=0. && fabs(xk2[n3]/xk[2*n3] < 1.e-30)) xk2[n3] = 0.;
+      // The original test here, if(xk2[n3]!=0. && fabs(xk2[n3]/xk[2*n3] < 1.e-30)) xk2[n3] = 0.;,
+      // read xk left over from the previous wavelength (and past its end), so it is left out,
+      // as in the Python port (apollo/radiative_transfer/RT_Toon1989.py).
     }
     // End of DSolver subroutine.
 
@@ -896,6 +1001,7 @@ calculating the contribution functions.
       } // end of ng for loop
     } // end of if(table=="lores")
   } // end of i for loop (wavens)
+  } // end of omp parallel
   
   return totalflux;
 }
@@ -904,34 +1010,11 @@ calculating the contribution functions.
 // computes the total spectral radiance of the planet in frequency space
 vector<double> Planet::getFluxOneStream(vector<double> wavens, string table, vector<vector<double > > taulayer, vector<vector<double > > tauprof)
 {
-  // 8 Gauss points
-  vector<double> gaussPoints(8,0);
-  vector<double> gaussWeights(8,0);
-  
-  // Cosines of angles to calculate the gauss points
-  gaussPoints[0] = 0.0446339553;
-  gaussPoints[1] = 0.1443662570;
-  gaussPoints[2] = 0.2868247571;
-  gaussPoints[3] = 0.4548133152;
-  gaussPoints[4] = 0.6280678354;
-  gaussPoints[5] = 0.7856915206;
-  gaussPoints[6] = 0.9086763921;
-  gaussPoints[7] = 0.9822200849;
-
-  // Weights for the gauss points
-  gaussWeights[0] = 0.0032951914;
-  gaussWeights[1] = 0.0178429027;
-  gaussWeights[2] = 0.0454393195;
-  gaussWeights[3] = 0.0791995995;
-  gaussWeights[4] = 0.1060473494;
-  gaussWeights[5] = 0.1125057995;
-  gaussWeights[6] = 0.0911190236;
-  gaussWeights[7] = 0.0445508044;
   
   vector<double> totalflux(wavens.size(),0);
   vector<double> fracflux(wavens.size(),0);
   
-  for(int j=0; j<8; j++){
+  for(int j=0; j<gaussPoints.size(); j++){
     fracflux = getFluxes(wavens,gaussPoints[j],gaussWeights[j],table,taulayer,tauprof);
     for(int i=0; i<wavens.size(); i++){
       totalflux[i] += 2.*pi*fracflux[i]*gaussWeights[j]*pi/2.; // erg/s/cm^2/Hz
@@ -949,7 +1032,9 @@ vector<double> Planet::getFluxes(vector<double> wavens, double cosmu, double del
     vector<double> fluxes(wavens.size(),0);
     double sinmu = sqrt(1.-cosmu*cosmu);
     
-    for(int i=0; i<wavens.size(); i++){
+    int nwaves = wavens.size();
+#pragma omp parallel for num_threads(nthreads) schedule(static)
+    for(int i=0; i<nwaves; i++){
       double wavelength = wavens[i]/1.e4;
       
       for(int j=nlayer-1; j>=0; j--){
@@ -997,7 +1082,9 @@ vector<double> Planet::getFluxes(vector<double> wavens, double cosmu, double del
     vector<double> fluxes(wavenslo.size(),0);
     double sinmu = sqrt(1.-cosmu*cosmu);
     
-    for(int i=0; i<wavenslo.size(); i++){
+    int nwaves = wavenslo.size();
+#pragma omp parallel for num_threads(nthreads) schedule(static)
+    for(int i=0; i<nwaves; i++){
       double wavelength = wavenslo[i]/1.e4;
       
       for(int j=nlayer-1; j>=0; j--){
@@ -1049,7 +1136,9 @@ vector<double> Planet::transFlux(double rs, vector<double> wavens, string table)
   if(table=="hires"){
     vector<double> fluxes(wavens.size(),0);
     
-    for(int i=0; i<wavens.size(); i++){
+    int nwaves = wavens.size();
+#pragma omp parallel for num_threads(nthreads) schedule(static)
+    for(int i=0; i<nwaves; i++){
       double dflux = pi*rp*rp;
       
       for(int j=nlayer-1; j>=0; j--){
@@ -1078,7 +1167,9 @@ vector<double> Planet::transFlux(double rs, vector<double> wavens, string table)
   if(table=="lores"){
     vector<double> fluxes(wavenslo.size(),0);
     
-    for(int i=0; i<wavenslo.size(); i++){
+    int nwaves = wavenslo.size();
+#pragma omp parallel for num_threads(nthreads) schedule(static)
+    for(int i=0; i<nwaves; i++){
       double dflux = pi*rp*rp;
       
       for(int j=nlayer-1; j>=0; j--){
@@ -1209,11 +1300,12 @@ void Planet::getTauProf(vector<double> wavens, string table)
     gastauprof = vector<vector<double> >(wavens.size(),vector<double>(nlayer,0));
     gastaulayer = vector<vector<double> >(wavens.size(),vector<double>(nlayer,0));
     
-    double forwardfrac = 0.;
-    double backwardfrac = 0.;
-    
-    for(int i=0; i<wavens.size(); i++){
+    int nwaves = wavens.size();
+#pragma omp parallel for num_threads(nthreads) schedule(static)
+    for(int i=0; i<nwaves; i++){
       double wavel = wavens[i];
+      double forwardfrac = 0.;
+      double backwardfrac = 0.;
       
       for(int j=0; j<nlayer; j++){
 	double dl = (hprof[j]-hprof[j+1]);
@@ -1244,7 +1336,7 @@ void Planet::getTauProf(vector<double> wavens, string table)
 	double scatterxsec = 0.;
 	double hazexsec = 0.;
 	
-	doMie = false;
+	bool doMie = false; // per layer, as the wavelengths may run on separate threads
 	
 	if((hazetype!=0 && cloudmod>1) || cloudmod==4){
 	  if(cloudmod!=4){
@@ -1374,11 +1466,12 @@ void Planet::getTauProf(vector<double> wavens, string table)
     gastauproflo = vector<vector<double> >(wavens.size(),vector<double>(nlayer,0));
     gastaulayerlo = vector<vector<double> >(wavens.size(),vector<double>(nlayer,0));
     
-    double forwardfrac = 0.;
-    double backwardfrac = 0.;
-    
-    for(int i=0; i<wavenslo.size(); i++){
+    int nwaves = wavenslo.size();
+#pragma omp parallel for num_threads(nthreads) schedule(static)
+    for(int i=0; i<nwaves; i++){
       double wavel = wavenslo[i];
+      double forwardfrac = 0.;
+      double backwardfrac = 0.;
       
       for(int j=0; j<nlayer; j++){
 	double dl = (hprof[j]-hprof[j+1]);
@@ -1409,7 +1502,7 @@ void Planet::getTauProf(vector<double> wavens, string table)
 	double scatterxsec = 0.;
 	double hazexsec = 0.;
 
-	doMie = false;
+	bool doMie = false;
 	
 	if((hazetype!=0 && cloudmod>1) || cloudmod==4){
 	  if(cloudmod!=4){
@@ -1725,7 +1818,6 @@ void Planet::getOpacProf(vector<double> rxsecs, vector<double> wavelist, vector<
   double ltmax = log10(tmax);
   double lpmin = log10(pmin);
   double lpmax = log10(pmax);
-  double wval = 0.;
 
   int wstart = 0;
 
@@ -1739,10 +1831,6 @@ void Planet::getOpacProf(vector<double> rxsecs, vector<double> wavelist, vector<
   }
   if(table=="lores") opacproflo = vector<vector<double> >(wavenslo.size(),vector<double>(nlayer,0));
   
-  // interpolation variables
-  double opr1, opr2, opac;
-  vector<double> xsec(4,0);
-
   // Compute the indexes for interpolation
   vector<double> logtemp(ntemp,0);
   for(int n=0; n<ntemp; n++){
@@ -1752,88 +1840,101 @@ void Planet::getOpacProf(vector<double> rxsecs, vector<double> wavelist, vector<
   for(int n=0; n<npress; n++){
     logpr[n] = n*0.5;
   }
-  
-  // loop over wavelengths
-  for(int m=0; m<wavelist.size(); m++){
-    int jw = m;
-    if(table=="hires"){
-      wval = log(wavelist[m]/wmin)*res/degrade + 0.000001;
-      jw = (int)wval;
+
+  // The table wavelengths are stride-1 (see tableIndex), so the layers are the outer loop
+  // and the P-T interpolation indexes are found once per layer rather than per wavelength.
+  int nw = nwavelo;
+  opacreal* opactable = lotable;
+  if(table=="hires"){
+    nw = nrows;
+    opactable = mastertable;
+  }
+
+  // loop over T-P profile; each layer fills its own column, so the layers can run on separate threads
+#pragma omp parallel for num_threads(nthreads) schedule(static)
+  for(int j=0; j<nlayer; j++){
+    // interpolation variables
+    double opr1, opr2, opac;
+
+    double tl = log10(0.5*(tprof[j]+tprof[j+1]));
+    double deltat = (tl-ltmin)/(ltmax-ltmin)*(ntemp-1.);
+    int jt = (int)deltat;
+    double dti = (tl-logtemp[jt])/(logtemp[jt+1]-logtemp[jt]);
+    //printf("tl %e jt %d dti %e, ", tl, jt, dti);
+
+    if(jt<0){
+      jt=0.;
+      dti=0.;
+    }
+    if(jt>ntemp-2){
+      jt=ntemp-2;
+      dti=0.999999;
+    }
+    double pl = 0.5*(log10(prprof[j]*prprof[j+1]));
+    double deltap = (pl-lpmin)/(lpmax-lpmin)*(npress-1.);
+    int jp = (int)deltap;
+    double dpi = (pl-logpr[jp])/(logpr[jp+1]-logpr[jp]);
+    //printf("pl %e jp %d dpi %e, ", pl, jp, dpi);
+
+    if(jp<0){
+      jp=0.;
+      dpi=0.;
+    }
+    if(jp>npress-2){
+      jp=npress-2;
+      dpi=0.999999;
     }
-    
-    // loop over T-P profile
-    for(int j=0; j<nlayer; j++){
-      double tl = log10(0.5*(tprof[j]+tprof[j+1]));
-      double deltat = (tl-ltmin)/(ltmax-ltmin)*(ntemp-1.);
-      int jt = (int)deltat;
-      double dti = (tl-logtemp[jt])/(logtemp[jt+1]-logtemp[jt]);
-      //printf("tl %e jt %d dti %e, ", tl, jt, dti);
-      
-      if(jt<0){
-	jt=0.;
-	dti=0.;
-      }
-      if(jt>ntemp-2){
-	jt=ntemp-2;
-	dti=0.999999;
-      }
-      double pl = 0.5*(log10(prprof[j]*prprof[j+1]));
-      double deltap = (pl-lpmin)/(lpmax-lpmin)*(npress-1.);
-      int jp = (int)deltap;
-      double dpi = (pl-logpr[jp])/(logpr[jp+1]-logpr[jp]);
-      //printf("pl %e jp %d dpi %e, ", pl, jp, dpi);
-      
-      if(jp<0){
-	jp=0.;
-	dpi=0.;
-      }
-      if(jp>npress-2){
-	jp=npress-2;
-	dpi=0.999999;
-      }
 
-      xsec[0] = 0.;
-      xsec[1] = 0.;
-      xsec[2] = 0.;
-      xsec[3] = 0.;
+    // ada: to get species-by-species outputs of the absorption opacities, put the interpolations within the loop over species, and fill a 3-D array that gets pulled to the Python side. I believe with specscatable, you don't need the summed scatable any more!
 
-      // ada: to get species-by-species outputs of the absorption opacities, put the interpolations within the loop over species, and fill a 3-D array that gets pulled to the Python side. I believe with specscatable, you don't need the summed scatable any more!
-      
-      if(table=="hires"){
-	for(int iii=0; iii<nmol; iii++){
-	  //xsec[0] = mastertable[jp][jt][jw][iii]*abund[iii][j];
-	  //xsec[1] = mastertable[jp][jt+1][jw][iii]*abund[iii][j];
-	  //xsec[2] = mastertable[jp+1][jt][jw][iii]*abund[iii][j];
-	  //xsec[3] = mastertable[jp+1][jt+1][jw][iii]*abund[iii][j];
-	  xsec[0] = mastertable[jp][jt][jw][iii]*abund[iii];
-	  xsec[1] = mastertable[jp][jt+1][jw][iii]*abund[iii];
-	  xsec[2] = mastertable[jp+1][jt][jw][iii]*abund[iii];
-	  xsec[3] = mastertable[jp+1][jt+1][jw][iii]*abund[iii];
+    if(table=="hires"){
+      for(int iii=0; iii<nmol; iii++){
+	// The four (P, T) corners of this layer for one species, each a contiguous row of wavelengths.
+	const opacreal* x00 = opactable + tableIndex(iii,jp,jt,0,nw);
+	const opacreal* x01 = opactable + tableIndex(iii,jp,jt+1,0,nw);
+	const opacreal* x10 = opactable + tableIndex(iii,jp+1,jt,0,nw);
+	const opacreal* x11 = opactable + tableIndex(iii,jp+1,jt+1,0,nw);
+
+	// loop over wavelengths
+	for(int m=0; m<wavelist.size(); m++){
+	  // Row of the band-limited hires table holding this wavelength (see the constructor).
+	  int jw = tablerow[m];
+	  double xsec0 = x00[jw]*abund[iii];
+	  double xsec1 = x01[jw]*abund[iii];
+	  double xsec2 = x10[jw]*abund[iii];
+	  double xsec3 = x11[jw]*abund[iii];
 
 	  // interpolate opacity
-	  opr1 = xsec[0] + dpi*(xsec[2]-xsec[0]);
-	  opr2 = xsec[1] + dpi*(xsec[3]-xsec[1]);
+	  opr1 = xsec0 + dpi*(xsec2-xsec0);
+	  opr2 = xsec1 + dpi*(xsec3-xsec1);
 	  opac = opr1 + dti*(opr2-opr1);
-	  
+
 	  specopacprof[iii][m][j] = opac + specscatable[iii][m][j];
 	  opacprof[m][j] += specopacprof[iii][m][j];
 	}
       }
-      if(table=="lores"){
-	for(int iii=0; iii<nmol; iii++){
-	  //xsec[0] += lotable[jp][jt][jw][iii]*abund[iii][j];
-	  //xsec[1] += lotable[jp][jt+1][jw][iii]*abund[iii][j];
-	  //xsec[2] += lotable[jp+1][jt][jw][iii]*abund[iii][j];
-	  //xsec[3] += lotable[jp+1][jt+1][jw][iii]*abund[iii][j];
-	  xsec[0] += lotable[jp][jt][jw][iii]*abund[iii];
-	  xsec[1] += lotable[jp][jt+1][jw][iii]*abund[iii];
-	  xsec[2] += lotable[jp+1][jt][jw][iii]*abund[iii];
-	  xsec[3] += lotable[jp+1][jt+1][jw][iii]*abund[iii];
+    }
+    if(table=="lores"){
+      // The species are summed in the same order as before, one wavelength row at a time.
+      vector<double> xsec0(wavelist.size(),0), xsec1(wavelist.size(),0);
+      vector<double> xsec2(wavelist.size(),0), xsec3(wavelist.size(),0);
+      for(int iii=0; iii<nmol; iii++){
+	const opacreal* x00 = opactable + tableIndex(iii,jp,jt,0,nw);
+	const opacreal* x01 = opactable + tableIndex(iii,jp,jt+1,0,nw);
+	const opacreal* x10 = opactable + tableIndex(iii,jp+1,jt,0,nw);
+	const opacreal* x11 = opactable + tableIndex(iii,jp+1,jt+1,0,nw);
+	for(int m=0; m<wavelist.size(); m++){
+	  xsec0[m] += x00[m]*abund[iii];
+	  xsec1[m] += x01[m]*abund[iii];
+	  xsec2[m] += x10[m]*abund[iii];
+	  xsec3[m] += x11[m]*abund[iii];
 	}
+      }
 
+      for(int m=0; m<wavelist.size(); m++){
 	// interpolate opacity
-	opr1 = xsec[0] + dpi*(xsec[2]-xsec[0]);
-	opr2 = xsec[1] + dpi*(xsec[3]-xsec[1]);
+	opr1 = xsec0[m] + dpi*(xsec2[m]-xsec0[m]);
+	opr2 = xsec1[m] + dpi*(xsec3[m]-xsec1[m]);
 	opac = opr1 + dti*(opr2-opr1);
 
 	opacproflo[m][j] = opac + scatablelo[m][j];
@@ -1955,3 +2056,72 @@ double Planet::HminFreeFree(double t, double waven){
   return sff_hm;		   
 }
 // end HminFreeFree
+
+// Name of the degraded-table cache entry for a species, or "" if caching is off.
+// The key covers the catalog, species, degrade factor, stored rows (the wavelength window),
+// table element type (a float32 build rounds the averages differently) and the size and
+// modification time of the source table, so a changed source, model grid or build never
+// matches an old entry.
+string Planet::degradedCacheFile(string species, string sourcefile)
+{
+  long long size, mtime;
+  if(cachedir=="" || !getFileStamp(sourcefile, size, mtime)) return "";
+
+  char keyhex[17];
+  snprintf(keyhex, sizeof(keyhex), "%016llx", fnv1a64(degradedCacheKey(species, size, mtime)));
+  return cachedir + "/" + species + "." + hires + "." + keyhex + ".npy";
+}
+
+string Planet::degradedCacheKey(string species, long long size, long long mtime)
+{
+  // Stored rows as inclusive runs, e.g. "100-399,500-619"
+  string rows = "";
+  int x = 0;
+  while(x<ntable){
+    if(rowindex[x]<0){
+      x++;
+      continue;
+    }
+    int start = x;
+    while(x+1<ntable && rowindex[x+1]>=0) x++;
+    if(rows!="") rows += ",";
+    rows += to_string(start) + "-" + to_string(x);
+    x++;
+  }
+  return species + "." + hires + "|degrade=" + to_string(degrade) + "|nwave=" + to_string(nwave) + "|dtype=" + (sizeof(opacreal)==4 ? "float32" : "float64") + "|rows=" + rows + "|size=" + to_string(size) + "|mtime=" + to_string(mtime);
+}
+
+bool Planet::readDegradedCache(string cachefile, int ispec)
+{
+  OpacityFile entry;
+  size_t nvalues = (size_t)npress*ntemp*nrows;
+  if(!entry.openNpy(cachefile) || entry.size() != nvalues) return false;
+  // A cache entry is laid out like one species plane of mastertable.
+  opacreal* plane = mastertable + tableIndex(ispec,0,0,0,nrows);
+  for(size_t n=0; n<nvalues; n++){
+    plane[n] = entry.next();
+  }
+  return true;
+}
+
+void Planet::writeDegradedCache(string cachefile, int ispec, string species, string sourcefile)
+{
+  const opacreal* plane = mastertable + tableIndex(ispec,0,0,0,nrows);
+  vector<double> values(plane, plane + (size_t)npress*ntemp*nrows);
+  vector<size_t> shape(3);
+  shape[0] = npress;
+  shape[1] = ntemp;
+  shape[2] = nrows;
+
+  // The metadata sidecar lets the eviction tool find stale entries.
+  long long size = 0, mtime = 0;
+  getFileStamp(sourcefile, size, mtime);
+  string metafile = cachefile.substr(0, cachefile.size()-4) + ".json";
+  ofstream metaout(metafile.c_str());
+  char* sourcepath = realpath(sourcefile.c_str(), NULL);
+  metaout << "{\"key\": \"" << degradedCacheKey(species, size, mtime) << "\", \"source\": \"" << (sourcepath != NULL ? sourcepath : sourcefile.c_str()) << "\"}" << std::endl;
+  free(sourcepath);
+  metaout.close();
+
+  if(!writeNpy(cachefile, values, shape)) printf("Could not write %s\n",cachefile.c_str());
+}
@@ -3,6 +3,7 @@
 
 #include "specincld.h"
 #include "Atmosphere.h"
+#include "OpacityStore.h"
 
 class Planet
 {
@@ -27,7 +28,7 @@ class Planet
   vector<vector<vector<double > > > specscatablelo;
 
  public:
-  Planet(vector<int> switches, vector<double> waves, vector<double> waveslo, vector<int> mollist, string opacname, string hir, string lor);
+  Planet(vector<int> switches, vector<double> waves, vector<double> waveslo, vector<int> mollist, string opacname, string hir, string lor, bool readtables=true);
 
   int nlayer;
   int nlevel;
@@ -36,13 +37,16 @@ class Planet
   int nwave;
   int nwavelo;
   int nspec;
+  int ntablespec; // species planes in the cross-section tables (1 for the gray atmosphere)
   int mode;
   int hazetype;
   int streams;
   int ntable;
+  int nrows;     // number of degraded table rows stored in mastertable
   int degrade;
   int cloudmod;
   int tprofmode;
+  int nthreads;  // OpenMP threads for the wavelength loops (1 without OpenMP)
   double rp;     // planet radius
   double rs;
   double rxsec;
@@ -67,6 +71,8 @@ class Planet
   double lmaxlo;
   double reslo;
   vector<double> haze;
+  vector<double> gaussPoints;   // cosines of the quadrature angles of the streams
+  vector<double> gaussWeights;  // and their weights, summing to 1/2
   vector<double> tpprof;
   vector<double> hprof;
   vector<vector<double > > opacprof;
@@ -94,10 +100,24 @@ class Planet
   vector<vector<double > > gasw0lo;
   vector<vector<double > > asymlo;
   vector<vector<double > > gasasymlo;
+  // Inputs of the last setWave, kept for setWaveLores; loresready is set once the lores
+  // profiles match them.
+  vector<double> rxsecslo;
+  vector<double> abundlo;
+  bool loresready;
   vector<vector<vector<double> > > opacities;
-  vector<vector<vector<vector<double> > > > mastertable;
-  vector<vector<vector<vector<double> > > > lotable;
+  // The cross-section tables are flat and contiguous, indexed [species][pressure][temperature][wavelength]
+  // (see tableIndex), so one species plane matches a degraded cache entry or a Python
+  // (species, P, T, wavelength) array, and the wavelengths at one (P, T) point are stride-1.
+  // They point at the owned storage below, or at an external buffer given to attachTable.
+  opacreal* mastertable;
+  opacreal* lotable;
+  vector<opacreal> masterstorage;
+  vector<opacreal> lostorage;
+  vector<int> rowindex;  // mastertable row for each degraded table row, -1 if outside the model bands
+  vector<int> tablerow;  // mastertable row for each model wavelength
   string opacdir;
+  string cachedir;       // degraded-table cache directory, "" if disabled
   bool doMie;
   string hires;
   string lores;
@@ -105,12 +125,22 @@ class Planet
   Atmosphere* atmoslores;
   
   void setParams(vector<double> plparams, vector<double> abund, vector<double>rxsecs, vector<double> tpprofile);
+  void setQuadrature(vector<double> points, vector<double> weights);
+  int setThreads(int n);
+  size_t tableSize(string table);
+  void attachTable(string table, opacreal* buffer);
+  // nw is the number of table wavelengths: nrows for hires, nwavelo for lores.
+  inline size_t tableIndex(int ispec, int jp, int jt, int jw, int nw) const
+  {
+    return (((size_t)ispec*npress + jp)*ntemp + jt)*nw + jw;
+  }
   //void setParams(vector<double> plparams, vector<vector<double> > abund, vector<double>rxsecs, vector<double> tpprofile);
   double getTeff();
   vector<double> getSpectrum();
   vector<double> getClearSpectrum();
   void readopac(vector<int> mollist, vector<double> wavens, string table, string opacdir);
   void setWave(int npoints, vector<double> rxsec, vector<double> wavelist, vector<double> abund);
+  void setWaveLores();
   //void setWave(int npoints, vector<double> rxsec, vector<double> wavelist, vector<vector<double> > abund);
   vector<vector<double> > getContribution();
   vector<vector<double> > getCloudContribution();
@@ -130,6 +160,10 @@ class Planet
   void getOpacProf(vector<double> rxsecs, vector<double> wavelist, vector<double> abund, string table);
   void getOpacProf(vector<double> rxsecs, vector<double> wavelist, vector<vector<double> > abund, string table);
   void getSca(vector<double> rxsecs, vector<double> wavelist, string table);
+  string degradedCacheFile(string species, string sourcefile);
+  string degradedCacheKey(string species, long long size, long long mtime);
+  bool readDegradedCache(string cachefile, int ispec);
+  void writeDegradedCache(string cachefile, int ispec, string species, string sourcefile);
   double HminBoundFree(double t, double waven);
   double HminFreeFree(double t, double waven);
 };
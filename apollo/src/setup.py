@@ -7,10 +7,28 @@ import os
 os.environ['CC'] = 'gcc'
 os.environ['CXX'] = 'g++'
 
+# Build with APOLLO_FLOAT32_TABLES=1 to hold the cross-section tables in float32,
+# which halves their memory (see apollo/opacities/table_precision.py).
+define_macros = []
+if os.environ.get('APOLLO_FLOAT32_TABLES', '0') != '0':
+    define_macros.append(('APOLLO_FLOAT32_TABLES', None))
+
+# Build with APOLLO_OPENMP=1 to run the wavelength loops of the forward model on
+# several threads, set with "Threads" in the input file or APOLLO_NUM_THREADS.
+# The spectra are the same, bit for bit, for any number of threads.
+extra_compile_args = ['-Wno-unknown-pragmas']
+extra_link_args = []
+if os.environ.get('APOLLO_OPENMP', '0') != '0':
+    extra_compile_args.append('-fopenmp')
+    extra_link_args.append('-fopenmp')
+
 ext_modules=[
     Extension("wrapPlanet",
     sources=["wrapPlanet.pyx"],
-    language="c++"
+    language="c++",
+    define_macros=define_macros,
+    extra_compile_args=extra_compile_args,
+    extra_link_args=extra_link_args
     )]
 
 setup(
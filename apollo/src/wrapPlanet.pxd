@@ -1,11 +1,30 @@
+from libcpp cimport bool
 from libcpp.vector cimport vector
 from libcpp.string cimport string
 
-cdef extern from "Planet.h":
+cdef extern from "OpacityStore.h":
+    # double, or float when built with APOLLO_FLOAT32_TABLES; only used through pointers.
+    ctypedef double opacreal
+
+# Every Planet method only touches its own object (and reads the tables), so they can
+# run without the GIL, concurrently on separate planets.
+cdef extern from "Planet.h" nogil:
     cdef cppclass Planet:
         Planet(vector[int] switches, vector[double] wavens, vector[double] wavenslo, vector[int] mollist, string opacname, string hir, string lor) except +
+        Planet(vector[int] switches, vector[double] wavens, vector[double] wavenslo, vector[int] mollist, string opacname, string hir, string lor, bool readtables) except +
+        int ntablespec
+        int npress
+        int ntemp
+        int nrows
+        int nwavelo
+        opacreal* mastertable
+        opacreal* lotable
+        size_t tableSize(string table)
+        void attachTable(string table, opacreal* buffer)
         void setParams(vector[double] plparams, vector[double] abund, vector[double] rxsecs, vector[double] tpprofile)
         #void setParams(vector[double] plparams, vector[vector[double]] abund, vector[double] rxsecs, vector[double] tpprofile)
+        void setQuadrature(vector[double] points, vector[double] weights)
+        int setThreads(int n)
         double getTeff()
         vector[double] getSpectrum()
         vector[double] getClearSpectrum()
@@ -1,51 +1,241 @@
 # distutils: language = c++
-# distutils: sources = [Planet.cpp,Atmosphere.cpp,constants.cpp]
+# distutils: sources = [Planet.cpp,Atmosphere.cpp,constants.cpp,OpacityStore.cpp]
+
+from libc.string cimport memcpy
+
+import numpy as np
+
+TABLE_NAMES = ("hires", "lores")
+
 
 cdef class PyPlanet:
     cdef Planet *thisptr
+    # Arrays attached as cross-section tables, kept alive for as long as the planet is.
+    cdef dict attached_tables
 
     def __cinit__(self):
         self.thisptr = NULL
+        self.attached_tables = {}
 
     def __dealloc__(self):
         if self.thisptr is not NULL:
             del self.thisptr
 
-    def MakePlanet(self, switches, wavens, wavenslo, mollist, opacdir, hires, lores):
-        self.thisptr = new Planet(switches, wavens, wavenslo, mollist, opacdir, hires, lores)
-
+    def MakePlanet(self, switches, wavens, wavenslo, mollist, opacdir, hires, lores, read_tables=True):
+        # With read_tables=False, the tables must be given with attach_table before use.
+        self.thisptr = new Planet(switches, wavens, wavenslo, mollist, opacdir, hires, lores, read_tables)
+
+    @property
+    def table_dtype(self):
+        return np.dtype(np.float32 if sizeof(opacreal) == 4 else np.float64)
+
+    def get_table_shape(self, table="hires"):
+        # (species, pressure, temperature, wavelength); hires has only the degraded rows
+        # in the model bands.
+        check_table_name(table)
+        number_of_wavelengths = self.thisptr.nrows if table == "hires" else self.thisptr.nwavelo
+        return (self.thisptr.ntablespec, self.thisptr.npress, self.thisptr.ntemp, number_of_wavelengths)
+
+    def get_table(self, table="hires"):
+        """
+        A NumPy view of a cross-section table, without a copy. Writing to it changes the
+        table; it is valid for as long as the planet is.
+        """
+        check_table_name(table)
+        cdef opacreal* buffer = self.thisptr.mastertable if table == "hires" else self.thisptr.lotable
+        if buffer == NULL:
+            raise ValueError(f"The {table} table has not been read in or attached.")
+
+        cdef size_t number_of_bytes = self.thisptr.tableSize(table.encode("utf-8")) * sizeof(opacreal)
+        cdef unsigned char[::1] table_bytes = <unsigned char[:number_of_bytes]> <unsigned char*> buffer
+
+        return np.asarray(table_bytes).view(self.table_dtype).reshape(self.get_table_shape(table))
+
+    def attach_table(self, table, array):
+        """
+        Points a cross-section table at the memory of a C-contiguous array (e.g. from
+        np.load with mmap_mode, or a SharedArray), without a copy. Read-only arrays are
+        accepted: the C++ core never writes to a table after reading it in.
+        """
+        check_table_name(table)
+        if array.shape != self.get_table_shape(table) or array.dtype != self.table_dtype:
+            raise ValueError(
+                f"The {table} table needs a {self.table_dtype} array of shape "
+                + f"{self.get_table_shape(table)}, not {array.dtype} {array.shape}."
+            )
+        if not array.flags.c_contiguous:
+            raise ValueError(f"The {table} table needs a C-contiguous array.")
+
+        cdef const unsigned char[::1] table_bytes = array.reshape(-1).view(np.uint8)
+        self.thisptr.attachTable(table.encode("utf-8"), <opacreal*> &table_bytes[0])
+        self.attached_tables[table] = array
+
+    def share_tables(self, PyPlanet source):
+        """
+        Points both cross-section tables at those of another planet made with the same
+        wavelengths, species and catalogs (this one is best made with read_tables=False).
+        The tables are only read during a model, so planets sharing them can run in
+        separate threads, with one copy of the tables between them.
+        """
+        for table in TABLE_NAMES:
+            self.attach_table(table, source.get_table(table))
+            # The views do not hold on to the source planet, so keep it alive here.
+            self.attached_tables[table] = (source, self.attached_tables[table])
+
+    # The model calls convert their arguments and results while holding the GIL, and
+    # release it for the computation, so threads can run models on separate planets.
+    # Arguments may be any float64 array-likes, and are copied into the C++ vectors in
+    # one block. Spectra come back as NumPy arrays over the C++ result, without a copy;
+    # with out=, they (and the contributions) are written into the caller's array.
     def get_Teff(self):
-        return self.thisptr.getTeff()
+        cdef double teff
+        with nogil:
+            teff = self.thisptr.getTeff()
+        return teff
 
     def set_Params(self, plparams, abund, rxsecs, tpprofile):
-        return self.thisptr.setParams(plparams, abund, rxsecs, tpprofile)
-
-    def get_Spectrum(self):
-        return self.thisptr.getSpectrum()
-
-    def get_ClearSpectrum(self):
-        return self.thisptr.getClearSpectrum()
+        cdef vector[double] c_plparams = as_vector(plparams)
+        cdef vector[double] c_abund = as_vector(abund)
+        cdef vector[double] c_rxsecs = as_vector(rxsecs)
+        cdef vector[double] c_tpprofile = as_vector(tpprofile)
+        with nogil:
+            self.thisptr.setParams(c_plparams, c_abund, c_rxsecs, c_tpprofile)
+
+    def set_Quadrature(self, points, weights):
+        return self.thisptr.setQuadrature(as_vector(points), as_vector(weights))
+
+    # Returns the number of threads in effect, which is 1 unless built with APOLLO_OPENMP.
+    def set_Threads(self, number_of_threads):
+        return self.thisptr.setThreads(number_of_threads)
+
+    def get_Spectrum(self, out=None):
+        cdef vector[double] spectrum
+        with nogil:
+            spectrum = self.thisptr.getSpectrum()
+        return vector_to_array(spectrum, out)
+
+    def get_ClearSpectrum(self, out=None):
+        cdef vector[double] spectrum
+        with nogil:
+            spectrum = self.thisptr.getClearSpectrum()
+        return vector_to_array(spectrum, out)
 
     def readopac(self, mollist, wavens, table, opacdir):
-        return self.thisptr.readopac(mollist, wavens, table, opacdir)
+        return self.thisptr.readopac(mollist, as_vector(wavens), table, opacdir)
 
     def setWave(self, npoints, rxsecs, wavens, abund):
-        return self.thisptr.setWave(npoints, rxsecs, wavens, abund)
-
-    def getContribution(self):
-        return self.thisptr.getContribution()
-
-    def getCloudContribution(self):
-        return self.thisptr.getCloudContribution()
-
-    def getGasContribution(self):
-        return self.thisptr.getGasContribution()
-
-    def getSpeciesContribution(self):
-        return self.thisptr.getSpeciesContribution()
-
-    def getFlux(self, wavens, table, taulayer, w0, asym):
-        return self.thisptr.getFlux(wavens, table, taulayer, w0, asym)
-
-    def transFlux(self, rs, wavens, table):
-        return self.thisptr.transFlux(rs, wavens, table)
\ No newline at end of file
+        return self.thisptr.setWave(npoints, as_vector(rxsecs), as_vector(wavens), as_vector(abund))
+
+    # The contributions are (wavelength, layer), and (species, wavelength, layer) by species.
+    def getContribution(self, out=None):
+        return nested_vector_to_array(self.thisptr.getContribution(), out)
+
+    def getCloudContribution(self, out=None):
+        return nested_vector_to_array(self.thisptr.getCloudContribution(), out)
+
+    def getGasContribution(self, out=None):
+        return nested_vector_to_array(self.thisptr.getGasContribution(), out)
+
+    def getSpeciesContribution(self, out=None):
+        cdef vector[vector[vector[double]]] contribution = self.thisptr.getSpeciesContribution()
+        cdef size_t number_of_species = contribution.size()
+        if number_of_species == 0:
+            return np.empty((0, 0, 0)) if out is None else out
+
+        if out is None:
+            out = np.empty((number_of_species, contribution[0].size(), contribution[0][0].size()))
+        check_output_shape(out, (number_of_species, contribution[0].size(), contribution[0][0].size()))
+        for species_index in range(number_of_species):
+            nested_vector_to_array(contribution[species_index], out[species_index])
+        return out
+
+    def getFlux(self, wavens, table, taulayer, w0, asym, out=None):
+        cdef vector[double] flux = self.thisptr.getFlux(
+            as_vector(wavens), table, as_nested_vector(taulayer), as_nested_vector(w0), as_nested_vector(asym)
+        )
+        return vector_to_array(flux, out)
+
+    def transFlux(self, rs, wavens, table, out=None):
+        cdef vector[double] flux = self.thisptr.transFlux(rs, as_vector(wavens), table)
+        return vector_to_array(flux, out)
+
+cdef class DoubleVector:
+    # Owns a vector<double> taken from a C++ result, and lends its memory to NumPy.
+    cdef vector[double] values
+    cdef Py_ssize_t shape[1]
+    cdef Py_ssize_t strides[1]
+
+    def __getbuffer__(self, Py_buffer* buffer, int flags):
+        self.shape[0] = self.values.size()
+        self.strides[0] = sizeof(double)
+        buffer.buf = self.values.data()
+        buffer.format = "d"
+        buffer.internal = NULL
+        buffer.itemsize = sizeof(double)
+        buffer.len = self.values.size() * sizeof(double)
+        buffer.ndim = 1
+        buffer.obj = self
+        buffer.readonly = 0
+        buffer.shape = self.shape
+        buffer.strides = self.strides
+        buffer.suboffsets = NULL
+
+    def __releasebuffer__(self, Py_buffer* buffer):
+        pass
+
+
+cdef vector[double] as_vector(values) except *:
+    cdef const double[::1] array = np.ascontiguousarray(values, dtype=np.float64).reshape(-1)
+    cdef vector[double] result
+    if array.shape[0] > 0:
+        result.assign(&array[0], &array[0] + array.shape[0])
+    return result
+
+
+cdef vector[vector[double]] as_nested_vector(values) except *:
+    cdef const double[:, ::1] array = np.ascontiguousarray(values, dtype=np.float64)
+    cdef vector[vector[double]] result = vector[vector[double]](array.shape[0])
+    for row in range(array.shape[0]):
+        if array.shape[1] > 0:
+            result[row].assign(&array[row, 0], &array[row, 0] + array.shape[1])
+    return result
+
+
+cdef object vector_to_array(vector[double]& values, out):
+    cdef DoubleVector holder
+    cdef double[::1] out_view
+    if out is None:
+        holder = DoubleVector.__new__(DoubleVector)
+        holder.values.swap(values)
+        return np.asarray(holder)
+
+    check_output_shape(out, (values.size(),))
+    out_view = out
+    if values.size() > 0:
+        memcpy(&out_view[0], values.data(), values.size() * sizeof(double))
+    return out
+
+
+cdef object nested_vector_to_array(const vector[vector[double]]& values, out):
+    cdef size_t number_of_columns = values[0].size() if values.size() > 0 else 0
+    if out is None:
+        out = np.empty((values.size(), number_of_columns))
+    check_output_shape(out, (values.size(), number_of_columns))
+
+    cdef double[:, ::1] out_view = out
+    for row in range(values.size()):
+        if number_of_columns > 0:
+            memcpy(&out_view[row, 0], values[row].data(), number_of_columns * sizeof(double))
+    return out
+
+
+def check_output_shape(out, shape):
+    if out.shape != shape or out.dtype != np.float64 or not out.flags.c_contiguous:
+        raise ValueError(
+            f"out= needs a C-contiguous float64 array of shape {shape}, "
+            + f"not {out.dtype} {out.shape}."
+        )
+
+def check_table_name(table):
+    if table not in TABLE_NAMES:
+        raise ValueError(f'Unknown table "{table}"; use one of {", ".join(TABLE_NAMES)}.')
@@ -0,0 +1,15 @@
+import math
+
+import numpy as np
+
+
+def write_text_table(filepath, table, header_line, fmt="%.18e"):
+    # An APOLLO text opacity table: the header, then one row per (P, T) point.
+    with open(filepath, "w") as file:
+        file.write(header_line + "\n")
+        np.savetxt(file, table.reshape(-1, table.shape[-1]), fmt=fmt)
+
+
+def reference_blackbody(T, wave):
+    h, c, k = 6.62607004e-27, 2.99792458e10, 1.38064852e-16
+    return (2 * h * c * c / math.pow(wave, 5)) / (math.exp(h * c / wave / k / T) - 1)
@@ -0,0 +1,175 @@
+import math
+
+import numpy as np
+import pytest
+
+from apollo.radiative_transfer.RT_Toon1989 import (
+    STREAM_COSINE_ANGLES,
+    STREAM_WEIGHTS,
+    PlanckCache,
+    RT_Toon1989,
+    TridiagonalSolver,
+)
+
+from conftest import reference_blackbody
+
+NUMBER_OF_WAVELENGTHS = 7
+NUMBER_OF_LAYERS = 6
+
+
+def reference_flux(wavelengths, tprof, taulayer, w0, asym):
+    # A direct transcription of the hires branch of Planet::getFlux, with tbfrac = 1.
+    pi, ubari, nlayer = math.pi, 0.5, len(tprof) - 1
+    totalflux = np.zeros(len(wavelengths))
+    for i, wavelength in enumerate(wavelengths):
+        alpha, lamda, gama = np.zeros(nlayer), np.zeros(nlayer), np.zeros(nlayer)
+        b0, bdiff = np.zeros(nlayer), np.zeros(nlayer)
+        cp, cm, cpm1, cmm1 = (np.zeros(nlayer) for _ in range(4))
+        e1, e2, e3, e4 = (np.zeros(nlayer) for _ in range(4))
+        for j in range(nlayer):
+            alpha[j] = math.sqrt((1 - w0[i][j]) / (1 - w0[i][j] * asym[i][j]))
+            lamda[j] = alpha[j] * (1 - w0[i][j] * asym[i][j]) / ubari
+            gama[j] = (1 - alpha[j]) / (1 + alpha[j])
+            term = 0.5 / (1 - w0[i][j] * asym[i][j])
+            b0[j] = reference_blackbody(tprof[j], wavelength)
+            b1 = reference_blackbody(tprof[j + 1], wavelength)
+            bdiff[j] = (b1 - b0[j]) / taulayer[i][j]
+            if taulayer[i][j] < 1e-6:
+                b0[j] = 0.5 * (b0[j] + b1)
+                bdiff[j] = 0
+            cp[j] = b0[j] + bdiff[j] * taulayer[i][j] + bdiff[j] * term
+            cm[j] = b0[j] + bdiff[j] * taulayer[i][j] - bdiff[j] * term
+            cpm1[j] = b0[j] + bdiff[j] * term
+            cmm1[j] = b0[j] - bdiff[j] * term
+            ep = math.exp(min(lamda[j] * taulayer[i][j], 35))
+            e1[j] = ep + gama[j] / ep
+            e2[j] = ep - gama[j] / ep
+            e3[j] = gama[j] * ep + 1 / ep
+            e4[j] = gama[j] * ep - 1 / ep
+
+        btop = (1 - math.exp(-taulayer[i][0] / ubari)) * reference_blackbody(
+            tprof[0], wavelength
+        )
+        bsurf = reference_blackbody(tprof[-1], wavelength)
+        bottom = bsurf + bdiff[-1] * ubari
+
+        nl2 = 2 * nlayer
+        af, bf, cf, df = (np.zeros(nl2) for _ in range(4))
+        bf[0], cf[0], df[0] = gama[0] + 1, gama[0] - 1, btop - cmm1[0]
+        for nn, ii in enumerate(range(2, nl2 - 1, 2)):
+            af[ii] = 2 * (1 - gama[nn] * gama[nn])
+            bf[ii] = (e1[nn] - e3[nn]) * (1 + gama[nn + 1])
+            cf[ii] = (e1[nn] + e3[nn]) * (gama[nn + 1] - 1)
+            df[ii] = e3[nn] * (cpm1[nn + 1] - cp[nn]) + e1[nn] * (cm[nn] - cmm1[nn + 1])
+        for nn, ii in enumerate(range(1, nl2 - 2, 2)):
+            af[ii] = (e1[nn] + e3[nn]) * (gama[nn + 1] - 1)
+            bf[ii] = (e2[nn] + e4[nn]) * (gama[nn + 1] - 1)
+            cf[ii] = 2 * (1 - gama[nn + 1] * gama[nn + 1])
+            df[ii] = (gama[nn + 1] - 1) * (cpm1[nn + 1] - cp[nn]) + (
+                1 - gama[nn + 1]
+            ) * (cm[nn] - cmm1[nn + 1])
+        af[-1], bf[-1], df[-1] = e1[-1], e2[-1], bottom - cp[-1]
+
+        as_, ds = np.zeros(nl2), np.zeros(nl2)
+        as_[-1], ds[-1] = af[-1] / bf[-1], df[-1] / bf[-1]
+        for ii in range(2, nl2):
+            xx = 1 / (bf[nl2 - ii] - cf[nl2 - ii] * as_[nl2 - ii + 1])
+            as_[nl2 - ii] = af[nl2 - ii] * xx
+            ds[nl2 - ii] = (df[nl2 - ii] - cf[nl2 - ii] * ds[nl2 - ii + 1]) * xx
+        xki = np.zeros(nl2)
+        xki[0] = ds[0]
+        for ii in range(1, nl2):
+            xki[ii] = ds[ii] - as_[ii] * xki[ii - 1]
+        xk1, xk2 = xki[0::2] + xki[1::2], xki[0::2] - xki[1::2]
+
+        for ugauss, weight in zip(STREAM_COSINE_ANGLES, STREAM_WEIGHTS):
+            fpt = 2 * pi * (bsurf + bdiff[-1] * ugauss)
+            for j in reversed(range(nlayer)):
+                x, g, t = w0[i][j], asym[i][j], taulayer[i][j]
+                gg = hh = 0.0
+                alpha1 = 2 * pi * b0[j]
+                if x >= 0.01:
+                    gg = 2 * pi * x * xk1[j] * (1 + g * alpha[j]) / (1 + alpha[j])
+                    hh = 2 * pi * x * xk2[j] * (1 - g * alpha[j]) / (1 + alpha[j])
+                    alpha1 = 2 * pi * (b0[j] + bdiff[j] * (ubari * x * g / (1 - x * g)))
+                em1, em2 = math.exp(-lamda[j] * t), math.exp(-t / ugauss)
+                epp = math.exp(min(lamda[j] * t, 35))
+                fpt = fpt * em2
+                fpt += gg / (lamda[j] * ugauss - 1) * (epp * em2 - 1)
+                fpt += hh / (lamda[j] * ugauss + 1) * (1 - em1 * em2)
+                fpt += alpha1 * (1 - em2)
+                fpt += 2 * pi * bdiff[j] * (ugauss - (t + ugauss) * em2)
+            totalflux[i] += weight * fpt
+    return totalflux
+
+
+# The tabulated Planck function is accurate to ~1e-7.
+@pytest.mark.parametrize(
+    "planck_cache_kind, rtol", [(None, 1e-12), ("exact", 1e-12), ("tabulated", 1e-6)]
+)
+def test_batched_fluxes_match_the_single_model_calculation(planck_cache_kind, rtol):
+    rng = np.random.default_rng(13)
+    batch_shape = (3, 2)
+    layer_shape = (*batch_shape, NUMBER_OF_WAVELENGTHS, NUMBER_OF_LAYERS)
+
+    wavelengths_in_cm = np.linspace(1.0, 5.0, NUMBER_OF_WAVELENGTHS) * 1e-4
+    temperatures_in_K = np.sort(
+        rng.uniform(500, 2500, size=(*batch_shape, NUMBER_OF_LAYERS + 1)), axis=-1
+    )
+    optical_depth_per_layer = 10 ** rng.uniform(-3, 1, size=layer_shape)
+    optical_depth_per_layer[..., 0, 0] = 1e-8  # a thin, isothermal layer
+    single_scattering_albedo = rng.uniform(0, 0.9, size=layer_shape)
+    single_scattering_albedo[..., 1, :] = 0.001  # below the scattering cutoff
+    scattering_asymmetry = rng.uniform(0, 0.5, size=layer_shape)
+
+    planck_cache = (
+        None
+        if planck_cache_kind is None
+        else PlanckCache(
+            wavelengths_in_cm, tabulated=(planck_cache_kind == "tabulated")
+        )
+    )
+
+    fluxes = RT_Toon1989(
+        wavelengths_in_cm,
+        temperatures_in_K,
+        optical_depth_per_layer,
+        single_scattering_albedo,
+        scattering_asymmetry,
+        planck_cache=planck_cache,
+    )
+    assert fluxes.shape == (*batch_shape, NUMBER_OF_WAVELENGTHS)
+
+    for model_index in np.ndindex(batch_shape):
+        np.testing.assert_allclose(
+            fluxes[model_index],
+            reference_flux(
+                wavelengths_in_cm,
+                temperatures_in_K[model_index],
+                optical_depth_per_layer[model_index],
+                single_scattering_albedo[model_index],
+                scattering_asymmetry[model_index],
+            ),
+            rtol=rtol,
+        )
+
+
+def test_banded_solver_matches_the_DTRIDGL_sweeps():
+    rng = np.random.default_rng(15)
+    layer_shape = (5, NUMBER_OF_WAVELENGTHS, NUMBER_OF_LAYERS)
+    models = dict(
+        wavelengths_in_cm=np.linspace(1.0, 5.0, NUMBER_OF_WAVELENGTHS) * 1e-4,
+        temperatures_in_K=np.sort(
+            rng.uniform(500, 2500, size=(5, NUMBER_OF_LAYERS + 1)), axis=-1
+        ),
+        optical_depth_per_layer=10 ** rng.uniform(-3, 1, size=layer_shape),
+        single_scattering_albedo=rng.uniform(0, 0.9, size=layer_shape),
+        scattering_asymmetry=rng.uniform(0, 0.5, size=layer_shape),
+    )
+
+    # LAPACK pivots where the sweeps do not, and the systems are poorly conditioned.
+    np.testing.assert_allclose(
+        RT_Toon1989(**models, tridiagonal_solver=TridiagonalSolver.banded),
+        RT_Toon1989(**models, tridiagonal_solver=TridiagonalSolver.thomas),
+        rtol=1e-8,
+    )
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from apollo.radiative_transfer import RT_Toon1989 as RT_Toon1989_numpy
+from apollo.radiative_transfer.backends import (
+    NUMBA_IS_AVAILABLE,
+    RT_BACKEND_ENVIRONMENT_VARIABLE,
+    RTBackend,
+    RT_Toon1989,
+    get_RT_Toon1989,
+)
+
+NUMBER_OF_WAVELENGTHS = 50
+NUMBER_OF_LAYERS = 12
+
+
+def make_batch_of_models(batch_shape=(4,)):
+    rng = np.random.default_rng(14)
+    layer_shape = (*batch_shape, NUMBER_OF_WAVELENGTHS, NUMBER_OF_LAYERS)
+
+    single_scattering_albedo = rng.uniform(0, 0.9, size=layer_shape)
+    single_scattering_albedo[..., ::3, :] = 0.0
+
+    return dict(
+        wavelengths_in_cm=np.linspace(0.6, 5.0, NUMBER_OF_WAVELENGTHS) * 1e-4,
+        temperatures_in_K=np.sort(
+            rng.uniform(300, 3000, size=(*batch_shape, NUMBER_OF_LAYERS + 1)), axis=-1
+        ),
+        optical_depth_per_layer=10 ** rng.uniform(-7, 2, size=layer_shape),
+        single_scattering_albedo=single_scattering_albedo,
+        scattering_asymmetry=rng.uniform(0, 0.6, size=layer_shape),
+    )
+
+
+@pytest.mark.skipif(not NUMBA_IS_AVAILABLE, reason="numba is not installed")
+def test_numba_backend_matches_numpy_backend():
+    models = make_batch_of_models(batch_shape=(2, 3))
+
+    numpy_fluxes = RT_Toon1989(**models, backend=RTBackend.numpy)
+    numba_fluxes = RT_Toon1989(**models, backend=RTBackend.numba)
+
+    assert numba_fluxes.shape == numpy_fluxes.shape == (2, 3, NUMBER_OF_WAVELENGTHS)
+    # exp differs in the last bit between the two, which the solve can amplify.
+    np.testing.assert_allclose(numba_fluxes, numpy_fluxes, rtol=1e-9)
+
+    # Inputs that only broadcast to the batch shape give the same answer.
+    models["scattering_asymmetry"] = models["scattering_asymmetry"][0, 0]
+    np.testing.assert_allclose(
+        RT_Toon1989(**models, backend=RTBackend.numba),
+        RT_Toon1989(**models, backend=RTBackend.numpy),
+        rtol=1e-9,
+    )
+
+
+def test_backend_can_be_chosen_from_the_environment(monkeypatch):
+    monkeypatch.setenv(RT_BACKEND_ENVIRONMENT_VARIABLE, "numpy")
+    assert get_RT_Toon1989() is RT_Toon1989_numpy.RT_Toon1989
+
+    with pytest.raises(ValueError):
+        get_RT_Toon1989("fortran")
@@ -0,0 +1,173 @@
+import math
+
+import numpy as np
+import pytest
+
+from apollo.radiative_transfer.backends import RT_Toon1989 as RT_Toon1989_by_backend
+from apollo.radiative_transfer.contributions import (
+    ContributionOpticalDepths,
+    EmissionWithContributions,
+    calculate_contribution_functions,
+)
+from apollo.radiative_transfer.RT_Toon1989 import RT_Toon1989
+
+from conftest import reference_blackbody
+
+NUMBER_OF_MODELS = 2
+NUMBER_OF_SPECIES = 3
+NUMBER_OF_WAVELENGTHS = 7
+NUMBER_OF_LAYERS = 6
+
+
+def reference_contribution(wavelengths, tprof, taulayer, tauprof):
+    # A direct transcription of Planet::getContribution, with blayer from getFlux.
+    nlayer = len(tprof) - 1
+    contribution = np.zeros((len(wavelengths), nlayer))
+    for i, wavelength in enumerate(wavelengths):
+        for j in range(nlayer):
+            b0 = reference_blackbody(tprof[j], wavelength)
+            if taulayer[i][j] < 1e-6:
+                b0 = 0.5 * (b0 + reference_blackbody(tprof[j + 1], wavelength))
+            contribution[i][j] = taulayer[i][j] * b0 / math.exp(tauprof[i][j])
+    return contribution
+
+
+@pytest.fixture
+def atmospheres():
+    rng = np.random.default_rng(20)
+    layer_shape = (NUMBER_OF_MODELS, NUMBER_OF_WAVELENGTHS, NUMBER_OF_LAYERS)
+
+    species_optical_depth_per_layer = 10 ** rng.uniform(
+        -4, 0, size=(NUMBER_OF_MODELS, NUMBER_OF_SPECIES, *layer_shape[1:])
+    )
+    gas_optical_depth_per_layer = species_optical_depth_per_layer.sum(axis=-3)
+    cloud_optical_depth_per_layer = 10 ** rng.uniform(-7, -1, size=layer_shape)
+
+    return dict(
+        wavelengths_in_cm=np.linspace(1.0, 5.0, NUMBER_OF_WAVELENGTHS) * 1e-4,
+        temperatures_in_K=np.sort(
+            rng.uniform(500, 2500, size=(NUMBER_OF_MODELS, NUMBER_OF_LAYERS + 1)),
+            axis=-1,
+        ),
+        optical_depth_per_layer=gas_optical_depth_per_layer
+        + cloud_optical_depth_per_layer,
+        single_scattering_albedo=rng.uniform(0, 0.9, size=layer_shape),
+        scattering_asymmetry=rng.uniform(0, 0.9, size=layer_shape),
+        contribution_optical_depths=ContributionOpticalDepths(
+            gas_optical_depth_per_layer=gas_optical_depth_per_layer,
+            cloud_optical_depth_per_layer=cloud_optical_depth_per_layer,
+            optical_depth_per_layer_by_species=species_optical_depth_per_layer,
+        ),
+    )
+
+
+def test_contributions_match_getContribution(atmospheres):
+    optical_depth_per_layer = atmospheres["optical_depth_per_layer"]
+    # The optical depth to the top of each layer, as with a tauprof starting at 0.
+    cumulative_optical_depth = np.cumsum(optical_depth_per_layer, axis=-1) - (
+        optical_depth_per_layer
+    )
+    contribution_optical_depths = atmospheres["contribution_optical_depths"]._replace(
+        cumulative_optical_depth=cumulative_optical_depth
+    )
+
+    emitted_flux, contribution_functions = RT_Toon1989(
+        **(atmospheres | dict(contribution_optical_depths=contribution_optical_depths))
+    )
+
+    for model_index in range(NUMBER_OF_MODELS):
+        reference_arguments = (
+            atmospheres["wavelengths_in_cm"],
+            atmospheres["temperatures_in_K"][model_index],
+        )
+        np.testing.assert_allclose(
+            contribution_functions.total[model_index],
+            reference_contribution(
+                *reference_arguments,
+                optical_depth_per_layer[model_index],
+                cumulative_optical_depth[model_index],
+            ),
+            rtol=1e-12,
+        )
+        for species_index in range(NUMBER_OF_SPECIES):
+            # The thin-layer test uses the total optical depth, as blayer does.
+            species_optical_depth_per_layer = (
+                contribution_optical_depths.optical_depth_per_layer_by_species[
+                    model_index, species_index
+                ]
+            )
+            np.testing.assert_allclose(
+                contribution_functions.by_species[model_index, species_index],
+                reference_contribution(
+                    *reference_arguments,
+                    optical_depth_per_layer[model_index],
+                    cumulative_optical_depth[model_index],
+                )
+                * species_optical_depth_per_layer
+                / optical_depth_per_layer[model_index],
+                rtol=1e-12,
+            )
+
+    np.testing.assert_array_equal(
+        emitted_flux,
+        RT_Toon1989(
+            **{
+                name: argument
+                for name, argument in atmospheres.items()
+                if name != "contribution_optical_depths"
+            }
+        ),
+    )
+
+
+def test_components_add_up_to_the_total(atmospheres):
+    contribution_functions = RT_Toon1989(**atmospheres).contribution_functions
+
+    np.testing.assert_allclose(
+        contribution_functions.gas + contribution_functions.cloud,
+        contribution_functions.total,
+        rtol=1e-12,
+    )
+    np.testing.assert_allclose(
+        contribution_functions.by_species.sum(axis=-3),
+        contribution_functions.gas,
+        rtol=1e-12,
+    )
+
+    contributions_by_name = contribution_functions.as_dict(["h2o", "co", "ch4"])
+    assert list(contributions_by_name) == ["total", "gas", "cloud", "h2o", "co", "ch4"]
+    assert contributions_by_name["co"].shape == (
+        NUMBER_OF_MODELS,
+        NUMBER_OF_WAVELENGTHS,
+        NUMBER_OF_LAYERS,
+    )
+
+
+def test_only_the_requested_contributions_are_computed(atmospheres):
+    contribution_functions = calculate_contribution_functions(
+        atmospheres["optical_depth_per_layer"],
+        np.ones_like(atmospheres["optical_depth_per_layer"]),
+    )
+
+    assert contribution_functions.total is not None
+    assert contribution_functions.gas is None
+    assert contribution_functions.by_species is None
+    assert list(contribution_functions.as_dict()) == ["total"]
+
+
+@pytest.mark.parametrize("backend", ["numpy", "numba"])
+def test_backends_return_contributions(atmospheres, backend):
+    if backend == "numba":
+        pytest.importorskip("numba")
+
+    emission = RT_Toon1989_by_backend(**atmospheres, backend=backend)
+    reference_emission = RT_Toon1989(**atmospheres)
+
+    assert isinstance(emission, EmissionWithContributions)
+    np.testing.assert_allclose(
+        emission.emitted_flux, reference_emission.emitted_flux, rtol=1e-10
+    )
+    for contribution, reference_contribution_function in zip(
+        emission.contribution_functions, reference_emission.contribution_functions
+    ):
+        np.testing.assert_array_equal(contribution, reference_contribution_function)
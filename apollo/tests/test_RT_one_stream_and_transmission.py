@@ -0,0 +1,148 @@
+import math
+
+import numpy as np
+
+from apollo.radiative_transfer.RT_one_stream import RT_one_stream
+from apollo.radiative_transfer.RT_Toon1989 import STREAM_COSINE_ANGLES, STREAM_WEIGHTS
+from apollo.radiative_transfer.RT_transmission import RT_transmission
+
+from conftest import reference_blackbody
+
+NUMBER_OF_WAVELENGTHS = 6
+NUMBER_OF_LAYERS = 8
+PLANET_RADIUS = 7.0e9
+STELLAR_RADIUS = 7.0e10
+
+
+def reference_one_stream_flux(wavelengths, tprof, hprof, hmin, taulayer, tauprof):
+    # A direct transcription of Planet::getFluxOneStream and Planet::getFluxes.
+    pi, nlayer = math.pi, len(tprof) - 1
+    totalflux = np.zeros(len(wavelengths))
+    for cosmu, weight in zip(STREAM_COSINE_ANGLES, STREAM_WEIGHTS):
+        sinmu = math.sqrt(1 - cosmu * cosmu)
+        for i, wavelength in enumerate(wavelengths):
+            flux = 0.0
+            for j in reversed(range(nlayer)):
+                if hprof[j] < hmin:
+                    continue
+                elif hprof[j + 1] >= hmin:
+                    tmid = 0.5 * (tprof[j + 1] + tprof[j])
+                    dflux = reference_blackbody(tmid, wavelength) * (
+                        1 - math.exp(-taulayer[i][j] / cosmu)
+                    )
+                    if j > 0:
+                        dflux *= math.exp(-tauprof[i][j - 1] / cosmu)
+                else:
+                    f = (hprof[j] - hmin) / (hprof[j] - hprof[j + 1])
+                    tcloud = f * tprof[j + 1] + (1 - f) * tprof[j]
+                    tmid = 0.5 * f * tprof[j + 1] + (1 - 0.5 * f) * tprof[j]
+                    tauadjust = f * taulayer[i][j]
+                    above = tauprof[i][j - 1] if j > 0 else 0.0
+                    dflux = reference_blackbody(tcloud, wavelength) * math.exp(
+                        -(tauadjust + above) / cosmu
+                    )
+                    dflux += (
+                        reference_blackbody(tmid, wavelength)
+                        * (1 - math.exp(-tauadjust / cosmu))
+                        * math.exp(-above / cosmu)
+                    )
+                flux += dflux * sinmu
+            totalflux[i] += 2 * pi * flux * weight * pi / 2
+    return totalflux
+
+
+def reference_transit_depth(hprof, hmin, tauprof):
+    # A direct transcription of Planet::transFlux.
+    pi, rp, rs, nlayer = math.pi, PLANET_RADIUS, STELLAR_RADIUS, len(hprof) - 1
+    fluxes = np.zeros(len(tauprof))
+    for i in range(len(tauprof)):
+        dflux = pi * rp * rp
+        for j in reversed(range(nlayer)):
+            area = (hprof[j] - hprof[j + 1]) * 2 * pi * (rp + hprof[j])
+            if hprof[j] < hmin:
+                dflux += area
+            elif hprof[j + 1] >= hmin:
+                dflux += (1 - math.exp(-tauprof[i][j])) * area
+            else:
+                f = (hprof[j] - hmin) / (hprof[j] - hprof[j + 1])
+                dflux += (1 - math.exp(-tauprof[i][j])) * area * f
+        fluxes[i] = dflux / (pi * rs * rs)
+    return fluxes
+
+
+def make_batch_of_atmospheres():
+    rng = np.random.default_rng(16)
+    layer_shape = (3, NUMBER_OF_WAVELENGTHS, NUMBER_OF_LAYERS)
+
+    altitudes = np.linspace(2e8, 0, NUMBER_OF_LAYERS + 1)
+    # One deck inside a layer, one on a level, and one below the whole profile.
+    cloud_deck_altitudes = np.array(
+        [0.5 * (altitudes[3] + altitudes[4]), altitudes[6], -1.0]
+    )
+
+    return dict(
+        wavelengths_in_cm=np.linspace(1.0, 5.0, NUMBER_OF_WAVELENGTHS) * 1e-4,
+        temperatures_in_K=np.sort(
+            rng.uniform(500, 2500, size=(3, NUMBER_OF_LAYERS + 1)), axis=-1
+        ),
+        optical_depth_per_layer=10 ** rng.uniform(-3, 0.5, size=layer_shape),
+        altitudes_in_cm=np.broadcast_to(altitudes, (3, NUMBER_OF_LAYERS + 1)),
+        cloud_deck_altitude_in_cm=cloud_deck_altitudes,
+    )
+
+
+def test_one_stream_fluxes_match_getFluxes():
+    atmospheres = make_batch_of_atmospheres()
+
+    fluxes = RT_one_stream(**atmospheres)
+    assert fluxes.shape == (3, NUMBER_OF_WAVELENGTHS)
+
+    cumulative_optical_depth = np.cumsum(atmospheres["optical_depth_per_layer"], -1)
+    for model in range(3):
+        np.testing.assert_allclose(
+            fluxes[model],
+            reference_one_stream_flux(
+                atmospheres["wavelengths_in_cm"],
+                atmospheres["temperatures_in_K"][model],
+                atmospheres["altitudes_in_cm"][model],
+                atmospheres["cloud_deck_altitude_in_cm"][model],
+                atmospheres["optical_depth_per_layer"][model],
+                cumulative_optical_depth[model],
+            ),
+            rtol=1e-13,
+        )
+
+
+def test_transit_depths_match_transFlux():
+    atmospheres = make_batch_of_atmospheres()
+
+    transit_depths = RT_transmission(
+        atmospheres["optical_depth_per_layer"],
+        atmospheres["altitudes_in_cm"],
+        PLANET_RADIUS,
+        STELLAR_RADIUS,
+        atmospheres["cloud_deck_altitude_in_cm"],
+    )
+    assert transit_depths.shape == (3, NUMBER_OF_WAVELENGTHS)
+
+    for model in range(3):
+        np.testing.assert_allclose(
+            transit_depths[model],
+            reference_transit_depth(
+                atmospheres["altitudes_in_cm"][model],
+                atmospheres["cloud_deck_altitude_in_cm"][model],
+                atmospheres["optical_depth_per_layer"][model],
+            ),
+            rtol=1e-13,
+        )
+
+    # Without a deck, the whole column is partially transparent.
+    np.testing.assert_array_less(
+        RT_transmission(
+            atmospheres["optical_depth_per_layer"],
+            atmospheres["altitudes_in_cm"],
+            PLANET_RADIUS,
+            STELLAR_RADIUS,
+        )[:2],
+        transit_depths[:2],
+    )
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from apollo.radiative_transfer.quadrature import (
+    QuadraturePreset,
+    benchmark_stream_quadratures,
+    calculate_stream_quadrature,
+    get_stream_quadrature,
+    make_random_atmospheres,
+)
+from apollo.radiative_transfer.RT_Toon1989 import (
+    STREAM_COSINE_ANGLES,
+    STREAM_WEIGHTS,
+    RT_Toon1989,
+)
+
+
+def test_eight_angles_reproduce_the_getFlux_points():
+    stream_cosine_angles, stream_weights = calculate_stream_quadrature(8)
+
+    np.testing.assert_allclose(stream_cosine_angles, STREAM_COSINE_ANGLES, atol=1e-10)
+    np.testing.assert_allclose(stream_weights, STREAM_WEIGHTS, atol=1e-10)
+
+
+@pytest.mark.parametrize("number_of_angles", [1, 2, 3, 5, 12])
+def test_quadrature_integrates_polynomials_exactly(number_of_angles):
+    stream_cosine_angles, stream_weights = calculate_stream_quadrature(number_of_angles)
+
+    # The integral of mu * mu**n over [0, 1], exact up to n = 2 * number_of_angles - 1.
+    for n in range(2 * number_of_angles):
+        assert np.sum(stream_weights * stream_cosine_angles**n) == pytest.approx(
+            1 / (n + 2), rel=1e-12
+        )
+
+
+def test_presets_and_angle_counts():
+    standard_angles, standard_weights = get_stream_quadrature("standard")
+    assert standard_angles is STREAM_COSINE_ANGLES
+    assert standard_weights is STREAM_WEIGHTS
+
+    assert len(get_stream_quadrature(QuadraturePreset.fast).stream_weights) == 4
+    assert len(get_stream_quadrature("reference").stream_weights) == 16
+    assert len(get_stream_quadrature("12").stream_weights) == 12
+
+    with pytest.raises(ValueError):
+        get_stream_quadrature("fastest")
+
+
+def test_fewer_angles_trade_accuracy():
+    atmospheres = make_random_atmospheres(2, 50, 20)
+
+    reference_fluxes = RT_Toon1989(
+        **atmospheres, **get_stream_quadrature("reference")._asdict()
+    )
+    errors = [
+        np.max(
+            np.abs(
+                RT_Toon1989(**atmospheres, **get_stream_quadrature(preset)._asdict())
+                / reference_fluxes
+                - 1
+            )
+        )
+        for preset in ("fast", "standard")
+    ]
+    assert errors[1] < errors[0] < 1e-2
+
+    benchmarks = benchmark_stream_quadratures(
+        (2, 8), number_of_models=2, number_of_wavelengths=20, number_of_layers=10
+    )
+    assert [benchmark.number_of_angles for benchmark in benchmarks] == [2, 8]
+    assert (
+        benchmarks[1].maximum_relative_flux_error
+        < benchmarks[0].maximum_relative_flux_error
+    )
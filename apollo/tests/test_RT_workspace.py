@@ -0,0 +1,59 @@
+import numpy as np
+
+from apollo.radiative_transfer.RT_Toon1989 import RT_Toon1989
+from apollo.radiative_transfer.RT_workspace import RTWorkspace
+
+NUMBER_OF_MODELS = 4
+NUMBER_OF_WAVELENGTHS = 7
+NUMBER_OF_LAYERS = 9
+
+
+def make_batch_of_atmospheres(seed):
+    rng = np.random.default_rng(seed)
+    layer_shape = (NUMBER_OF_MODELS, NUMBER_OF_WAVELENGTHS, NUMBER_OF_LAYERS)
+
+    optical_depth_per_layer = 10 ** rng.uniform(-8, 1, size=layer_shape)
+    single_scattering_albedo = rng.uniform(0, 0.99, size=layer_shape)
+    # Thin and non-scattering layers take the other branches in getFlux.
+    single_scattering_albedo[..., ::3] = 0.005
+
+    return dict(
+        wavelengths_in_cm=np.linspace(1.0, 5.0, NUMBER_OF_WAVELENGTHS) * 1e-4,
+        temperatures_in_K=np.sort(
+            rng.uniform(500, 2500, size=(NUMBER_OF_MODELS, NUMBER_OF_LAYERS + 1)),
+            axis=-1,
+        ),
+        optical_depth_per_layer=optical_depth_per_layer,
+        single_scattering_albedo=single_scattering_albedo,
+        scattering_asymmetry=rng.uniform(-0.5, 0.9, size=layer_shape),
+    )
+
+
+def test_workspace_matches_RT_Toon1989_exactly():
+    workspace = RTWorkspace(
+        NUMBER_OF_LAYERS, NUMBER_OF_WAVELENGTHS, batch_shape=(NUMBER_OF_MODELS,)
+    )
+
+    # The same buffers are reused for every call.
+    for seed in range(3):
+        atmospheres = make_batch_of_atmospheres(seed)
+        fluxes = workspace.RT_Toon1989(**atmospheres)
+
+        assert fluxes.shape == (NUMBER_OF_MODELS, NUMBER_OF_WAVELENGTHS)
+        np.testing.assert_array_equal(fluxes, RT_Toon1989(**atmospheres))
+
+
+def test_workspace_broadcasts_shared_inputs():
+    atmospheres = make_batch_of_atmospheres(17)
+    atmospheres["scattering_asymmetry"] = 0.3
+    atmospheres["single_scattering_albedo"] = atmospheres["single_scattering_albedo"][0]
+
+    workspace = RTWorkspace(
+        NUMBER_OF_LAYERS, NUMBER_OF_WAVELENGTHS, batch_shape=(NUMBER_OF_MODELS,)
+    )
+    first_fluxes = workspace.RT_Toon1989(**atmospheres)
+    np.testing.assert_array_equal(first_fluxes, RT_Toon1989(**atmospheres))
+
+    # Returned fluxes are not overwritten by the next call.
+    workspace.RT_Toon1989(**make_batch_of_atmospheres(18))
+    np.testing.assert_array_equal(first_fluxes, RT_Toon1989(**atmospheres))
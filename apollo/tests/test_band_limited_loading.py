@@ -0,0 +1,48 @@
+import numpy as np
+
+from apollo.crosssections import (
+    get_wavelength_index_ranges_from_band_indices,
+    get_wavelength_indices_from_ranges,
+    load_crosssection_table,
+)
+from apollo.opacities.binary_store import convert_text_table_to_binary
+
+TABLE_SHAPE = (2, 3, 20)
+HEADER_LINE = "2 -6.0 -5.5 3 1.875061 3.599199 20 2.80000 2.86 1000.00"
+
+
+def test_band_indices_become_merged_full_resolution_ranges():
+    # Degraded bands [1, 3] and [2, 4] overlap; [7, 8] runs off the table end.
+    ranges = get_wavelength_index_ranges_from_band_indices(
+        [7, 1, 2], [8, 3, 4], degrade=2, number_of_spectral_elements=17
+    )
+
+    assert ranges == [(2, 10), (14, 17)]
+
+
+def test_partial_loading_matches_full_table(tmp_path):
+    table = np.arange(np.prod(TABLE_SHAPE), dtype=np.float64).reshape(TABLE_SHAPE)
+    table_filepath = tmp_path / "h2o.test.dat"
+    with open(table_filepath, "w") as file:
+        file.write(HEADER_LINE + "\n")
+        np.savetxt(file, table.reshape(-1, TABLE_SHAPE[-1]))
+
+    wavelength_index_ranges = [(2, 5), (11, 14)]
+    expected_table = table[
+        ..., get_wavelength_indices_from_ranges(wavelength_index_ranges)
+    ]
+
+    # Tables come back in file order.
+    np.testing.assert_array_equal(
+        load_crosssection_table(table_filepath, TABLE_SHAPE), table
+    )
+    np.testing.assert_array_equal(
+        load_crosssection_table(table_filepath, TABLE_SHAPE, wavelength_index_ranges),
+        expected_table,
+    )
+
+    convert_text_table_to_binary(table_filepath)
+    np.testing.assert_array_equal(
+        load_crosssection_table(table_filepath, TABLE_SHAPE, wavelength_index_ranges),
+        expected_table,
+    )
@@ -0,0 +1,58 @@
+import numpy as np
+
+from apollo.crosssections import (
+    create_crosssection_catalog,
+    load_crosssections_into_array,
+)
+from apollo.opacities.binary_store import (
+    convert_text_table_to_binary,
+    get_table_header_filepath,
+    has_binary_table,
+)
+
+from conftest import write_text_table
+
+TABLE_SHAPE = (3, 4, 5)
+HEADER_LINE = "3 -6.0 -5.0 4 1.875061 3.599199 5 2.80000 2.81 1000.00"
+
+
+def test_binary_store_matches_text_tables(tmp_path):
+    gas_directory = tmp_path / "gases"
+    gas_directory.mkdir()
+
+    rng = np.random.default_rng(0)
+    tables = {
+        species: 10 ** rng.uniform(-30, -20, size=TABLE_SHAPE)
+        for species in ("h2o", "ch4")
+    }
+    for species, table in tables.items():
+        write_text_table(
+            gas_directory / f"{species}.test.dat", table, HEADER_LINE, fmt="%.6e"
+        )
+
+    text_catalog = create_crosssection_catalog(gas_directory)
+    text_arrays = load_crosssections_into_array(
+        *TABLE_SHAPE, text_catalog["test"].filepath_directory, excluded_species=[]
+    )
+
+    for species in tables:
+        # Small chunks exercise the streaming conversion.
+        convert_text_table_to_binary(
+            gas_directory / f"{species}.test.dat", lines_per_chunk=2
+        )
+        assert has_binary_table(gas_directory / f"{species}.test.dat")
+
+    binary_catalog = create_crosssection_catalog(gas_directory)
+    assert binary_catalog["test"].header == text_catalog["test"].header
+    assert all(
+        filepath.suffix == ".hdr"
+        for filepath in binary_catalog["test"].filepath_directory.values()
+    )
+    assert get_table_header_filepath(tmp_path, "h2o", "test").suffix == ".hdr"
+
+    binary_arrays = load_crosssections_into_array(
+        *TABLE_SHAPE, binary_catalog["test"].filepath_directory, excluded_species=[]
+    )
+
+    for species in tables:
+        np.testing.assert_array_equal(binary_arrays[species], text_arrays[species])
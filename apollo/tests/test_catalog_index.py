@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+
+from apollo.crosssections import create_crosssection_catalog
+from apollo.opacities.catalog_index import (
+    get_catalog_index_filepath,
+    read_catalog_index,
+)
+
+from conftest import write_text_table
+
+TABLE_SHAPE = (2, 3, 4)
+HEADER_LINE = "2 -6.0 -5.5 3 1.875061 3.599199 4 1.00000 1.01 1000.00"
+
+
+def test_index_is_reused_and_updated_incrementally(tmp_path):
+    write_text_table(tmp_path / "h2o.test.dat", np.ones(TABLE_SHAPE), HEADER_LINE)
+    write_text_table(tmp_path / "ch4.test.dat", np.ones(TABLE_SHAPE), HEADER_LINE)
+
+    catalog = create_crosssection_catalog(tmp_path)
+    assert get_catalog_index_filepath(tmp_path).is_file()
+    assert set(read_catalog_index(tmp_path).files) == {"h2o.test.dat", "ch4.test.dat"}
+
+    # A header changed behind the index's back is not re-read while the file's
+    # size and modification time still match...
+    h2o_stat = os.stat(tmp_path / "h2o.test.dat")
+    write_text_table(
+        tmp_path / "h2o.test.dat",
+        np.ones(TABLE_SHAPE),
+        HEADER_LINE.replace("1000.00", "2000.00"),
+    )
+    os.utime(tmp_path / "h2o.test.dat", ns=(h2o_stat.st_atime_ns, h2o_stat.st_mtime_ns))
+    assert (
+        create_crosssection_catalog(tmp_path)["test"].header == catalog["test"].header
+    )
+
+    # ...but is once they change, and removed files drop out of the index.
+    os.utime(tmp_path / "h2o.test.dat", ns=(0, h2o_stat.st_mtime_ns + 10**9))
+    (tmp_path / "ch4.test.dat").unlink()
+    updated_catalog = create_crosssection_catalog(tmp_path)["test"]
+    assert updated_catalog.header[-1] == 2000.0
+    assert updated_catalog.list_of_species == ("h2o",)
+    assert set(read_catalog_index(tmp_path).files) == {"h2o.test.dat"}
+
+    assert (
+        create_crosssection_catalog(tmp_path, use_index=False)["test"].header
+        == updated_catalog.header
+    )
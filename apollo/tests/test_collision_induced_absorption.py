@@ -0,0 +1,144 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from apollo.crosssections import CrossSectionTableHeader
+from apollo.opacities.binary_store import load_binary_table
+
+# Imported under the same name as write_H2.py and write_He.py do, so that they share
+# numba's on-disk cache of the compiled kernel.
+HELIUM_FILES_DIRECTORY = (
+    Path(__file__).resolve().parents[2] / "extensions" / "helium_files"
+)
+if str(HELIUM_FILES_DIRECTORY) not in sys.path:
+    sys.path.append(str(HELIUM_FILES_DIRECTORY))
+
+from collision_induced_absorption import (  # noqa: E402
+    UPPER_EDGE_STEP,
+    CIAInputGrid,
+    amagat,
+    combine_cia_tables,
+    k,
+    write_cia_table,
+)
+
+# 100 to 500 K in steps of 100 K, and 3000 to 21000 cm^-1 in steps of 600 cm^-1.
+INPUT_GRID_SHAPE = (5, 31)
+
+
+def make_input_grid(seed):
+    rng = np.random.default_rng(seed)
+    return CIAInputGrid(
+        absorption_coefficients=10 ** rng.uniform(-8, -6, size=INPUT_GRID_SHAPE),
+        minimum_temperature=100.0,
+        maximum_temperature=500.0,
+        minimum_wavenumber=3000.0,
+        maximum_wavenumber=21000.0,
+    )
+
+
+def make_table_header(number_of_spectral_elements=23):
+    # 50 to 800 K, so that some temperatures fall below and above the input grid.
+    return CrossSectionTableHeader(
+        number_of_pressure_layers=3,
+        minimum_log_pressure=-4.0,
+        maximum_log_pressure=0.0,
+        number_of_temperatures=8,
+        minimum_log_temperature=np.log10(50.0),
+        maximum_log_temperature=np.log10(800.0),
+        number_of_spectral_elements=number_of_spectral_elements,
+        minimum_wavelength=0.6,
+        maximum_wavelength=2.5,
+        effective_resolution=16.0,
+    )
+
+
+def reference_crosssection(input_grid, log_pressure, temperature, wavelength):
+    # Bilinear in temperature and wavenumber, held at the ends of the input grid
+    # (just short of the top end, as in getOpacProf).
+    coefficients = input_grid.absorption_coefficients
+
+    if temperature < input_grid.minimum_temperature:
+        ti, temperature_step = 0, 0.0
+    elif temperature > input_grid.maximum_temperature:
+        ti, temperature_step = input_grid.number_of_temperatures - 2, UPPER_EDGE_STEP
+    else:
+        temperature_position = (
+            temperature - input_grid.minimum_temperature
+        ) / input_grid.temperature_step
+        ti = min(int(temperature_position), input_grid.number_of_temperatures - 2)
+        temperature_step = temperature_position - ti
+
+    wavenumber_position = (
+        1e4 / wavelength - input_grid.minimum_wavenumber
+    ) / input_grid.wavenumber_step
+    wi = min(int(wavenumber_position), input_grid.number_of_wavenumbers - 2)
+    wavenumber_step = wavenumber_position - wi
+
+    coefficient = (
+        (1 - temperature_step) * (1 - wavenumber_step) * coefficients[ti, wi]
+        + temperature_step * (1 - wavenumber_step) * coefficients[ti + 1, wi]
+        + (1 - temperature_step) * wavenumber_step * coefficients[ti, wi + 1]
+        + temperature_step * wavenumber_step * coefficients[ti + 1, wi + 1]
+    )
+    number_density = 10 ** (log_pressure + 6.0) / temperature / k
+
+    return coefficient / amagat**2 * number_density
+
+
+def test_cia_table_matches_scalar_bilinear_interpolation(tmp_path):
+    input_grid = make_input_grid(12)
+    table_header = make_table_header()
+    assert table_header.temperatures.min() < input_grid.minimum_temperature
+    assert table_header.temperatures.max() > input_grid.maximum_temperature
+
+    # A chunk size that does not divide the wavelengths evenly.
+    table_filepath = tmp_path / "h2.test.dat"
+    write_cia_table(input_grid, table_filepath, table_header, wavelengths_per_chunk=5)
+
+    expected_table = np.array(
+        [
+            [
+                [
+                    reference_crosssection(
+                        input_grid, log_pressure, temperature, wavelength
+                    )
+                    for wavelength in table_header.wavelengths
+                ]
+                for temperature in table_header.temperatures
+            ]
+            for log_pressure in table_header.pressures
+        ]
+    )
+    np.testing.assert_allclose(
+        load_binary_table(table_filepath), expected_table, rtol=1e-12
+    )
+
+
+def test_combined_tables_must_share_a_grid(tmp_path):
+    table_filepaths = {
+        species: tmp_path / f"{species}.test.dat" for species in ("h2", "he", "other")
+    }
+    write_cia_table(make_input_grid(1), table_filepaths["h2"], make_table_header())
+    write_cia_table(make_input_grid(2), table_filepaths["he"], make_table_header())
+    write_cia_table(make_input_grid(3), table_filepaths["other"], make_table_header(24))
+
+    combined_table_filepath = combine_cia_tables(
+        {table_filepaths["h2"]: 0.85, table_filepaths["he"]: 0.15},
+        tmp_path / "h2he.test.dat",
+        wavelengths_per_chunk=5,
+    )
+    np.testing.assert_allclose(
+        load_binary_table(combined_table_filepath),
+        0.85 * load_binary_table(table_filepaths["h2"])
+        + 0.15 * load_binary_table(table_filepaths["he"]),
+        rtol=1e-15,
+    )
+
+    with pytest.raises(ValueError, match="different grids"):
+        combine_cia_tables(
+            {table_filepaths["h2"]: 0.85, table_filepaths["other"]: 0.15},
+            tmp_path / "h2other.test.dat",
+        )
@@ -0,0 +1,49 @@
+import numpy as np
+
+from apollo.crosssections import create_crosssection_catalog
+from apollo.opacities.binary_store import convert_text_table_to_binary
+
+from conftest import write_text_table
+
+TABLE_SHAPE = (2, 3, 10)
+HEADER_LINE = "2 -6.0 -5.5 3 1.875061 3.599199 10 1.00000 1.01 1000.00"
+TABLE_BYTES = np.prod(TABLE_SHAPE) * 8
+
+
+def test_least_recently_used_tables_are_evicted_first(tmp_path):
+    for index, species in enumerate(("h2o", "ch4", "co")):
+        write_text_table(
+            tmp_path / f"{species}.test.dat",
+            np.full(TABLE_SHAPE, float(index)),
+            HEADER_LINE,
+        )
+
+    catalog = create_crosssection_catalog(
+        tmp_path, memory_budget_in_bytes=2 * TABLE_BYTES
+    )["test"]
+
+    h2o_table = catalog.get_crosssections("h2o")
+    catalog.get_crosssections("ch4")
+    assert catalog.get_crosssections("h2o") is h2o_table
+
+    # ch4 is now the least recently used, so it makes room for co.
+    catalog.get_crosssections("co")
+    assert catalog.get_crosssections("h2o") is h2o_table
+    cache_info = catalog.cache_info()
+    assert (cache_info.hits, cache_info.misses, cache_info.evictions) == (2, 3, 1)
+    assert cache_info.resident_bytes == 2 * TABLE_BYTES
+
+    dataset = catalog.get_dataset(["co", "h2o"], wavelength_index_ranges=[(2, 5)])
+    assert dataset.h2o.shape == (2, 3, 3)
+    np.testing.assert_array_equal(dataset.co.values, 2.0)
+
+
+def test_memory_mapped_tables_do_not_count_against_the_budget(tmp_path):
+    write_text_table(tmp_path / "h2o.test.dat", np.ones(TABLE_SHAPE), HEADER_LINE)
+    convert_text_table_to_binary(tmp_path / "h2o.test.dat")
+
+    catalog = create_crosssection_catalog(tmp_path, memory_budget_in_bytes=0)["test"]
+    catalog.get_crosssections("h2o")
+
+    assert catalog.cache_info().number_of_tables == 1
+    assert catalog.cache_info().resident_bytes == 0
@@ -0,0 +1,124 @@
+import json
+import os
+
+import numpy as np
+
+from apollo.opacities.degraded_table_cache import (
+    CacheKey,
+    build_degraded_table,
+    evict_stale_entries,
+    fnv1a64,
+    format_row_ranges,
+    get_cache_directory,
+    make_cache_key,
+    warm_degraded_table_cache,
+)
+
+from conftest import write_text_table
+
+TABLE_SHAPE = (2, 3, 21)
+HEADER_LINE = "2 -6.0 -5.5 3 1.875061 3.599199 21 1.00000 1.02 1000.00"
+
+
+def test_cache_key_helpers_match_the_cpp_conventions():
+    # Published FNV-1a 64-bit test vector.
+    assert fnv1a64("a") == 0xAF63DC4C8601EC8C
+    assert format_row_ranges([9, 3, 4, 5, 7]) == "3-5,7-7,9-9"
+
+
+def test_float32_tables_have_their_own_cache_entries(tmp_path):
+    table_filepath = tmp_path / "h2o.test.dat"
+    write_text_table(table_filepath, np.ones(TABLE_SHAPE), HEADER_LINE)
+
+    keys = {
+        table_dtype: make_cache_key(
+            "h2o", "test", 3, 21, [0, 1, 2], table_filepath, table_dtype
+        )
+        for table_dtype in (np.float64, np.float32)
+    }
+    assert keys[np.float32].text == (
+        "h2o.test|degrade=3|nwave=21|dtype=float32|rows=0-2"
+        + f"|size={table_filepath.stat().st_size}"
+        + f"|mtime={int(table_filepath.stat().st_mtime)}"
+    )
+    assert keys[np.float64].filename != keys[np.float32].filename
+    assert CacheKey.from_text(keys[np.float32].text) == keys[np.float32]
+
+
+def test_degraded_table_averages_clipped_values(tmp_path):
+    table = np.linspace(0.0, 1e-20, np.prod(TABLE_SHAPE)).reshape(TABLE_SHAPE)
+    table[0, 0, 0] = np.nan
+    table_filepath = tmp_path / "h2o.test.dat"
+    write_text_table(table_filepath, table, HEADER_LINE)
+
+    rows = np.array([0, 4, 10])
+    degraded_table = build_degraded_table(table_filepath, TABLE_SHAPE, 3, rows)
+
+    clipped_table = np.where(table >= 1e-50, table, 1e-50)
+    padded_table = np.concatenate(
+        [clipped_table, np.zeros((*TABLE_SHAPE[:-1], 12))], axis=-1
+    )
+    expected_table = padded_table.reshape(*TABLE_SHAPE[:-1], -1, 3).sum(-1) / 3
+    np.testing.assert_allclose(degraded_table, expected_table[..., rows], rtol=1e-14)
+
+
+def test_warm_then_evict_when_source_changes(tmp_path, monkeypatch):
+    monkeypatch.delenv("APOLLO_DEGRADED_CACHE", raising=False)
+    (tmp_path / "gases").mkdir()
+    table_filepath = tmp_path / "gases" / "h2o.test.dat"
+    write_text_table(table_filepath, np.ones(TABLE_SHAPE), HEADER_LINE)
+
+    model_wavelengths = np.exp(np.arange(4, 12, 2) / 1000.0)
+    (entry_filepath,) = warm_degraded_table_cache(
+        tmp_path, "test", ["h2o"], model_wavelengths
+    )
+    assert entry_filepath.parent == get_cache_directory(tmp_path)
+    assert np.load(entry_filepath).shape == (2, 3, 4)
+    assert evict_stale_entries(get_cache_directory(tmp_path)) == []
+
+    os.utime(table_filepath, (0, 0))
+    assert evict_stale_entries(get_cache_directory(tmp_path)) == [entry_filepath]
+    assert not entry_filepath.with_suffix(".json").exists()
+
+
+def test_float32_degraded_table_rounds_each_sum(tmp_path):
+    rng = np.random.default_rng(10)
+    table = 10 ** rng.uniform(-30, -20, size=TABLE_SHAPE)
+    table_filepath = tmp_path / "h2o.test.dat"
+    write_text_table(table_filepath, table, HEADER_LINE)
+
+    rows = np.array([0, 4, 6])
+    degraded_table = build_degraded_table(
+        table_filepath, TABLE_SHAPE, 3, rows, np.float32
+    )
+
+    # As Planet::readopac accumulates into a float32 table: each sum is taken in
+    # double precision, then rounded.
+    read_table = np.loadtxt(table_filepath, skiprows=1).reshape(TABLE_SHAPE)
+    expected_table = np.zeros((*TABLE_SHAPE[:-1], len(rows)), dtype=np.float32)
+    for offset in range(3):
+        expected_table = (
+            expected_table.astype(np.float64) + read_table[..., rows * 3 + offset] / 3
+        ).astype(np.float32)
+    assert degraded_table.dtype == np.float32
+    np.testing.assert_array_equal(degraded_table, expected_table)
+
+
+def test_entries_with_an_older_key_are_evicted(tmp_path):
+    source_filepath = tmp_path / "h2o.test.dat"
+    write_text_table(source_filepath, np.ones(TABLE_SHAPE), HEADER_LINE)
+    stat = source_filepath.stat()
+
+    entry_filepath = tmp_path / "h2o.test.0123456789abcdef.npy"
+    np.save(entry_filepath, np.ones((2, 3, 1)))
+    entry_filepath.with_suffix(".json").write_text(
+        json.dumps(
+            dict(
+                key=f"h2o.test|degrade=3|nwave=21|rows=0-0|size={stat.st_size}"
+                + f"|mtime={int(stat.st_mtime)}",
+                source=str(source_filepath),
+            )
+        )
+    )
+
+    assert evict_stale_entries(tmp_path) == [entry_filepath]
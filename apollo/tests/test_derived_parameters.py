@@ -0,0 +1,42 @@
+import pickle
+
+import numpy as np
+
+from apollo.retrieval.results.derived_parameters import (
+    save_derived_parameters_for_samples,
+)
+
+
+def test_saved_samples_are_put_into_the_full_parameter_vector(tmp_path):
+    model_parameters = [11.2, 5.0, 2.5, -3.0, -4.0]
+    free_parameter_indices = [1, 3]
+    samples = np.array([[4.5, -3.5], [5.5, -2.5], [5.0, -3.0]])
+
+    model_calls = []
+
+    def model_function(parameters, compute_derived_parameters=False):
+        model_calls.append((parameters.copy(), compute_derived_parameters))
+        return np.zeros(3), [parameters[1], parameters[3], 0.0, 1000 * parameters[1]]
+
+    derived_parameters_filepath = tmp_path / "derived.pkl"
+    derived_parameters = save_derived_parameters_for_samples(
+        derived_parameters_filepath,
+        model_function,
+        samples,
+        model_parameters,
+        free_parameter_indices,
+    )
+
+    for (parameters, compute_derived_parameters), sample in zip(model_calls, samples):
+        assert compute_derived_parameters
+        np.testing.assert_array_equal(parameters[[0, 2, 4]], [11.2, 2.5, -4.0])
+        np.testing.assert_array_equal(parameters[free_parameter_indices], sample)
+
+    np.testing.assert_array_equal(
+        derived_parameters,
+        np.c_[samples, np.zeros(len(samples)), 1000 * samples[:, 0]],
+    )
+    with open(derived_parameters_filepath, "rb") as derived_parameters_file:
+        np.testing.assert_array_equal(
+            pickle.load(derived_parameters_file), derived_parameters
+        )
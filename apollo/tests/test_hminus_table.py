@@ -0,0 +1,79 @@
+import math
+
+import numpy as np
+
+from apollo.crosssections import create_crosssection_catalog
+from apollo.opacities.hminus_table import (
+    BOLTZMANN_CONSTANT,
+    HMINUS_FREE_FREE_LONG_COEFFICIENTS,
+    HMINUS_FREE_FREE_SHORT_COEFFICIENTS,
+    build_hminus_table,
+    calculate_hminus_crosssections,
+    get_table_temperatures,
+    get_table_wavelengths,
+)
+
+TABLE_SHAPE = (2, 36, 400)
+HEADER_LINE = "2 -6.0 -5.5 36 1.875061 3.599199 400 0.15 25.0 78.0"
+
+
+def reference_hminus_crosssection(t, al):
+    # A direct transcription of Planet::HminBoundFree and Planet::HminFreeFree.
+    bf = 0.0
+    if al < 1.6419:
+        x = math.sqrt(1.0 / al - 1.0 / 1.6419)
+        f = 0.0
+        for coefficient in (152.519, 49.534, -118.858, 92.536, -34.194, 4.982):
+            f *= x
+            f += coefficient
+        bf = math.pow(al * x, 3) * f * 1.0e-18
+
+    ff = 0.0
+    if not (t < 800 or al > 20):
+        hj = np.zeros(6)
+        for i in range(6):
+            if al > 0.3645:
+                a, b, c, d, e, f = HMINUS_FREE_FREE_LONG_COEFFICIENTS[:, i]
+            elif al < 0.1823:
+                a, b, c, d, e, f = HMINUS_FREE_FREE_SHORT_COEFFICIENTS[:, i]
+            else:
+                continue
+            hj[i] = (
+                1.0e-29 * (al * al * a + b + (c + (d + (e + f) / al) / al) / al) / al
+            )
+        for i in range(6):
+            ff += math.pow(5040.0 / t, (i + 1.0) / 2.0) * hj[i]
+        ff *= BOLTZMANN_CONSTANT * t
+
+    value = bf + ff
+    return 1e-50 if not value >= 1e-50 or np.isinf(value) else value
+
+
+def test_hminus_table_matches_the_scalar_calculation(tmp_path):
+    gas_directory = tmp_path / "gases"
+    gas_directory.mkdir()
+    with open(gas_directory / "h2o.test.dat", "w") as file:
+        file.write(HEADER_LINE + "\n")
+        np.savetxt(file, np.ones((TABLE_SHAPE[0] * TABLE_SHAPE[1], TABLE_SHAPE[2])))
+
+    build_hminus_table(tmp_path, "test")
+    catalog = create_crosssection_catalog(gas_directory)["test"]
+    assert "h-" in catalog.list_of_species
+
+    hminus_table = catalog.get_crosssections("h-")
+    np.testing.assert_array_equal(hminus_table[0], hminus_table[1])
+
+    temperatures = get_table_temperatures(catalog.table_header)
+    wavelengths = get_table_wavelengths(catalog.table_header)
+    reference_table = np.array(
+        [
+            [reference_hminus_crosssection(t, al) for al in wavelengths]
+            for t in temperatures
+        ]
+    )
+    # Bit for bit, so that loading the table gives the same spectrum as computing it.
+    np.testing.assert_array_equal(hminus_table[0], reference_table)
+    np.testing.assert_array_equal(
+        calculate_hminus_crosssections(temperatures[:3], wavelengths[::7]),
+        reference_table[:3, ::7],
+    )
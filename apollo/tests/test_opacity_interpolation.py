@@ -0,0 +1,99 @@
+import numpy as np
+
+from apollo.crosssections import CrossSectionTableHeader
+from apollo.opacities.interpolation import (
+    calculate_opacity_profile,
+    get_table_wavelength_indices,
+)
+
+TABLE_HEADER = CrossSectionTableHeader(
+    18, -6.0, 2.5, 36, 1.875061, 3.599199, 200, 0.6, 5.0, 100.0
+)
+
+
+def reference_opacity_profile(
+    table, wavelength_indices, pressures, temperatures, abundances
+):
+    # A direct transcription of the scalar loops in Planet::getOpacProf.
+    number_of_species = table.shape[0]
+    number_of_layers = len(pressures) - 1
+    npress = TABLE_HEADER.number_of_pressure_layers
+    ntemp = TABLE_HEADER.number_of_temperatures
+    logpr = TABLE_HEADER.pressures + 6.0
+    logtemp = np.log10(TABLE_HEADER.temperatures)
+    lpmin, lpmax = logpr[0], logpr[-1]
+    ltmin, ltmax = logtemp[0], logtemp[-1]
+
+    opacities = np.zeros((number_of_species, len(wavelength_indices), number_of_layers))
+    for j in range(number_of_layers):
+        tl = np.log10(0.5 * (temperatures[j] + temperatures[j + 1]))
+        jt = int((tl - ltmin) / (ltmax - ltmin) * (ntemp - 1))
+        dti = (tl - logtemp[min(max(jt, 0), ntemp - 2)]) / (
+            logtemp[min(max(jt, 0), ntemp - 2) + 1]
+            - logtemp[min(max(jt, 0), ntemp - 2)]
+        )
+        if jt < 0:
+            jt, dti = 0, 0.0
+        if jt > ntemp - 2:
+            jt, dti = ntemp - 2, 0.999999
+
+        pl = 0.5 * np.log10(pressures[j] * pressures[j + 1])
+        jp = int((pl - lpmin) / (lpmax - lpmin) * (npress - 1))
+        dpi = (pl - logpr[min(max(jp, 0), npress - 2)]) / 0.5
+        if jp < 0:
+            jp, dpi = 0, 0.0
+        if jp > npress - 2:
+            jp, dpi = npress - 2, 0.999999
+
+        for m, jw in enumerate(wavelength_indices):
+            for s in range(number_of_species):
+                x0 = table[s, jp, jt, jw] * abundances[s]
+                x1 = table[s, jp, jt + 1, jw] * abundances[s]
+                x2 = table[s, jp + 1, jt, jw] * abundances[s]
+                x3 = table[s, jp + 1, jt + 1, jw] * abundances[s]
+                opr1 = x0 + dpi * (x2 - x0)
+                opr2 = x1 + dpi * (x3 - x1)
+                opacities[s, m, j] = opr1 + dti * (opr2 - opr1)
+
+    return opacities
+
+
+def test_vectorized_profile_matches_scalar_loops():
+    rng = np.random.default_rng(1)
+    table = 10 ** rng.uniform(
+        -30,
+        -20,
+        size=(
+            3,
+            TABLE_HEADER.number_of_pressure_layers,
+            TABLE_HEADER.number_of_temperatures,
+            TABLE_HEADER.number_of_spectral_elements,
+        ),
+    )
+    abundances = np.array([0.8, 1e-3, 1e-5])
+
+    # Levels run off both ends of the pressure and temperature grids.
+    pressures = 10 ** np.linspace(-1.0, 9.5, 25)
+    temperatures = np.linspace(50.0, 5000.0, 25)
+    model_wavelengths = TABLE_HEADER.wavelengths[5:150:3] * 1.0000001
+
+    wavelength_indices = get_table_wavelength_indices(
+        model_wavelengths,
+        TABLE_HEADER.minimum_wavelength,
+        TABLE_HEADER.effective_resolution,
+    )
+    np.testing.assert_array_equal(wavelength_indices, np.arange(5, 150, 3))
+
+    opacity_profile = calculate_opacity_profile(
+        table, model_wavelengths, pressures, temperatures, abundances, TABLE_HEADER
+    )
+    expected_opacities = reference_opacity_profile(
+        table, wavelength_indices, pressures, temperatures, abundances
+    )
+
+    np.testing.assert_allclose(
+        opacity_profile.species_opacities, expected_opacities, rtol=1e-12
+    )
+    np.testing.assert_allclose(
+        opacity_profile.total_opacity, expected_opacities.sum(axis=0), rtol=1e-12
+    )
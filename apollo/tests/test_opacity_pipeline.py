@@ -0,0 +1,80 @@
+from pathlib import Path
+
+import pytest
+
+from extensions.opacity_pipeline import (
+    MANIFEST_SUFFIX,
+    OpacityManifest,
+    run_pieces_in_parallel,
+)
+
+SETTINGS = dict(
+    original_opacity_directory="/opacities/lupu",
+    list_of_molecules=["H2O", "CO"],
+    minimum_wavelength=0.6,
+    maximum_wavelength=5.0,
+    new_resolution=1000.0,
+)
+
+
+# The stand-in pieces run in worker processes, so they log their runs to disk.
+def write_piece(output_filepath, run_log_filepath):
+    with open(run_log_filepath, "a") as run_log:
+        run_log.write(Path(output_filepath).name + "\n")
+    Path(output_filepath).write_text("done")
+    return output_filepath
+
+
+def fail_piece(output_filepath, run_log_filepath):
+    with open(run_log_filepath, "a") as run_log:
+        run_log.write(Path(output_filepath).name + "\n")
+    raise OSError(f"could not write {Path(output_filepath).name}")
+
+
+def test_failed_pieces_are_raised_together_and_redone_on_resume(tmp_path):
+    run_log_filepath = tmp_path / "runs.log"
+    manifest_filepath = tmp_path / f"test{MANIFEST_SUFFIX}"
+
+    def make_pieces(functions):
+        return {
+            piece_name: (function, (tmp_path / f"{piece_name}.out", run_log_filepath))
+            for piece_name, function in functions.items()
+        }
+
+    with pytest.raises(RuntimeError, match="2 of 3 pieces failed") as error_info:
+        run_pieces_in_parallel(
+            make_pieces(dict(h2o=write_piece, co=fail_piece, ch4=fail_piece)),
+            OpacityManifest(manifest_filepath, SETTINGS),
+            max_workers=2,
+        )
+    assert "co: OSError('could not write co.out')" in str(error_info.value)
+    assert "ch4: OSError('could not write ch4.out')" in str(error_info.value)
+
+    manifest = OpacityManifest(manifest_filepath, SETTINGS)
+    assert list(manifest.finished_pieces) == ["h2o"]
+
+    run_log_filepath.unlink()
+    run_pieces_in_parallel(
+        make_pieces(dict(h2o=write_piece, co=write_piece, ch4=write_piece)),
+        manifest,
+        max_workers=2,
+    )
+    assert sorted(run_log_filepath.read_text().split()) == ["ch4.out", "co.out"]
+    assert set(OpacityManifest(manifest_filepath, SETTINGS).finished_pieces) == {
+        "h2o",
+        "co",
+        "ch4",
+    }
+
+
+def test_resuming_with_different_settings_is_refused(tmp_path):
+    manifest_filepath = tmp_path / f"test{MANIFEST_SUFFIX}"
+    OpacityManifest(manifest_filepath, SETTINGS).mark_finished(
+        "database:H2O", tmp_path / "h2o.db"
+    )
+
+    with pytest.raises(ValueError, match="different settings"):
+        OpacityManifest(
+            manifest_filepath,
+            SETTINGS | dict(original_opacity_directory="/opacities/other"),
+        )
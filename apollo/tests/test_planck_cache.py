@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from apollo.radiative_transfer.planck_cache import (
+    PlanckCache,
+    blackbody_intensity_by_wavelength,
+    calculate_effective_temperature,
+)
+from apollo.radiative_transfer.RT_one_stream import RT_one_stream
+
+WAVELENGTHS_IN_CM = np.linspace(0.6, 30.0, 500) * 1e-4
+
+
+def make_temperature_profiles():
+    rng = np.random.default_rng(19)
+    return np.sort(rng.uniform(75, 4000, size=(3, 12)), axis=-1)
+
+
+def test_exact_cache_matches_the_blackbody_function():
+    temperatures_in_K = make_temperature_profiles()
+
+    np.testing.assert_array_equal(
+        PlanckCache(WAVELENGTHS_IN_CM).blackbody_intensity(temperatures_in_K),
+        blackbody_intensity_by_wavelength(
+            np.expand_dims(temperatures_in_K, axis=-2),
+            np.expand_dims(WAVELENGTHS_IN_CM, axis=-1),
+        ),
+    )
+
+
+def test_tabulated_cache_is_within_its_error_bound():
+    temperatures_in_K = make_temperature_profiles()
+    planck_cache = PlanckCache(WAVELENGTHS_IN_CM, tabulated=True)
+
+    exact_intensities = blackbody_intensity_by_wavelength(
+        np.expand_dims(temperatures_in_K, axis=-2),
+        np.expand_dims(WAVELENGTHS_IN_CM, axis=-1),
+    )
+    np.testing.assert_allclose(
+        planck_cache.blackbody_intensity(temperatures_in_K),
+        exact_intensities,
+        rtol=planck_cache.log_temperature_spacing**2 / 8 + 1e-12,
+    )
+
+    # Outside the table, the cache falls back to the exact evaluation.
+    np.testing.assert_array_equal(
+        planck_cache.blackbody_intensity(temperatures_in_K + 5000),
+        PlanckCache(WAVELENGTHS_IN_CM).blackbody_intensity(temperatures_in_K + 5000),
+    )
+
+
+def test_cache_serves_one_stream_fluxes_and_Teff():
+    rng = np.random.default_rng(20)
+    number_of_layers = 10
+    atmospheres = dict(
+        wavelengths_in_cm=WAVELENGTHS_IN_CM,
+        temperatures_in_K=np.sort(
+            rng.uniform(500, 2500, size=(2, number_of_layers + 1)), axis=-1
+        ),
+        optical_depth_per_layer=10
+        ** rng.uniform(-3, 1, size=(2, len(WAVELENGTHS_IN_CM), number_of_layers)),
+    )
+    planck_cache = PlanckCache(WAVELENGTHS_IN_CM)
+
+    fluxes = RT_one_stream(**atmospheres, planck_cache=planck_cache)
+    np.testing.assert_array_equal(fluxes, RT_one_stream(**atmospheres))
+
+    # An isothermal, opaque atmosphere radiates as a blackbody.
+    isothermal_fluxes = RT_one_stream(
+        WAVELENGTHS_IN_CM,
+        np.full(number_of_layers + 1, 1200.0),
+        np.full((len(WAVELENGTHS_IN_CM), number_of_layers), 100.0),
+        planck_cache=planck_cache,
+    )
+    assert calculate_effective_temperature(
+        WAVELENGTHS_IN_CM, isothermal_fluxes
+    ) == pytest.approx(1200.0, rel=0.02)
+
+    with pytest.raises(ValueError):
+        RT_one_stream(
+            **{**atmospheres, "wavelengths_in_cm": 2 * WAVELENGTHS_IN_CM},
+            planck_cache=planck_cache,
+        )
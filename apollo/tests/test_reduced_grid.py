@@ -0,0 +1,56 @@
+import numpy as np
+
+from apollo.crosssections import create_crosssection_catalog
+from apollo.opacities.reduced_grid import (
+    build_reduced_catalog,
+    calculate_k_distribution_means,
+    report_reduced_catalog_accuracy,
+)
+
+from conftest import write_text_table
+
+TABLE_SHAPE = (2, 3, 120)
+HEADER_LINE = "2 -6.0 -5.5 3 1.875061 3.599199 120 1.00000 1.12 1000.00"
+
+
+def test_k_distribution_means_keep_the_bin_mean():
+    rng = np.random.default_rng(2)
+    crosssections = 10 ** rng.uniform(-30, -20, size=(4, 25))
+
+    # 25 points do not divide evenly into 8 g-intervals.
+    k_values = calculate_k_distribution_means(crosssections, 8)
+
+    assert np.all(np.diff(k_values, axis=-1) >= 0)
+    np.testing.assert_allclose(
+        k_values.mean(axis=-1), crosssections.mean(axis=-1), rtol=1e-12
+    )
+
+
+def test_reduced_catalog_is_a_loadable_table(tmp_path):
+    gas_directory = tmp_path / "gases"
+    gas_directory.mkdir()
+    rng = np.random.default_rng(3)
+    write_text_table(
+        gas_directory / "h2o.test.dat",
+        10 ** rng.uniform(-30, -20, size=TABLE_SHAPE),
+        HEADER_LINE,
+    )
+
+    # R=1000 tables in bins of R=100 hold 10 points; keeping all 10 loses nothing
+    # in bin-mean transmission, while fewer points must cost some accuracy.
+    full_catalog_name = build_reduced_catalog(tmp_path, "test", 100, 10)
+    reduced_catalog_name = build_reduced_catalog(tmp_path, "test", 100, 2)
+    assert reduced_catalog_name == "test_ktable2R100"
+
+    # 12 bins of 2 points, at R*G = 200.
+    reduced_header = create_crosssection_catalog(gas_directory)[
+        reduced_catalog_name
+    ].header
+    assert reduced_header[6] == 24
+    assert reduced_header[9] == 200.0
+
+    (full_report,) = report_reduced_catalog_accuracy(tmp_path, full_catalog_name)
+    (reduced_report,) = report_reduced_catalog_accuracy(tmp_path, reduced_catalog_name)
+    assert np.all(full_report.maximum_errors < 1e-12)
+    assert np.all(reduced_report.maximum_errors > 1e-6)
+    assert np.all(reduced_report.maximum_errors < 1.0)
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from apollo.crosssections import (
+    load_crosssections_into_array,
+    load_crosssections_into_shared_dataset,
+)
+from apollo.opacities.shared_memory import (
+    attach_multiprocessing_shared_array,
+    attach_planet_tables,
+    share_planet_tables,
+)
+
+TABLE_SHAPE = (2, 3, 4)
+HEADER_LINE = "2 -6.0 -5.5 3 1.875061 3.599199 4 2.80000 2.81 1000.00"
+
+
+def test_shared_dataset_matches_private_tables(tmp_path):
+    rng = np.random.default_rng(1)
+    filepaths = {}
+    for species in ("h2o", "co"):
+        filepaths[species] = tmp_path / f"{species}.test.dat"
+        with open(filepaths[species], "w") as file:
+            file.write(HEADER_LINE + "\n")
+            np.savetxt(file, 10 ** rng.uniform(-30, -20, size=(6, 4)))
+
+    private_arrays = load_crosssections_into_array(*TABLE_SHAPE, filepaths)
+
+    dataset, shared_crosssections = load_crosssections_into_shared_dataset(
+        np.arange(2.0), np.arange(3.0), np.arange(4.0), filepaths
+    )
+    try:
+        for species, private_array in private_arrays.items():
+            np.testing.assert_array_equal(dataset[species].values, private_array)
+
+        # A second process would attach to the same block by name.
+        attached = attach_multiprocessing_shared_array(
+            shared_crosssections.name, shared_crosssections.array.shape
+        )
+        np.testing.assert_array_equal(attached.array, shared_crosssections.array)
+        with pytest.raises(ValueError):
+            attached.array[0, 0, 0, 0] = 0.0
+        attached.release()
+    finally:
+        del dataset
+        shared_crosssections.release()
+
+
+class TablePlanet:
+    # Stands in for the table interface of PyPlanet: views of, and attached, tables.
+    table_dtype = np.dtype(np.float64)
+
+    def __init__(self, tables):
+        self.tables = tables
+
+    def get_table_shape(self, table):
+        return (2, 3, 4, 5) if table == "hires" else (2, 3, 4, 1)
+
+    def get_table(self, table):
+        return self.tables[table]
+
+    def attach_table(self, table, array):
+        assert array.shape == self.get_table_shape(table)
+        self.tables[table] = array
+
+
+def test_planet_tables_are_shared_without_copies():
+    rng = np.random.default_rng(2)
+    planet = TablePlanet(
+        {
+            table: rng.uniform(size=TablePlanet.get_table_shape(None, table))
+            for table in ("hires", "lores")
+        }
+    )
+    private_tables = {table: array.copy() for table, array in planet.tables.items()}
+
+    shared_tables = share_planet_tables(planet)
+    reader = TablePlanet({})
+    attached_tables = attach_planet_tables(
+        reader, {table: shared.name for table, shared in shared_tables.items()}
+    )
+    try:
+        for table, private_table in private_tables.items():
+            assert planet.get_table(table) is shared_tables[table].array
+            np.testing.assert_array_equal(reader.get_table(table), private_table)
+            assert not reader.get_table(table).flags.writeable
+    finally:
+        for shared in (*attached_tables.values(), *shared_tables.values()):
+            shared.release()
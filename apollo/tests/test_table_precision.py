@@ -0,0 +1,50 @@
+import numpy as np
+
+from apollo.crosssections import create_crosssection_catalog
+from apollo.opacities.binary_store import get_binary_table_filepath, read_header_notes
+from apollo.opacities.interpolation import calculate_opacity_profile
+from apollo.opacities.table_precision import build_reduced_precision_catalog
+
+from conftest import write_text_table
+
+TABLE_SHAPE = (4, 3, 50)
+HEADER_LINE = "4 -6.0 -4.5 3 1.875061 3.599199 50 1.00000 1.05 1000.00"
+
+
+def test_log10_tables_keep_the_full_range_until_interpolation(tmp_path):
+    gas_directory = tmp_path / "gases"
+    gas_directory.mkdir()
+    rng = np.random.default_rng(4)
+    table = 10 ** rng.uniform(-50, -18, size=TABLE_SHAPE)
+    write_text_table(gas_directory / "h2o.test.dat", table, HEADER_LINE)
+
+    reduced_catalog_name = build_reduced_precision_catalog(tmp_path, "test", "log10")
+    assert reduced_catalog_name == "test_log10"
+    assert read_header_notes(gas_directory / "h2o.test_log10.dat") == {
+        "scale": ["log10"]
+    }
+    assert (
+        np.load(get_binary_table_filepath(gas_directory / "h2o.test_log10.dat")).dtype
+        == np.float32
+    )
+
+    catalogs = create_crosssection_catalog(gas_directory)
+    level_pressures = np.logspace(-5.9, -4.6, 9) * 1e6
+    level_temperatures = np.linspace(100.0, 3000.0, 9)
+    opacity_profiles = [
+        calculate_opacity_profile(
+            catalogs[catalog_name].get_dataset(),
+            model_wavelengths=catalogs[catalog_name].table_header.wavelengths[:-1],
+            level_pressures_in_cgs=level_pressures,
+            level_temperatures_in_K=level_temperatures,
+            abundances=[1e-3],
+            table_header=catalogs[catalog_name].table_header,
+        )
+        for catalog_name in ("test", "test_log10")
+    ]
+
+    np.testing.assert_allclose(
+        opacity_profiles[1].total_opacity,
+        opacity_profiles[0].total_opacity,
+        rtol=1e-5,
+    )
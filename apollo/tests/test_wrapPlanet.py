@@ -0,0 +1,417 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from apollo.opacities.degraded_table_cache import warm_degraded_table_cache
+from apollo.radiative_transfer.RT_Toon1989 import RT_Toon1989
+
+NUMBER_OF_PRESSURES = 18
+NUMBER_OF_TEMPERATURES = 12
+NUMBER_OF_LEVELS = 71
+
+# The model wavelengths (in microns) sit inside the table range, 1.0 to 1.3 microns.
+MODEL_WAVELENGTHS = 1.0 * np.exp(2e-3 * np.arange(100))
+TEFF_WAVELENGTHS = 1.0 * np.exp(np.arange(26) / 100)
+
+# The cloud deck is just above the base, so that getFlux integrates the whole profile
+# (tbfrac = 1), as RT_Toon1989 does.
+PLANET_PARAMETERS = [1.0, 5.0, 2.49999999, 5000, 1.0, 2.3, 0.0, -4.0, 2.5, 0.05]
+
+
+def import_wrapPlanet():
+    wrapPlanet = pytest.importorskip("apollo.src.wrapPlanet", exc_type=ImportError)
+
+    source_directory = Path(wrapPlanet.__file__).parent
+    build_time = os.path.getmtime(wrapPlanet.__file__)
+    if any(
+        os.path.getmtime(source_directory / source_file) > build_time
+        for source_file in ("Planet.cpp", "Planet.h", "wrapPlanet.pyx")
+    ):
+        pytest.skip("wrapPlanet is older than its sources; rebuild it to test it.")
+
+    return wrapPlanet
+
+
+def write_opacity_table(filepath, number_of_wavelengths, resolution, rng):
+    with open(filepath, "w") as file:
+        file.write(
+            f"{NUMBER_OF_PRESSURES} -6.0 2.5 {NUMBER_OF_TEMPERATURES} 1.875 3.6 "
+            + f"{number_of_wavelengths} 1.0 1.3 {resolution}\n"
+        )
+        table_shape = (
+            NUMBER_OF_PRESSURES * NUMBER_OF_TEMPERATURES,
+            number_of_wavelengths,
+        )
+        np.savetxt(file, 10 ** rng.uniform(-26, -20, size=table_shape), fmt="%.6e")
+
+
+@pytest.fixture
+def opacity_directory(tmp_path, monkeypatch):
+    monkeypatch.setenv("APOLLO_DEGRADED_CACHE", str(tmp_path / "degraded"))
+    rng = np.random.default_rng(25)
+    (tmp_path / "gases").mkdir()
+    for species in ("h2o", "co"):
+        for catalog_name, resolution in (("hi", 1000.0), ("lo", 100.0)):
+            write_opacity_table(
+                tmp_path / "gases" / f"{species}.{catalog_name}.dat",
+                int(np.ceil(resolution * np.log(1.3))),
+                resolution,
+                rng,
+            )
+    return tmp_path
+
+
+def make_planet(wrapPlanet, opacity_directory, streams=2, read_tables=True):
+    planet = wrapPlanet.PyPlanet()
+    planet.MakePlanet(
+        [0, 0, 0, streams, 0],
+        list(MODEL_WAVELENGTHS),
+        list(TEFF_WAVELENGTHS),
+        [4, 6],
+        str(opacity_directory).encode("utf-8"),
+        b"hi",
+        b"lo",
+        read_tables,
+    )
+    return planet
+
+
+def calculate_spectrum(planet):
+    temperatures = np.linspace(600.0, 2200.0, NUMBER_OF_LEVELS)
+    planet.set_Params(PLANET_PARAMETERS, [1e-3, 1e-4], [0.0, 0.0], temperatures)
+    return planet.get_Spectrum()
+
+
+def test_getFlux_matches_RT_Toon1989_with_scattering(opacity_directory):
+    planet = make_planet(import_wrapPlanet(), opacity_directory)
+    temperatures = np.linspace(600.0, 2200.0, NUMBER_OF_LEVELS)
+    planet.set_Params(PLANET_PARAMETERS, [1e-3, 1e-4], [0.0, 0.0], temperatures)
+
+    rng = np.random.default_rng(13)
+    layer_shape = (len(MODEL_WAVELENGTHS), NUMBER_OF_LEVELS - 1)
+    optical_depth_per_layer = 10 ** rng.uniform(-3, 0.5, size=layer_shape)
+    single_scattering_albedo = rng.uniform(0, 0.9, size=layer_shape)
+    scattering_asymmetry = rng.uniform(0, 0.5, size=layer_shape)
+
+    np.testing.assert_allclose(
+        planet.getFlux(
+            MODEL_WAVELENGTHS,
+            b"hires",
+            optical_depth_per_layer,
+            single_scattering_albedo,
+            scattering_asymmetry,
+        ),
+        RT_Toon1989(
+            wavelengths_in_cm=MODEL_WAVELENGTHS / 1e4,
+            temperatures_in_K=temperatures,
+            optical_depth_per_layer=optical_depth_per_layer,
+            single_scattering_albedo=single_scattering_albedo,
+            scattering_asymmetry=scattering_asymmetry,
+        ),
+        rtol=1e-8,
+    )
+
+    # Each wavelength is computed on its own, whatever comes before it.
+    reversed_flux = planet.getFlux(
+        MODEL_WAVELENGTHS[::-1],
+        b"hires",
+        optical_depth_per_layer[::-1],
+        single_scattering_albedo[::-1],
+        scattering_asymmetry[::-1],
+    )
+    np.testing.assert_array_equal(
+        reversed_flux[::-1],
+        planet.getFlux(
+            MODEL_WAVELENGTHS,
+            b"hires",
+            optical_depth_per_layer,
+            single_scattering_albedo,
+            scattering_asymmetry,
+        ),
+    )
+
+
+def test_planet_reads_the_cache_warmed_from_python(opacity_directory):
+    wrapPlanet = import_wrapPlanet()
+    table_dtype = wrapPlanet.PyPlanet().table_dtype
+    entry_filepaths = warm_degraded_table_cache(
+        opacity_directory, "hi", ["h2o", "co"], MODEL_WAVELENGTHS, table_dtype
+    )
+
+    planet = make_planet(wrapPlanet, opacity_directory)
+
+    # A key that did not match would have made the core write entries of its own.
+    assert sorted(entry_filepaths[0].parent.glob("*.npy")) == sorted(entry_filepaths)
+    for species_table, entry_filepath in zip(planet.get_table(), entry_filepaths):
+        np.testing.assert_array_equal(species_table, np.load(entry_filepath))
+
+
+def make_Planet(opacity_directory, cclass_settings):
+    # apollo.planet imports the extension, so it can only be imported once it is built.
+    from apollo.planet import CPlanetBlueprint, Planet, SwitchBlueprint
+
+    return Planet(
+        "b",
+        CPlanetBlueprint(
+            switches=SwitchBlueprint(0, 0, 0, 1, 0),
+            model_wavelengths=list(MODEL_WAVELENGTHS),
+            Teff_calculation_wavelengths=list(TEFF_WAVELENGTHS),
+            gas_species_indices=[4, 6],
+            gas_opacity_directory=str(opacity_directory),
+            opacity_catalog_name="hi",
+            Teff_opacity_catalog_name="lo",
+        ),
+        cclass_settings,
+    )
+
+
+def test_Planet_applies_its_stream_quadrature(opacity_directory):
+    wrapPlanet = import_wrapPlanet()
+    from apollo.planet import CPlanetSettings
+    from apollo.radiative_transfer.quadrature import get_stream_quadrature
+
+    planet = make_Planet(opacity_directory, CPlanetSettings(stream_quadrature="fast"))
+
+    fast_planet = make_planet(wrapPlanet, opacity_directory, streams=1)
+    fast_planet.set_Quadrature(*get_stream_quadrature("fast"))
+    np.testing.assert_array_equal(
+        calculate_spectrum(planet.cclass), calculate_spectrum(fast_planet)
+    )
+
+    standard_planet = make_planet(wrapPlanet, opacity_directory, streams=1)
+    assert not np.array_equal(
+        calculate_spectrum(planet.cclass), calculate_spectrum(standard_planet)
+    )
+
+
+def test_Planet_threads_leave_the_spectrum_unchanged(opacity_directory):
+    wrapPlanet = import_wrapPlanet()
+    from apollo.planet import CPlanetSettings
+
+    # With an OpenMP build each thread takes whole wavelengths, so the spectrum is
+    # bitwise the same as a serial one; without, the setting is ignored.
+    planet = make_Planet(opacity_directory, CPlanetSettings(number_of_threads=3))
+
+    serial_planet = make_planet(wrapPlanet, opacity_directory, streams=1)
+    serial_planet.set_Threads(1)
+    np.testing.assert_array_equal(
+        calculate_spectrum(planet.cclass), calculate_spectrum(serial_planet)
+    )
+
+
+def test_Teff_follows_the_latest_parameters(opacity_directory):
+    wrapPlanet = import_wrapPlanet()
+    planet = make_planet(wrapPlanet, opacity_directory)
+
+    cooler_temperatures = np.linspace(500.0, 1500.0, NUMBER_OF_LEVELS)
+    planet.set_Params(PLANET_PARAMETERS, [1e-3, 1e-4], [0.0, 0.0], cooler_temperatures)
+    cooler_Teff = planet.get_Teff()
+
+    # The low-resolution profiles are redone after each set_Params, and only once.
+    calculate_spectrum(planet)
+    Teff = planet.get_Teff()
+    assert Teff != cooler_Teff
+    assert planet.get_Teff() == Teff
+
+    fresh_planet = make_planet(wrapPlanet, opacity_directory)
+    calculate_spectrum(fresh_planet)
+    assert fresh_planet.get_Teff() == Teff
+
+
+class IsothermalProfile:
+    @staticmethod
+    def evaluate_model(temperature, num_layers_final, P_min, P_max):
+        return np.full(num_layers_final, temperature)
+
+
+def make_model_function(planet, compute_derived_parameters):
+    from apollo.planet import MakeModelBlueprint
+
+    # Radius, log(g) and cloud deck, then the log abundances of h2o and co.
+    return planet.MakeModel(
+        MakeModelBlueprint(
+            model_wavelengths=MODEL_WAVELENGTHS,
+            gas_species=["h2", "h2o", "co"],
+            minimum_model_pressure=-4.0,
+            maximum_model_pressure=2.5,
+            model_pressures=[],
+            number_of_atmospheric_layers=NUMBER_OF_LEVELS,
+            stellar_effective_temperature=5000.0,
+            stellar_radius=1.0,
+            semimajor_axis=0.05,
+            distance_to_system=10.0,
+            gas_start_index=3,
+            gas_end_index=5,
+            TP_model_type="Layers",
+            TP_model_function=IsothermalProfile(),
+            is_TP_profile_gray=True,
+            isothermal_temperature=1500.0,
+            is_TP_profile_verbatim=False,
+            TP_start_index=5,
+            TP_end_index=5,
+            number_of_TP_arguments=0,
+            number_of_params1_arguments=10,
+            basic_parameter_names=["Rad", "Log(g)", "P_cl"],
+            basic_start_index=0,
+            cloud_model_index=0,
+            hazetype_index=0,
+            cloud_parameter_names=[],
+            cloud_start_index=5,
+            calibration_parameter_names=[],
+            calibration_start_index=5,
+            APOLLO_use_mode="Ensemble",
+            compute_derived_parameters=compute_derived_parameters,
+        )
+    )
+
+
+def test_model_function_can_leave_the_derived_parameters_for_later(opacity_directory):
+    import_wrapPlanet()
+    from apollo.planet import CPlanetSettings
+
+    model_parameters = [11.2, 5.0, 2.49999999, -3.0, -4.0]
+
+    saved_samples_function = make_model_function(
+        make_Planet(opacity_directory, CPlanetSettings()),
+        compute_derived_parameters=False,
+    )
+    spectrum, derived_parameters = saved_samples_function(model_parameters)
+    assert derived_parameters is None
+
+    every_call_function = make_model_function(
+        make_Planet(opacity_directory, CPlanetSettings()),
+        compute_derived_parameters=True,
+    )
+    every_call_spectrum, every_call_derived_parameters = every_call_function(
+        model_parameters
+    )
+    np.testing.assert_array_equal(spectrum, every_call_spectrum)
+
+    # Asked for afterwards, as they are for the saved samples.
+    recomputed_spectrum, recomputed_derived_parameters = saved_samples_function(
+        model_parameters, compute_derived_parameters=True
+    )
+    np.testing.assert_array_equal(recomputed_spectrum, spectrum)
+    assert recomputed_derived_parameters == every_call_derived_parameters
+    assert recomputed_derived_parameters[1] == pytest.approx(1e-4 / (1e-3 + 1e-4))
+    assert recomputed_derived_parameters[3] > 0
+
+
+def test_planet_on_shared_tables_matches_one_that_reads_them(opacity_directory):
+    wrapPlanet = import_wrapPlanet()
+    from apollo.opacities.shared_memory import attach_planet_tables, share_planet_tables
+
+    reading_planet = make_planet(wrapPlanet, opacity_directory)
+    expected_spectrum = calculate_spectrum(reading_planet)
+    expected_Teff = reading_planet.get_Teff()
+
+    owning_planet = make_planet(wrapPlanet, opacity_directory)
+    shared_tables = share_planet_tables(owning_planet)
+    attaching_planet = make_planet(wrapPlanet, opacity_directory, read_tables=False)
+    attached_tables = attach_planet_tables(
+        attaching_planet,
+        {table: shared.name for table, shared in shared_tables.items()},
+    )
+    try:
+        for planet in (owning_planet, attaching_planet):
+            np.testing.assert_array_equal(calculate_spectrum(planet), expected_spectrum)
+            assert planet.get_Teff() == expected_Teff
+    finally:
+        # The planets hold views of the blocks, which cannot be closed until they go.
+        del planet, owning_planet, attaching_planet
+        for shared_table in [*attached_tables.values(), *shared_tables.values()]:
+            shared_table.release()
+
+
+def test_planets_sharing_tables_run_in_threads(opacity_directory):
+    wrapPlanet = import_wrapPlanet()
+    source_planet = make_planet(wrapPlanet, opacity_directory)
+
+    planets = []
+    for _ in range(4):
+        planet = make_planet(wrapPlanet, opacity_directory, read_tables=False)
+        planet.share_tables(source_planet)
+        assert np.shares_memory(planet.get_table(), source_planet.get_table())
+        planets.append(planet)
+    # The source planet is kept alive by the ones sharing its tables.
+    del source_planet
+
+    # Each planet runs in one thread, through several models so the threads overlap.
+    def calculate_models(planet_index):
+        planet = planets[planet_index]
+        models = []
+        for model_index in range(5):
+            top_temperature = 1600.0 + 100.0 * planet_index + 50.0 * model_index
+            temperatures = np.linspace(600.0, top_temperature, NUMBER_OF_LEVELS)
+            planet.set_Params(PLANET_PARAMETERS, [1e-3, 1e-4], [0.0, 0.0], temperatures)
+            models.append((planet.get_Spectrum(), planet.get_Teff()))
+        return models
+
+    serial_models = [calculate_models(index) for index in range(len(planets))]
+    with ThreadPoolExecutor(max_workers=len(planets)) as executor:
+        threaded_models = list(executor.map(calculate_models, range(len(planets))))
+
+    for (serial_spectrum, serial_Teff), (threaded_spectrum, threaded_Teff) in zip(
+        sum(serial_models, []), sum(threaded_models, [])
+    ):
+        np.testing.assert_array_equal(threaded_spectrum, serial_spectrum)
+        assert threaded_Teff == serial_Teff
+
+
+def make_radiative_transfer_inputs():
+    rng = np.random.default_rng(13)
+    layer_shape = (len(MODEL_WAVELENGTHS), NUMBER_OF_LEVELS - 1)
+    return (
+        MODEL_WAVELENGTHS,
+        b"hires",
+        10 ** rng.uniform(-3, 0.5, size=layer_shape),
+        rng.uniform(0, 0.9, size=layer_shape),
+        rng.uniform(0, 0.5, size=layer_shape),
+    )
+
+
+def test_results_are_written_into_given_arrays(opacity_directory):
+    planet = make_planet(import_wrapPlanet(), opacity_directory)
+    spectrum = calculate_spectrum(planet)
+    flux = planet.getFlux(*make_radiative_transfer_inputs())
+
+    for get_result, result in (
+        (planet.get_Spectrum, spectrum),
+        (lambda out: planet.getFlux(*make_radiative_transfer_inputs(), out=out), flux),
+        (planet.getContribution, planet.getContribution()),
+        (planet.getSpeciesContribution, planet.getSpeciesContribution()),
+    ):
+        out = np.full_like(result, np.nan)
+        assert get_result(out=out) is out
+        np.testing.assert_array_equal(out, result)
+
+
+def test_given_arrays_must_fit_the_results(opacity_directory):
+    planet = make_planet(import_wrapPlanet(), opacity_directory)
+    calculate_spectrum(planet)
+
+    for get_result in (
+        planet.get_Spectrum,
+        lambda out: planet.getFlux(*make_radiative_transfer_inputs(), out=out),
+        planet.getContribution,
+        planet.getSpeciesContribution,
+    ):
+        result_shape = get_result(out=None).shape
+        wider_shape = (*result_shape[:-1], 2 * result_shape[-1])
+        for out in (
+            np.empty((*result_shape[:-1], result_shape[-1] + 1)),
+            np.empty(result_shape, dtype=np.float32),
+            np.empty(wider_shape)[..., ::2],
+        ):
+            with pytest.raises(
+                ValueError,
+                match=(
+                    r"out= needs a C-contiguous float64 array of shape "
+                    + re.escape(str(result_shape))
+                ),
+            ):
+                get_result(out=out)
@@ -50,18 +50,83 @@ def run_picaso_opacity_factory(
     return new_opacity_database_filepath
 
 
-def prepare_opacity_table(
+def insert_molecule_into_database(
     opacity_db,
     molecule,
     minimum_wavelength,
     maximum_wavelength,
+    original_opacity_directory,
+    new_resolution,
+    alkali_directory="individual_file",
+):
+    start_time = time.time()
+    print("Inserting: " + molecule)
+
+    opa_fac.build_skeleton(opacity_db)
+    opa_fac.insert_molecular_1460(
+        molecule,
+        minimum_wavelength,
+        maximum_wavelength,
+        original_opacity_directory,
+        opacity_db,
+        new_R=new_resolution,
+        alkali_dir=alkali_directory,
+    )
+    print(
+        molecule
+        + " inserts finished in :"
+        + str((time.time() - start_time) / 60.0)[0:3]
+        + " minutes"
+    )
+
+    return opacity_db
+
+
+def format_opacity_table_header(
+    number_of_pressures,
+    pressure_min,
+    pressure_max,
+    number_of_temperatures,
+    temperature_min,
+    temperature_max,
+    number_of_spectral_elements,
+    minimum_wavelength,
+    maximum_wavelength,
     new_resolution,
-    save_name,
 ):
+    actual_resolution_of_tables: float = ORIGINAL_LUPU_RESOLUTION / int(
+        ORIGINAL_LUPU_RESOLUTION / new_resolution
+    )
+
+    header_info = [
+        (number_of_pressures, "d"),
+        (pressure_min, "1.1f"),
+        (pressure_max, "1.1f"),
+        (number_of_temperatures, "d"),
+        (temperature_min, "1.6f"),
+        (temperature_max, "1.6f"),
+        (number_of_spectral_elements, "d"),
+        (minimum_wavelength, "2.5f"),
+        (maximum_wavelength, "2.5f"),
+        (actual_resolution_of_tables, "6.2f"),
+    ]
+
+    return " ".join(["{:{}}".format(*entry) for entry in header_info])
+
+
+def read_opacity_table_from_database(
+    opacity_db,
+    molecule,
+    minimum_wavelength,
+    maximum_wavelength,
+    new_resolution,
+):
+    # Returns the table as (pressure, temperature, wavelength), in APOLLO order,
+    # along with its header line.
     molecules, pt_pairs = opa_fac.molecular_avail(opacity_db)
     if molecule not in molecules:
         print("Molecule not in the available molecules.")
-        return None
+        return None, None
 
     pressure_levels = np.unique(np.array(pt_pairs)[:, 1])
     number_of_pressures = len(pressure_levels)
@@ -81,6 +146,7 @@ def prepare_opacity_table(
         (molecule,),
     )
     data = cur.fetchall()
+    conn.close()
 
     actual_data = np.asarray([tup[-1] for tup in data])[::-1]
 
@@ -92,29 +158,43 @@ def prepare_opacity_table(
         ),
     )[::-1, ::-1, ::-1]
 
-    final_data = np.reshape(
-        transposed_data,
-        (number_of_pressures * number_of_temperatures, np.shape(transposed_data)[-1]),
+    header_string = format_opacity_table_header(
+        number_of_pressures,
+        pressure_min,
+        pressure_max,
+        number_of_temperatures,
+        temperature_min,
+        temperature_max,
+        np.shape(transposed_data)[-1],
+        minimum_wavelength,
+        maximum_wavelength,
+        new_resolution,
     )
-    number_of_spectral_elements = np.shape(final_data)[-1]
 
-    actual_resolution_of_tables: float = ORIGINAL_LUPU_RESOLUTION / int(
-        ORIGINAL_LUPU_RESOLUTION / new_resolution
+    return transposed_data, header_string
+
+
+def prepare_opacity_table(
+    opacity_db,
+    molecule,
+    minimum_wavelength,
+    maximum_wavelength,
+    new_resolution,
+    save_name,
+):
+    transposed_data, header_string = read_opacity_table_from_database(
+        opacity_db, molecule, minimum_wavelength, maximum_wavelength, new_resolution
     )
+    if transposed_data is None:
+        return None
 
-    header_info = [
-        (number_of_pressures, "d"),
-        (pressure_min, "1.1f"),
-        (pressure_max, "1.1f"),
-        (number_of_temperatures, "d"),
-        (temperature_min, "1.6f"),
-        (temperature_max, "1.6f"),
-        (number_of_spectral_elements, "d"),
-        (minimum_wavelength, "2.5f"),
-        (maximum_wavelength, "2.5f"),
-        (actual_resolution_of_tables, "6.2f"),
-    ]
-    header_string = " ".join(["{:{}}".format(*entry) for entry in header_info])
+    final_data = np.reshape(
+        transposed_data,
+        (
+            np.shape(transposed_data)[0] * np.shape(transposed_data)[1],
+            np.shape(transposed_data)[-1],
+        ),
+    )
 
     np.savetxt(
         f"{molecule.lower()}.{save_name}.dat",
@@ -3,7 +3,7 @@ from pathlib import Path
 from typing import Final
 
 import msgspec
-from Lupu_opacity_reader import generate_opacity_files
+from opacity_pipeline import generate_opacity_files_in_parallel
 
 OPACITY_DIRECTORY: Final[Path] = Path("/Volumes/ResearchStorage") / "Lupu_opacities"
 
@@ -15,6 +15,8 @@ class OpacityConfiguration(msgspec.Struct):
     maximum_wavelength: float
     new_resolution: float
     combine_alkalis: bool = False
+    output_directory: str | None = None
+    max_workers: int | None = None  # defaults to the number of CPUs
 
 
 def read_configuration_file_into_kwargs() -> OpacityConfiguration:
@@ -36,7 +38,8 @@ def read_configuration_file_into_kwargs() -> OpacityConfiguration:
 if __name__ == "__main__":
     opacity_configuration: OpacityConfiguration = read_configuration_file_into_kwargs()
 
-    new_opacity_files: list[Path] = generate_opacity_files(
+    # Rerunning with the same configuration resumes an interrupted run.
+    new_opacity_files: list[Path] = generate_opacity_files_in_parallel(
         original_opacity_directory=OPACITY_DIRECTORY,
         **msgspec.structs.asdict(opacity_configuration),
     )
@@ -0,0 +1,327 @@
+"""
+Collision-induced absorption (CIA) tables for H2-H2 and H2-He.
+
+The input grids (hespec.dat, h2spec.dat) hold log10 absorption coefficients in
+cm^-1 amagat^-2, linear in temperature and wavenumber. They are interpolated onto the
+(temperature, wavelength) grid of an APOLLO table and multiplied by the number density
+at each pressure, giving cross sections per molecule. Tables are written straight into
+APOLLO's binary store (<species>.<catalog>.npy plus a .hdr header) a block of
+wavelengths at a time, so only one block is ever held in memory, and each block is
+computed in parallel with numba.
+"""
+
+import sys
+from dataclasses import astuple, dataclass
+from pathlib import Path
+from typing import Final, NamedTuple
+
+import msgspec
+import numpy as np
+from numba import njit, prange
+from numpy.typing import NDArray
+
+APOLLO_DIRECTORY = Path(__file__).resolve().parents[2]
+if str(APOLLO_DIRECTORY) not in sys.path:
+    sys.path.append(str(APOLLO_DIRECTORY))
+
+from apollo.crosssections import CrossSectionTableHeader  # noqa: E402
+from apollo.opacities.binary_store import (  # noqa: E402
+    finish_binary_table,
+    get_header_filepath,
+    load_binary_table,
+    open_partial_binary_table,
+    read_header_line,
+)
+
+k: Final[float] = 1.38064852e-16  # boltzmann constant in CGS units
+amagat: Final[float] = 2.6867805e19  # number density at STP, in cm^-3
+
+# Missing values in the input grids are replaced by this log10 coefficient.
+MISSING_LOG_COEFFICIENT: Final[float] = -33.0
+
+INPUT_GRID_TEMPERATURE_MINIMUM: Final[float] = 75.0  # K; pressure is irrelevant
+INPUT_GRID_TEMPERATURE_MAXIMUM: Final[float] = 3500.0  # 138 steps of 25 K
+INPUT_GRID_WAVENUMBER_MINIMUM: Final[float] = 0.0  # cm^-1
+INPUT_GRID_WAVENUMBER_MAXIMUM: Final[float] = 19980.0  # cm^-1
+
+# Largest fractional temperature step used above the input grid, as in getOpacProf.
+UPPER_EDGE_STEP: Final[float] = 1 - 1e-6
+
+# Block size for writing; 4096 wavelengths of an 18 x 36 table are ~20 MB.
+DEFAULT_WAVELENGTHS_PER_CHUNK: Final[int] = 4096
+
+
+class OpacityConfiguration(msgspec.Struct):
+    opacity_catalog_id: str
+    input_opacity_directory: str
+
+    number_of_pressure_points: int = 18
+    minimum_log10_pressure_in_bars: float = -6.0
+    maximum_log10_pressure_in_bars: float = 2.5
+
+    number_of_temperature_points: int = 36
+    minimum_log10_temperature: float = 1.875061263  # i.e. 75 K
+    maximum_log10_temperature: float = 3.599199194  # i.e. 4000 K
+
+    minimum_wavelength_in_microns: float = 0.6
+    maximum_wavelength_in_microns: float = 5.0
+    mean_resolution: float = 10000
+
+
+def read_opacity_configuration(configuration_filepath: Path) -> OpacityConfiguration:
+    with open(configuration_filepath, "rb") as opacity_configuration_file:
+        return msgspec.toml.decode(
+            opacity_configuration_file.read(), type=OpacityConfiguration
+        )
+
+
+def get_number_of_wavelengths(
+    starting_wavelength: float, ending_wavelength: float, resolution: float
+) -> int:
+    return int(
+        np.ceil(resolution * np.log(ending_wavelength / starting_wavelength)) + 1
+    )
+
+
+def get_output_table_header(config: OpacityConfiguration) -> CrossSectionTableHeader:
+    return CrossSectionTableHeader(
+        number_of_pressure_layers=config.number_of_pressure_points,
+        minimum_log_pressure=config.minimum_log10_pressure_in_bars,
+        maximum_log_pressure=config.maximum_log10_pressure_in_bars,
+        number_of_temperatures=config.number_of_temperature_points,
+        minimum_log_temperature=config.minimum_log10_temperature,
+        maximum_log_temperature=config.maximum_log10_temperature,
+        number_of_spectral_elements=get_number_of_wavelengths(
+            config.minimum_wavelength_in_microns,
+            config.maximum_wavelength_in_microns,
+            config.mean_resolution,
+        ),
+        minimum_wavelength=config.minimum_wavelength_in_microns,
+        maximum_wavelength=config.maximum_wavelength_in_microns,
+        effective_resolution=config.mean_resolution,
+    )
+
+
+def format_table_header_line(table_header: CrossSectionTableHeader) -> str:
+    return " ".join(str(header_value) for header_value in astuple(table_header))
+
+
+def get_table_filepath(config: OpacityConfiguration, species: str) -> Path:
+    return (
+        Path(config.input_opacity_directory)
+        / f"{species}.{config.opacity_catalog_id}.dat"
+    )
+
+
+def read_table_header_line(table_filepath: Path) -> str:
+    return read_header_line(get_header_filepath(table_filepath))
+
+
+@dataclass
+class CIAInputGrid:
+    absorption_coefficients: NDArray[np.float64]  # (temperature, wavenumber)
+    minimum_temperature: float = INPUT_GRID_TEMPERATURE_MINIMUM
+    maximum_temperature: float = INPUT_GRID_TEMPERATURE_MAXIMUM
+    minimum_wavenumber: float = INPUT_GRID_WAVENUMBER_MINIMUM
+    maximum_wavenumber: float = INPUT_GRID_WAVENUMBER_MAXIMUM
+
+    @property
+    def number_of_temperatures(self) -> int:
+        return self.absorption_coefficients.shape[0]
+
+    @property
+    def number_of_wavenumbers(self) -> int:
+        return self.absorption_coefficients.shape[1]
+
+    @property
+    def temperature_step(self) -> float:
+        return (self.maximum_temperature - self.minimum_temperature) / (
+            self.number_of_temperatures - 1
+        )
+
+    @property
+    def wavenumber_step(self) -> float:
+        return (self.maximum_wavenumber - self.minimum_wavenumber) / (
+            self.number_of_wavenumbers - 1
+        )
+
+
+def load_cia_input_grid(input_spec_filepath: Path, **grid_bounds) -> CIAInputGrid:
+    log_coefficients = np.loadtxt(input_spec_filepath)
+
+    return CIAInputGrid(
+        absorption_coefficients=10
+        ** np.where(
+            np.isnan(log_coefficients), MISSING_LOG_COEFFICIENT, log_coefficients
+        ),
+        **grid_bounds,
+    )
+
+
+class GridIndices(NamedTuple):
+    indices: NDArray[np.int_]
+    fractional_steps: NDArray[np.float64]
+
+
+def get_temperature_indices(
+    temperatures: NDArray[np.float64], input_grid: CIAInputGrid
+) -> GridIndices:
+    # Clamped at both ends of the input grid, as the tables are in getOpacProf.
+    fractional_indices = (temperatures - input_grid.minimum_temperature) / (
+        input_grid.temperature_step
+    )
+    indices = np.clip(
+        fractional_indices.astype(int), 0, input_grid.number_of_temperatures - 2
+    )
+    fractional_steps = fractional_indices - indices
+
+    fractional_steps = np.where(fractional_indices < 0, 0.0, fractional_steps)
+    fractional_steps = np.where(
+        fractional_indices > input_grid.number_of_temperatures - 1,
+        UPPER_EDGE_STEP,
+        fractional_steps,
+    )
+
+    return GridIndices(indices=indices, fractional_steps=fractional_steps)
+
+
+def get_wavenumber_indices(
+    wavenumbers: NDArray[np.float64], input_grid: CIAInputGrid
+) -> GridIndices:
+    indices = np.clip(
+        (wavenumbers - input_grid.minimum_wavenumber) / input_grid.wavenumber_step,
+        a_min=0,
+        a_max=input_grid.number_of_wavenumbers - 2,
+    ).astype(int)
+
+    lower_wavenumber_bin_edge = (
+        input_grid.minimum_wavenumber + indices * input_grid.wavenumber_step
+    )
+    upper_wavenumber_bin_edge = lower_wavenumber_bin_edge + input_grid.wavenumber_step
+
+    return GridIndices(
+        indices=indices,
+        fractional_steps=(wavenumbers - lower_wavenumber_bin_edge)
+        / (upper_wavenumber_bin_edge - lower_wavenumber_bin_edge),
+    )
+
+
+def calculate_number_densities(
+    pressures_in_cgs: NDArray[np.float64], temperatures: NDArray[np.float64]
+) -> NDArray[np.float64]:
+    # (pressure, temperature)
+    return pressures_in_cgs[:, np.newaxis] / temperatures[np.newaxis, :] / k
+
+
+@njit(parallel=True, cache=True)
+def calculate_cia_crosssections(
+    absorption_coefficients: NDArray[np.float64],
+    temperature_indices: NDArray[np.int_],
+    temperature_steps: NDArray[np.float64],
+    wavenumber_indices: NDArray[np.int_],
+    wavenumber_steps: NDArray[np.float64],
+    number_densities: NDArray[np.float64],
+    output_crosssections: NDArray[np.float64],
+) -> None:
+    # Fills output_crosssections, shaped (pressure, temperature, wavenumber).
+    for j in prange(wavenumber_indices.shape[0]):
+        wi = wavenumber_indices[j]
+        wavenumber_step = wavenumber_steps[j]
+
+        for i in range(temperature_indices.shape[0]):
+            ti = temperature_indices[i]
+            temperature_step = temperature_steps[i]
+
+            low_end = absorption_coefficients[ti, wi] + temperature_step * (
+                absorption_coefficients[ti + 1, wi] - absorption_coefficients[ti, wi]
+            )
+            high_end = absorption_coefficients[ti, wi + 1] + temperature_step * (
+                absorption_coefficients[ti + 1, wi + 1]
+                - absorption_coefficients[ti, wi + 1]
+            )
+            coefficient = (low_end + wavenumber_step * (high_end - low_end)) / amagat**2
+
+            for p in range(number_densities.shape[0]):
+                output_crosssections[p, i, j] = coefficient * number_densities[p, i]
+
+
+def write_cia_table(
+    input_grid: CIAInputGrid,
+    table_filepath: Path,
+    table_header: CrossSectionTableHeader,
+    wavelengths_per_chunk: int = DEFAULT_WAVELENGTHS_PER_CHUNK,
+) -> Path:
+    temperatures = table_header.temperatures
+    temperature_indices = get_temperature_indices(temperatures, input_grid)
+    number_densities = calculate_number_densities(
+        10 ** (table_header.pressures + 6.0), temperatures
+    )
+    output_wavenumbers = 1e4 / table_header.wavelengths
+
+    table_shape = (
+        table_header.number_of_pressure_layers,
+        table_header.number_of_temperatures,
+        table_header.number_of_spectral_elements,
+    )
+    output_table = open_partial_binary_table(table_filepath, table_shape)
+    chunk = np.empty((*table_shape[:-1], wavelengths_per_chunk))
+
+    for chunk_start in range(0, table_shape[-1], wavelengths_per_chunk):
+        chunk_stop = min(chunk_start + wavelengths_per_chunk, table_shape[-1])
+        wavenumber_indices = get_wavenumber_indices(
+            output_wavenumbers[chunk_start:chunk_stop], input_grid
+        )
+        chunk_crosssections = chunk[..., : chunk_stop - chunk_start]
+
+        calculate_cia_crosssections(
+            input_grid.absorption_coefficients,
+            temperature_indices.indices,
+            temperature_indices.fractional_steps,
+            wavenumber_indices.indices,
+            wavenumber_indices.fractional_steps,
+            number_densities,
+            chunk_crosssections,
+        )
+        output_table[..., chunk_start:chunk_stop] = chunk_crosssections
+
+    output_table.flush()
+    del output_table
+
+    return finish_binary_table(table_filepath, format_table_header_line(table_header))
+
+
+def combine_cia_tables(
+    table_filepaths_and_fractions: dict[Path, float],
+    combined_table_filepath: Path,
+    wavelengths_per_chunk: int = DEFAULT_WAVELENGTHS_PER_CHUNK,
+) -> Path:
+    """
+    Writes the fraction-weighted sum of tables on the same grid, e.g. H2-H2 and
+    H2-He weighted by the molar fractions of H2 and He.
+    """
+    header_lines = {
+        table_filepath: read_table_header_line(table_filepath)
+        for table_filepath in table_filepaths_and_fractions
+    }
+    if len(set(header_lines.values())) > 1:
+        raise ValueError(f"The tables are on different grids: {header_lines}.")
+
+    tables = {
+        table_filepath: load_binary_table(table_filepath)
+        for table_filepath in table_filepaths_and_fractions
+    }
+    table_shape = next(iter(tables.values())).shape
+
+    combined_table = open_partial_binary_table(combined_table_filepath, table_shape)
+    for chunk_start in range(0, table_shape[-1], wavelengths_per_chunk):
+        chunk_stop = min(chunk_start + wavelengths_per_chunk, table_shape[-1])
+        combined_table[..., chunk_start:chunk_stop] = sum(
+            fraction * tables[table_filepath][..., chunk_start:chunk_stop]
+            for table_filepath, fraction in table_filepaths_and_fractions.items()
+        )
+    combined_table.flush()
+    del combined_table
+
+    return finish_binary_table(
+        combined_table_filepath, next(iter(header_lines.values()))
+    )
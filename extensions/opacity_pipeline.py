@@ -0,0 +1,341 @@
+"""
+Parallel, resumable generation of APOLLO opacity tables from the Lupu database.
+
+Each molecule is inserted into its own SQLite database by its own worker process, and
+its table is then written straight into APOLLO's binary store (<molecule>.<save name>
+.npy plus a .hdr header sidecar). Every finished piece is recorded in a manifest,
+<save name>.manifest.json in the output directory, so a rerun after an interruption
+only redoes what had not finished.
+"""
+
+import json
+import multiprocessing
+import os
+import sys
+from collections.abc import Callable, Sequence
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Final
+
+import numpy as np
+
+APOLLO_DIRECTORY = Path(__file__).resolve().parent.parent
+if str(APOLLO_DIRECTORY) not in sys.path:
+    sys.path.append(str(APOLLO_DIRECTORY))
+
+from apollo.opacities.binary_store import (  # noqa: E402
+    finish_binary_table,
+    get_binary_table_filepath,
+    get_header_filepath,
+    has_binary_table,
+    load_binary_table,
+    open_partial_binary_table,
+    read_header_line,
+)
+
+MANIFEST_SUFFIX: Final[str] = ".manifest.json"
+
+ALKALI_TABLE_NAME: Final[str] = "Lupu_alk"
+
+
+class OpacityManifest:
+    """
+    Records finished pieces (a molecule's database, or a table) along with the
+    settings they were made with, so that a resumed run cannot mix in pieces
+    made for a different wavelength range or resolution.
+    """
+
+    def __init__(self, manifest_filepath: Path, settings: dict[str, Any]):
+        self.manifest_filepath = Path(manifest_filepath)
+        self.settings = settings
+        self.finished_pieces: dict[str, dict[str, str]] = {}
+
+        if self.manifest_filepath.is_file():
+            manifest = json.loads(self.manifest_filepath.read_text())
+            if manifest["settings"] != settings:
+                raise ValueError(
+                    f"{self.manifest_filepath} was made with different settings: "
+                    + f"{manifest['settings']}. Use a new save name, "
+                    + "or remove the manifest to start over."
+                )
+            self.finished_pieces = manifest["finished_pieces"]
+
+    def is_finished(self, piece_name: str) -> bool:
+        return (
+            piece_name in self.finished_pieces
+            and Path(self.finished_pieces[piece_name]["output"]).exists()
+        )
+
+    def mark_finished(self, piece_name: str, output_filepath: Path) -> None:
+        self.finished_pieces[piece_name] = dict(
+            output=str(output_filepath), finished=datetime.now().isoformat()
+        )
+        self.write()
+
+    def write(self) -> None:
+        # Written under a temporary name and renamed, so that an interruption
+        # never leaves a half-written manifest.
+        temporary_filepath = self.manifest_filepath.with_suffix(".tmp")
+        temporary_filepath.write_text(
+            json.dumps(
+                dict(settings=self.settings, finished_pieces=self.finished_pieces),
+                indent=2,
+            )
+        )
+        os.replace(temporary_filepath, self.manifest_filepath)
+
+
+def get_molecule_database_filepath(
+    original_opacity_directory,
+    save_name,
+    molecule,
+    minimum_wavelength,
+    maximum_wavelength,
+    new_resolution,
+):
+    # One database per molecule, so that molecules can be inserted in parallel
+    # without contending for a single SQLite writer.
+    return f"{original_opacity_directory}/lupu_{minimum_wavelength}_{maximum_wavelength}_R{new_resolution}_{save_name}_{molecule}.db"
+
+
+def get_table_filepath(output_directory: Path, table_name: str, save_name: str):
+    return Path(output_directory) / f"{table_name}.{save_name}.dat"
+
+
+def write_binary_opacity_table(
+    table_filepath: Path, table: np.ndarray, header_string: str
+) -> Path:
+    binary_table = open_partial_binary_table(table_filepath, table.shape)
+    binary_table[:] = table
+    binary_table.flush()
+    del binary_table
+
+    return finish_binary_table(table_filepath, header_string)
+
+
+def run_pieces_in_parallel(
+    pieces: dict[str, tuple[Callable, tuple]],
+    manifest: OpacityManifest,
+    max_workers: int = None,
+) -> None:
+    # Runs every piece not already in the manifest, recording each as it finishes.
+    # Only this process writes the manifest. A failed piece does not stop the others;
+    # the failures are raised together once every piece has run.
+    unfinished_pieces = {
+        piece_name: piece
+        for piece_name, piece in pieces.items()
+        if not manifest.is_finished(piece_name)
+    }
+    for piece_name in pieces.keys() - unfinished_pieces.keys():
+        print(f"{piece_name} already finished.")
+
+    if not unfinished_pieces:
+        return
+
+    # Workers start from a fresh server process rather than a fork of this one, which
+    # may hold threads (e.g. numba's TBB pool) that do not survive a fork.
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("forkserver")
+    ) as executor:
+        futures = {
+            executor.submit(function, *arguments): piece_name
+            for piece_name, (function, arguments) in unfinished_pieces.items()
+        }
+        failed_pieces: dict[str, BaseException] = {}
+        for future in as_completed(futures):
+            piece_name = futures[future]
+            try:
+                output_filepath = future.result()
+            except Exception as error:
+                failed_pieces[piece_name] = error
+                print(f"{piece_name} failed: {error!r}")
+                continue
+
+            manifest.mark_finished(piece_name, output_filepath)
+            print(f"Finished {piece_name}.")
+
+    if failed_pieces:
+        raise RuntimeError(
+            f"{len(failed_pieces)} of {len(unfinished_pieces)} pieces failed "
+            + "(the rest are in the manifest, so a rerun only redoes these): "
+            + "; ".join(
+                f"{piece_name}: {error!r}"
+                for piece_name, error in sorted(failed_pieces.items())
+            )
+        ) from next(iter(failed_pieces.values()))
+
+
+def build_molecule_database(
+    opacity_db: str,
+    molecule: str,
+    minimum_wavelength: float,
+    maximum_wavelength: float,
+    original_opacity_directory: Path,
+    new_resolution: float,
+) -> str:
+    # PICASO is only imported by the workers that need it.
+    from Lupu_opacity_reader import insert_molecule_into_database
+
+    # A database left over from an interrupted insert holds a partial set of rows.
+    Path(opacity_db).unlink(missing_ok=True)
+
+    return insert_molecule_into_database(
+        opacity_db,
+        molecule,
+        minimum_wavelength,
+        maximum_wavelength,
+        original_opacity_directory,
+        new_resolution,
+    )
+
+
+def write_molecule_table(
+    opacity_db: str,
+    molecule: str,
+    minimum_wavelength: float,
+    maximum_wavelength: float,
+    new_resolution: float,
+    table_filepath: Path,
+) -> Path:
+    from Lupu_opacity_reader import read_opacity_table_from_database
+
+    table, header_string = read_opacity_table_from_database(
+        opacity_db, molecule, minimum_wavelength, maximum_wavelength, new_resolution
+    )
+    if table is None:
+        raise ValueError(f"{molecule} is not in {opacity_db}.")
+
+    return write_binary_opacity_table(table_filepath, table, header_string)
+
+
+def write_alkali_table(
+    Na_table_filepath: Path, K_table_filepath: Path, table_filepath: Path
+) -> Path:
+    from combine_alkalis import combine_alkalis
+
+    header_string = read_header_line(get_header_filepath(Na_table_filepath))
+    alkali_table = combine_alkalis(
+        load_binary_table(Na_table_filepath),
+        load_binary_table(K_table_filepath),
+        header_string,
+    )
+
+    return write_binary_opacity_table(table_filepath, alkali_table, header_string)
+
+
+def generate_opacity_files_in_parallel(
+    original_opacity_directory: Path,
+    save_name: str,
+    list_of_molecules: Sequence[str],
+    minimum_wavelength: float,
+    maximum_wavelength: float,
+    new_resolution: float,
+    combine_alkalis: bool = False,
+    output_directory: Path = None,
+    max_workers: int = None,
+) -> list[Path]:
+    """
+    Databases are built with one worker per molecule, then the tables are written
+    the same way. Pieces already in the manifest are skipped.
+    """
+    if output_directory is None:
+        output_directory = Path.cwd()
+    output_directory = Path(output_directory)
+
+    manifest = OpacityManifest(
+        output_directory / f"{save_name}{MANIFEST_SUFFIX}",
+        settings=dict(
+            original_opacity_directory=str(original_opacity_directory),
+            list_of_molecules=list(list_of_molecules),
+            minimum_wavelength=minimum_wavelength,
+            maximum_wavelength=maximum_wavelength,
+            new_resolution=new_resolution,
+        ),
+    )
+
+    database_filepaths = {
+        molecule: get_molecule_database_filepath(
+            original_opacity_directory,
+            save_name,
+            molecule,
+            minimum_wavelength,
+            maximum_wavelength,
+            new_resolution,
+        )
+        for molecule in list_of_molecules
+    }
+    run_pieces_in_parallel(
+        {
+            f"database:{molecule}": (
+                build_molecule_database,
+                (
+                    database_filepaths[molecule],
+                    molecule,
+                    minimum_wavelength,
+                    maximum_wavelength,
+                    original_opacity_directory,
+                    new_resolution,
+                ),
+            )
+            for molecule in list_of_molecules
+        },
+        manifest,
+        max_workers,
+    )
+
+    table_filepaths = {
+        molecule: get_table_filepath(output_directory, molecule.lower(), save_name)
+        for molecule in list_of_molecules
+    }
+    run_pieces_in_parallel(
+        {
+            f"table:{molecule}": (
+                write_molecule_table,
+                (
+                    database_filepaths[molecule],
+                    molecule,
+                    minimum_wavelength,
+                    maximum_wavelength,
+                    new_resolution,
+                    table_filepaths[molecule],
+                ),
+            )
+            for molecule in list_of_molecules
+        },
+        manifest,
+        max_workers,
+    )
+
+    output_opacity_filepaths = [
+        get_binary_table_filepath(table_filepath)
+        for table_filepath in table_filepaths.values()
+    ]
+
+    if combine_alkalis:
+        alkali_table_filepath = get_table_filepath(
+            output_directory, ALKALI_TABLE_NAME, save_name
+        )
+        run_pieces_in_parallel(
+            {
+                f"table:{ALKALI_TABLE_NAME}": (
+                    write_alkali_table,
+                    (
+                        table_filepaths["na"],
+                        table_filepaths["k"],
+                        alkali_table_filepath,
+                    ),
+                )
+            },
+            manifest,
+            max_workers=1,
+        )
+        output_opacity_filepaths.append(
+            get_binary_table_filepath(alkali_table_filepath)
+        )
+
+    return [
+        filepath
+        for filepath in output_opacity_filepaths
+        if has_binary_table(filepath.with_suffix(".dat"))
+    ]
@@ -1 +1,98 @@
-from apollo.crosssections import 
\ No newline at end of file
+"""
+Converts APOLLO text cross-section tables (<species>.<catalog>.dat) into the binary
+store read by both the Python loaders and the C++ Planet core: a memory-mappable
+<species>.<catalog>.npy plus a <species>.<catalog>.hdr sidecar holding the header.
+
+Despite the name, the store is raw .npy rather than zarr, so that the C++ side can
+memory-map it without any extra libraries.
+"""
+
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
+from time import perf_counter
+
+from apollo.crosssections import create_crosssection_catalog
+from apollo.opacities.binary_store import (
+    DEFAULT_LINES_PER_CHUNK,
+    TEXT_TABLE_SUFFIX,
+    convert_text_table_to_binary,
+)
+
+
+def convert_crosssection_catalog_to_binary(
+    gas_opacity_directory: Path,
+    catalog_names: list[str] = None,
+    species_to_convert: list[str] = None,
+    lines_per_chunk: int = DEFAULT_LINES_PER_CHUNK,
+    overwrite: bool = False,
+) -> list[Path]:
+    crosssection_catalog = create_crosssection_catalog(
+        gas_opacity_directory, filename_match_strings=(f"*.*{TEXT_TABLE_SUFFIX}",)
+    )
+
+    if catalog_names is None:
+        catalog_names = list(crosssection_catalog.keys())
+
+    binary_filepaths = []
+    for catalog_name in catalog_names:
+        crosssection_directory = crosssection_catalog[catalog_name]
+
+        for species, filepath in crosssection_directory.filepath_directory.items():
+            if species_to_convert is not None and species not in species_to_convert:
+                continue
+
+            start_time = perf_counter()
+            binary_filepaths.append(
+                convert_text_table_to_binary(
+                    filepath, lines_per_chunk=lines_per_chunk, overwrite=overwrite
+                )
+            )
+            print(f"{filepath.name}: {perf_counter() - start_time:.1f} s")
+
+    return binary_filepaths
+
+
+def read_command_line_arguments() -> Namespace:
+    parser: ArgumentParser = ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "gas_opacity_directory",
+        type=Path,
+        help="Directory holding the text tables, e.g. <opacdir>/gases.",
+    )
+    parser.add_argument(
+        "--catalogs",
+        nargs="+",
+        default=None,
+        help="Catalog names to convert (e.g. nir lores). Default: all.",
+    )
+    parser.add_argument(
+        "--species",
+        nargs="+",
+        default=None,
+        help="Species to convert (e.g. h2o ch4). Default: all.",
+    )
+    parser.add_argument(
+        "--lines-per-chunk",
+        type=int,
+        default=DEFAULT_LINES_PER_CHUNK,
+        help="Number of text lines parsed at a time.",
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Re-convert tables that already have a binary copy.",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args: Namespace = read_command_line_arguments()
+
+    convert_crosssection_catalog_to_binary(
+        gas_opacity_directory=args.gas_opacity_directory,
+        catalog_names=args.catalogs,
+        species_to_convert=args.species,
+        lines_per_chunk=args.lines_per_chunk,
+        overwrite=args.overwrite,
+    )
@@ -59,22 +59,21 @@ def interleave(
         np.shape(first_terms)[interleaved_axis]
         + np.shape(second_terms)[interleaved_axis]
     )
-    interleaved_array_shape = np.shape(first_terms)
+    interleaved_array_shape = list(np.shape(first_terms))
     interleaved_array_shape[interleaved_axis] = interleaved_dimension_size
-    interleaved_array = np.empty(interleaved_array_shape, dtype=first_terms.dtype)
-
-    base_slice_list = [slice(None)] * first_terms.ndim
+    interleaved_array = np.empty(
+        interleaved_array_shape,
+        dtype=np.result_type(first_terms, second_terms),
+    )
 
-    first_slice = slice(0, None, 2)
-    first_slices = base_slice_list
-    first_slices[interleaved_axis] = first_slice
+    first_slices = [slice(None)] * interleaved_array.ndim
+    first_slices[interleaved_axis] = slice(0, None, 2)
 
-    second_slice = slice(1, None, 2)
-    second_slices = base_slice_list
-    second_slices[interleaved_axis] = second_slice
+    second_slices = [slice(None)] * interleaved_array.ndim
+    second_slices[interleaved_axis] = slice(1, None, 2)
 
-    interleaved_array[first_slices] = first_terms
-    interleaved_array[second_slices] = second_terms
+    interleaved_array[tuple(first_slices)] = first_terms
+    interleaved_array[tuple(second_slices)] = second_terms
 
     return interleaved_array
 